@@ -47,6 +47,7 @@ except ImportError:
     backup_manager = None
 
 from ARCHIVOS.utils import send_error_email_async, get_effective_user_id
+from ARCHIVOS import sqlite_profile, db_routing, query_stats, report_cache, export_jobs, month_end, fragment_cache, single_flight, cache_warming, column_store
 
 # Importa tus Blueprints
 # MEJORA DE ESTRUCTURA: Se actualizan las rutas de importación tras mover los archivos a la carpeta 'routes'.
@@ -90,6 +91,43 @@ class Config:
     DATABASE_PATH = BASE_DIR / 'control_papelerias.db'
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{DATABASE_PATH}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Perfil del motor SQLite (ver sqlite_profile.py). WAL permite que los workers
+    # lean mientras otro escribe; synchronous=NORMAL es seguro en modo WAL.
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # 256MB
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -32000))  # ~32MB (KiB si es negativo)
+    SQLITE_TEMP_STORE = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # ms
+    SQLITE_STATEMENT_CACHE_SIZE = int(os.environ.get('SQLITE_STATEMENT_CACHE_SIZE', 256))
+
+    # Engine de solo lectura (ver db_routing.py): los métodos de repositorio marcados con @reads
+    # (gráficos, analytics, búsqueda, exportaciones) usan su propio pool con mode=ro y query_only
+    SQLITE_READ_ENGINE_ENABLED = os.environ.get('SQLITE_READ_ENGINE_ENABLED', 'True').lower() == 'true'
+    SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE', 8))
+    SQLITE_READ_MAX_OVERFLOW = int(os.environ.get('SQLITE_READ_MAX_OVERFLOW', 8))
+
+    # Instrumentación SQL por petición (ver query_stats.py): conteo, tiempo, N+1 y Server-Timing
+    QUERY_STATS_ENABLED = os.environ.get('QUERY_STATS_ENABLED', 'True').lower() == 'true'
+    QUERY_STATS_SERVER_TIMING = os.environ.get('QUERY_STATS_SERVER_TIMING', 'True').lower() == 'true'
+    QUERY_STATS_N_PLUS_ONE_THRESHOLD = int(os.environ.get('QUERY_STATS_N_PLUS_ONE_THRESHOLD', 3))
+
+    # Caché de reportes PDF (ver report_cache.py): expulsión por edad y por tamaño del directorio
+    PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', BASE_DIR / 'reportes_pdf'))
+    PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 200 * 1024 * 1024))  # 200MB
+    PDF_CACHE_MAX_AGE = int(os.environ.get('PDF_CACHE_MAX_AGE', 7 * 24 * 3600))  # 7 días sin descargas
+
+    # Exportaciones en segundo plano (ver export_jobs.py)
+    EXPORT_JOBS_EXECUTOR = os.environ.get('EXPORT_JOBS_EXECUTOR', 'process')  # 'process' | 'inline'
+    EXPORT_JOBS_WORKERS = int(os.environ.get('EXPORT_JOBS_WORKERS', 1))  # Procesos por worker de gunicorn
+    EXPORT_JOBS_DIR = Path(os.environ.get('EXPORT_JOBS_DIR', BASE_DIR / 'exportaciones'))
+    EXPORT_JOBS_MAX_AGE = int(os.environ.get('EXPORT_JOBS_MAX_AGE', 24 * 3600))  # 1 día
+    EXPORT_JOBS_STALE_AFTER = int(os.environ.get('EXPORT_JOBS_STALE_AFTER', 600))  # 10 min sin progreso
+
+    # Estados de cuenta de fin de mes (ver month_end.py); MONTH_END_SCHEDULE los programa en backup_manager
+    MONTH_END_DIR = Path(os.environ.get('MONTH_END_DIR', BASE_DIR / 'estados_cuenta'))
+    MONTH_END_WORKERS = int(os.environ.get('MONTH_END_WORKERS', 0))  # 0 = un proceso por CPU
     
     # Configuración de seguridad
     WTF_CSRF_ENABLED = True
@@ -104,8 +142,30 @@ class Config:
     # Configuración de caché multicapa (OPTIMIZADO para PythonAnywhere gratis)
     CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
     CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', '300'))
-    CACHE_TYPE = 'SimpleCache'  # Mejor para PythonAnywhere gratis (sin Redis)
-    CACHE_THRESHOLD = 500  # Máximo elementos en caché
+    # Dos niveles sin Redis (ver tiered_cache.py): LRU por worker + SQLite compartido entre workers
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'ARCHIVOS.tiered_cache.TieredCache')
+    CACHE_THRESHOLD = int(os.environ.get('CACHE_THRESHOLD', 2000))  # Máximo elementos en caché (L2)
+    CACHE_L2_PATH = Path(os.environ.get('CACHE_L2_PATH', BASE_DIR / 'cache_compartida.db'))
+    CACHE_L1_MAX_BYTES = int(os.environ.get('CACHE_L1_MAX_BYTES', 16 * 1024 * 1024))  # 16MB por worker
+    CACHE_L1_TTL = int(os.environ.get('CACHE_L1_TTL', 30))  # Segundos en L1 antes de releer L2
+    # Fragmentos HTMX versionados con ETag (ver fragment_cache.py)
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', 'True').lower() == 'true'
+    FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 600))
+    # Un solo cálculo por clave y stale-while-revalidate en las APIs del dashboard (ver single_flight.py)
+    SINGLE_FLIGHT_STALE_MAX_AGE = int(os.environ.get('SINGLE_FLIGHT_STALE_MAX_AGE', 60))  # 0 = siempre esperar al valor nuevo
+    SINGLE_FLIGHT_WAIT = float(os.environ.get('SINGLE_FLIGHT_WAIT', 10))  # Espera por el cálculo de otro worker
+    SINGLE_FLIGHT_REFRESH = os.environ.get('SINGLE_FLIGHT_REFRESH', 'thread')  # 'thread' | 'inline'
+    SINGLE_FLIGHT_REFRESH_WORKERS = int(os.environ.get('SINGLE_FLIGHT_REFRESH_WORKERS', 2))
+    # Precalentamiento tras escribir y al arrancar (ver cache_warming.py)
+    CACHE_WARMING_ENABLED = os.environ.get('CACHE_WARMING_ENABLED', 'True').lower() == 'true'
+    CACHE_WARMING_WORKERS = int(os.environ.get('CACHE_WARMING_WORKERS', 1))  # Hilos por worker de gunicorn
+    CACHE_WARMING_MAX_PENDING = int(os.environ.get('CACHE_WARMING_MAX_PENDING', 16))
+    CACHE_WARMING_MAX_LOAD = float(os.environ.get('CACHE_WARMING_MAX_LOAD', 0.75))  # Carga por CPU
+    CACHE_WARMING_HOT_FILE = Path(os.environ.get('CACHE_WARMING_HOT_FILE', BASE_DIR / 'cache_hot_keys.json'))
+    CACHE_WARMING_HOT_USERS = int(os.environ.get('CACHE_WARMING_HOT_USERS', 20))
+    # Rollup de trámites en columnas NumPy por usuario para analytics y gráficos (ver column_store.py)
+    COLUMN_STORE_ENABLED = os.environ.get('COLUMN_STORE_ENABLED', 'True').lower() == 'true'  # Requiere numpy
+    COLUMN_STORE_MAX_BYTES = int(os.environ.get('COLUMN_STORE_MAX_BYTES', 64 * 1024 * 1024))  # Por worker
     
     # Configuración de compresión (reduce transferencia 60-80%)
     COMPRESS_MIMETYPES = [
@@ -160,6 +220,20 @@ def run_db_migration(app):
         # Por ahora, solo se asegura que la tabla se cree con la columna si no existe.
         db.create_all()
 
+        # Columnas añadidas a tablas existentes (ALTER TABLE idempotente)
+        from ARCHIVOS.schema_migrations import ensure_tramites_cantidad, ensure_periodo_columns, ensure_indexes
+        ensure_tramites_cantidad()
+        ensure_periodo_columns()
+        ensure_indexes()
+
+        # Rollups diarios: backfill automático si la tabla está vacía pero hay datos
+        from ARCHIVOS.rollups import ensure_rollups_populated
+        ensure_rollups_populated()
+
+        # Índice FTS5 de la búsqueda global: tabla, triggers y poblado inicial
+        from ARCHIVOS.search_index import ensure_search_index
+        ensure_search_index()
+
 
 def create_app(config_class=Config):
 
@@ -178,19 +252,26 @@ def create_app(config_class=Config):
     # Disable CSRF in testing mode to simplify unit tests that POST forms.
     if not app.config.get('TESTING', False):
         CSRFProtect(app)
+
+    # ✅ Perfil SQLite: caché de sentencias en las opciones del engine (antes de init_app)
+    # y PRAGMA (foreign_keys, WAL, mmap, cache_size, ...) en cada conexión nueva.
+    if str(app.config.get('SQLALCHEMY_DATABASE_URI', '')).startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_profile.engine_options(
+            app.config, app.config.get('SQLALCHEMY_ENGINE_OPTIONS')
+        )
     db.init_app(app)
-    
-    # ✅ Habilitar PRAGMA foreign_keys para SQLite (integridad referencial)
-    from sqlalchemy import event
-    from sqlalchemy.engine import Engine
-    
-    @event.listens_for(Engine, "connect")
-    def set_sqlite_pragma(dbapi_connection, connection_record):
-        cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA foreign_keys=ON")
-        cursor.close()
+    sqlite_profile.init_app(app, db)
+    db_routing.init_app(app, db)
+    query_stats.init_app(app, db)
+    report_cache.init_app(app)
+    export_jobs.init_app(app)
+    month_end.init_app(app)
+    fragment_cache.init_app(app)
+    single_flight.init_app(app)
+    cache_warming.init_app(app)
+    column_store.init_app(app)
     # ✅ 3. Inicializar caché multicapa
-    # Intentamos usar el backend indicado en configuración (por defecto Redis).
+    # Intentamos usar el backend indicado en configuración (por defecto TieredCache, ver tiered_cache.py).
     # Si falla (p. ej. Redis no está disponible en desarrollo) caemos a SimpleCache.
     try:
         cache = Cache(app)
@@ -202,6 +283,10 @@ def create_app(config_class=Config):
         cache = Cache(app)
         app.cache = cache
 
+    # Workers recién arrancados (p. ej. tras un reinicio): caché de los usuarios más activos
+    if not app.config.get('TESTING', False):
+        cache_warming.warm_hot_tenants(app)
+
     # Ruta de prueba para verificar la caché
     @app.route('/cache-test')
     @cache.cached(timeout=60)
@@ -263,16 +348,21 @@ def create_app(config_class=Config):
     register_context_processors(app)
     register_error_handlers(app)
     register_blueprints(app)
+    register_cli_commands(app)
 
     @app.route('/health')
     def health_check():
         try:
             db.session.execute(text('SELECT 1'))
-            return jsonify({
+            respuesta = {
                 'status': 'healthy',
                 'timestamp': datetime.now().isoformat(),
                 'database': 'connected'
-            }), 200
+            }
+            backend = getattr(app.cache, 'cache', None)
+            if hasattr(backend, 'stats'):
+                respuesta['cache'] = backend.stats()
+            return jsonify(respuesta), 200
         except Exception as e:
             return jsonify({
                 'status': 'unhealthy',
@@ -416,6 +506,69 @@ def register_blueprints(app):
 
 
 
+# ==================== COMANDOS CLI ====================
+
+def register_cli_commands(app):
+    """Registra comandos de mantenimiento para `flask --app wsgi <comando>`."""
+    import click
+
+    @app.cli.command('rebuild-rollups')
+    @click.option('--user-id', type=int, default=None, help='Reconstruir solo los rollups de este usuario.')
+    def rebuild_rollups_command(user_id):
+        """Reconstruye por completo las tablas de rollup diario desde tramites/gastos."""
+        from ARCHIVOS.rollups import rebuild_all
+        rebuild_all(user_id)
+        click.echo(f"✅ Rollups reconstruidos ({'usuario ' + str(user_id) if user_id else 'todos los usuarios'})")
+
+    @app.cli.command('rebuild-search-index')
+    @click.option('--user-id', type=int, default=None, help='Reindexar solo los documentos de este usuario.')
+    def rebuild_search_index_command(user_id):
+        """Reconstruye el índice FTS5 de la búsqueda global desde las tablas crudas."""
+        from ARCHIVOS import search_index
+        if not search_index.enabled():
+            click.echo("⚠️ FTS5 no disponible en esta base de datos; la búsqueda usa ILIKE.")
+            return
+        search_index.rebuild(user_id)
+        click.echo(f"✅ Índice de búsqueda reconstruido ({'usuario ' + str(user_id) if user_id else 'todos los usuarios'})")
+
+    @app.cli.command('prune-report-cache')
+    def prune_report_cache_command():
+        """Aplica los límites de edad y tamaño a la caché de reportes PDF."""
+        cache = report_cache.ReportCache.from_config(app.config)
+        borrados = cache.evict()
+        click.echo(f"✅ {borrados} reportes expulsados de {cache.directory}")
+
+    @app.cli.command('month-end-statements')
+    @click.option('--mes', default=None, help='Mes AAAA-MM (por defecto, el mes anterior).')
+    @click.option('--user-id', type=int, default=None, help='Solo las papelerías de este usuario.')
+    @click.option('--workers', type=int, default=None, help='Procesos para dibujar los PDF (0 = uno por CPU).')
+    def month_end_statements_command(mes, user_id, workers):
+        """Genera el ZIP de estados de cuenta del mes: un PDF por papelería activa más un índice."""
+        try:
+            ruta, entradas = month_end.generar_lote(mes, user_id, workers)
+        except ValueError:
+            raise click.BadParameter('usa el formato AAAA-MM', param_hint='--mes')
+        click.echo(f"✅ {len(entradas)} estados de cuenta en {ruta}")
+
+    @app.cli.command('analytics-snapshots')
+    @click.option('--user-id', type=int, default=None, help='Solo los snapshots de este usuario.')
+    def analytics_snapshots_command(user_id):
+        """Extiende hasta ayer los snapshots de analytics (lo mismo que el job nocturno)."""
+        from ARCHIVOS.database import analytics_repository
+        if user_id:
+            analytics_repository.refresh_snapshot(user_id)
+        else:
+            analytics_repository.refresh_all_snapshots()
+        click.echo(f"✅ Snapshots de analytics actualizados ({'usuario ' + str(user_id) if user_id else 'todos los usuarios'})")
+
+    @app.cli.command('compact-tramites')
+    def compact_tramites_command():
+        """Fusiona filas de trámites idénticas en una sola fila con `cantidad`."""
+        from ARCHIVOS.schema_migrations import compact_tramites
+        eliminadas = compact_tramites()
+        click.echo(f"✅ {eliminadas} filas duplicadas fusionadas. Ejecuta VACUUM para recuperar espacio en disco.")
+
+
 # ==================== EJECUCIÓN LOCAL SEGURA ====================
 # Para desarrollo local, permite ejecutar el servidor solo si el archivo es ejecutado como script principal.
 if __name__ == "__main__":
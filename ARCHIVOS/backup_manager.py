@@ -5,8 +5,8 @@ Gestiona backups programados de la base de datos SQLite
 
 import os
 import sqlite3
-import shutil
 import logging
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -20,6 +20,14 @@ except ImportError:
     BackgroundScheduler = None
     CronTrigger = None
 
+# fcntl (solo Unix) coordina los jobs programados entre los workers de gunicorn
+FCNTL_AVAILABLE = False
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -97,6 +105,28 @@ class BackupManager:
             replace_existing=True
         )
         
+        # Estados de cuenta del mes anterior (opcional): día 1 de cada mes a las 3 AM
+        if os.environ.get('MONTH_END_SCHEDULE', 'False').lower() == 'true':
+            self.scheduler.add_job(
+                func=self.create_month_end_statements,
+                trigger=CronTrigger(day=1, hour=3, minute=0),
+                id='month_end_statements',
+                name='Estados de cuenta de fin de mes',
+                replace_existing=True
+            )
+            logger.info("⏰ Estados de cuenta programados: día 1 de cada mes (3 AM)")
+
+        # Snapshot de analytics hasta ayer: diario a la 1 AM (antes del backup)
+        if os.environ.get('ANALYTICS_SNAPSHOT_SCHEDULE', 'True').lower() == 'true':
+            self.scheduler.add_job(
+                func=self.create_analytics_snapshots,
+                trigger=CronTrigger(hour=1, minute=0),
+                id='analytics_snapshots',
+                name='Snapshot nocturno de analytics',
+                replace_existing=True
+            )
+            logger.info("⏰ Snapshot de analytics programado: diariamente (1 AM)")
+
         # Backup al iniciar (opcional)
         if os.environ.get('BACKUP_ON_START', 'True').lower() == 'true':
             self.scheduler.add_job(
@@ -128,12 +158,7 @@ class BackupManager:
             backup_path = self.backup_dir / backup_filename
             
             # Realizar backup seguro usando SQLite API (evita corrupción si la DB está en uso)
-            src = sqlite3.connect(self.db_path)
-            dst = sqlite3.connect(backup_path)
-            with dst:
-                src.backup(dst)
-            dst.close()
-            src.close()
+            self._sqlite_copy(self.db_path, backup_path)
             
             # Verificar integridad del backup
             if backup_path.exists() and backup_path.stat().st_size > 0:
@@ -154,6 +179,69 @@ class BackupManager:
             logger.error(f"❌ Error creando backup: {e}")
             return None
     
+    @contextmanager
+    def _job_lock(self, directorio, nombre, clave):
+        """
+        Coordina un job programado entre workers: cada worker de gunicorn arranca su propio
+        scheduler y todos disparan a la vez. Toma un `flock` no bloqueante sobre
+        `<directorio>/.<nombre>.lock` y produce True solo en el worker que lo obtiene y si el
+        job aún no terminó para `clave` (el mes o el día, que se guarda en el archivo al acabar).
+        """
+        directorio.mkdir(parents=True, exist_ok=True)
+        with open(directorio / f'.{nombre}.lock', 'a+') as candado:
+            if FCNTL_AVAILABLE:
+                try:
+                    fcntl.flock(candado, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    logger.info(f"⏭️ {nombre}: otro worker lo está ejecutando")
+                    yield False
+                    return
+            candado.seek(0)
+            if candado.read().strip() == clave:
+                logger.info(f"⏭️ {nombre}: ya ejecutado para {clave}")
+                yield False
+                return
+            yield True
+            candado.seek(0)
+            candado.truncate()
+            candado.write(clave)
+
+    def create_month_end_statements(self):
+        """Genera el ZIP de estados de cuenta del mes anterior de todos los usuarios (un solo worker)."""
+        from .month_end import generar_lote, rango_mes, ruta_lote
+        try:
+            with self.app.app_context():
+                mes, _, _ = rango_mes()
+                ruta = ruta_lote(mes)
+                if ruta.exists():
+                    logger.info(f"⏭️ Estados de cuenta de {mes} ya generados: {ruta.name}")
+                    return None
+                with self._job_lock(ruta.parent, 'month_end_statements', mes) as ejecutar:
+                    if not ejecutar:
+                        return None
+                    ruta, entradas = generar_lote(mes)
+            logger.info(f"📄 Estados de cuenta generados: {ruta.name} ({len(entradas)} papelerías)")
+            return ruta
+        except Exception as e:
+            logger.error(f"❌ Error generando estados de cuenta: {e}")
+            return None
+
+    def create_analytics_snapshots(self):
+        """Extiende hasta ayer los snapshots de analytics de todos los usuarios (un worker por noche)."""
+        from .database import analytics_repository
+        try:
+            directorio = Path(self.app.config['DATABASE_PATH']).parent
+            with self._job_lock(directorio, 'analytics_snapshots', datetime.now().date().isoformat()) as ejecutar:
+                if not ejecutar:
+                    return None
+                with self.app.app_context():
+                    usuarios = analytics_repository.refresh_all_snapshots()
+            logger.info(f"📊 Snapshots de analytics actualizados ({usuarios} usuarios)")
+            return usuarios
+        except Exception as e:
+            logger.error(f"❌ Error actualizando snapshots de analytics: {e}")
+            return None
+
     def cleanup_old_backups(self):
         """Elimina backups más antiguos que el período de retención."""
         try:
@@ -205,6 +293,18 @@ class BackupManager:
         
         return backups
     
+    @staticmethod
+    def _sqlite_copy(origen, destino):
+        """Copia la BD `origen` sobre `destino` con la API de backup de SQLite (segura con WAL y en uso)."""
+        src = sqlite3.connect(origen)
+        dst = sqlite3.connect(destino)
+        try:
+            with dst:
+                src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
     def restore_backup(self, backup_filename):
         """Restaura la base de datos desde un backup."""
         try:
@@ -214,13 +314,15 @@ class BackupManager:
                 logger.error(f"❌ Backup no encontrado: {backup_filename}")
                 return False
             
-            # Crear backup de seguridad antes de restaurar
+            # Crear backup de seguridad antes de restaurar. Con la API de backup (y no copiando
+            # archivos) incluye las páginas confirmadas que aún están en el -wal
             safety_backup = self.db_path.parent / f"{self.db_path.stem}_before_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-            shutil.copy2(self.db_path, safety_backup)
+            self._sqlite_copy(self.db_path, safety_backup)
             logger.info(f"🔒 Backup de seguridad creado: {safety_backup.name}")
             
-            # Restaurar
-            shutil.copy2(backup_path, self.db_path)
+            # Restaurar a través de una conexión a la BD viva: SQLite reescribe las páginas
+            # respetando el -wal/-shm existentes en lugar de pisar el archivo principal
+            self._sqlite_copy(backup_path, self.db_path)
             logger.info(f"✅ Base de datos restaurada desde: {backup_filename}")
             
             return True
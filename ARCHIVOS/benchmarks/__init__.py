@@ -0,0 +1 @@
+# Benchmarks de rendimiento de DocuExpress (ejecutar con `python -m ARCHIVOS.benchmarks.<modulo>`)
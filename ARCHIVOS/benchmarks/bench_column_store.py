@@ -0,0 +1,123 @@
+"""
+Benchmark de las lecturas de analytics y gráficos: consultas SQL sobre el rollup contra las
+implementaciones vectorizadas de `column_store` (columnas NumPy ya cargadas en memoria).
+
+Siembra una BD SQLite temporal, mide cada camino y la carga en frío de las columnas (lo que
+paga la primera lectura tras una escritura).
+
+Uso:
+    python -m ARCHIVOS.benchmarks.bench_column_store --rows 50000 --papelerias 12 --renders 50
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from ARCHIVOS.benchmarks.bench_dashboard_snapshot import _seed
+
+
+def _make_config(tmp):
+    class BenchConfig:
+        TESTING = True
+        SECRET_KEY = 'bench'
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        DATABASE_PATH = os.path.join(tmp, 'bench.db')
+        RATELIMIT_ENABLED = False
+        CACHE_TYPE = 'SimpleCache'   # Las columnas se asocian a la versión de datos guardada en la caché
+        CACHE_WARMING_ENABLED = False
+
+        @staticmethod
+        def init_app(app):
+            pass
+
+    return BenchConfig
+
+
+def lecturas(user_id):
+    """Lo que leen `/api/analytics-avanzado` y `/api/dashboard-charts` de `tramites_diarios`."""
+    from ARCHIVOS.database import analytics_repository, papeleria_repository, tramite_repository
+    analytics_repository.get_mejor_mes_historico(user_id)
+    analytics_repository.get_dias_mas_productivos(user_id)
+    analytics_repository.get_margen_promedio(user_id)
+    analytics_repository.get_costo_promedio_tramite(user_id)
+    analytics_repository.get_roi_por_papeleria(user_id)
+    analytics_repository.get_rentabilidad_por_tramite(user_id)
+    papeleria_repository.get_top_by_ganancia(user_id)
+    tramite_repository.get_tramites_distribution(user_id)
+    tramite_repository.get_monthly_summary(user_id)
+
+
+def measure(app, enabled, user_id, renders):
+    """Devuelve (sentencias por render, media ms, p95 ms)."""
+    from ARCHIVOS import query_stats
+    from ARCHIVOS.models import db
+
+    app.config['COLUMN_STORE_ENABLED'] = enabled
+    lecturas(user_id)  # Calentamiento: caché de páginas, de sentencias y columnas cargadas
+    db.session.remove()
+    with query_stats.collect() as stats:
+        lecturas(user_id)
+    db.session.remove()
+
+    tiempos = []
+    for _ in range(renders):
+        inicio = time.perf_counter()
+        lecturas(user_id)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        db.session.remove()
+    tiempos.sort()
+    return stats.count, statistics.mean(tiempos), tiempos[int(len(tiempos) * 0.95) - 1]
+
+
+def measure_load(user_id, renders):
+    """Carga en frío de las columnas: (media ms, bytes)."""
+    from ARCHIVOS import column_store
+    from ARCHIVOS.models import db
+
+    tiempos = []
+    for _ in range(max(renders // 5, 3)):
+        column_store.clear()
+        inicio = time.perf_counter()
+        columnas = column_store.columns(user_id)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        db.session.remove()
+    return statistics.mean(tiempos), columnas.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000, help='Líneas de captura sembradas')
+    parser.add_argument('--papelerias', type=int, default=12, help='Papelerías del usuario')
+    parser.add_argument('--dias', type=int, default=730, help='Antigüedad máxima de los trámites')
+    parser.add_argument('--renders', type=int, default=50, help='Renders medidos por camino')
+    args = parser.parse_args()
+
+    from ARCHIVOS.app import create_app
+    from ARCHIVOS import column_store
+    from ARCHIVOS.models import db
+
+    if not column_store.NUMPY_AVAILABLE:
+        raise SystemExit('numpy no está instalado: pip install numpy')
+
+    random.seed(24)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(config_class=_make_config(tmp))
+        with app.app_context():
+            _seed(1, args.rows, args.papelerias, args.dias)
+            resultados = [
+                ('SQL (rollup)',) + measure(app, False, 1, args.renders),
+                ('column_store',) + measure(app, True, 1, args.renders),
+            ]
+            carga_ms, nbytes = measure_load(1, args.renders)
+            db.engine.dispose()
+
+    print(f"{'Camino':<24}{'consultas':>10}{'media ms':>12}{'p95 ms':>10}")
+    for nombre, consultas, media, p95 in resultados:
+        print(f"{nombre:<24}{consultas:>10}{media:>12.2f}{p95:>10.2f}")
+    print(f"Carga en frío de las columnas: {carga_ms:.2f} ms ({nbytes / 1024:.1f} KB)")
+
+
+if __name__ == '__main__':
+    main()
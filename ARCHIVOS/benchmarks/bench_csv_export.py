@@ -0,0 +1,112 @@
+"""
+Benchmark de memoria de la exportación CSV: lista completa + StringIO + BytesIO (como
+hacía `exportar_csv_general`) contra el streaming con `yield_per` de `csv_export`.
+
+Mide el pico de memoria Python (tracemalloc) y el tiempo de cada camino para varios
+tamaños de historial; el camino en streaming debe mantenerse plano.
+
+Uso:
+    python -m ARCHIVOS.benchmarks.bench_csv_export --rows 10000 100000 --gzip
+"""
+import argparse
+import io
+import csv
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from ARCHIVOS.benchmarks.bench_dashboard_snapshot import _make_config
+
+HEADER = ['Papelería', 'Trámite', 'Fecha', 'Cantidad', 'Precio', 'Costo', 'Ganancia']
+
+
+def _seed(user_id, rows):
+    from ARCHIVOS.models import db, User, Papeleria, Tramite
+    from ARCHIVOS.database import tramite_repository
+
+    if db.session.get(User, user_id) is None:
+        user = User(id=user_id, username='bench', role='admin')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.add(Papeleria(id=1, nombre='PAPELERÍA BENCH', user_id=user_id))
+        db.session.commit()
+
+    faltan = rows - Tramite.query.filter_by(user_id=user_id).count()
+    hoy = date.today()
+    for inicio in range(0, faltan, 5000):
+        tramite_repository.add_many(user_id, [{
+            'papeleria_id': 1,
+            'tramite': f'TRÁMITE {random.randint(1, 30)}',
+            'fecha': hoy - timedelta(days=random.randint(0, 1500)),
+            'precio': 50.0, 'costo': 15.0, 'cantidad': random.randint(1, 3),
+        } for _ in range(min(5000, faltan - inicio))])
+
+
+def _row(row):
+    return [row.papeleria, row.tramite, row.fecha.strftime('%Y-%m-%d'), row.cantidad, row.precio, row.costo, row.ganancia]
+
+
+def legacy_export(user_id, gzip=False):
+    """Lo que hacía la ruta antes: `.all()`, StringIO completo y copia a BytesIO."""
+    from ARCHIVOS.database import tramite_repository
+    data = list(tramite_repository.export_all_as_csv(user_id))
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(HEADER)
+    for row in data:
+        writer.writerow(_row(row))
+    output.seek(0)
+    return len(io.BytesIO(output.read().encode('utf-8')).getvalue())
+
+
+def streaming_export(user_id, gzip=False):
+    from ARCHIVOS import csv_export
+    from ARCHIVOS.database import tramite_repository
+    chunks = csv_export.csv_chunks(HEADER, (_row(r) for r in tramite_repository.export_all_as_csv(user_id)))
+    if gzip:
+        chunks = csv_export.gzip_chunks(chunks)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def measure(fn, user_id, gzip):
+    """Devuelve (bytes generados, pico MB, segundos)."""
+    from ARCHIVOS.models import db
+    db.session.remove()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    total = fn(user_id, gzip)
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.remove()
+    return total, pico / 1024 / 1024, segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='Tamaños de historial a medir')
+    parser.add_argument('--gzip', action='store_true', help='Comprimir la salida en streaming')
+    args = parser.parse_args()
+
+    from ARCHIVOS.app import create_app
+    from ARCHIVOS.models import db
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(config_class=_make_config(tmp))
+        with app.app_context():
+            for rows in sorted(args.rows):
+                _seed(1, rows)
+                for nombre, fn in (('lista + StringIO', legacy_export), ('streaming', streaming_export)):
+                    resultados.append((rows, nombre) + measure(fn, 1, args.gzip and fn is streaming_export))
+            db.engine.dispose()
+
+    print(f"{'Filas':>9}  {'Camino':<18}{'bytes':>12}{'pico MB':>10}{'seg':>8}")
+    for rows, nombre, total, pico, segundos in resultados:
+        print(f"{rows:>9}  {nombre:<18}{total:>12}{pico:>10.1f}{segundos:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark del contexto del dashboard: llamadas individuales a los repositorios
+(como hacía `_get_dashboard_context`) contra `DashboardSnapshot.for_user`.
+
+Siembra una BD SQLite temporal con trámites y gastos repartidos en varios meses,
+cuenta las sentencias SQL por render y mide la latencia de cada camino.
+
+Uso:
+    python -m ARCHIVOS.benchmarks.bench_dashboard_snapshot --rows 50000 --papelerias 12 --renders 50
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+
+def _make_config(tmp):
+    class BenchConfig:
+        TESTING = True
+        SECRET_KEY = 'bench'
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        DATABASE_PATH = os.path.join(tmp, 'bench.db')
+        RATELIMIT_ENABLED = False
+        CACHE_TYPE = 'NullCache'
+
+        @staticmethod
+        def init_app(app):
+            pass
+
+    return BenchConfig
+
+
+def _seed(user_id, rows, papelerias, dias):
+    from ARCHIVOS.models import db, User, Papeleria
+    from ARCHIVOS.database import tramite_repository, gasto_repository, proveedor_repository
+
+    user = User(id=user_id, username='bench', role='admin')
+    user.set_password('bench')
+    db.session.add(user)
+    for i in range(1, papelerias + 1):
+        db.session.add(Papeleria(id=i, nombre=f'PAPELERIA {i:02d}', user_id=user_id, is_active=i % 6 != 0))
+    db.session.commit()
+
+    hoy = date.today()
+    filas = [{
+        'papeleria_id': random.randint(1, papelerias),
+        'tramite': f'TRAMITE {random.randint(1, 30)}',
+        'fecha': hoy - timedelta(days=random.randint(0, dias)),
+        'precio': float(random.choice((30, 45, 50, 80, 120))),
+        'costo': float(random.choice((0, 10, 15, 20))),
+        'cantidad': random.randint(1, 3),
+    } for _ in range(rows)]
+    for inicio in range(0, rows, 5000):
+        tramite_repository.add_many(user_id, filas[inicio:inicio + 5000])
+
+    proveedor = proveedor_repository.add('PROVEEDOR BENCH', user_id)
+    for i in range(200):
+        gasto_repository.add(proveedor.id, f'Gasto {i}', float(random.randint(50, 500)),
+                             (hoy - timedelta(days=random.randint(0, dias))).strftime('%Y-%m-%d'),
+                             random.choice(('RENTA', 'SERVICIOS', 'INSUMOS')), user_id)
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+def legacy_context(user_id):
+    """Las llamadas que hacía `_get_dashboard_context` antes del snapshot."""
+    from ARCHIVOS.database import papeleria_repository, tramite_repository, gasto_repository, analytics_repository
+    papeleria_repository.get_papelerias_and_totals_for_user(user_id)
+    papeleria_repository.get_totales_comparativa(user_id)
+    tramite_repository.get_tramites_comparativa(user_id)
+    analytics_repository.get_meta_mensual_progress(user_id)
+    analytics_repository.get_mejor_mes_historico(user_id)
+    analytics_repository.get_dias_mas_productivos(user_id)
+    analytics_repository.get_margen_promedio(user_id)
+    analytics_repository.get_rentabilidad_por_tramite(user_id)
+    gasto_repository.get_total_gastos(user_id)
+
+
+def snapshot_context(user_id):
+    from ARCHIVOS.dashboard_snapshot import DashboardSnapshot
+    DashboardSnapshot.for_user(user_id).as_context()
+
+
+def measure(fn, user_id, renders):
+    """Devuelve (sentencias por render, media ms, p95 ms)."""
+    from ARCHIVOS import query_stats
+    from ARCHIVOS.models import db
+
+    fn(user_id)  # Calentamiento: caché de páginas y de sentencias
+    db.session.remove()
+    with query_stats.collect() as stats:
+        fn(user_id)
+    db.session.remove()
+
+    tiempos = []
+    for _ in range(renders):
+        inicio = time.perf_counter()
+        fn(user_id)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        db.session.remove()
+    tiempos.sort()
+    return stats.count, statistics.mean(tiempos), tiempos[int(len(tiempos) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000, help='Líneas de captura sembradas')
+    parser.add_argument('--papelerias', type=int, default=12, help='Papelerías del usuario')
+    parser.add_argument('--dias', type=int, default=730, help='Antigüedad máxima de los trámites')
+    parser.add_argument('--renders', type=int, default=50, help='Renders medidos por camino')
+    args = parser.parse_args()
+
+    from ARCHIVOS.app import create_app
+    from ARCHIVOS.models import db
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(config_class=_make_config(tmp))
+        with app.app_context():
+            _seed(1, args.rows, args.papelerias, args.dias)
+            resultados = [
+                ('repositorios (legacy)',) + measure(legacy_context, 1, args.renders),
+                ('DashboardSnapshot',) + measure(snapshot_context, 1, args.renders),
+            ]
+            db.engine.dispose()
+
+    print(f"{'Camino':<24}{'consultas':>10}{'media ms':>12}{'p95 ms':>10}")
+    for nombre, consultas, media, p95 in resultados:
+        print(f"{nombre:<24}{consultas:>10}{media:>12.2f}{p95:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
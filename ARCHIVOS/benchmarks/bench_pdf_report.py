@@ -0,0 +1,115 @@
+"""
+Benchmark del reporte PDF de papelería: el constructor anterior (objetos ORM con `.all()`,
+un `Paragraph` por celda, una sola tabla con `setStyle` por fila y el encabezado
+reconstruido en cada página) contra `pdf_generator.escribir_pdf`.
+
+Mide el tiempo, el pico de memoria Python (tracemalloc) y el tamaño del PDF. El tiempo
+se toma en una pasada sin tracemalloc (que lo multiplica) y la memoria en otra. El
+constructor anterior crece de forma casi cuadrática al partir una tabla gigante entre
+páginas, así que solo se mide hasta `--legacy-max` filas.
+
+Uso:
+    python -m ARCHIVOS.benchmarks.bench_pdf_report --rows 10000 100000 500000
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from ARCHIVOS.benchmarks.bench_dashboard_snapshot import _make_config
+from ARCHIVOS.benchmarks.bench_csv_export import _seed
+
+
+def legacy_pdf(user_id, output):
+    """Reproduce el constructor anterior a los reportes por trozos."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle
+    from ARCHIVOS.database import tramite_repository
+    from ARCHIVOS.models import Tramite
+
+    datos = tramite_repository._details_query(1, user_id).order_by(Tramite.fecha.desc(), Tramite.id.desc()).all()
+
+    def header_footer(canvas, doc):
+        canvas.saveState()
+        styles = getSampleStyleSheet()
+        titulo = Paragraph("<b>DOCUEXPRESS</b>", styles['Heading1'])
+        w, h = titulo.wrapOn(canvas, doc.width, doc.topMargin)
+        titulo.drawOn(canvas, doc.leftMargin, doc.height + doc.topMargin - h)
+        canvas.drawRightString(doc.width + doc.leftMargin, 10 * mm, f"Página {doc.page}")
+        canvas.restoreState()
+
+    styles = getSampleStyleSheet()
+    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=20*mm, leftMargin=20*mm, topMargin=40*mm, bottomMargin=20*mm)
+    data = [["Fecha", "Trámite", "Cant.", "Importe"]]
+    for r in datos:
+        data.append([r.fecha.strftime('%Y-%m-%d'), Paragraph(r.tramite, styles['BodyText']), str(r.cantidad), f"${r.precio * r.cantidad:.2f}"])
+    t = Table(data, colWidths=[30*mm, None, 15*mm, 30*mm], repeatRows=1)
+    t.setStyle(TableStyle([('BACKGROUND', (0,1), (-1,-1), colors.HexColor('#ecf0f1')),
+                           ('GRID', (0,0), (-1,-1), 1, colors.HexColor('#bdc3c7'))]))
+    for i in range(0, len(datos), 2):
+        t.setStyle(TableStyle([('BACKGROUND', (0, i+1), (-1, i+1), colors.white)]))
+    doc.build([t], onFirstPage=header_footer, onLaterPages=header_footer)
+
+
+def streaming_pdf(user_id, output):
+    from ARCHIVOS import pdf_generator
+    from ARCHIVOS.database import papeleria_repository, tramite_repository
+    reporte = pdf_generator.preparar_reporte(papeleria_repository, tramite_repository, 1, user_id)
+    pdf_generator.escribir_pdf(reporte, output)
+
+
+def _ejecutar(fn, user_id):
+    """Escribe el PDF en un temporal; devuelve sus bytes."""
+    from ARCHIVOS.models import db
+    db.session.remove()
+    with tempfile.TemporaryFile() as output:
+        fn(user_id, output)
+        total = output.tell()
+    db.session.remove()
+    return total
+
+
+def measure(fn, user_id):
+    """Devuelve (bytes del PDF, pico MB, segundos): el tiempo sin tracemalloc, el pico con él."""
+    inicio = time.perf_counter()
+    total = _ejecutar(fn, user_id)
+    segundos = time.perf_counter() - inicio
+    tracemalloc.start()
+    _ejecutar(fn, user_id)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return total, pico / 1024 / 1024, segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 500000], help='Tamaños de historial a medir')
+    parser.add_argument('--legacy-max', type=int, default=10000, help='Máximo de filas para el constructor anterior')
+    args = parser.parse_args()
+
+    from ARCHIVOS.app import create_app
+    from ARCHIVOS.models import db
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(config_class=_make_config(tmp))
+        with app.app_context():
+            for rows in sorted(args.rows):
+                _seed(1, rows)
+                caminos = [('por trozos', streaming_pdf)]
+                if rows <= args.legacy_max:
+                    caminos.insert(0, ('anterior', legacy_pdf))
+                for nombre, fn in caminos:
+                    resultados.append((rows, nombre) + measure(fn, 1))
+            db.engine.dispose()
+
+    print(f"{'Filas':>9}  {'Camino':<12}{'bytes':>12}{'pico MB':>10}{'seg':>9}")
+    for rows, nombre, total, pico, segundos in resultados:
+        print(f"{rows:>9}  {nombre:<12}{total:>12}{pico:>10.1f}{segundos:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark de concurrencia lectores/escritor sobre SQLite.
+
+Simula la carga de los workers de gunicorn: varios procesos lectores ejecutan el
+agregado del dashboard mientras un proceso escritor registra trámites en transacciones
+cortas. Compara el perfil anterior (journal DELETE, synchronous FULL) con el perfil
+afinado de `sqlite_profile` (WAL, synchronous NORMAL, mmap, cache_size).
+
+Uso:
+    python -m ARCHIVOS.benchmarks.bench_sqlite_concurrency --readers 3 --seconds 5 --rows 50000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+from ARCHIVOS.sqlite_profile import LEGACY_PROFILE, DEFAULTS, apply_pragmas
+
+SCHEMA = """
+CREATE TABLE tramites (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    papeleria_id INTEGER NOT NULL,
+    tramite VARCHAR NOT NULL,
+    fecha DATE NOT NULL,
+    precio FLOAT NOT NULL,
+    costo FLOAT NOT NULL,
+    timestamp DATETIME
+);
+CREATE INDEX idx_tramites_user_fecha ON tramites (user_id, fecha);
+"""
+
+READ_SQL = (
+    "SELECT papeleria_id, COUNT(id), SUM(precio), SUM(costo) FROM tramites "
+    "WHERE user_id = ? AND fecha >= ? GROUP BY papeleria_id"
+)
+WRITE_SQL = (
+    "INSERT INTO tramites (user_id, papeleria_id, tramite, fecha, precio, costo, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)"
+)
+
+
+def _connect(path, profile):
+    conn = sqlite3.connect(
+        path,
+        timeout=profile['SQLITE_BUSY_TIMEOUT'] / 1000,
+        cached_statements=profile['SQLITE_STATEMENT_CACHE_SIZE'],
+    )
+    apply_pragmas(conn, profile)
+    return conn
+
+
+def _seed(path, rows):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    hoy = date.today()
+    data = [
+        (random.randint(1, 3), random.randint(1, 20), f"TRAMITE {random.randint(1, 30)}",
+         (hoy - timedelta(days=random.randint(0, 720))).isoformat(), 50.0, 20.0)
+        for _ in range(rows)
+    ]
+    conn.executemany(
+        "INSERT INTO tramites (user_id, papeleria_id, tramite, fecha, precio, costo) VALUES (?, ?, ?, ?, ?, ?)",
+        data,
+    )
+    conn.commit()
+    conn.close()
+
+
+def _reader(path, profile, stop_at, counter, busy):
+    conn = _connect(path, profile)
+    desde = (date.today() - timedelta(days=90)).isoformat()
+    done = 0
+    while time.time() < stop_at:
+        try:
+            conn.execute(READ_SQL, (random.randint(1, 3), desde)).fetchall()
+            done += 1
+        except sqlite3.OperationalError:
+            with busy.get_lock():
+                busy.value += 1
+    with counter.get_lock():
+        counter.value += done
+    conn.close()
+
+
+def _writer(path, profile, stop_at, counter, busy):
+    conn = _connect(path, profile)
+    hoy = date.today().isoformat()
+    done = 0
+    while time.time() < stop_at:
+        try:
+            conn.execute(WRITE_SQL, (1, 1, 'ACTA DE NACIMIENTO', hoy, 50.0, 20.0))
+            conn.commit()
+            done += 1
+        except sqlite3.OperationalError:
+            conn.rollback()
+            with busy.get_lock():
+                busy.value += 1
+    with counter.get_lock():
+        counter.value += done
+    conn.close()
+
+
+def run_profile(name, profile, readers, seconds, rows):
+    """Ejecuta la carga con un perfil y devuelve lecturas/s, escrituras/s y errores BUSY."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        _seed(path, rows)
+        # El modo de journal es persistente: fijarlo antes de lanzar los procesos
+        _connect(path, profile).close()
+
+        reads, writes, busy = mp.Value('i', 0), mp.Value('i', 0), mp.Value('i', 0)
+        stop_at = time.time() + seconds
+        procs = [mp.Process(target=_reader, args=(path, profile, stop_at, reads, busy)) for _ in range(readers)]
+        procs.append(mp.Process(target=_writer, args=(path, profile, stop_at, writes, busy)))
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+    return {
+        'perfil': name,
+        'lecturas_s': reads.value / seconds,
+        'escrituras_s': writes.value / seconds,
+        'busy': busy.value,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=3, help='Procesos lectores (workers de gunicorn)')
+    parser.add_argument('--seconds', type=float, default=5, help='Duración de cada corrida')
+    parser.add_argument('--rows', type=int, default=50000, help='Trámites sembrados antes de medir')
+    args = parser.parse_args()
+
+    resultados = [
+        run_profile('legacy (DELETE/FULL)', LEGACY_PROFILE, args.readers, args.seconds, args.rows),
+        run_profile('afinado (WAL/NORMAL)', DEFAULTS, args.readers, args.seconds, args.rows),
+    ]
+
+    print(f"{'Perfil':<24}{'lecturas/s':>14}{'escrituras/s':>16}{'BUSY':>8}")
+    for r in resultados:
+        print(f"{r['perfil']:<24}{r['lecturas_s']:>14.1f}{r['escrituras_s']:>16.1f}{r['busy']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark de memoria de la exportación a Excel: libro normal de openpyxl con todas las
+filas en memoria contra el modo write-only por lotes de `xlsx_export`.
+
+Mide el pico de memoria Python (tracemalloc), el tiempo y el tamaño del archivo para
+varios tamaños de historial; el camino write-only debe mantenerse casi plano.
+
+Uso:
+    python -m ARCHIVOS.benchmarks.bench_xlsx_export --rows 10000 100000
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from ARCHIVOS.benchmarks.bench_csv_export import _seed
+from ARCHIVOS.benchmarks.bench_dashboard_snapshot import _make_config
+
+
+def legacy_export(user_id, output):
+    """Workbook normal: `.all()` y una hoja con toda la cuadrícula en memoria hasta guardar."""
+    from openpyxl import Workbook
+    from ARCHIVOS.database import tramite_repository
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Papelería', 'Trámite', 'Fecha', 'Cantidad', 'Precio', 'Costo', 'Ganancia'])
+    for r in list(tramite_repository.export_all_as_csv(user_id)):
+        ws.append([r.papeleria, r.tramite, r.fecha, r.cantidad, r.precio, r.costo, r.ganancia])
+    wb.save(output)
+
+
+def write_only_export(user_id, output):
+    from ARCHIVOS import xlsx_export
+    xlsx_export.escribir_tramites(output, user_id)
+
+
+def measure(fn, user_id):
+    """Devuelve (bytes del archivo, pico MB, segundos)."""
+    from ARCHIVOS.models import db
+    db.session.remove()
+    with tempfile.TemporaryFile() as output:
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        fn(user_id, output)
+        segundos = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        total = output.tell()
+    db.session.remove()
+    return total, pico / 1024 / 1024, segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='Tamaños de historial a medir')
+    args = parser.parse_args()
+
+    from ARCHIVOS.app import create_app
+    from ARCHIVOS.models import db
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(config_class=_make_config(tmp))
+        with app.app_context():
+            for rows in sorted(args.rows):
+                _seed(1, rows)
+                for nombre, fn in (('workbook normal', legacy_export), ('write-only', write_only_export)):
+                    resultados.append((rows, nombre) + measure(fn, 1))
+            db.engine.dispose()
+
+    print(f"{'Filas':>9}  {'Camino':<18}{'bytes':>12}{'pico MB':>10}{'seg':>8}")
+    for rows, nombre, total, pico, segundos in resultados:
+        print(f"{rows:>9}  {nombre:<18}{total:>12}{pico:>10.1f}{segundos:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
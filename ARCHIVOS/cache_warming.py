@@ -0,0 +1,227 @@
+"""
+Precalentamiento de la caché del dashboard después de escribir y al arrancar.
+
+Después de `bump_user_data_version` la siguiente vista del dashboard paga el cálculo
+completo en frío, y cuando el scheduler de backups reinicia los workers todas las cachés
+arrancan vacías. Aquí esos cálculos se adelantan en segundo plano:
+
+- Tras una escritura confirmada que toca los dominios del dashboard, `enqueue(user_id)`
+  recalcula los totales y gráficos de ese usuario para los rangos que se abren sin
+  filtro (`default_ranges`). Varias escrituras seguidas del mismo usuario se juntan
+  en un solo recálculo, que lee la versión más reciente al empezar.
+- Al arrancar, `warm_hot_tenants(app)` hace lo mismo para los usuarios más activos según
+  `CACHE_WARMING_HOT_FILE`, un JSON `{user_id: {"hits": n, "ultimo": epoch}}` que cada
+  worker actualiza con `record_activity` (se vuelca cada `CACHE_WARMING_FLUSH_INTERVAL`
+  segundos y al salir; entre workers gana el último en escribir, basta como ranking).
+
+El trabajo corre en un pool de `CACHE_WARMING_WORKERS` hilos y se descarta, no se
+encola, si ya hay `CACHE_WARMING_MAX_PENDING` usuarios pendientes o la carga del
+sistema por CPU pasa de `CACHE_WARMING_MAX_LOAD`: precalentar nunca debe competir con
+las peticiones. Los valores se guardan con las mismas claves que `api_routes`
+(`single_flight.cached`), así que un precalentamiento y una petición simultáneos
+calculan una sola vez.
+
+Con `CACHE_WARMING_EXECUTOR = 'inline'` el recálculo corre en el hilo que lo pide (tests).
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+from flask import current_app
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'CACHE_WARMING_ENABLED': True,
+    'CACHE_WARMING_EXECUTOR': 'thread',    # 'thread' | 'inline'
+    'CACHE_WARMING_WORKERS': 1,            # Hilos de precalentamiento por worker de gunicorn
+    'CACHE_WARMING_MAX_PENDING': 16,       # Usuarios pendientes a partir de los cuales se descarta
+    'CACHE_WARMING_MAX_LOAD': 0.75,        # Carga (1 min) por CPU a partir de la cual se descarta
+    'CACHE_WARMING_HOT_FILE': None,        # JSON de usuarios activos; None = no se persiste
+    'CACHE_WARMING_HOT_USERS': 20,         # Usuarios que se precalientan al arrancar
+    'CACHE_WARMING_HOT_MAX_AGE': 7 * 24 * 3600,  # Usuarios sin actividad en este tiempo no cuentan
+    'CACHE_WARMING_FLUSH_INTERVAL': 60,    # Segundos entre volcados del archivo
+}
+
+_pendientes = set()
+_lock = threading.Lock()
+_executor = None
+_actividad = Counter()        # Usuario -> vistas/escrituras desde el último volcado
+_ultimo_volcado = time.monotonic()
+
+
+def init_app(app):
+    """Completa la configuración del precalentamiento con `DEFAULTS`."""
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, default)
+    if app.config['CACHE_WARMING_HOT_FILE']:
+        atexit.register(flush_activity, app)
+
+
+def default_ranges(hoy=None):
+    """
+    Rangos que pide el dashboard al abrirse: sin filtro, el mes en curso y los últimos 30
+    días (el valor inicial del selector de fechas de `index.html`).
+    """
+    hoy = hoy or date.today()
+    return [
+        (None, None),
+        (hoy.replace(day=1).isoformat(), hoy.isoformat()),
+        ((hoy - timedelta(days=30)).isoformat(), hoy.isoformat()),
+    ]
+
+
+def enqueue(user_id, domains=None):
+    """
+    Encola el precalentamiento de `user_id` si la escritura tocó datos del dashboard.
+    Retorna True si quedó encolado (o ya lo estaba).
+    """
+    from .dashboard_snapshot import DATA_DOMAINS
+
+    app = current_app._get_current_object()
+    if not app.config.get('CACHE_WARMING_ENABLED', True) or user_id is None:
+        return False
+    if domains and not set(domains) & set(DATA_DOMAINS):
+        return False
+    record_activity(user_id)
+    return _submit(app, user_id)
+
+
+def warm_hot_tenants(app):
+    """Encola el precalentamiento de los usuarios más activos (al arrancar el worker)."""
+    if not app.config.get('CACHE_WARMING_ENABLED', True):
+        return []
+    usuarios = hot_tenants(app)
+    encolados = [user_id for user_id in usuarios if _submit(app, user_id)]
+    if encolados:
+        logging.info(f"🔥 Precalentando la caché de {len(encolados)} usuarios activos")
+    return encolados
+
+
+def hot_tenants(app):
+    """Usuarios activos recientemente, del más al menos activo (según el archivo persistido)."""
+    datos = _leer(app.config.get('CACHE_WARMING_HOT_FILE'))
+    limite = time.time() - app.config.get('CACHE_WARMING_HOT_MAX_AGE', DEFAULTS['CACHE_WARMING_HOT_MAX_AGE'])
+    activos = [(uid, d['hits']) for uid, d in datos.items() if d.get('ultimo', 0) >= limite]
+    activos.sort(key=lambda par: par[1], reverse=True)
+    return [int(uid) for uid, _ in activos[:app.config.get('CACHE_WARMING_HOT_USERS', DEFAULTS['CACHE_WARMING_HOT_USERS'])]]
+
+
+def record_activity(user_id):
+    """Cuenta una vista o escritura de `user_id` para el ranking de usuarios activos."""
+    app = current_app._get_current_object()
+    if not app.config.get('CACHE_WARMING_HOT_FILE') or user_id is None:
+        return
+    with _lock:
+        _actividad[str(user_id)] += 1
+        volcar = time.monotonic() - _ultimo_volcado >= app.config.get(
+            'CACHE_WARMING_FLUSH_INTERVAL', DEFAULTS['CACHE_WARMING_FLUSH_INTERVAL'])
+    if volcar:
+        flush_activity(app)
+
+
+def flush_activity(app):
+    """Suma la actividad acumulada en este worker al archivo de usuarios activos."""
+    global _ultimo_volcado
+    ruta = app.config.get('CACHE_WARMING_HOT_FILE')
+    with _lock:
+        actividad = dict(_actividad)
+        _actividad.clear()
+        _ultimo_volcado = time.monotonic()
+    if not ruta or not actividad:
+        return
+    ahora = time.time()
+    limite = ahora - app.config.get('CACHE_WARMING_HOT_MAX_AGE', DEFAULTS['CACHE_WARMING_HOT_MAX_AGE'])
+    datos = {uid: d for uid, d in _leer(ruta).items() if d.get('ultimo', 0) >= limite}
+    for uid, hits in actividad.items():
+        datos[uid] = {'hits': datos.get(uid, {}).get('hits', 0) + hits, 'ultimo': ahora}
+    ruta = Path(ruta)
+    try:
+        # Archivo temporal + rename: otro worker nunca lee un JSON a medias
+        with tempfile.NamedTemporaryFile('w', dir=ruta.parent, suffix='.tmp', delete=False) as tmp:
+            json.dump(datos, tmp)
+        os.replace(tmp.name, ruta)
+    except OSError as e:
+        logging.warning(f"[WARMING] No se pudo guardar {ruta}: {e}")
+
+
+def under_load(app):
+    """True si el precalentamiento debe descartarse (cola llena o CPU ocupada)."""
+    with _lock:
+        if len(_pendientes) >= app.config.get('CACHE_WARMING_MAX_PENDING', DEFAULTS['CACHE_WARMING_MAX_PENDING']):
+            return True
+    try:
+        carga = os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):  # Windows
+        return False
+    return carga > app.config.get('CACHE_WARMING_MAX_LOAD', DEFAULTS['CACHE_WARMING_MAX_LOAD'])
+
+
+def warm_user(user_id, hoy=None):
+    """Calcula (o encuentra ya en caché) los totales y gráficos por defecto de `user_id`."""
+    from .routes.api_routes import cached_charts, cached_totals
+    from .utils import get_user_data_version
+    from .dashboard_snapshot import DATA_DOMAINS
+
+    # Sin caché no hay dónde dejar el resultado
+    if get_user_data_version(user_id, *DATA_DOMAINS) is None:
+        return False
+    for fecha_inicio, fecha_fin in default_ranges(hoy):
+        # Si hay un valor anterior servible, single_flight lo recalcula en su propio pool
+        cached_totals(user_id, fecha_inicio, fecha_fin)
+        cached_charts(user_id, fecha_inicio, fecha_fin)
+    return True
+
+
+def _submit(app, user_id):
+    with _lock:
+        if user_id in _pendientes:
+            return True
+    if under_load(app):
+        logging.debug(f"[WARMING] Descartado user={user_id}: sistema ocupado")
+        return False
+    with _lock:
+        _pendientes.add(user_id)
+
+    def _tarea():
+        # Se quita de pendientes antes de calcular: una escritura posterior vuelve a encolar
+        with _lock:
+            _pendientes.discard(user_id)
+        with app.app_context():
+            try:
+                inicio = time.time()
+                if warm_user(user_id):
+                    logging.debug(f"[WARMING] user={user_id} en {(time.time() - inicio) * 1000:.0f}ms")
+            except Exception as e:
+                logging.error(f"[WARMING] Error precalentando user={user_id}: {e}")
+
+    if app.config.get('CACHE_WARMING_EXECUTOR', DEFAULTS['CACHE_WARMING_EXECUTOR']) == 'inline':
+        _tarea()
+        return True
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get('CACHE_WARMING_WORKERS', DEFAULTS['CACHE_WARMING_WORKERS']),
+            thread_name_prefix='cache-warming')
+        atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+    _executor.submit(_tarea)
+    return True
+
+
+def _leer(ruta):
+    if not ruta:
+        return {}
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            datos = json.load(f)
+        return datos if isinstance(datos, dict) else {}
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,304 @@
+"""
+Almacén columnar en memoria del rollup de trámites por usuario, para analytics vectorizados.
+
+El dashboard y `/api/analytics-avanzado` agregan el mismo `tramites_diarios` de muchas
+formas (mejor mes, día de la semana, margen, ROI, rentabilidad, top de papelerías,
+distribución, resumen mensual) y cada una es una consulta a SQLite. `columns(user_id)`
+carga una vez las filas del rollup del usuario como arreglos NumPy ordenados por fecha:
+
+    fecha (días desde 1970-01-01), periodo (AAAAMM), papelería, código de trámite,
+    cuantos, ingresos y costos
+
+y los métodos de `Columnas` calculan cada agregado con `bincount` sobre esos arreglos, con
+el mismo resultado que las consultas de `database.py` (que siguen siendo la referencia y el
+camino sin NumPy).
+
+La carga se asocia a la versión de datos `tramites` + `papelerias` del usuario (ver
+`utils.get_user_data_version`): cuando otra escritura la cambia, la siguiente lectura vuelve a
+cargar. Sin caché configurada no hay versión y siempre se usa SQL. Los usuarios cargados se
+guardan en un LRU acotado por `COLUMN_STORE_MAX_BYTES` (suma de los arreglos).
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import Integer, cast, func, select
+
+from .models import db, Papeleria, TramiteDiario, periodo_label
+
+# NumPy es opcional: sin él los repositorios consultan SQLite como siempre
+NUMPY_AVAILABLE = False
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'COLUMN_STORE_ENABLED': True,
+    'COLUMN_STORE_MAX_BYTES': 64 * 1024 * 1024,   # Tope del LRU por worker
+}
+
+_JULIANO_1970 = 2440587.5   # julianday('1970-01-01')
+
+# Dominios de datos que cambian el contenido de las columnas
+DOMINIOS = ('tramites', 'papelerias')
+
+_almacen = OrderedDict()   # user_id -> Columnas, del menos al más reciente
+_bytes = 0
+_lock = threading.Lock()
+
+
+def init_app(app):
+    """Completa la configuración del almacén columnar con `DEFAULTS`."""
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, default)
+
+
+def enabled():
+    """True si NumPy está instalado y el almacén no está desactivado."""
+    return NUMPY_AVAILABLE and current_app.config.get('COLUMN_STORE_ENABLED', DEFAULTS['COLUMN_STORE_ENABLED'])
+
+
+def columns(user_id):
+    """
+    Columnas del rollup de `user_id` en la versión actual de sus datos, o None si hay que
+    usar SQL (sin NumPy, desactivado o sin caché de versiones).
+    """
+    global _bytes
+    if not enabled():
+        return None
+    from .utils import get_user_data_version
+    version = get_user_data_version(user_id, *DOMINIOS)
+    if version is None:
+        return None
+
+    with _lock:
+        columnas = _almacen.get(user_id)
+        if columnas is not None and columnas.version == version:
+            _almacen.move_to_end(user_id)
+            return columnas
+
+    # La versión se leyó antes de consultar: los datos son al menos tan nuevos como ella
+    columnas = Columnas.cargar(user_id, version)
+    limite = current_app.config.get('COLUMN_STORE_MAX_BYTES', DEFAULTS['COLUMN_STORE_MAX_BYTES'])
+    with _lock:
+        anterior = _almacen.pop(user_id, None)
+        if anterior is not None:
+            _bytes -= anterior.nbytes
+        if columnas.nbytes <= limite:
+            _almacen[user_id] = columnas
+            _bytes += columnas.nbytes
+        while _bytes > limite:
+            _, expulsada = _almacen.popitem(last=False)
+            _bytes -= expulsada.nbytes
+    return columnas
+
+
+def stats():
+    """Usuarios y bytes en memoria en este worker."""
+    with _lock:
+        return {'usuarios': len(_almacen), 'bytes': _bytes}
+
+
+def clear():
+    """Vacía el almacén de este worker."""
+    global _bytes
+    with _lock:
+        _almacen.clear()
+        _bytes = 0
+
+
+def dias(fecha):
+    """Fecha (date, datetime o 'AAAA-MM-DD') como días desde 1970-01-01."""
+    if isinstance(fecha, datetime):
+        fecha = fecha.date()
+    elif not isinstance(fecha, date):
+        fecha = datetime.strptime(str(fecha)[:10], '%Y-%m-%d').date()
+    return (fecha - date(1970, 1, 1)).days
+
+
+class Columnas:
+    """Rollup de trámites de un usuario: una posición por fila de `tramites_diarios`, ordenadas por fecha."""
+
+    def __init__(self, version, fecha, periodo, papeleria, tramite, cuantos, ingresos, costos,
+                 tramites, papelerias):
+        self.version = version
+        self.cargado = time.time()
+        self.fecha = fecha
+        self.periodo = periodo
+        self.papeleria = papeleria     # Posición en `papelerias`
+        self.tramite = tramite         # Posición en `tramites`
+        self.cuantos = cuantos
+        self.ingresos = ingresos
+        self.costos = costos
+        self.tramites = tramites       # Nombres de trámite, ordenados
+        self.papelerias = papelerias   # [(id, nombre, is_active)], ordenadas por id
+        self.activa = np.array([p[2] for p in papelerias], dtype=bool)
+        self.nbytes = sum(a.nbytes for a in (fecha, periodo, papeleria, tramite, cuantos, ingresos, costos))
+
+    @classmethod
+    def cargar(cls, user_id, version):
+        """Lee el rollup y las papelerías de `user_id` (dos consultas por índice)."""
+        inicio = time.time()
+        papelerias = db.session.execute(
+            select(Papeleria.id, Papeleria.nombre, Papeleria.is_active)
+            .where(Papeleria.user_id == user_id).order_by(Papeleria.id)
+        ).all()
+        # Core y días calculados por SQLite: sin objetos date ni filas ORM por cada registro
+        filas = db.session.connection().execute(
+            select(cast(func.julianday(TramiteDiario.fecha) - _JULIANO_1970, Integer),
+                   TramiteDiario.periodo, TramiteDiario.papeleria_id, TramiteDiario.tramite,
+                   TramiteDiario.cuantos, TramiteDiario.total_ingresos, TramiteDiario.total_costos)
+            .where(TramiteDiario.user_id == user_id).order_by(TramiteDiario.fecha)
+        ).all()
+
+        fecha, periodo, papeleria_id, tramite, cuantos, ingresos, costos = zip(*filas) if filas else ((),) * 7
+        ids = np.array([p.id for p in papelerias], dtype=np.int64)
+        papeleria_id = np.array(papeleria_id, dtype=np.int64)
+        # Como los JOIN de las consultas: solo filas de papelerías del usuario
+        propias = np.isin(papeleria_id, ids)
+        tramites, codigos = np.unique(np.array(tramite, dtype=str)[propias], return_inverse=True)
+        columnas = cls(
+            version,
+            fecha=np.array(fecha, dtype=np.int32)[propias],
+            periodo=np.array(periodo, dtype=np.int32)[propias],
+            papeleria=np.searchsorted(ids, papeleria_id[propias]).astype(np.int32),
+            tramite=codigos.astype(np.int32),
+            cuantos=np.array(cuantos, dtype=np.int64)[propias],
+            ingresos=np.array(ingresos, dtype=np.float64)[propias],
+            costos=np.array(costos, dtype=np.float64)[propias],
+            tramites=tramites.tolist(),
+            papelerias=[tuple(p) for p in papelerias],
+        )
+        logging.debug(f"[COLUMNS] user={user_id} {len(columnas.fecha)} filas, {columnas.nbytes} bytes "
+                      f"en {(time.time() - inicio) * 1000:.0f}ms")
+        return columnas
+
+    # --- Selección ---
+
+    def _tramo(self, fecha_inicio=None, fecha_fin=None):
+        """Slice de las filas con fecha en [fecha_inicio, fecha_fin] (búsqueda binaria: están ordenadas)."""
+        if not (fecha_inicio and fecha_fin):
+            return slice(None)
+        return slice(int(np.searchsorted(self.fecha, dias(fecha_inicio), side='left')),
+                     int(np.searchsorted(self.fecha, dias(fecha_fin), side='right')))
+
+    def _activas(self, tramo=slice(None)):
+        return self.activa[self.papeleria[tramo]]
+
+    def _sumar(self, claves, n, seleccion, *valores):
+        """bincount de cada arreglo de `valores` por `claves` (solo las filas de `seleccion`)."""
+        claves = claves[seleccion]
+        return [np.bincount(claves, weights=v[seleccion], minlength=n) for v in valores]
+
+    @staticmethod
+    def _orden_desc(valores):
+        # Estable: en empates queda el orden de las claves
+        return np.argsort(-valores, kind='stable')
+
+    # --- AnalyticsRepository ---
+
+    def mejor_mes(self):
+        """Como `AnalyticsRepository.get_mejor_mes_historico`."""
+        activas = self._activas()
+        if not activas.any():
+            return None
+        periodos, posicion = np.unique(self.periodo[activas], return_inverse=True)
+        ganancia = np.bincount(posicion, weights=(self.ingresos - self.costos)[activas])
+        mejor = int(np.argmax(ganancia))
+        return {'mes': periodo_label(int(periodos[mejor])), 'ganancia': float(ganancia[mejor])}
+
+    def dia_productivo(self):
+        """Como `AnalyticsRepository.get_dias_mas_productivos` (0=Domingo)."""
+        from .database import DIAS_NOMBRES
+        activas = self._activas()
+        if not activas.any():
+            return None
+        dia_semana = (self.fecha.astype(np.int64) + 4) % 7   # 1970-01-01 fue jueves
+        ganancia, cuantos, filas = self._sumar(dia_semana, 7, activas, self.ingresos - self.costos,
+                                               self.cuantos, np.ones(len(self.fecha)))
+        ganancia[filas == 0] = -np.inf
+        dia = int(np.argmax(ganancia))
+        return {'dia_nombre': DIAS_NOMBRES[dia], 'ganancia': float(ganancia[dia]), 'tramites': int(cuantos[dia])}
+
+    def margen_promedio(self):
+        """Como `AnalyticsRepository.get_margen_promedio`."""
+        activas = self._activas()
+        ingresos = float(self.ingresos[activas].sum())
+        if not ingresos:
+            return 0
+        return round((ingresos - float(self.costos[activas].sum())) / ingresos * 100, 1)
+
+    def costo_promedio_tramite(self):
+        """Como `AnalyticsRepository.get_costo_promedio_tramite` (todas las papelerías)."""
+        cuantos = int(self.cuantos.sum())
+        if not cuantos:
+            return 0.0
+        return round(float(self.costos.sum()) / cuantos, 2)
+
+    def roi_papelerias(self, limit=5):
+        """Como `AnalyticsRepository.get_roi_por_papeleria`."""
+        ingresos, costos = self._sumar(self.papeleria, len(self.papelerias), slice(None), self.ingresos, self.costos)
+        candidatas = np.flatnonzero(self.activa & (costos > 0))
+        roi = (ingresos[candidatas] - costos[candidatas]) / costos[candidatas] * 100
+        return [{'nombre': self.papelerias[candidatas[i]][1], 'roi': round(float(roi[i]), 1)}
+                for i in self._orden_desc(roi)[:limit]]
+
+    def rentabilidad_tramites(self):
+        """Como `AnalyticsRepository.get_rentabilidad_por_tramite`."""
+        activas = self._activas()
+        cuantos, ganancia = self._sumar(self.tramite, len(self.tramites), activas,
+                                        self.cuantos, self.ingresos - self.costos)
+        presentes = np.flatnonzero(np.bincount(self.tramite[activas], minlength=len(self.tramites)))
+        orden = presentes[self._orden_desc(ganancia[presentes])]
+        return [{
+            'tramite': self.tramites[i],
+            'cantidad': int(cuantos[i]),
+            'margen_promedio': round(float(ganancia[i] / cuantos[i]), 2) if cuantos[i] else 0,
+            'ganancia_total': round(float(ganancia[i]), 2)
+        } for i in orden]
+
+    def historico(self):
+        """Las métricas de `AnalyticsRepository.get_historico` (sin el bloque de frescura)."""
+        return {
+            'mejor_mes': self.mejor_mes(),
+            'dia_productivo': self.dia_productivo(),
+            'margen_promedio': self.margen_promedio(),
+            'costo_promedio_tramite': self.costo_promedio_tramite(),
+            'roi_papelerias': self.roi_papelerias(),
+            'rentabilidad_tramites': self.rentabilidad_tramites(),
+        }
+
+    # --- Gráficos del dashboard ---
+
+    def top_papelerias(self, limit=10, fecha_inicio=None, fecha_fin=None):
+        """Como `PapeleriaRepository.get_top_by_ganancia`."""
+        tramo = self._tramo(fecha_inicio, fecha_fin)
+        ganancia, filas = self._sumar(self.papeleria[tramo], len(self.papelerias), slice(None),
+                                      (self.ingresos - self.costos)[tramo], np.ones(len(self.fecha))[tramo])
+        # Con rango solo cuentan las papelerías con trámites en él; sin rango, todas
+        candidatas = np.flatnonzero(filas) if fecha_inicio and fecha_fin else np.arange(len(self.papelerias))
+        return [{'nombre': self.papelerias[candidatas[i]][1], 'ganancia_total': float(ganancia[candidatas[i]])}
+                for i in self._orden_desc(ganancia[candidatas])[:limit]]
+
+    def distribucion_tramites(self, limit=10, fecha_inicio=None, fecha_fin=None):
+        """Como `TramiteRepository.get_tramites_distribution`."""
+        tramo = self._tramo(fecha_inicio, fecha_fin)
+        codigos = self.tramite[tramo]
+        cuantos, = self._sumar(codigos, len(self.tramites), slice(None), self.cuantos[tramo])
+        presentes = np.flatnonzero(np.bincount(codigos, minlength=len(self.tramites)))
+        return [{'tramite_label': self.tramites[i], 'total_count': int(cuantos[i])}
+                for i in presentes[self._orden_desc(cuantos[presentes])][:limit]]
+
+    def totales_por_periodo(self, fecha_inicio, fecha_fin):
+        """[(periodo, ingresos, costos)] de las filas en [fecha_inicio, fecha_fin], como en `get_monthly_summary`."""
+        tramo = self._tramo(fecha_inicio, fecha_fin)
+        periodos, posicion = np.unique(self.periodo[tramo], return_inverse=True)
+        ingresos = np.bincount(posicion, weights=self.ingresos[tramo], minlength=len(periodos))
+        costos = np.bincount(posicion, weights=self.costos[tramo], minlength=len(periodos))
+        return [(int(p), float(i), float(c)) for p, i, c in zip(periodos, ingresos, costos)]
@@ -0,0 +1,85 @@
+"""
+Exportaciones CSV en streaming con memoria constante.
+
+Las filas llegan de los repositorios como un iterador (`yield_per`: la BD entrega lotes
+y el ORM no acumula la lista completa), se escriben en un buffer pequeño que se vacía
+cada `CHUNK_ROWS` filas y cada trozo sale al cliente en cuanto está listo. Con
+`?gzip=1` los trozos pasan por un compresor zlib incremental y se descarga un `.csv.gz`.
+
+La memoria del worker depende del tamaño del lote, no del número de trámites.
+`text/csv` no está en `COMPRESS_MIMETYPES`, así que Flask-Compress no bufferiza la
+respuesta para comprimirla.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+
+from flask import Response, stream_with_context
+
+CHUNK_ROWS = 500        # Filas por trozo enviado al cliente
+GZIP_LEVEL = 6
+
+HEADER_GENERAL = ['Papelería', 'Trámite', 'Fecha', 'Cantidad', 'Precio', 'Costo', 'Ganancia']
+HEADER_PAPELERIA = ['Trámite', 'Fecha', 'Cantidad', 'Precio', 'Costo', 'Ganancia']
+
+
+def csv_chunks(header, rows):
+    """Genera el CSV (`header` + `rows`) en trozos de bytes UTF-8."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """Comprime al vuelo un iterador de bytes en formato gzip."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def wants_gzip(args):
+    """True si la petición pide la descarga comprimida (`?gzip=1`)."""
+    return str(args.get('gzip', '')).lower() in ('1', 'true', 'si', 'sí')
+
+
+def csv_response(filename, header, rows, gzip=False):
+    """Respuesta de descarga que va escribiendo el CSV mientras se envía."""
+    chunks = csv_chunks(header, rows)
+    mimetype = 'text/csv'
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: no acumular la respuesta
+    return response
+
+
+def tramites_csv(user_id, fecha_inicio=None, fecha_fin=None, papeleria_id=None, wrap=None):
+    """
+    Nombre de archivo, encabezado y filas del CSV de trámites: general o de una papelería.
+    `wrap` recibe el iterador de filas del repositorio (p. ej. para reportar progreso).
+    """
+    from .database import tramite_repository
+
+    data = tramite_repository.export_all_as_csv(user_id, fecha_inicio, fecha_fin, papeleria_id=papeleria_id)
+    if wrap:
+        data = wrap(data)
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    if papeleria_id is None:
+        rows = ([r.papeleria, r.tramite, r.fecha.strftime('%Y-%m-%d'), r.cantidad, r.precio, r.costo, r.ganancia] for r in data)
+        return f"reporte_general_{hoy}.csv", HEADER_GENERAL, rows
+    rows = ([r.tramite, r.fecha.strftime('%Y-%m-%d'), r.cantidad, r.precio, r.costo, r.ganancia] for r in data)
+    return f"reporte_papeleria_{papeleria_id}_{hoy}.csv", HEADER_PAPELERIA, rows
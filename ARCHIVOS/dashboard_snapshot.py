@@ -0,0 +1,230 @@
+"""
+Snapshot del dashboard principal.
+
+`DashboardSnapshot.for_user` reúne todas las cifras de la página de inicio (totales por
+papelería, comparativas hoy/ayer y mes actual/anterior, meta mensual, mejor mes, día más
+productivo, margen, rentabilidad por trámite y gastos) a partir de:
+
+1. Los totales por (papelería, trámite) de `tramites_diarios`, recorriendo en orden el
+   índice cubriente (user_id, papeleria_id, tramite, ...): sin ordenamiento temporal.
+   De aquí salen la lista de papelerías, los totales, el margen y la rentabilidad.
+2. Un `UNION ALL` con los totales por día de las papelerías activas desde el inicio del
+   mes anterior, los trámites de hoy/ayer y el total de `gastos_diarios`. Mes actual y
+   anterior y meta se pliegan en Python sobre esas filas (~60).
+3. Mejor mes y día más productivo, que abarcan toda la historia, salen de
+   `AnalyticsRepository.get_historico`: snapshot nocturno más el delta (o el almacén
+   columnar en memoria), sin recorrer el rollup completo en cada render.
+
+Los resultados coinciden con los métodos individuales de los repositorios, que siguen
+disponibles para la API y los reportes.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import and_, func, literal, null, select, union_all
+
+from .db_routing import reads
+from .models import db, Papeleria, TramiteDiario, GastoDiario
+from .database import analytics_repository, comparativa_totales, comparativa_tramites, meta_mensual_progress
+
+# Dominios de datos que lee el dashboard (claves de caché, ver utils.DATA_DOMAINS)
+DATA_DOMAINS = ('tramites', 'gastos', 'papelerias')
+
+
+@dataclass
+class PapeleriaResumen:
+    """Fila de la lista de papelerías del dashboard (mismos campos que la consulta original)."""
+    id: int
+    nombre: str
+    cuantos: int = 0
+    total_ingresos: float = 0
+    total_costos: float = 0
+
+    @property
+    def ganancia_total(self):
+        return self.total_ingresos - self.total_costos
+
+
+@dataclass
+class DashboardSnapshot:
+    """Cifras del dashboard de un usuario, listas para la plantilla."""
+    papelerias: list
+    totales: dict
+    totales_comparativa: dict
+    tramites_comparativa: dict
+    meta_progress: dict
+    mejor_mes: Optional[dict]
+    dia_productivo: Optional[dict]
+    margen_promedio: float
+    rentabilidad_tramites: list = field(default_factory=list)
+    total_gastos_operativos: float = 0
+    search_term: Optional[str] = None
+
+    @property
+    def tramites_de_hoy(self):
+        return self.tramites_comparativa['hoy']
+
+    @property
+    def num_papelerias(self):
+        return len(self.papelerias)
+
+    def as_context(self, top_tramites=5):
+        """Diccionario con las claves que consumen `index.html` y `dashboard_content.html`."""
+        return {
+            'papelerias': self.papelerias,
+            'totales': self.totales,
+            'totales_comparativa': self.totales_comparativa,
+            'tramites_de_hoy': self.tramites_de_hoy,
+            'tramites_comparativa': self.tramites_comparativa,
+            'meta_progress': self.meta_progress,
+            'mejor_mes': self.mejor_mes,
+            'dia_productivo': self.dia_productivo,
+            'margen_promedio': self.margen_promedio,
+            'rentabilidad_tramites': self.rentabilidad_tramites[:top_tramites],
+            'num_papelerias': self.num_papelerias,
+            'total_gastos_operativos': self.total_gastos_operativos,
+            'search_term': self.search_term,
+        }
+
+    @classmethod
+    @reads
+    def for_user(cls, user_id, search_term=None, hoy=None, meta_objetivo=10000):
+        """Calcula el snapshot del usuario: dos consultas más las de `get_historico`."""
+        hoy = hoy or date.today()
+        inicio_mes = hoy.replace(day=1)
+        inicio_mes_anterior = inicio_mes - relativedelta(months=1)
+        papelerias, tramites, ingresos_activas, costos_activas = _por_papeleria_y_tramite(user_id, search_term)
+        dias, cuantos_hoy, cuantos_ayer, total_gastos = _por_dia(user_id, hoy, inicio_mes_anterior)
+        historico = analytics_repository.get_historico(user_id)
+
+        totales = {
+            'cuantos': sum(p.cuantos for p in papelerias),
+            'total_ingresos': sum(p.total_ingresos for p in papelerias),
+            'total_costos': sum(p.total_costos for p in papelerias),
+        }
+        totales['ganancia'] = totales['total_ingresos'] - totales['total_costos']
+
+        margen_promedio = 0
+        if ingresos_activas:
+            margen_promedio = round((ingresos_activas - costos_activas) / ingresos_activas * 100, 1)
+
+        # Comparativas y meta: papelerías activas; hoy/ayer incluye también las inactivas
+        mes = [d for d in dias if d.fecha >= inicio_mes]
+        mes_anterior = [d for d in dias if inicio_mes_anterior <= d.fecha < inicio_mes]
+        ingresos_mes = float(sum(d.ingresos for d in mes))
+        costos_mes = float(sum(d.costos for d in mes))
+        totales_comparativa = comparativa_totales(
+            ingresos_mes, costos_mes,
+            float(sum(d.ingresos for d in mes_anterior)), float(sum(d.costos for d in mes_anterior))
+        )
+        tramites_comparativa = comparativa_tramites(cuantos_hoy, cuantos_ayer)
+
+        return cls(
+            papelerias=papelerias,
+            totales=totales,
+            totales_comparativa=totales_comparativa,
+            tramites_comparativa=tramites_comparativa,
+            meta_progress=meta_mensual_progress(ingresos_mes - costos_mes, hoy, meta_objetivo),
+            mejor_mes=historico['mejor_mes'],
+            dia_productivo=historico['dia_productivo'],
+            margen_promedio=margen_promedio,
+            rentabilidad_tramites=_rentabilidad(tramites),
+            total_gastos_operativos=total_gastos,
+            search_term=search_term,
+        )
+
+
+def _por_papeleria_y_tramite(user_id, search_term):
+    """
+    Consulta 1: totales por (papelería, trámite). Devuelve la lista de papelerías activas
+    que coinciden con la búsqueda, los totales por trámite de las activas y los ingresos
+    y costos de todas las activas.
+    """
+    coincide = Papeleria.nombre.like(f'%{search_term}%') if search_term else literal(True)
+    filas = db.session.query(
+        Papeleria.id,
+        Papeleria.nombre,
+        Papeleria.is_active,
+        coincide.label('coincide'),
+        TramiteDiario.tramite,
+        func.coalesce(func.sum(TramiteDiario.cuantos), 0).label('cuantos'),
+        func.coalesce(func.sum(TramiteDiario.total_ingresos), 0).label('ingresos'),
+        func.coalesce(func.sum(TramiteDiario.total_costos), 0).label('costos'),
+    ).outerjoin(TramiteDiario, and_(TramiteDiario.papeleria_id == Papeleria.id, TramiteDiario.user_id == user_id))\
+     .filter(Papeleria.user_id == user_id, Papeleria.is_active == True)\
+     .group_by(Papeleria.id, TramiteDiario.tramite)\
+     .all()
+
+    papelerias = {}
+    tramites = defaultdict(lambda: [0, 0.0, 0.0])
+    ingresos_activas = costos_activas = 0.0
+    for fila in filas:
+        ingresos_activas += fila.ingresos
+        costos_activas += fila.costos
+        if fila.tramite is not None:
+            acumulado = tramites[fila.tramite]
+            acumulado[0] += fila.cuantos
+            acumulado[1] += fila.ingresos
+            acumulado[2] += fila.costos
+        if fila.coincide:
+            resumen = papelerias.setdefault(fila.id, PapeleriaResumen(fila.id, fila.nombre))
+            resumen.cuantos += fila.cuantos
+            resumen.total_ingresos += fila.ingresos
+            resumen.total_costos += fila.costos
+
+    lista = sorted(papelerias.values(), key=lambda p: p.nombre)
+    return lista, tramites, ingresos_activas, costos_activas
+
+
+def _por_dia(user_id, hoy, desde):
+    """
+    Consulta 2 (`UNION ALL`): totales por día de las papelerías activas a partir de `desde`
+    (rango por índice, no toda la historia); trámites de hoy y ayer de todas las papelerías
+    (búsqueda por clave primaria); y el total de gastos.
+    """
+    ayer = hoy - timedelta(days=1)
+    activas = select(Papeleria.id).where(Papeleria.user_id == user_id, Papeleria.is_active == True)
+
+    def totales_por_dia(tipo, *filtros):
+        return select(
+            literal(tipo).label('tipo'),
+            TramiteDiario.fecha.label('fecha'),
+            func.sum(TramiteDiario.cuantos).label('cuantos'),
+            func.sum(TramiteDiario.total_ingresos).label('ingresos'),
+            func.sum(TramiteDiario.total_costos).label('costos'),
+        ).where(TramiteDiario.user_id == user_id, *filtros).group_by(TramiteDiario.fecha)
+
+    gastos = select(
+        literal('gastos'), null(), literal(0),
+        func.coalesce(func.sum(GastoDiario.total_monto), 0), literal(0)
+    ).where(GastoDiario.user_id == user_id)
+
+    dias, cuantos_todas, total_gastos = [], {}, 0
+    for fila in db.session.execute(union_all(
+        totales_por_dia('dia', TramiteDiario.fecha >= desde, TramiteDiario.papeleria_id.in_(activas)),
+        totales_por_dia('todas', TramiteDiario.fecha.in_([hoy, ayer])),
+        gastos,
+    )):
+        if fila.tipo == 'dia':
+            dias.append(fila)
+        elif fila.tipo == 'todas':
+            cuantos_todas[fila.fecha] = fila.cuantos
+        else:
+            total_gastos = fila.ingresos
+    return dias, int(cuantos_todas.get(hoy, 0)), int(cuantos_todas.get(ayer, 0)), total_gastos
+
+
+def _rentabilidad(tramites):
+    resultado = []
+    for tramite, (cuantos, ingresos, costos) in sorted(tramites.items(), key=lambda t: t[1][1] - t[1][2], reverse=True):
+        ganancia = float(ingresos - costos)
+        resultado.append({
+            'tramite': tramite,
+            'cantidad': cuantos,
+            'margen_promedio': round(ganancia / cuantos, 2) if cuantos else 0,
+            'ganancia_total': round(ganancia, 2)
+        })
+    return resultado
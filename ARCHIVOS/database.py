@@ -5,12 +5,125 @@ Cada repositorio es responsable de la lógica de negocio de un único modelo,
 asegurando un código limpio, mantenible y desacoplado de la capa de rutas.
 """
 
-from .models import db, User, Papeleria, Tramite, Gasto, Proveedor, TramiteCosto, PapeleriaPrecio
+from .models import (db, User, Papeleria, Tramite, Gasto, Proveedor, TramiteCosto, PapeleriaPrecio, TramiteDiario, GastoDiario,
+                     ExportJob, AnalyticsSnapshot, periodo_de, periodo_label)
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func
-from datetime import datetime
+from sqlalchemy import func, insert, update, delete, and_, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import contains_eager
+from datetime import date, datetime, timedelta
+import json
 import logging
+import uuid
 from .constants import TRAMITES_PREDEFINIDOS
+from . import rollups, search_index, column_store
+from .db_routing import reads, writes
+from .pagination import keyset_paginate
+
+# NOTA: Todos los agregados (totales, distribuciones, resúmenes mensuales y analytics)
+# leen de los rollups diarios `TramiteDiario`/`GastoDiario`. Las consultas de detalle,
+# búsqueda y exportación siguen leyendo las tablas crudas.
+# Los agregados mensuales agrupan por la columna entera `periodo` (YYYYMM), no por
+# strftime('%Y-%m', fecha), para recorrer el índice (user_id, periodo) por rango.
+# Las búsquedas por texto (`search_term` de los métodos get_all_*) usan el índice FTS5 de
+# `search_index` cuando está disponible; el `ILIKE '%term%'` queda como respaldo.
+# Los métodos marcados con `@reads` (gráficos, analytics, búsqueda y exportaciones) leen del
+# engine de solo lectura de `db_routing`; el resto, y los `@writes`, van al primario.
+
+
+def _periodo_filters(model, start_date, end_date):
+    """
+    Filtros sargables de rango para agregados mensuales: rango por `periodo` y, solo si
+    los límites no coinciden con el inicio/fin de mes, el ajuste fino por `fecha`.
+    """
+    start_date = rollups._as_date(start_date)
+    end_date = rollups._as_date(end_date)
+    filters = [model.periodo.between(periodo_de(start_date), periodo_de(end_date))]
+    if start_date.day != 1:
+        filters.append(model.fecha >= start_date)
+    if (end_date + timedelta(days=1)).day != 1:
+        filters.append(model.fecha <= end_date)
+    return filters
+
+
+def _columnas(user_id, *fechas):
+    """
+    In-memory columns of the user's rollup (see column_store.py), or None to query SQLite:
+    no NumPy, store disabled, no data version, or a date bound that is not a valid date.
+    """
+    try:
+        for fecha in fechas:
+            if fecha:
+                column_store.dias(fecha)
+    except (TypeError, ValueError):
+        return None
+    return column_store.columns(user_id)
+
+
+def porcentaje_cambio(actual, anterior):
+    """Percentage change from `anterior` to `actual` (100 when growing from zero)."""
+    if anterior == 0:
+        return 100 if actual > 0 else 0
+    return round(((actual - anterior) / anterior) * 100, 1)
+
+
+def comparativa_totales(ingresos_actual, costos_actual, ingresos_anterior, costos_anterior):
+    """Builds the current-vs-previous month comparison shown on the dashboard."""
+    ganancia_actual = ingresos_actual - costos_actual
+    ganancia_anterior = ingresos_anterior - costos_anterior
+    return {
+        'ganancia_actual': ganancia_actual,
+        'ganancia_anterior': ganancia_anterior,
+        'cambio_ganancia': ganancia_actual - ganancia_anterior,
+        'porcentaje_ganancia': porcentaje_cambio(ganancia_actual, ganancia_anterior),
+        'ingresos_porcentaje': porcentaje_cambio(ingresos_actual, ingresos_anterior),
+        'costos_porcentaje': porcentaje_cambio(costos_actual, costos_anterior)
+    }
+
+
+def comparativa_tramites(tramites_hoy, tramites_ayer):
+    """Builds the today-vs-yesterday tramite count comparison."""
+    return {
+        'hoy': tramites_hoy,
+        'ayer': tramites_ayer,
+        'cambio': tramites_hoy - tramites_ayer,
+        'porcentaje': porcentaje_cambio(tramites_hoy, tramites_ayer)
+    }
+
+
+def meta_mensual_progress(ganancia_actual, hoy, meta_objetivo=10000):
+    """Progress towards the monthly goal given the profit accumulated so far this month."""
+    from dateutil.relativedelta import relativedelta
+
+    inicio_mes = hoy.replace(day=1)
+    porcentaje = (ganancia_actual / meta_objetivo * 100) if meta_objetivo > 0 else 0
+
+    # Calcular días restantes hasta el próximo DOMINGO (día de corte)
+    # weekday(): 0=Lunes, 1=Martes, 2=Miércoles, 3=Jueves, 4=Viernes, 5=Sábado, 6=Domingo
+    dia_actual = hoy.weekday()
+
+    if dia_actual == 6:  # Si hoy es domingo
+        dias_hasta_domingo = 0
+    else:
+        # Días hasta el próximo domingo: 6 - dia_actual
+        dias_hasta_domingo = 6 - dia_actual
+
+    # Calcular proyección basada en el mes completo
+    dias_transcurridos = (hoy - inicio_mes).days + 1
+    dias_en_mes = (hoy.replace(day=28) + relativedelta(days=4)).replace(day=1) - relativedelta(days=1)
+    dias_totales = dias_en_mes.day
+
+    proyeccion = (ganancia_actual / dias_transcurridos * dias_totales) if dias_transcurridos > 0 else 0
+
+    return {
+        'ganancia_actual': ganancia_actual,
+        'meta_objetivo': meta_objetivo,
+        'porcentaje': round(porcentaje, 1),
+        'proyeccion': round(proyeccion, 2),
+        'dias_restantes': dias_hasta_domingo,  # Hasta el próximo domingo
+        'falta': max(0, meta_objetivo - ganancia_actual)
+    }
+
 
 class UserRepository:
     """
@@ -100,10 +213,10 @@ class PapeleriaRepository:
         query = Papeleria.query.filter_by(user_id=user_id, is_active=True)
         if fecha_inicio and fecha_fin:
             # Solo contar papelerías con al menos un trámite en el rango
-            subq = db.session.query(Tramite.papeleria_id).filter(
-                Tramite.user_id == user_id,
-                Tramite.fecha >= fecha_inicio,
-                Tramite.fecha <= fecha_fin
+            subq = db.session.query(TramiteDiario.papeleria_id).filter(
+                TramiteDiario.user_id == user_id,
+                TramiteDiario.fecha >= fecha_inicio,
+                TramiteDiario.fecha <= fecha_fin
             ).distinct().subquery()
             query = query.filter(Papeleria.id.in_(subq))
         return query.count()
@@ -113,14 +226,14 @@ class PapeleriaRepository:
         NOTA: Incluye datos de papelerías inactivas para mostrar históricos completos.
         """
         query = db.session.query(
-            func.sum(Tramite.precio).label('total_ingresos'),
-            func.sum(Tramite.costo).label('total_costos')
+            func.sum(TramiteDiario.total_ingresos).label('total_ingresos'),
+            func.sum(TramiteDiario.total_costos).label('total_costos')
         )
         query = query.filter(
-            Tramite.user_id == user_id
+            TramiteDiario.user_id == user_id
         )
         if fecha_inicio and fecha_fin:
-            query = query.filter(Tramite.fecha >= fecha_inicio, Tramite.fecha <= fecha_fin)
+            query = query.filter(TramiteDiario.fecha >= fecha_inicio, TramiteDiario.fecha <= fecha_fin)
         result = query.first()
         total_ingresos = float(result.total_ingresos or 0)
         total_costos = float(result.total_costos or 0)
@@ -176,11 +289,11 @@ class PapeleriaRepository:
         """
         # Subquery to get stats per papeleria
         papeleria_stats_sq = db.session.query(
-            Tramite.papeleria_id,
-            func.count(Tramite.id).label('cuantos'),
-            func.sum(Tramite.precio).label('total_ingresos'),
-            func.sum(Tramite.costo).label('total_costos')
-        ).filter(Tramite.user_id == user_id).group_by(Tramite.papeleria_id).subquery()
+            TramiteDiario.papeleria_id,
+            func.sum(TramiteDiario.cuantos).label('cuantos'),
+            func.sum(TramiteDiario.total_ingresos).label('total_ingresos'),
+            func.sum(TramiteDiario.total_costos).label('total_costos')
+        ).filter(TramiteDiario.user_id == user_id).group_by(TramiteDiario.papeleria_id).subquery()
 
         # Main query to get papelerias and join the stats
         query = db.session.query(
@@ -213,6 +326,7 @@ class PapeleriaRepository:
         
         return {'papelerias': papelerias, 'totales': totales}
     
+    @reads
     def get_totales_comparativa(self, user_id):
         """Retorna totales del mes actual vs mes anterior con porcentajes de cambio."""
         from datetime import date
@@ -228,72 +342,59 @@ class PapeleriaRepository:
         
         # Datos mes actual
         datos_actual = db.session.query(
-            func.sum(Tramite.precio).label('ingresos'),
-            func.sum(Tramite.costo).label('costos')
-        ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
+            func.sum(TramiteDiario.total_ingresos).label('ingresos'),
+            func.sum(TramiteDiario.total_costos).label('costos')
+        ).join(Papeleria, TramiteDiario.papeleria_id == Papeleria.id)\
          .filter(
-            Tramite.user_id == user_id,
+            TramiteDiario.user_id == user_id,
+            Papeleria.user_id == user_id,
             Papeleria.is_active == True,
-            Tramite.fecha >= inicio_mes_actual
+            TramiteDiario.fecha >= inicio_mes_actual
         ).first()
         
         # Datos mes anterior
         datos_anterior = db.session.query(
-            func.sum(Tramite.precio).label('ingresos'),
-            func.sum(Tramite.costo).label('costos')
-        ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
+            func.sum(TramiteDiario.total_ingresos).label('ingresos'),
+            func.sum(TramiteDiario.total_costos).label('costos')
+        ).join(Papeleria, TramiteDiario.papeleria_id == Papeleria.id)\
          .filter(
-            Tramite.user_id == user_id,
+            TramiteDiario.user_id == user_id,
+            Papeleria.user_id == user_id,
             Papeleria.is_active == True,
-            Tramite.fecha >= inicio_mes_anterior,
-            Tramite.fecha <= fin_mes_anterior
+            TramiteDiario.fecha >= inicio_mes_anterior,
+            TramiteDiario.fecha <= fin_mes_anterior
         ).first()
         
-        # Calcular valores
-        ingresos_actual = float(datos_actual.ingresos or 0)
-        costos_actual = float(datos_actual.costos or 0)
-        ganancia_actual = ingresos_actual - costos_actual
-        
-        ingresos_anterior = float(datos_anterior.ingresos or 0)
-        costos_anterior = float(datos_anterior.costos or 0)
-        ganancia_anterior = ingresos_anterior - costos_anterior
-        
-        # Calcular porcentajes de cambio
-        def calcular_porcentaje(actual, anterior):
-            if anterior == 0:
-                return 100 if actual > 0 else 0
-            return round(((actual - anterior) / anterior) * 100, 1)
-        
-        return {
-            'ganancia_actual': ganancia_actual,
-            'ganancia_anterior': ganancia_anterior,
-            'cambio_ganancia': ganancia_actual - ganancia_anterior,
-            'porcentaje_ganancia': calcular_porcentaje(ganancia_actual, ganancia_anterior),
-            'ingresos_porcentaje': calcular_porcentaje(ingresos_actual, ingresos_anterior),
-            'costos_porcentaje': calcular_porcentaje(costos_actual, costos_anterior)
-        }
+        return comparativa_totales(
+            float(datos_actual.ingresos or 0), float(datos_actual.costos or 0),
+            float(datos_anterior.ingresos or 0), float(datos_anterior.costos or 0)
+        )
 
+    @reads
     def get_top_by_ganancia(self, user_id, limit=10, fecha_inicio=None, fecha_fin=None):
         """Gets top papelerias by total profit, optionally filtered by date range.
         NOTA: Incluye papelerías inactivas para mostrar datos históricos completos."""
+        columnas = _columnas(user_id, fecha_inicio, fecha_fin)
+        if columnas is not None:
+            return columnas.top_papelerias(limit, fecha_inicio, fecha_fin)
         try:
             # Si hay filtro de fechas, usar INNER JOIN para solo incluir papelerías con trámites en el rango
             if fecha_inicio and fecha_fin:
                 query = db.session.query(
                     Papeleria.nombre,
-                    (func.sum(func.coalesce(Tramite.precio, 0)) - func.sum(func.coalesce(Tramite.costo, 0))).label('ganancia_total')
-                ).join(Tramite, Papeleria.id == Tramite.papeleria_id)\
+                    (func.sum(func.coalesce(TramiteDiario.total_ingresos, 0)) - func.sum(func.coalesce(TramiteDiario.total_costos, 0))).label('ganancia_total')
+                ).join(TramiteDiario, Papeleria.id == TramiteDiario.papeleria_id)\
                  .filter(
                     Papeleria.user_id == user_id,
-                    Tramite.fecha >= fecha_inicio,
-                    Tramite.fecha <= fecha_fin
+                    TramiteDiario.fecha >= fecha_inicio,
+                    TramiteDiario.fecha <= fecha_fin
                 )
             else:
                 # Sin filtro de fechas, usar OUTER JOIN para incluir todas las papelerías
                 query = db.session.query(
                     Papeleria.nombre,
-                    (func.sum(func.coalesce(Tramite.precio, 0)) - func.sum(func.coalesce(Tramite.costo, 0))).label('ganancia_total')
-                ).outerjoin(Tramite, Papeleria.id == Tramite.papeleria_id)\
+                    (func.sum(func.coalesce(TramiteDiario.total_ingresos, 0)) - func.sum(func.coalesce(TramiteDiario.total_costos, 0))).label('ganancia_total')
+                ).outerjoin(TramiteDiario, Papeleria.id == TramiteDiario.papeleria_id)\
                  .filter(Papeleria.user_id == user_id)
             
             query = query.group_by(Papeleria.id, Papeleria.nombre)\
@@ -420,16 +521,24 @@ class PapeleriaRepository:
         
         return {tramite: {'costo_general': costos_generales.get(tramite), 'precio_especifico': precios_especificos.get(tramite)} for tramite in todos_los_tramites}
 
+    def get_precios_map(self, user_id):
+        """Gets every specific price of the user's active papelerias as {(papeleria_id, tramite): precio}."""
+        rows = db.session.query(PapeleriaPrecio.papeleria_id, PapeleriaPrecio.tramite, PapeleriaPrecio.precio)\
+            .join(Papeleria)\
+            .filter(Papeleria.user_id == user_id, Papeleria.is_active == True)\
+            .all()
+        return {(r.papeleria_id, r.tramite): r.precio for r in rows}
+
     def total_por_papeleria(self, papeleria_id, user_id, fecha_inicio=None, fecha_fin=None):
         """Calculates totals for a specific papeleria."""
         query = db.session.query(
-            func.count(Tramite.id).label('cuantos'), # type: ignore
-            func.sum(func.coalesce(Tramite.precio, 0)).label('total_ingresos'),
-            func.sum(func.coalesce(Tramite.costo, 0)).label('total_costos')
-        ).filter(Tramite.papeleria_id == papeleria_id, Tramite.user_id == user_id)
+            func.sum(TramiteDiario.cuantos).label('cuantos'), # type: ignore
+            func.sum(TramiteDiario.total_ingresos).label('total_ingresos'),
+            func.sum(TramiteDiario.total_costos).label('total_costos')
+        ).filter(TramiteDiario.papeleria_id == papeleria_id, TramiteDiario.user_id == user_id)
 
         if fecha_inicio and fecha_fin:
-            query = query.filter(Tramite.fecha.between(fecha_inicio, fecha_fin))
+            query = query.filter(TramiteDiario.fecha.between(fecha_inicio, fecha_fin))
 
         result = query.one()
         
@@ -443,97 +552,240 @@ class PapeleriaRepository:
             'ganancia': ingresos - costos
         }
     
-    def get_all_papelerias(self, user_id, search_term=None):
+    @reads
+    def get_statement_summaries(self, user_id, fecha_inicio, fecha_fin):
+        """Per-papeleria summary for month-end statements: every active papeleria of the
+        user (also those without tramites in the range), read from the daily rollup in one GROUP BY."""
+        rows = db.session.query(
+            Papeleria.id,
+            Papeleria.nombre,
+            func.coalesce(func.sum(TramiteDiario.cuantos), 0).label('cuantos'),
+            func.coalesce(func.sum(TramiteDiario.total_ingresos), 0).label('total_ingresos')
+        ).outerjoin(TramiteDiario, (TramiteDiario.papeleria_id == Papeleria.id) &
+                    (TramiteDiario.user_id == user_id) &
+                    TramiteDiario.fecha.between(fecha_inicio, fecha_fin))\
+         .filter(Papeleria.user_id == user_id, Papeleria.is_active == True)\
+         .group_by(Papeleria.id, Papeleria.nombre)\
+         .order_by(Papeleria.nombre).all()
+        return [{
+            'id': r.id,
+            'nombre': r.nombre,
+            'cuantos': int(r.cuantos),
+            'total_ingresos': float(r.total_ingresos)
+        } for r in rows]
+
+    def get_user_ids_with_active_papelerias(self):
+        """Ids of the users that own at least one active papeleria (month-end batch over all users)."""
+        return [r[0] for r in db.session.query(Papeleria.user_id).filter(Papeleria.is_active == True)
+                .distinct().order_by(Papeleria.user_id).all()]
+
+    @reads
+    def get_all_papelerias(self, user_id, search_term=None, limit=None):
         """Gets active papelerias for search functionality, optionally filtered."""
+        # Número de precios configurados por papelería en un solo GROUP BY (no una consulta por papelería)
+        precios_sq = db.session.query(
+            PapeleriaPrecio.papeleria_id,
+            func.count(PapeleriaPrecio.id).label('precios_count')
+        ).join(Papeleria, PapeleriaPrecio.papeleria_id == Papeleria.id)\
+         .filter(Papeleria.user_id == user_id)\
+         .group_by(PapeleriaPrecio.papeleria_id).subquery()
+
         query = db.session.query(
             Papeleria.id,
-            Papeleria.nombre
-        ).filter(
+            Papeleria.nombre,
+            func.coalesce(precios_sq.c.precios_count, 0).label('precios_count')
+        ).outerjoin(precios_sq, Papeleria.id == precios_sq.c.papeleria_id)\
+         .filter(
             Papeleria.user_id == user_id,
             Papeleria.is_active == True
         )
         
-        if search_term:
+        order_by = [Papeleria.nombre]
+        if search_term and search_index.enabled():
+            hits = search_index.hits(user_id, 'papeleria', search_term)
+            if hits is None:
+                return []
+            query = query.join(hits, Papeleria.id == hits.c.ref_id)
+            order_by = [hits.c.relevancia, Papeleria.nombre]
+        elif search_term:
             query = query.filter(Papeleria.nombre.ilike(f'%{search_term}%'))
             
-        papelerias = query.order_by(Papeleria.nombre).all()
-        
-        result = []
-        for p in papelerias:
-            # Contar precios configurados
-            precios_count = PapeleriaPrecio.query.filter_by(papeleria_id=p.id).count()
-            result.append({
-                'id': p.id,
-                'nombre': p.nombre,
-                'precios': [{'tramite': '', 'precio': 0}] * precios_count  # Lista simulada para el count
-            })
-        
-        return result
+        return [{
+            'id': p.id,
+            'nombre': p.nombre,
+            'precios_count': p.precios_count
+        } for p in query.order_by(*order_by).limit(limit).all()]
 
 class TramiteRepository:
     """Repository for Tramite and TramiteCosto related operations."""
 
     def add_bulk(self, papeleria_id, tramite, user_id, fecha, precio, costo, cantidad):
         """Registers multiple tramites in a single transaction."""
-        fecha_dt = datetime.strptime(fecha, "%Y-%m-%d")
+        return self.add_many(user_id, [{
+            'papeleria_id': papeleria_id,
+            'tramite': tramite,
+            'fecha': fecha,
+            'precio': precio,
+            'costo': costo,
+            'cantidad': cantidad,
+        }])
+
+    def add_many(self, user_id, filas):
+        """
+        Registers several capture lines (papeleria_id, tramite, fecha, precio, costo, cantidad)
+        in one transaction. Each line becomes a single row carrying its `cantidad` (precio and
+        costo are per unit), inserted with one Core executemany INSERT, and the rollup receives
+        a single delta per (papeleria, tramite, fecha).
+        Returns the number of units registered.
+        """
+        rows = []
+        deltas = {}
+        for fila in filas:
+            cantidad = int(fila['cantidad'])
+            if cantidad <= 0:
+                continue
+            fecha_dt = rollups._as_date(fila['fecha'])
+            precio = float(fila['precio'])
+            costo = float(fila['costo'])
+            rows.append({
+                'papeleria_id': fila['papeleria_id'],
+                'tramite': fila['tramite'],
+                'user_id': user_id,
+                'fecha': fecha_dt,
+                'precio': precio,
+                'costo': costo,
+                'cantidad': cantidad,
+            })
 
-        for _ in range(cantidad):
-            new_tramite = Tramite(
-                papeleria_id=papeleria_id,
-                tramite=tramite,
-                user_id=user_id,
-                fecha=fecha_dt,
-                precio=float(precio),
-                costo=float(costo)
-            )
-            db.session.add(new_tramite)
-        db.session.commit()
+            key = (fila['papeleria_id'], fila['tramite'], fecha_dt)
+            acumulado = deltas.setdefault(key, [0, 0.0, 0.0])
+            acumulado[0] += cantidad
+            acumulado[1] += precio * cantidad
+            acumulado[2] += costo * cantidad
+
+        if not rows:
+            return 0
+
+        try:
+            db.session.execute(insert(Tramite.__table__), rows)
+            for (papeleria_id, tramite, fecha_dt), (cuantos, ingresos, costos) in deltas.items():
+                rollups.apply_tramite_delta(user_id, papeleria_id, tramite, fecha_dt, cuantos, ingresos, costos)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return sum(row['cantidad'] for row in rows)
 
     def get_by_id(self, tramite_id, user_id):
         """Gets a single tramite by its ID."""
         return Tramite.query.filter_by(id=tramite_id, user_id=user_id).first()
 
-    def update(self, tramite_id, user_id, fecha, tramite, precio, costo):
-        """Updates an existing tramite."""
+    def _apply_rollup(self, tramite_obj, signo):
+        """Adds (signo=1) or removes (signo=-1) a whole row from the daily rollup."""
+        rollups.apply_tramite_delta(
+            tramite_obj.user_id, tramite_obj.papeleria_id, tramite_obj.tramite, tramite_obj.fecha,
+            signo * tramite_obj.cantidad,
+            signo * tramite_obj.precio * tramite_obj.cantidad,
+            signo * tramite_obj.costo * tramite_obj.cantidad
+        )
+
+    def update(self, tramite_id, user_id, fecha, tramite, precio, costo, cantidad=None):
+        """Updates an existing tramite row (precio/costo are per unit; cantidad is optional)."""
         tramite_obj = self.get_by_id(tramite_id, user_id)
         if tramite_obj:
-            fecha_dt = datetime.strptime(fecha, "%Y-%m-%d")
-            tramite_obj.fecha = fecha_dt
+            # Retirar los valores anteriores del rollup antes de modificar la fila
+            self._apply_rollup(tramite_obj, -1)
+            tramite_obj.fecha = datetime.strptime(fecha, "%Y-%m-%d").date()
             tramite_obj.tramite = tramite
             tramite_obj.precio = float(precio)
             tramite_obj.costo = float(costo)
+            if cantidad is not None:
+                tramite_obj.cantidad = int(cantidad)
+            self._apply_rollup(tramite_obj, 1)
             db.session.commit()
 
     def delete(self, tramite_id, user_id):
-        """Deletes a tramite and returns the associated papeleria_id."""
+        """Deletes a tramite row (all of its units) and returns the associated papeleria_id."""
         tramite = self.get_by_id(tramite_id, user_id)
         if tramite:
             papeleria_id = tramite.papeleria_id
+            self._apply_rollup(tramite, -1)
             db.session.delete(tramite)
             db.session.commit()
             return papeleria_id
         return None
 
-    def get_details_for_papeleria(self, papeleria_id, user_id, fecha_inicio=None, fecha_fin=None, page=1, per_page=20):
-        """Gets a paginated list of tramites for a specific papeleria."""
+    def split_unit(self, tramite_id, user_id):
+        """
+        Splits one unit off a row with cantidad > 1 into its own row, so it can be edited
+        or deleted individually. Totals do not change, so the rollup is untouched.
+        Returns the new tramite, or None if the row does not exist or has a single unit.
+        """
+        tramite = self.get_by_id(tramite_id, user_id)
+        if not tramite or tramite.cantidad <= 1:
+            return None
+        tramite.cantidad -= 1
+        unidad = Tramite(
+            user_id=tramite.user_id,
+            papeleria_id=tramite.papeleria_id,
+            tramite=tramite.tramite,
+            fecha=tramite.fecha,
+            precio=tramite.precio,
+            costo=tramite.costo,
+            cantidad=1
+        )
+        db.session.add(unidad)
+        db.session.commit()
+        return unidad
+
+    def _details_query(self, papeleria_id, user_id, fecha_inicio=None, fecha_fin=None):
         query = Tramite.query.join(Papeleria).filter(Tramite.papeleria_id == papeleria_id, Tramite.user_id == user_id, Papeleria.is_active == True)
 
         if fecha_inicio and fecha_fin:
             query = query.filter(Tramite.fecha.between(fecha_inicio, fecha_fin))
+        return query
 
-        pagination = query.order_by(Tramite.fecha.desc(), Tramite.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
-        return pagination.items, pagination.total, pagination.pages
+    def get_details_for_papeleria(self, papeleria_id, user_id, fecha_inicio=None, fecha_fin=None, per_page=20,
+                                  after=None, before=None, desde=None):
+        """
+        Gets one keyset page (`KeysetPage`) of tramites for a specific papeleria, newest first.
+        `after`/`before` are cursors from a previous page; `desde` jumps to a date.
+        """
+        query = self._details_query(papeleria_id, user_id, fecha_inicio, fecha_fin)
+        return keyset_paginate(query, Tramite.fecha, Tramite.id, per_page, after=after, before=before, desde=desde)
+
+    def get_report_summary(self, papeleria_id, user_id, fecha_inicio=None, fecha_fin=None):
+        """Summary of an active papeleria for its PDF report, read from the daily rollup:
+        units, income and the first/last day with tramites."""
+        query = db.session.query(
+            func.sum(TramiteDiario.cuantos).label('cuantos'), # type: ignore
+            func.sum(TramiteDiario.total_ingresos).label('total_ingresos'),
+            func.min(TramiteDiario.fecha).label('primera'),
+            func.max(TramiteDiario.fecha).label('ultima')
+        ).join(Papeleria, TramiteDiario.papeleria_id == Papeleria.id)\
+         .filter(TramiteDiario.papeleria_id == papeleria_id, TramiteDiario.user_id == user_id, Papeleria.is_active == True)
+
+        if fecha_inicio and fecha_fin:
+            query = query.filter(TramiteDiario.fecha.between(fecha_inicio, fecha_fin))
+
+        result = query.one()
+        return {
+            'cuantos': int(result.cuantos or 0),
+            'total_ingresos': float(result.total_ingresos or 0),
+            'primera': result.primera,
+            'ultima': result.ultima
+        }
 
     def get_total_general(self, user_id, fecha_inicio=None, fecha_fin=None):
         """Calculates grand totals for a user."""
         query = db.session.query(
-            func.count(Tramite.id).label('cuantos'), # type: ignore
-            func.sum(func.coalesce(Tramite.precio, 0)).label('total_ingresos'),
-            func.sum(func.coalesce(Tramite.costo, 0)).label('total_costos')
-        ).filter(Tramite.user_id == user_id)
+            func.sum(TramiteDiario.cuantos).label('cuantos'), # type: ignore
+            func.sum(TramiteDiario.total_ingresos).label('total_ingresos'),
+            func.sum(TramiteDiario.total_costos).label('total_costos')
+        ).filter(TramiteDiario.user_id == user_id)
 
         if fecha_inicio and fecha_fin:
-            query = query.filter(Tramite.fecha.between(fecha_inicio, fecha_fin))
+            query = query.filter(TramiteDiario.fecha.between(fecha_inicio, fecha_fin))
 
         result = query.one()
         ingresos = float(result.total_ingresos or 0)
@@ -550,14 +802,15 @@ class TramiteRepository:
         Returns the number of tramites registered today or in a given date range.
         If fecha_inicio and fecha_fin are provided, counts tramites in that range; otherwise, counts only today.
         """
-        query = Tramite.query.filter(Tramite.user_id == user_id)
+        query = db.session.query(func.sum(TramiteDiario.cuantos)).filter(TramiteDiario.user_id == user_id)
         if fecha_inicio and fecha_fin:
-            query = query.filter(Tramite.fecha >= fecha_inicio, Tramite.fecha <= fecha_fin)
+            query = query.filter(TramiteDiario.fecha >= fecha_inicio, TramiteDiario.fecha <= fecha_fin)
         else:
             hoy_str = datetime.now().strftime("%Y-%m-%d")
-            query = query.filter(Tramite.fecha == hoy_str)
-        return query.count()
+            query = query.filter(TramiteDiario.fecha == hoy_str)
+        return int(query.scalar() or 0)
     
+    @reads
     def get_all_tramites(self, user_id, search_term=None, limit=100):
         """Gets recent tramites for search functionality.
         NOTA: Incluye datos de papelerías inactivas para búsqueda completa."""
@@ -567,19 +820,27 @@ class TramiteRepository:
             Tramite.fecha,
             Tramite.precio,
             Tramite.costo,
-            (Tramite.precio - Tramite.costo).label('ganancia'),
+            Tramite.cantidad,
+            ((Tramite.precio - Tramite.costo) * Tramite.cantidad).label('ganancia'),
             Papeleria.nombre.label('papeleria')
         ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
          .filter(Tramite.user_id == user_id)
         
-        if search_term:
+        order_by = [Tramite.fecha.desc(), Tramite.id.desc()]
+        if search_term and search_index.enabled():
+            hits = search_index.hits(user_id, 'tramite', search_term, limit)
+            if hits is None:
+                return []
+            query = query.join(hits, Tramite.id == hits.c.ref_id)
+            order_by = [hits.c.relevancia, Tramite.id.desc()]
+        elif search_term:
             term = f"%{search_term}%"
             query = query.filter(
                 (Tramite.tramite.ilike(term)) | 
                 (Papeleria.nombre.ilike(term))
             )
             
-        tramites = query.order_by(Tramite.fecha.desc(), Tramite.id.desc())\
+        tramites = query.order_by(*order_by)\
          .limit(limit)\
          .all()
         
@@ -589,50 +850,123 @@ class TramiteRepository:
             'fecha': t.fecha.strftime('%Y-%m-%d') if hasattr(t.fecha, 'strftime') else str(t.fecha),
             'precio': float(t.precio),
             'costo': float(t.costo),
+            'cantidad': t.cantidad,
             'ganancia': float(t.ganancia),
             'papeleria': t.papeleria
         } for t in tramites]
     
+    @reads
     def get_tramites_comparativa(self, user_id):
         """Retorna trámites de hoy vs ayer y el porcentaje de cambio."""
         from datetime import timedelta
         hoy = datetime.now().date()
         ayer = hoy - timedelta(days=1)
         
-        tramites_hoy = Tramite.query.filter(
-            Tramite.fecha == hoy.strftime("%Y-%m-%d"), 
-            Tramite.user_id == user_id
-        ).count()
-        
-        tramites_ayer = Tramite.query.filter(
-            Tramite.fecha == ayer.strftime("%Y-%m-%d"), 
-            Tramite.user_id == user_id
-        ).count()
+        tramites_hoy = int(db.session.query(func.sum(TramiteDiario.cuantos)).filter(
+            TramiteDiario.fecha == hoy.strftime("%Y-%m-%d"), 
+            TramiteDiario.user_id == user_id
+        ).scalar() or 0)
         
-        cambio = tramites_hoy - tramites_ayer
-        porcentaje = ((cambio / tramites_ayer) * 100) if tramites_ayer > 0 else (100 if tramites_hoy > 0 else 0)
+        tramites_ayer = int(db.session.query(func.sum(TramiteDiario.cuantos)).filter(
+            TramiteDiario.fecha == ayer.strftime("%Y-%m-%d"), 
+            TramiteDiario.user_id == user_id
+        ).scalar() or 0)
         
-        return {
-            'hoy': tramites_hoy,
-            'ayer': tramites_ayer,
-            'cambio': cambio,
-            'porcentaje': round(porcentaje, 1)
-        }
-
-    def export_all_as_csv(self, user_id):
-        """Exports all tramites for a user to be used in a CSV.
-        NOTA: Incluye datos de papelerías inactivas para exportación completa."""
-        return db.session.query(
+        return comparativa_tramites(tramites_hoy, tramites_ayer)
+
+    @reads
+    def export_all_as_csv(self, user_id, fecha_inicio=None, fecha_fin=None, papeleria_id=None, batch_size=1000,
+                          por_papeleria=False):
+        """Streams the tramites of a user (or of one active papeleria) for CSV/XLSX exports and PDF reports.
+        Rows are fetched `batch_size` at a time (`yield_per`), so memory stays flat
+        regardless of the history size. Consume the iterator inside the request.
+        With `por_papeleria` rows come grouped by papeleria (one XLSX sheet each).
+        NOTA: Sin `papeleria_id` incluye datos de papelerías inactivas para exportación completa."""
+        query = db.session.query(
+            Tramite.papeleria_id,
             Papeleria.nombre.label('papeleria'),
             Tramite.tramite,
             Tramite.fecha,
             Tramite.precio,
             Tramite.costo,
-            (Tramite.precio - Tramite.costo).label('ganancia')
+            Tramite.cantidad,
+            ((Tramite.precio - Tramite.costo) * Tramite.cantidad).label('ganancia')
         ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
-         .filter(Tramite.user_id == user_id)\
-         .order_by(Tramite.fecha.desc())\
-         .all()
+         .filter(Tramite.user_id == user_id)
+
+        if papeleria_id is not None:
+            query = query.filter(Tramite.papeleria_id == papeleria_id, Papeleria.is_active == True)
+        if fecha_inicio and fecha_fin:
+            query = query.filter(Tramite.fecha.between(fecha_inicio, fecha_fin))
+
+        order_by = [Tramite.fecha.desc(), Tramite.id.desc()]
+        if por_papeleria:
+            order_by.insert(0, Tramite.papeleria_id)
+        return query.order_by(*order_by).execution_options(yield_per=batch_size)
+
+    @reads
+    def get_totals_by_papeleria(self, user_id, fecha_inicio=None, fecha_fin=None):
+        """Units, income and costs per papeleria from the daily rollup (summary sheet of the XLSX export).
+        NOTA: Incluye papelerías inactivas, igual que la exportación general."""
+        query = db.session.query(
+            Papeleria.nombre,
+            func.sum(TramiteDiario.cuantos).label('cuantos'), # type: ignore
+            func.sum(TramiteDiario.total_ingresos).label('total_ingresos'),
+            func.sum(TramiteDiario.total_costos).label('total_costos')
+        ).join(Papeleria, TramiteDiario.papeleria_id == Papeleria.id)\
+         .filter(TramiteDiario.user_id == user_id)
+
+        if fecha_inicio and fecha_fin:
+            query = query.filter(TramiteDiario.fecha.between(fecha_inicio, fecha_fin))
+
+        rows = query.group_by(TramiteDiario.papeleria_id, Papeleria.nombre).order_by(Papeleria.nombre).all()
+        return [{
+            'papeleria': r.nombre,
+            'cuantos': int(r.cuantos or 0),
+            'total_ingresos': float(r.total_ingresos or 0),
+            'total_costos': float(r.total_costos or 0)
+        } for r in rows]
+
+    @reads
+    def get_totals_by_periodo(self, user_id, fecha_inicio=None, fecha_fin=None, papeleria_id=None):
+        """Units, income and costs per month (newest first) from the daily rollup, for the
+        whole user or one papeleria (summary sheet of the XLSX export)."""
+        query = db.session.query(
+            TramiteDiario.periodo,
+            func.sum(TramiteDiario.cuantos).label('cuantos'), # type: ignore
+            func.sum(TramiteDiario.total_ingresos).label('total_ingresos'),
+            func.sum(TramiteDiario.total_costos).label('total_costos')
+        ).filter(TramiteDiario.user_id == user_id)
+
+        if papeleria_id is not None:
+            query = query.filter(TramiteDiario.papeleria_id == papeleria_id)
+        if fecha_inicio and fecha_fin:
+            query = query.filter(*_periodo_filters(TramiteDiario, fecha_inicio, fecha_fin))
+
+        rows = query.group_by(TramiteDiario.periodo).order_by(TramiteDiario.periodo.desc()).all()
+        return [{
+            'mes': periodo_label(r.periodo),
+            'cuantos': int(r.cuantos or 0),
+            'total_ingresos': float(r.total_ingresos or 0),
+            'total_costos': float(r.total_costos or 0)
+        } for r in rows]
+
+    @reads
+    def stream_for_statements(self, user_id, fecha_inicio, fecha_fin, batch_size=1000):
+        """Streams the tramites of all active papelerias of a user in a date range, ordered by
+        papeleria (then newest first, like the PDF report), so month-end statements can split
+        a single pass per papeleria with `itertools.groupby`."""
+        return db.session.query(
+            Tramite.papeleria_id,
+            Tramite.tramite,
+            Tramite.fecha,
+            Tramite.precio,
+            Tramite.cantidad
+        ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
+         .filter(Tramite.user_id == user_id, Papeleria.is_active == True,
+                 Tramite.fecha.between(fecha_inicio, fecha_fin))\
+         .order_by(Tramite.papeleria_id.desc(), Tramite.fecha.desc(), Tramite.id.desc())\
+         .execution_options(yield_per=batch_size)
 
     def get_all_costos(self, user_id):
         """Gets all defined tramite costs for a user."""
@@ -656,7 +990,7 @@ class TramiteRepository:
 
     def get_distinct_tramites(self, user_id):
         """Gets a list of all unique tramite names for a user."""
-        return [r[0] for r in db.session.query(Tramite.tramite).filter_by(user_id=user_id).distinct().order_by(Tramite.tramite).all()]
+        return [r[0] for r in db.session.query(TramiteDiario.tramite).filter_by(user_id=user_id).distinct().order_by(TramiteDiario.tramite).all()]
 
     def update_old_costos(self, user_id):
         """Updates the cost of old tramites (where cost is 0) using default cost values."""
@@ -669,9 +1003,13 @@ class TramiteRepository:
             updated_rows = Tramite.query.filter_by(tramite=tramite, costo=0, user_id=user_id).update({'costo': costo})
             count += updated_rows
         
+        # La actualización masiva no pasa por add_bulk/update: recalcular el rollup del usuario
+        if count:
+            rollups.rebuild_tramites_rollup(user_id)
         db.session.commit()
         return count
 
+    @reads
     def get_monthly_summary(self, user_id, fecha_inicio=None, fecha_fin=None):
         """
         Calculates a comprehensive monthly financial summary for the last 12 months.
@@ -733,41 +1071,38 @@ class TramiteRepository:
 
         # 2. Get data from Tramites (Ingresos and Costos)
         # NOTA: No filtramos por is_active para incluir datos históricos de papelerías inactivas
-        # Convertir fechas a string para comparación consistente con SQLite
-        start_date_str = start_date.strftime('%Y-%m-%d')
-        end_date_str = end_date.strftime('%Y-%m-%d')
-        
-        tramites_query = db.session.query(
-            func.strftime('%Y-%m', Tramite.fecha).label('month'),
-            func.coalesce(func.sum(Tramite.precio), 0).label('total_ingresos'),
-            func.coalesce(func.sum(Tramite.costo), 0).label('total_costos_tramite')
-        ).filter(
-            Tramite.user_id == user_id,
-            Tramite.fecha >= start_date_str,
-            Tramite.fecha <= end_date_str
-        ).group_by('month').all()
+        columnas = _columnas(user_id)
+        if columnas is not None:
+            tramites_query = columnas.totales_por_periodo(start_date, end_date)
+        else:
+            tramites_query = db.session.query(
+                TramiteDiario.periodo,
+                func.coalesce(func.sum(TramiteDiario.total_ingresos), 0).label('total_ingresos'),
+                func.coalesce(func.sum(TramiteDiario.total_costos), 0).label('total_costos_tramite')
+            ).filter(
+                TramiteDiario.user_id == user_id,
+                *_periodo_filters(TramiteDiario, start_date, end_date)
+            ).group_by(TramiteDiario.periodo).all()
 
         # 3. Get data from Gastos
         gastos_query = db.session.query(
-            func.strftime('%Y-%m', Gasto.fecha).label('month'),
-            func.coalesce(func.sum(Gasto.monto), 0).label('total_gastos_generales')
+            GastoDiario.periodo,
+            func.coalesce(func.sum(GastoDiario.total_monto), 0).label('total_gastos_generales')
         ).filter(
-            Gasto.user_id == user_id,
-            Gasto.fecha >= start_date_str,
-            Gasto.fecha <= end_date_str
-        ).group_by('month').all()
+            GastoDiario.user_id == user_id,
+            *_periodo_filters(GastoDiario, start_date, end_date)
+        ).group_by(GastoDiario.periodo).all()
 
         # 4. Process and combine data
         monthly_summary = defaultdict(lambda: {'ingresos': 0, 'gastos': 0})
 
-        for row in tramites_query:
-            if row.month:  # Solo procesar si el mes no es None
-                monthly_summary[row.month]['ingresos'] += float(row.total_ingresos or 0)
-                monthly_summary[row.month]['gastos'] += float(row.total_costos_tramite or 0)
+        for periodo, ingresos, costos in tramites_query:
+            month = periodo_label(periodo)
+            monthly_summary[month]['ingresos'] += float(ingresos or 0)
+            monthly_summary[month]['gastos'] += float(costos or 0)
 
         for row in gastos_query:
-            if row.month:  # Solo procesar si el mes no es None
-                monthly_summary[row.month]['gastos'] += float(row.total_gastos_generales or 0)
+            monthly_summary[periodo_label(row.periodo)]['gastos'] += float(row.total_gastos_generales or 0)
         
         # 5. Build final list and calculate totals
         final_data = []
@@ -802,21 +1137,26 @@ class TramiteRepository:
         }
 
 
+    @reads
     def get_tramites_distribution(self, user_id, limit=10, fecha_inicio=None, fecha_fin=None):
         """Gets the distribution of tramites by count, optionally filtered by date range."""
+        columnas = _columnas(user_id, fecha_inicio, fecha_fin)
+        if columnas is not None:
+            return columnas.distribucion_tramites(limit, fecha_inicio, fecha_fin)
         try:
             # NOTA: No filtramos por is_active para incluir datos históricos de papelerías inactivas
             query = db.session.query(
-                Tramite.tramite.label('tramite_label'),
-                func.count(Tramite.id).label('total_count')
-            ).filter(Tramite.user_id == user_id)
+                TramiteDiario.tramite.label('tramite_label'),
+                func.sum(TramiteDiario.cuantos).label('total_count')
+            ).filter(TramiteDiario.user_id == user_id)
             
             # Aplicar filtro de fecha si se proporciona
             if fecha_inicio and fecha_fin:
-                query = query.filter(Tramite.fecha >= fecha_inicio, Tramite.fecha <= fecha_fin)
+                query = query.filter(TramiteDiario.fecha >= fecha_inicio, TramiteDiario.fecha <= fecha_fin)
             
-            query = query.group_by(Tramite.tramite)\
-             .order_by(db.desc('total_count'))\
+            # Empates por nombre: mismo orden que column_store
+            query = query.group_by(TramiteDiario.tramite)\
+             .order_by(db.desc('total_count'), TramiteDiario.tramite)\
              .limit(limit)
             
             results = []
@@ -830,17 +1170,19 @@ class TramiteRepository:
             logging.error(f"Error in get_tramites_distribution: {e}")
             return []
 
+    @reads
     def get_tramites_distribution_for_papeleria(self, papeleria_id, user_id, limit=10):
         """Gets the distribution of tramites for a specific papeleria."""
         query = db.session.query(
-            Tramite.tramite.label('tramite_label'), # type: ignore
-            func.count(Tramite.id).label('total_count')
-        ).filter(Tramite.user_id == user_id, Tramite.papeleria_id == papeleria_id)\
-         .group_by(Tramite.tramite)\
+            TramiteDiario.tramite.label('tramite_label'), # type: ignore
+            func.sum(TramiteDiario.cuantos).label('total_count')
+        ).filter(TramiteDiario.user_id == user_id, TramiteDiario.papeleria_id == papeleria_id)\
+         .group_by(TramiteDiario.tramite)\
          .order_by(db.desc('total_count'))\
          .limit(limit)
         return [row._asdict() for row in query.all()]
 
+    @reads
     def get_monthly_summary_for_papeleria(self, papeleria_id, user_id):
         """
         Calculates a comprehensive monthly financial summary for a specific papeleria
@@ -870,21 +1212,20 @@ class TramiteRepository:
 
         # 2. Get data from Tramites for this specific papeleria
         tramites_query = db.session.query(
-            func.strftime('%Y-%m', Tramite.fecha).label('month'), # type: ignore
-            func.sum(Tramite.precio).label('total_ingresos'),
-            func.sum(Tramite.costo).label('total_costos')
+            TramiteDiario.periodo,
+            func.sum(TramiteDiario.total_ingresos).label('total_ingresos'),
+            func.sum(TramiteDiario.total_costos).label('total_costos')
         ).filter(
-            Tramite.user_id == user_id,
-            Tramite.papeleria_id == papeleria_id,
-            Tramite.fecha >= start_date,
-            Tramite.fecha <= end_date
-        ).group_by('month').all()
+            TramiteDiario.user_id == user_id,
+            TramiteDiario.papeleria_id == papeleria_id,
+            *_periodo_filters(TramiteDiario, start_date, end_date)
+        ).group_by(TramiteDiario.periodo).all()
 
         # 3. Process data
         monthly_summary = defaultdict(lambda: {'ingresos': 0, 'gastos': 0})
         for row in tramites_query:
-            monthly_summary[row.month]['ingresos'] = row.total_ingresos
-            monthly_summary[row.month]['gastos'] = row.total_costos
+            monthly_summary[periodo_label(row.periodo)]['ingresos'] = row.total_ingresos
+            monthly_summary[periodo_label(row.periodo)]['gastos'] = row.total_costos
 
         # 4. Build final list and calculate totals
         final_data = []
@@ -936,6 +1277,19 @@ class ProveedorRepository:
     def get_all(self, user_id):
         return Proveedor.query.filter_by(user_id=user_id).order_by(Proveedor.nombre).all()
 
+    @reads
+    def search(self, user_id, search_term, limit=10):
+        """Proveedores whose name matches `search_term`, for the global search."""
+        query = db.session.query(Proveedor.id, Proveedor.nombre).filter(Proveedor.user_id == user_id)
+        if search_index.enabled():
+            hits = search_index.hits(user_id, 'proveedor', search_term, limit)
+            if hits is None:
+                return []
+            query = query.join(hits, Proveedor.id == hits.c.ref_id).order_by(hits.c.relevancia, Proveedor.nombre)
+        else:
+            query = query.filter(Proveedor.nombre.ilike(f'%{search_term}%')).order_by(Proveedor.nombre)
+        return [{'id': p.id, 'nombre': p.nombre} for p in query.limit(limit).all()]
+
     def get_by_id(self, proveedor_id, user_id):
         return Proveedor.query.filter_by(id=proveedor_id, user_id=user_id).first()
 
@@ -969,9 +1323,15 @@ class GastoRepository:
             receipt_filename=receipt_filename
         )
         db.session.add(new_gasto)
+        rollups.apply_gasto_delta(user_id, categoria, fecha_dt, 1, float(monto))
         db.session.commit()
 
-    def get_all(self, user_id, page=1, per_page=20, fecha_inicio=None, fecha_fin=None, categoria=None):
+    def get_all(self, user_id, per_page=20, fecha_inicio=None, fecha_fin=None, categoria=None,
+                after=None, before=None, desde=None):
+        """
+        Gets one keyset page (`KeysetPage`) of gastos, newest first, with the proveedor
+        loaded in the same query. The total comes from the `gastos_diarios` rollup.
+        """
         query = Gasto.query.filter_by(user_id=user_id)
 
         if fecha_inicio and fecha_fin:
@@ -980,9 +1340,21 @@ class GastoRepository:
         if categoria:
             query = query.filter_by(categoria=categoria)
         
-        pagination = query.join(Proveedor).order_by(Gasto.fecha.desc(), Gasto.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
-        return pagination.items, pagination.total
+        query = query.join(Proveedor).options(contains_eager(Gasto.proveedor))
+        page = keyset_paginate(query, Gasto.fecha, Gasto.id, per_page, after=after, before=before, desde=desde)
+        page.total = self.count(user_id, fecha_inicio, fecha_fin, categoria)
+        return page
+
+    def count(self, user_id, fecha_inicio=None, fecha_fin=None, categoria=None):
+        """Number of gastos matching the listing filters, read from the daily rollup."""
+        query = db.session.query(func.sum(GastoDiario.cuantos)).filter(GastoDiario.user_id == user_id)
+        if fecha_inicio and fecha_fin:
+            query = query.filter(GastoDiario.fecha.between(fecha_inicio, fecha_fin))
+        if categoria:
+            query = query.filter(GastoDiario.categoria == categoria)
+        return int(query.scalar() or 0)
     
+    @reads
     def get_all_gastos(self, user_id, search_term=None, limit=100):
         """Gets recent gastos for search functionality."""
         query = db.session.query(
@@ -995,7 +1367,14 @@ class GastoRepository:
         ).join(Proveedor, Gasto.proveedor_id == Proveedor.id)\
          .filter(Gasto.user_id == user_id)
         
-        if search_term:
+        order_by = [Gasto.fecha.desc(), Gasto.id.desc()]
+        if search_term and search_index.enabled():
+            hits = search_index.hits(user_id, 'gasto', search_term, limit)
+            if hits is None:
+                return []
+            query = query.join(hits, Gasto.id == hits.c.ref_id)
+            order_by = [hits.c.relevancia, Gasto.id.desc()]
+        elif search_term:
             term = f"%{search_term}%"
             query = query.filter(
                 (Gasto.descripcion.ilike(term)) |
@@ -1003,7 +1382,7 @@ class GastoRepository:
                 (Gasto.categoria.ilike(term))
             )
             
-        gastos = query.order_by(Gasto.fecha.desc(), Gasto.id.desc())\
+        gastos = query.order_by(*order_by)\
          .limit(limit)\
          .all()
         
@@ -1016,12 +1395,56 @@ class GastoRepository:
             'proveedor': g.proveedor
         } for g in gastos]
 
+    @reads
+    def export_all(self, user_id, fecha_inicio=None, fecha_fin=None, categoria=None, batch_size=1000):
+        """Streams the gastos of a user (newest first) with the proveedor name, `batch_size`
+        rows at a time (`yield_per`), for the XLSX export. Consume the iterator inside the request."""
+        query = db.session.query(
+            Gasto.fecha,
+            Proveedor.nombre.label('proveedor'),
+            Gasto.categoria,
+            Gasto.descripcion,
+            Gasto.monto
+        ).join(Proveedor, Gasto.proveedor_id == Proveedor.id)\
+         .filter(Gasto.user_id == user_id)
+
+        if fecha_inicio and fecha_fin:
+            query = query.filter(Gasto.fecha.between(fecha_inicio, fecha_fin))
+        if categoria:
+            query = query.filter(Gasto.categoria == categoria)
+
+        return query.order_by(Gasto.fecha.desc(), Gasto.id.desc()).execution_options(yield_per=batch_size)
+
+    @reads
+    def get_totals_by_periodo(self, user_id, fecha_inicio=None, fecha_fin=None, categoria=None):
+        """Number and amount of gastos per (month, categoria), newest month first, from the daily rollup."""
+        query = db.session.query(
+            GastoDiario.periodo,
+            GastoDiario.categoria,
+            func.sum(GastoDiario.cuantos).label('cuantos'),
+            func.sum(GastoDiario.total_monto).label('total_monto')
+        ).filter(GastoDiario.user_id == user_id)
+
+        if fecha_inicio and fecha_fin:
+            query = query.filter(*_periodo_filters(GastoDiario, fecha_inicio, fecha_fin))
+        if categoria:
+            query = query.filter(GastoDiario.categoria == categoria)
+
+        rows = query.group_by(GastoDiario.periodo, GastoDiario.categoria)\
+            .order_by(GastoDiario.periodo.desc(), GastoDiario.categoria).all()
+        return [{
+            'mes': periodo_label(r.periodo),
+            'categoria': r.categoria,
+            'cuantos': int(r.cuantos or 0),
+            'total_monto': float(r.total_monto or 0)
+        } for r in rows]
+
     def get_total_gastos(self, user_id, fecha_inicio=None, fecha_fin=None):
         """Calculates the total amount of all expenses for a user."""
-        query = db.session.query(func.sum(Gasto.monto)).filter_by(user_id=user_id)
+        query = db.session.query(func.sum(GastoDiario.total_monto)).filter_by(user_id=user_id)
 
         if fecha_inicio and fecha_fin:
-            query = query.filter(Gasto.fecha.between(fecha_inicio, fecha_fin))
+            query = query.filter(GastoDiario.fecha.between(fecha_inicio, fecha_fin))
 
         return query.scalar() or 0
 
@@ -1031,36 +1454,40 @@ class GastoRepository:
     def update(self, gasto_id, user_id, proveedor_id, descripcion, monto, fecha, categoria, receipt_filename=None):
         gasto = self.get_by_id(gasto_id, user_id)
         if gasto:
+            rollups.apply_gasto_delta(user_id, gasto.categoria, gasto.fecha, -1, -gasto.monto)
             gasto.proveedor_id = proveedor_id
             gasto.descripcion = descripcion
             gasto.monto = float(monto)
             gasto.fecha = datetime.strptime(fecha, "%Y-%m-%d")
             gasto.categoria = categoria
             gasto.receipt_filename = receipt_filename
+            rollups.apply_gasto_delta(user_id, categoria, gasto.fecha, 1, float(monto))
             db.session.commit()
 
     def delete(self, gasto_id, user_id):
         gasto = self.get_by_id(gasto_id, user_id)
         if gasto:
+            rollups.apply_gasto_delta(user_id, gasto.categoria, gasto.fecha, -1, -gasto.monto)
             db.session.delete(gasto)
             db.session.commit()
 
     def does_receipt_belong_to_user(self, filename, user_id):
         return Gasto.query.filter_by(receipt_filename=filename, user_id=user_id).first() is not None
 
+    @reads
     def get_gastos_distribution(self, user_id, fecha_inicio=None, fecha_fin=None):
         """Gets the distribution of gastos by categoria, optionally filtered by date range."""
         try:
             query = db.session.query(
-                Gasto.categoria,
-                func.coalesce(func.sum(Gasto.monto), 0).label('total_monto')
-            ).filter(Gasto.user_id == user_id)
+                GastoDiario.categoria,
+                func.coalesce(func.sum(GastoDiario.total_monto), 0).label('total_monto')
+            ).filter(GastoDiario.user_id == user_id)
             
             # Aplicar filtro de fecha si se proporciona
             if fecha_inicio and fecha_fin:
-                query = query.filter(Gasto.fecha >= fecha_inicio, Gasto.fecha <= fecha_fin)
+                query = query.filter(GastoDiario.fecha >= fecha_inicio, GastoDiario.fecha <= fecha_fin)
             
-            query = query.group_by(Gasto.categoria)\
+            query = query.group_by(GastoDiario.categoria)\
              .order_by(db.desc('total_monto'))
             
             results = []
@@ -1074,17 +1501,18 @@ class GastoRepository:
             logging.error(f"Error in get_gastos_distribution: {e}")
             return []
 
+    @reads
     def get_gastos_summary(self, user_id, fecha_inicio=None, fecha_fin=None, categoria=None):
         """Gets a complete summary of gastos including total, distribution and trend."""
         # 1. Calcular el total
         total_query = db.session.query(
-            func.sum(Gasto.monto).label('total')
-        ).filter(Gasto.user_id == user_id)
+            func.sum(GastoDiario.total_monto).label('total')
+        ).filter(GastoDiario.user_id == user_id)
 
         if fecha_inicio and fecha_fin:
-            total_query = total_query.filter(Gasto.fecha.between(fecha_inicio, fecha_fin))
+            total_query = total_query.filter(GastoDiario.fecha.between(fecha_inicio, fecha_fin))
         if categoria:
-            total_query = total_query.filter(Gasto.categoria == categoria)
+            total_query = total_query.filter(GastoDiario.categoria == categoria)
         
         total = float(total_query.scalar() or 0)
         
@@ -1114,28 +1542,27 @@ class GastoRepository:
             # Si hay fecha_inicio y fecha_fin, usar esas fechas
             # Si no, usar los últimos 12 meses
             query = db.session.query(
-                func.strftime('%Y-%m', Gasto.fecha).label('month'),
-                func.sum(Gasto.monto).label('total')
-            ).filter(Gasto.user_id == user_id)
+                GastoDiario.periodo,
+                func.sum(GastoDiario.total_monto).label('total')
+            ).filter(GastoDiario.user_id == user_id)
             
             if fecha_inicio and fecha_fin:
-                query = query.filter(Gasto.fecha.between(fecha_inicio, fecha_fin))
+                query = query.filter(*_periodo_filters(GastoDiario, fecha_inicio, fecha_fin))
             else:
                 # Últimos 12 meses si no hay filtro de fecha
                 from datetime import date
                 from dateutil.relativedelta import relativedelta
-                end_date = date.today()
-                start_date = end_date - relativedelta(months=12)
-                query = query.filter(Gasto.fecha >= start_date)
+                start_date = date.today() - relativedelta(months=12)
+                query = query.filter(GastoDiario.periodo >= periodo_de(start_date), GastoDiario.fecha >= start_date)
             
             if categoria:
-                query = query.filter(Gasto.categoria == categoria)
+                query = query.filter(GastoDiario.categoria == categoria)
             
-            query = query.group_by('month').order_by('month')
+            query = query.group_by(GastoDiario.periodo).order_by(GastoDiario.periodo)
             
             results = query.all()
             
-            labels = [row.month for row in results]
+            labels = [periodo_label(row.periodo) for row in results]
             data = [float(row.total or 0) for row in results]
             
             return {'labels': labels, 'data': data}
@@ -1145,88 +1572,145 @@ class GastoRepository:
 
 
 # ==================== REPOSITORIO DE ANÁLISIS AVANZADO ====================
+DIAS_NOMBRES = ['Domingo', 'Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado']
+
+
+def _acumular_historico(datos, fila):
+    """Suma una fila agrupada del rollup a los datos de snapshot de una papelería (ver AnalyticsSnapshot.datos)."""
+    ganancia = float(fila.ingresos) - float(fila.costos)
+    datos['cuantos'] = datos.get('cuantos', 0) + int(fila.cuantos)
+    datos['ingresos'] = datos.get('ingresos', 0.0) + float(fila.ingresos)
+    datos['costos'] = datos.get('costos', 0.0) + float(fila.costos)
+    meses = datos.setdefault('meses', {})
+    meses[str(fila.periodo)] = meses.get(str(fila.periodo), 0.0) + ganancia
+    dia = datos.setdefault('semana', {}).setdefault(str(fila.dia_semana), [0.0, 0])
+    dia[0] += ganancia
+    dia[1] += int(fila.cuantos)
+    tramite = datos.setdefault('tramites', {}).setdefault(fila.tramite, [0, 0.0, 0.0])
+    tramite[0] += int(fila.cuantos)
+    tramite[1] += float(fila.ingresos)
+    tramite[2] += float(fila.costos)
+
+
+def _metricas_historicas(datos, activas):
+    """Combina los datos por papelería en las métricas históricas de AnalyticsRepository."""
+    meses, semana, tramites = {}, {}, {}
+    ingresos = costos = 0.0
+    costos_todas, cuantos_todas = 0.0, 0
+    roi = []
+    for papeleria_id, valores in datos.items():
+        costos_todas += valores.get('costos', 0.0)
+        cuantos_todas += valores.get('cuantos', 0)
+        if papeleria_id not in activas or not valores:
+            continue
+        ingresos += valores['ingresos']
+        costos += valores['costos']
+        if valores['costos'] > 0:
+            roi.append({'nombre': activas[papeleria_id],
+                        'roi': (valores['ingresos'] - valores['costos']) / valores['costos'] * 100})
+        for periodo, ganancia in valores['meses'].items():
+            meses[periodo] = meses.get(periodo, 0.0) + ganancia
+        for dia, (ganancia, cuantos) in valores['semana'].items():
+            acumulado = semana.setdefault(dia, [0.0, 0])
+            acumulado[0] += ganancia
+            acumulado[1] += cuantos
+        for nombre, (cuantos, ing, cos) in valores['tramites'].items():
+            acumulado = tramites.setdefault(nombre, [0, 0.0, 0.0])
+            acumulado[0] += cuantos
+            acumulado[1] += ing
+            acumulado[2] += cos
+
+    mejor_mes = None
+    if meses:
+        periodo, ganancia = max(meses.items(), key=lambda m: m[1])
+        mejor_mes = {'mes': periodo_label(int(periodo)), 'ganancia': ganancia}
+    dia_productivo = None
+    if semana:
+        dia, (ganancia, cuantos) = max(semana.items(), key=lambda d: d[1][0])
+        dia_productivo = {'dia_nombre': DIAS_NOMBRES[int(dia)], 'ganancia': ganancia, 'tramites': cuantos}
+    roi.sort(key=lambda r: r['roi'], reverse=True)
+    rentabilidad = sorted(tramites.items(), key=lambda t: t[1][1] - t[1][2], reverse=True)
+    return {
+        'mejor_mes': mejor_mes,
+        'dia_productivo': dia_productivo,
+        'margen_promedio': round((ingresos - costos) / ingresos * 100, 1) if ingresos > 0 else 0,
+        'costo_promedio_tramite': round(costos_todas / cuantos_todas, 2) if cuantos_todas else 0.0,
+        'roi_papelerias': [{'nombre': r['nombre'], 'roi': round(r['roi'], 1)} for r in roi[:5]],
+        'rentabilidad_tramites': [{
+            'tramite': nombre,
+            'cantidad': cuantos,
+            'margen_promedio': round((ing - cos) / cuantos, 2) if cuantos else 0,
+            'ganancia_total': round(ing - cos, 2)
+        } for nombre, (cuantos, ing, cos) in rentabilidad],
+    }
+
+
 class AnalyticsRepository:
     """Repositorio para análisis predictivo y métricas avanzadas."""
     
+    @reads
     def get_meta_mensual_progress(self, user_id, meta_objetivo=10000):
         """Calcula el progreso hacia la meta mensual."""
-        from datetime import date, timedelta
-        from dateutil.relativedelta import relativedelta
+        from datetime import date
         
         hoy = date.today()
         inicio_mes = hoy.replace(day=1)
         
         # Ganancia actual del mes
         resultado = db.session.query(
-            func.sum(Tramite.precio - Tramite.costo).label('ganancia_actual')
-        ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
+            func.sum(TramiteDiario.total_ingresos - TramiteDiario.total_costos).label('ganancia_actual')
+        ).join(Papeleria, TramiteDiario.papeleria_id == Papeleria.id)\
          .filter(
-            Tramite.user_id == user_id,
+            TramiteDiario.user_id == user_id,
+            Papeleria.user_id == user_id,
             Papeleria.is_active == True,
-            Tramite.fecha >= inicio_mes
+            TramiteDiario.fecha >= inicio_mes
         ).first()
         
-        ganancia_actual = float(resultado.ganancia_actual or 0)
-        porcentaje = (ganancia_actual / meta_objetivo * 100) if meta_objetivo > 0 else 0
-        
-        # Calcular días restantes hasta el próximo DOMINGO (día de corte)
-        # weekday(): 0=Lunes, 1=Martes, 2=Miércoles, 3=Jueves, 4=Viernes, 5=Sábado, 6=Domingo
-        dia_actual = hoy.weekday()  # Hoy es miércoles = 2
-        
-        if dia_actual == 6:  # Si hoy es domingo
-            dias_hasta_domingo = 0
-        else:
-            # Días hasta el próximo domingo: 6 - dia_actual
-            dias_hasta_domingo = 6 - dia_actual
-        
-        # Calcular proyección basada en el mes completo
-        dias_transcurridos = (hoy - inicio_mes).days + 1
-        dias_en_mes = (hoy.replace(day=28) + relativedelta(days=4)).replace(day=1) - relativedelta(days=1)
-        dias_totales = dias_en_mes.day
-        
-        proyeccion = (ganancia_actual / dias_transcurridos * dias_totales) if dias_transcurridos > 0 else 0
-        
-        return {
-            'ganancia_actual': ganancia_actual,
-            'meta_objetivo': meta_objetivo,
-            'porcentaje': round(porcentaje, 1),
-            'proyeccion': round(proyeccion, 2),
-            'dias_restantes': dias_hasta_domingo,  # Cambiado: ahora es hasta el próximo domingo
-            'falta': max(0, meta_objetivo - ganancia_actual)
-        }
+        return meta_mensual_progress(float(resultado.ganancia_actual or 0), hoy, meta_objetivo)
     
+    @reads
     def get_mejor_mes_historico(self, user_id):
         """Obtiene el mejor mes histórico."""
+        columnas = _columnas(user_id)
+        if columnas is not None:
+            return columnas.mejor_mes()
         resultado = db.session.query(
-            func.strftime('%Y-%m', Tramite.fecha).label('mes'),
-            func.sum(Tramite.precio - Tramite.costo).label('ganancia')
-        ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
+            TramiteDiario.periodo,
+            func.sum(TramiteDiario.total_ingresos - TramiteDiario.total_costos).label('ganancia')
+        ).join(Papeleria, TramiteDiario.papeleria_id == Papeleria.id)\
          .filter(
-            Tramite.user_id == user_id,
+            TramiteDiario.user_id == user_id,
+            Papeleria.user_id == user_id,
             Papeleria.is_active == True
-        ).group_by('mes')\
+        ).group_by(TramiteDiario.periodo)\
          .order_by(db.desc('ganancia'))\
          .first()
         
         if resultado:
             return {
-                'mes': resultado.mes,
+                'mes': periodo_label(resultado.periodo),
                 'ganancia': float(resultado.ganancia)
             }
         return None
     
+    @reads
     def get_dias_mas_productivos(self, user_id):
         """Identifica los días de la semana más productivos."""
+        columnas = _columnas(user_id)
+        if columnas is not None:
+            return columnas.dia_productivo()
         # SQLite: 0=Domingo, 1=Lunes, ..., 6=Sábado
         dias_nombres = ['Domingo', 'Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado']
         
         resultado = db.session.query(
-            func.strftime('%w', Tramite.fecha).label('dia_semana'),
-            func.sum(Tramite.precio - Tramite.costo).label('ganancia_total'),
-            func.count(Tramite.id).label('cantidad_tramites')
-        ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
+            func.strftime('%w', TramiteDiario.fecha).label('dia_semana'),
+            func.sum(TramiteDiario.total_ingresos - TramiteDiario.total_costos).label('ganancia_total'),
+            func.sum(TramiteDiario.cuantos).label('cantidad_tramites')
+        ).join(Papeleria, TramiteDiario.papeleria_id == Papeleria.id)\
          .filter(
-            Tramite.user_id == user_id,
+            TramiteDiario.user_id == user_id,
+            Papeleria.user_id == user_id,
             Papeleria.is_active == True
         ).group_by('dia_semana')\
          .order_by(db.desc('ganancia_total'))\
@@ -1242,13 +1726,14 @@ class AnalyticsRepository:
             }
         return None
     
+    @reads
     def get_hora_pico(self, user_id):
         """Calcula la hora pico de actividad (requiere timestamp, estimado)."""
         # Por simplicidad, retorna basado en trámites por día
         resultado = db.session.query(
-            func.strftime('%H', Tramite.fecha).label('hora'),
-            func.count(Tramite.id).label('cantidad')
-        ).filter(Tramite.user_id == user_id)\
+            func.strftime('%H', TramiteDiario.fecha).label('hora'),
+            func.sum(TramiteDiario.cuantos).label('cantidad')
+        ).filter(TramiteDiario.user_id == user_id)\
          .group_by('hora')\
          .order_by(db.desc('cantidad'))\
          .first()
@@ -1257,14 +1742,19 @@ class AnalyticsRepository:
             return f"{resultado.hora}:00"
         return "10:00"  # Default
     
+    @reads
     def get_margen_promedio(self, user_id):
         """Calcula el margen de ganancia promedio."""
+        columnas = _columnas(user_id)
+        if columnas is not None:
+            return columnas.margen_promedio()
         resultado = db.session.query(
-            func.sum(Tramite.precio).label('total_ingresos'),
-            func.sum(Tramite.costo).label('total_costos')
-        ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
+            func.sum(TramiteDiario.total_ingresos).label('total_ingresos'),
+            func.sum(TramiteDiario.total_costos).label('total_costos')
+        ).join(Papeleria, TramiteDiario.papeleria_id == Papeleria.id)\
          .filter(
-            Tramite.user_id == user_id,
+            TramiteDiario.user_id == user_id,
+            Papeleria.user_id == user_id,
             Papeleria.is_active == True
         ).first()
         
@@ -1275,45 +1765,61 @@ class AnalyticsRepository:
             return round(margen, 1)
         return 0
     
+    @reads
     def get_costo_promedio_tramite(self, user_id):
         """Calcula el costo promedio por trámite."""
+        columnas = _columnas(user_id)
+        if columnas is not None:
+            return columnas.costo_promedio_tramite()
         resultado = db.session.query(
-            func.avg(Tramite.costo).label('promedio')
-        ).filter(Tramite.user_id == user_id).first()
+            func.sum(TramiteDiario.total_costos).label('total_costos'),
+            func.sum(TramiteDiario.cuantos).label('cuantos')
+        ).filter(TramiteDiario.user_id == user_id).first()
         
-        return round(float(resultado.promedio or 0), 2)
+        if not resultado or not resultado.cuantos:
+            return 0.0
+        return round(float(resultado.total_costos or 0) / resultado.cuantos, 2)
     
+    @reads
     def get_roi_por_papeleria(self, user_id):
         """Calcula ROI por papelería."""
+        columnas = _columnas(user_id)
+        if columnas is not None:
+            return columnas.roi_papelerias()
         resultado = db.session.query(
             Papeleria.nombre,
-            func.sum(Tramite.precio).label('ingresos'),
-            func.sum(Tramite.costo).label('costos'),
-            ((func.sum(Tramite.precio) - func.sum(Tramite.costo)) / func.sum(Tramite.costo) * 100).label('roi')
-        ).join(Tramite, Papeleria.id == Tramite.papeleria_id)\
+            func.sum(TramiteDiario.total_ingresos).label('ingresos'),
+            func.sum(TramiteDiario.total_costos).label('costos'),
+            ((func.sum(TramiteDiario.total_ingresos) - func.sum(TramiteDiario.total_costos)) / func.sum(TramiteDiario.total_costos) * 100).label('roi')
+        ).join(TramiteDiario, Papeleria.id == TramiteDiario.papeleria_id)\
          .filter(
             Papeleria.user_id == user_id,
             Papeleria.is_active == True
         ).group_by(Papeleria.id, Papeleria.nombre)\
-         .having(func.sum(Tramite.costo) > 0)\
+         .having(func.sum(TramiteDiario.total_costos) > 0)\
          .order_by(db.desc('roi'))\
          .limit(5)\
          .all()
         
         return [{'nombre': r.nombre, 'roi': round(float(r.roi), 1)} for r in resultado]
     
+    @reads
     def get_rentabilidad_por_tramite(self, user_id):
         """Analiza rentabilidad por tipo de trámite."""
+        columnas = _columnas(user_id)
+        if columnas is not None:
+            return columnas.rentabilidad_tramites()
         resultado = db.session.query(
-            Tramite.tramite,
-            func.count(Tramite.id).label('cantidad'),
-            func.avg(Tramite.precio - Tramite.costo).label('margen_promedio'),
-            func.sum(Tramite.precio - Tramite.costo).label('ganancia_total')
-        ).join(Papeleria, Tramite.papeleria_id == Papeleria.id)\
+            TramiteDiario.tramite,
+            func.sum(TramiteDiario.cuantos).label('cantidad'),
+            (func.sum(TramiteDiario.total_ingresos - TramiteDiario.total_costos) * 1.0 / func.sum(TramiteDiario.cuantos)).label('margen_promedio'),
+            func.sum(TramiteDiario.total_ingresos - TramiteDiario.total_costos).label('ganancia_total')
+        ).join(Papeleria, TramiteDiario.papeleria_id == Papeleria.id)\
          .filter(
-            Tramite.user_id == user_id,
+            TramiteDiario.user_id == user_id,
+            Papeleria.user_id == user_id,
             Papeleria.is_active == True
-        ).group_by(Tramite.tramite)\
+        ).group_by(TramiteDiario.tramite)\
          .order_by(db.desc('ganancia_total'))\
          .all()
         
@@ -1324,6 +1830,181 @@ class AnalyticsRepository:
             'ganancia_total': round(float(r.ganancia_total or 0), 2)
         } for r in resultado]
 
+    # --- Snapshot histórico (tabla analytics_snapshots) ---
+    # Las métricas históricas cambian poco pero recorren toda la historia del usuario.
+    # `refresh_snapshot` (job nocturno o bajo demanda) guarda por papelería sus agregados
+    # hasta ayer; `get_historico` les suma solo las filas del rollup posteriores.
+
+    @reads
+    def get_historico(self, user_id):
+        """
+        Métricas históricas (mejor mes, día más productivo, margen, costo promedio, ROI por
+        papelería y rentabilidad por trámite) desde el snapshot más las filas del rollup que
+        aún no cubre. Mismos valores que los métodos individuales, más un bloque `snapshot`
+        con su frescura. Con el almacén columnar en memoria no consulta SQLite.
+        """
+        columnas = _columnas(user_id)
+        if columnas is not None:
+            historico = columnas.historico()
+            historico['snapshot'] = {
+                'origen': 'memoria',
+                'hasta': date.today().isoformat(),
+                'actualizado': datetime.fromtimestamp(columnas.cargado).isoformat(timespec='seconds'),
+                'papelerias_sin_snapshot': 0,
+                'filas_delta': 0,
+            }
+            return historico
+
+        papelerias = db.session.query(
+            Papeleria.id, Papeleria.nombre, Papeleria.is_active,
+            AnalyticsSnapshot.hasta, AnalyticsSnapshot.datos, AnalyticsSnapshot.actualizado
+        ).outerjoin(AnalyticsSnapshot, and_(AnalyticsSnapshot.papeleria_id == Papeleria.id,
+                                            AnalyticsSnapshot.user_id == user_id))\
+         .filter(Papeleria.user_id == user_id).all()
+
+        con_snapshot = [p for p in papelerias if p.hasta is not None]
+        sin_snapshot = [p.id for p in papelerias if p.hasta is None]
+        datos = {p.id: json.loads(p.datos) for p in con_snapshot}
+        # Cota por índice: las papelerías con snapshot solo aportan días posteriores al más antiguo
+        desde = min((p.hasta for p in con_snapshot), default=None)
+        delta = self._filas_fuera_de_snapshot(user_id, desde=desde, sin_snapshot=sin_snapshot)
+        for fila in delta:
+            _acumular_historico(datos.setdefault(fila.papeleria_id, {}), fila)
+
+        activas = {p.id: p.nombre for p in papelerias if p.is_active}
+        historico = _metricas_historicas(datos, activas)
+        historico['snapshot'] = {
+            'origen': 'snapshot',
+            'hasta': desde.isoformat() if desde else None,
+            'actualizado': min(p.actualizado for p in con_snapshot).isoformat(timespec='seconds') if con_snapshot else None,
+            'papelerias_sin_snapshot': sum(1 for p in sin_snapshot if p in datos),
+            'filas_delta': len(delta),
+        }
+        return historico
+
+    @writes
+    def refresh_snapshot(self, user_id, hasta=None):
+        """
+        Extiende los snapshots del usuario hasta `hasta` (por defecto y como máximo, ayer)
+        sumando solo las filas del rollup que cada papelería aún no tiene. El día en curso
+        siempre queda en el delta. Retorna las papelerías escritas.
+        """
+        ayer = date.today() - timedelta(days=1)
+        hasta = min(hasta or ayer, ayer)
+        try:
+            # Escritura primero: toma el candado de SQLite antes de leer, así ninguna
+            # escritura con fecha pasada (que descarta el snapshot) queda entre lectura y guardado
+            db.session.execute(update(AnalyticsSnapshot)
+                               .where(AnalyticsSnapshot.user_id == user_id)
+                               .values(hasta=AnalyticsSnapshot.hasta))
+            existentes = {s.papeleria_id: s for s in AnalyticsSnapshot.query.filter_by(user_id=user_id)}
+            datos = {pid: json.loads(s.datos) for pid, s in existentes.items() if s.hasta < hasta}
+            for fila in self._filas_fuera_de_snapshot(user_id, hasta=hasta):
+                if fila.papeleria_id in existentes and fila.papeleria_id not in datos:
+                    continue  # Ya cubierta hasta `hasta` o después
+                _acumular_historico(datos.setdefault(fila.papeleria_id, {}), fila)
+
+            ahora = datetime.now()
+            for papeleria_id, valores in datos.items():
+                stmt = sqlite_insert(AnalyticsSnapshot).values(
+                    user_id=user_id, papeleria_id=papeleria_id, hasta=hasta,
+                    datos=json.dumps(valores, separators=(',', ':')), actualizado=ahora)
+                db.session.execute(stmt.on_conflict_do_update(
+                    index_elements=['user_id', 'papeleria_id'],
+                    set_={'hasta': stmt.excluded.hasta, 'datos': stmt.excluded.datos,
+                          'actualizado': stmt.excluded.actualizado}))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(datos)
+
+    @writes
+    def refresh_all_snapshots(self, hasta=None):
+        """Refresca los snapshots de todos los usuarios con papelerías (job nocturno). Retorna cuántos."""
+        user_ids = [r[0] for r in db.session.query(Papeleria.user_id).distinct().all()]
+        for user_id in user_ids:
+            self.refresh_snapshot(user_id, hasta)
+        return len(user_ids)
+
+    def _filas_fuera_de_snapshot(self, user_id, hasta=None, desde=None, sin_snapshot=()):
+        """
+        Filas del rollup posteriores al snapshot de cada papelería (todas si no tiene),
+        agrupadas por (papelería, periodo, día de la semana, trámite).
+        """
+        dia_semana = func.strftime('%w', TramiteDiario.fecha)
+        query = db.session.query(
+            TramiteDiario.papeleria_id,
+            TramiteDiario.periodo,
+            dia_semana.label('dia_semana'),
+            TramiteDiario.tramite,
+            func.sum(TramiteDiario.cuantos).label('cuantos'),
+            func.sum(TramiteDiario.total_ingresos).label('ingresos'),
+            func.sum(TramiteDiario.total_costos).label('costos')
+        ).outerjoin(AnalyticsSnapshot, and_(AnalyticsSnapshot.user_id == TramiteDiario.user_id,
+                                            AnalyticsSnapshot.papeleria_id == TramiteDiario.papeleria_id))\
+         .filter(
+            TramiteDiario.user_id == user_id,
+            or_(AnalyticsSnapshot.hasta.is_(None), TramiteDiario.fecha > AnalyticsSnapshot.hasta)
+        )
+        if desde is not None:
+            query = query.filter(or_(TramiteDiario.fecha > desde, TramiteDiario.papeleria_id.in_(sin_snapshot)))
+        if hasta is not None:
+            query = query.filter(TramiteDiario.fecha <= hasta)
+        return query.group_by(TramiteDiario.papeleria_id, TramiteDiario.periodo, 'dia_semana', TramiteDiario.tramite).all()
+
+
+class ExportJobRepository:
+    """Repository for background export jobs (see export_jobs.py)."""
+    ACTIVE_STATES = ('pendiente', 'en_proceso')
+
+    def create(self, user_id, tipo, parametros):
+        job = ExportJob(id=uuid.uuid4().hex, user_id=user_id, tipo=tipo, parametros=json.dumps(parametros))
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def get(self, job_id):
+        return db.session.get(ExportJob, job_id)
+
+    def get_for_user(self, job_id, user_id):
+        return ExportJob.query.filter_by(id=job_id, user_id=user_id).first()
+
+    def get_recent(self, user_id, limit=5):
+        """Latest jobs of a user, newest first (index user_id, creado)."""
+        return ExportJob.query.filter_by(user_id=user_id)\
+            .order_by(ExportJob.creado.desc()).limit(limit).all()
+
+    def get_params(self, job):
+        return json.loads(job.parametros or '{}')
+
+    def update(self, job_id, **values):
+        """Updates a job through its own short transaction, on a separate connection.
+        Safe to call while a streaming (`yield_per`) query is still open in the session."""
+        values.setdefault('actualizado', datetime.now())
+        with db.engine.begin() as connection:
+            connection.execute(update(ExportJob).where(ExportJob.id == job_id).values(**values))
+
+    def mark_stale(self, user_id, older_than):
+        """Fails the active jobs of a user that stopped reporting progress (e.g. after a restart)."""
+        result = db.session.execute(
+            update(ExportJob)
+            .where(ExportJob.user_id == user_id, ExportJob.estado.in_(self.ACTIVE_STATES),
+                   ExportJob.actualizado < older_than)
+            .values(estado='error', error='La exportación se interrumpió. Inténtalo de nuevo.',
+                    actualizado=datetime.now())
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def delete_older_than(self, fecha):
+        """Deletes finished jobs created before `fecha`; returns the deleted rows' result files."""
+        old = db.session.query(ExportJob.id, ExportJob.archivo)\
+            .filter(ExportJob.creado < fecha, ExportJob.estado.notin_(self.ACTIVE_STATES)).all()
+        if old:
+            db.session.execute(delete(ExportJob).where(ExportJob.id.in_([j.id for j in old])))
+            db.session.commit()
+        return [j.archivo for j in old if j.archivo]
 
 
 # Instancias únicas de repositorios
@@ -1333,3 +2014,4 @@ tramite_repository = TramiteRepository()
 proveedor_repository = ProveedorRepository()
 gasto_repository = GastoRepository()
 analytics_repository = AnalyticsRepository()
+export_job_repository = ExportJobRepository()
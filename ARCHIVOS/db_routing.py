@@ -0,0 +1,211 @@
+"""
+Separación lectura/escritura sobre SQLite para DocuExpress.
+
+Todos los repositorios comparten `db.session`. Este módulo le da a esa sesión un segundo
+engine de solo lectura (`mode=ro` + `PRAGMA query_only=ON`, con su propio pool) y enruta
+allí las consultas de los métodos marcados con `@reads` (gráficos, analytics, búsqueda y
+exportaciones). Todo lo demás, y los métodos marcados con `@writes`, va al engine primario.
+
+Con WAL los lectores no bloquean al escritor ni al revés; separar los pools evita además
+que un export largo o los gráficos ocupen las conexiones que usa `registrar_tramite`.
+
+Reglas del enrutado (ver `RoutingSession.get_bind`):
+- Solo dentro de `@reads` / `reading()` y si hay engine de lectura (BD en archivo).
+- Un flush o una sesión con escrituras sin confirmar usan el primario: la transacción
+  sigue viendo sus propios cambios.
+- `@writes` fuerza el primario aunque se llame desde un método de lectura.
+"""
+import contextvars
+import inspect
+import logging
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import quote
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Query
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'SQLITE_READ_ENGINE_ENABLED': True,
+    'SQLITE_READ_POOL_SIZE': 8,       # Conexiones de solo lectura que el pool mantiene abiertas
+    'SQLITE_READ_MAX_OVERFLOW': 8,    # Conexiones extra en picos (se cierran al devolverse)
+}
+
+LECTURA = 'lectura'
+ESCRITURA = 'escritura'
+
+# Modo del método de repositorio en curso (None = sin marcar -> primario)
+_modo = contextvars.ContextVar('db_routing_modo', default=None)
+
+# Clave de `session.info` que indica escrituras sin confirmar en la transacción actual
+_ESCRITURA_PENDIENTE = 'db_routing_escritura_pendiente'
+# Opción de ejecución que lleva el modo a las consultas perezosas (exports con yield_per)
+_OPCION = 'db_routing'
+
+
+def _marcar(modo):
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @wraps(fn)
+            def generador(*args, **kwargs):
+                # El modo se activa solo mientras el generador avanza, no entre `yield`
+                iterador = fn(*args, **kwargs)
+                while True:
+                    token = _modo.set(modo)
+                    try:
+                        fila = next(iterador)
+                    except StopIteration:
+                        return
+                    finally:
+                        _modo.reset(token)
+                    yield fila
+            generador.db_routing = modo
+            return generador
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = _modo.set(modo)
+            try:
+                resultado = fn(*args, **kwargs)
+            finally:
+                _modo.reset(token)
+            # Las consultas que se devuelven sin ejecutar (streaming) conservan el modo
+            if isinstance(resultado, Query):
+                resultado = resultado.execution_options(**{_OPCION: modo})
+            return resultado
+        wrapper.db_routing = modo
+        return wrapper
+    return decorator
+
+
+# Marca un método de repositorio que solo lee: sus consultas pueden ir al engine de lectura
+reads = _marcar(LECTURA)
+# Marca un método que escribe: siempre usa el primario, aunque lo llame un método de lectura
+writes = _marcar(ESCRITURA)
+
+
+@contextmanager
+def reading():
+    """Bloque de solo lectura, equivalente a `@reads` para código fuera de los repositorios."""
+    token = _modo.set(LECTURA)
+    try:
+        yield
+    finally:
+        _modo.reset(token)
+
+
+def read_engine():
+    """Engine de solo lectura de la app actual, o None si no hay (BD en memoria o desactivado)."""
+    return current_app.extensions.get('db_routing')
+
+
+class RoutingSession(Session):
+    """Sesión de Flask-SQLAlchemy que manda las lecturas marcadas al engine de solo lectura."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not self.info.get(_ESCRITURA_PENDIENTE) \
+                and _modo_de(clause) == LECTURA:
+            engine = read_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _modo_de(clause):
+    modo = _modo.get()
+    if modo is None and clause is not None:
+        modo = getattr(clause, '_execution_options', {}).get(_OPCION)
+    return modo
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _detectar_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete \
+            or (not orm_execute_state.is_select and _es_escritura(orm_execute_state.statement)):
+        orm_execute_state.session.info[_ESCRITURA_PENDIENTE] = True
+
+
+def _es_escritura(statement):
+    # text(): INSERT/UPDATE/DELETE/REPLACE escritos a mano (search_index, rollups)
+    texto = getattr(statement, 'text', None)
+    return texto is not None and texto.lstrip().split(None, 1)[0].upper() not in ('SELECT', 'WITH', 'PRAGMA')
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _detectar_flush(session, flush_context):
+    session.info[_ESCRITURA_PENDIENTE] = True
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _limpiar(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_ESCRITURA_PENDIENTE, None)
+
+
+def _ruta_archivo(uri):
+    """Ruta del archivo SQLite de `uri`, o None si no es SQLite en archivo."""
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:') \
+            or url.database.startswith('file:'):
+        return None
+    return url.database
+
+
+def create_read_engine(path, profile, pool_size, max_overflow):
+    """
+    Engine de solo lectura sobre `path`: URI `mode=ro` (SQLite rechaza abrirlo para escribir)
+    y `query_only=ON` en cada conexión, con el perfil de caché/mmap del primario.
+    """
+    engine = create_engine(
+        f"sqlite:///file:{quote(path)}?mode=ro&uri=true",
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        connect_args={
+            'cached_statements': profile['SQLITE_STATEMENT_CACHE_SIZE'],
+            'timeout': profile['SQLITE_BUSY_TIMEOUT'] / 1000,
+        },
+    )
+
+    @event.listens_for(engine, 'connect')
+    def _set_read_pragmas(dbapi_connection, connection_record):
+        # Sin journal_mode ni synchronous: los fija el primario y un lector no puede cambiarlos
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA query_only=ON")
+            cursor.execute(f"PRAGMA busy_timeout={profile['SQLITE_BUSY_TIMEOUT']}")
+            cursor.execute(f"PRAGMA mmap_size={profile['SQLITE_MMAP_SIZE']}")
+            cursor.execute(f"PRAGMA cache_size={profile['SQLITE_CACHE_SIZE']}")
+            cursor.execute(f"PRAGMA temp_store={profile['SQLITE_TEMP_STORE']}")
+        finally:
+            cursor.close()
+
+    return engine
+
+
+def init_app(app, db):
+    """
+    Crea el engine de lectura de la app. Llamar después de `sqlite_profile.init_app` (usa su
+    perfil) y antes de `query_stats.init_app` (que instrumenta también este engine).
+    """
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, default)
+
+    path = _ruta_archivo(app.config.get('SQLALCHEMY_DATABASE_URI', 'sqlite://'))
+    if not app.config['SQLITE_READ_ENGINE_ENABLED'] or path is None:
+        app.extensions['db_routing'] = None
+        return None
+
+    with app.app_context():
+        # El archivo (y el -shm de WAL) debe existir antes de abrirlo en modo solo lectura
+        with db.engine.connect():
+            pass
+    engine = create_read_engine(path, app.config['SQLITE_PROFILE'],
+                                app.config['SQLITE_READ_POOL_SIZE'], app.config['SQLITE_READ_MAX_OVERFLOW'])
+    app.extensions['db_routing'] = engine
+    logging.info("✅ Engine de solo lectura: pool=%s overflow=%s",
+                 app.config['SQLITE_READ_POOL_SIZE'], app.config['SQLITE_READ_MAX_OVERFLOW'])
+    return engine
@@ -0,0 +1,288 @@
+"""
+Exportaciones en segundo plano (PDF de papelería, CSV de trámites y estados de cuenta del mes).
+
+Generar un reporte grande dentro de la petición ocupa un worker sync de gunicorn
+durante decenas de segundos y nginx corta las más lentas (`proxy_read_timeout`). Aquí la
+petición solo registra un `ExportJob` y devuelve su id; el archivo se genera en un
+`ProcessPoolExecutor` acotado (`EXPORT_JOBS_WORKERS` procesos por worker de gunicorn):
+
+- El proceso hijo abre su propia app mínima (config + SQLAlchemy, sin blueprints ni
+  scheduler) contra la misma base SQLite; WAL permite que lea mientras los workers web
+  escriben.
+- El progreso (0-100, por unidades de trámite) se escribe en `export_jobs` en
+  transacciones cortas, así que cualquier worker web puede responder
+  `/api/exports/<id>` aunque el trabajo corra en otro.
+- Los PDF se guardan en `report_cache` con la misma clave que la descarga directa: si
+  ya existe, el trabajo nace completado; si dos trabajos piden la misma clave, solo uno
+  construye.
+- Los CSV se escriben en `EXPORT_JOBS_DIR/<id>.csv[.gz]` y se borran junto con el
+  trabajo después de `EXPORT_JOBS_MAX_AGE` segundos. Igual el ZIP de estados de cuenta
+  (`EXPORT_JOBS_DIR/<id>.zip`, ver `month_end`), que reparte sus PDF en sus propios procesos.
+
+Con `EXPORT_JOBS_EXECUTOR = 'inline'` el trabajo corre dentro de la petición (tests y
+servidores donde no se pueden crear procesos).
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from flask import current_app
+
+from .models import db
+from .database import export_job_repository, papeleria_repository, tramite_repository
+from . import csv_export, month_end, pdf_generator, report_cache, sqlite_profile
+from .utils import get_user_data_version
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'EXPORT_JOBS_EXECUTOR': 'process',   # 'process' | 'inline'
+    'EXPORT_JOBS_WORKERS': 1,            # Procesos de exportación por worker de gunicorn
+    'EXPORT_JOBS_DIR': Path(__file__).resolve().parent / 'exportaciones',
+    'EXPORT_JOBS_MAX_AGE': 24 * 3600,    # Los trabajos y sus CSV se borran después de un día
+    'EXPORT_JOBS_STALE_AFTER': 600,      # Sin progreso en este tiempo: el trabajo se da por perdido
+}
+
+TIPOS = ('pdf', 'csv', 'estados')
+PROGRESO_CADA = 2000  # Filas entre escrituras de progreso
+
+# Configuración que necesita el proceso hijo para abrir la base y escribir los archivos
+_CLAVES_HIJO = ('SQLALCHEMY_DATABASE_URI', 'SQLITE_', 'PDF_CACHE_', 'EXPORT_JOBS_DIR', 'UPLOAD_FOLDER', 'MONTH_END_')
+
+_executor = None
+_app_hijo = None
+
+
+class ExportError(Exception):
+    """La exportación pedida no es válida (tipo, papelería o sin datos)."""
+
+
+def init_app(app):
+    """Completa la configuración de las exportaciones con `DEFAULTS`."""
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, default)
+
+
+def submit(user_id, tipo, papeleria_id=None, fecha_inicio=None, fecha_fin=None, gzip=False, mes=None, todos=False):
+    """
+    Registra una exportación y la encola. Retorna el `ExportJob` (puede nacer completado
+    si el PDF ya está en caché). Lanza `ExportError` si la petición no es válida.
+    Los estados de cuenta usan `mes` ('AAAA-MM', por defecto el anterior) y `todos`
+    (todas las papelerías de todos los usuarios, no solo las de `user_id`).
+    """
+    if tipo not in TIPOS:
+        raise ExportError(f"Tipo de exportación no soportado: {tipo}")
+    config = current_app.config
+    purge(config['EXPORT_JOBS_MAX_AGE'])
+
+    parametros = {'papeleria_id': papeleria_id, 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin}
+    if papeleria_id is not None and not papeleria_repository.get_name(papeleria_id, user_id):
+        raise ExportError("Papelería no encontrada")
+
+    if tipo == 'pdf':
+        if papeleria_id is None:
+            raise ExportError("El PDF se genera por papelería")
+        reporte = pdf_generator.preparar_reporte(papeleria_repository, tramite_repository, papeleria_id, user_id,
+                                                 fecha_inicio, fecha_fin)
+        if not reporte.num_tramites:
+            raise ExportError("No hay trámites para generar un PDF con los filtros seleccionados.")
+        logo_path = pdf_generator.logo_de_usuario(config['UPLOAD_FOLDER'], user_id) if config.get('UPLOAD_FOLDER') else None
+        parametros.update(logo_path=logo_path, clave=pdf_generator.clave_cache(
+            reporte, papeleria_id, user_id, fecha_inicio, fecha_fin, logo_path,
+            get_user_data_version(user_id, 'tramites', 'papelerias')))
+        job = export_job_repository.create(user_id, tipo, parametros)
+        ruta = report_cache.ReportCache.from_config(config).get(parametros['clave'])
+        if ruta:
+            export_job_repository.update(job.id, estado='completado', progreso=100, archivo=str(ruta),
+                                         nombre_archivo=reporte.nombre_archivo)
+            db.session.refresh(job)
+            return job
+    elif tipo == 'estados':
+        try:
+            mes, fecha_inicio, fecha_fin = month_end.rango_mes(mes)
+        except ValueError:
+            raise ExportError("Mes no válido; usa el formato AAAA-MM")
+        if not (papeleria_repository.get_user_ids_with_active_papelerias() if todos
+                else papeleria_repository.get_statement_summaries(user_id, fecha_inicio, fecha_fin)):
+            raise ExportError("No hay papelerías activas para generar estados de cuenta.")
+        parametros = {'mes': mes, 'todos': bool(todos)}
+        job = export_job_repository.create(user_id, tipo, parametros)
+    else:
+        parametros['gzip'] = bool(gzip)
+        job = export_job_repository.create(user_id, tipo, parametros)
+
+    if config['EXPORT_JOBS_EXECUTOR'] == 'inline':
+        run_job(job.id)
+    else:
+        _enqueue(current_app._get_current_object(), job.id)
+    db.session.refresh(job)
+    return job
+
+
+def run_job(job_id):
+    """Genera el archivo de un trabajo. Requiere contexto de app; nunca lanza excepciones."""
+    job = export_job_repository.get(job_id)
+    if job is None:
+        return
+    parametros = export_job_repository.get_params(job)
+    export_job_repository.update(job_id, estado='en_proceso', progreso=0)
+    try:
+        archivo, nombre = _GENERADORES[job.tipo](job, parametros)
+        export_job_repository.update(job_id, estado='completado', progreso=100, archivo=str(archivo),
+                                     nombre_archivo=nombre)
+        logging.info(f"Exportación {job_id} ({job.tipo}) completada: {nombre}")
+    except Exception as e:
+        db.session.rollback()
+        logging.exception(f"Exportación {job_id} ({job.tipo}) falló")
+        export_job_repository.update(job_id, estado='error', error=str(e) or e.__class__.__name__)
+
+
+def status(job):
+    """Diccionario JSON con el estado de un trabajo."""
+    return {
+        'id': job.id,
+        'tipo': job.tipo,
+        'estado': job.estado,
+        'progreso': job.progreso,
+        'nombre_archivo': job.nombre_archivo,
+        'error': job.error,
+        'creado': job.creado.isoformat(timespec='seconds'),
+        'actualizado': job.actualizado.isoformat(timespec='seconds'),
+    }
+
+
+def mark_stale(user_id):
+    """Da por perdidos los trabajos del usuario que dejaron de reportar progreso."""
+    limite = datetime.now() - timedelta(seconds=current_app.config['EXPORT_JOBS_STALE_AFTER'])
+    return export_job_repository.mark_stale(user_id, limite)
+
+
+def purge(max_age):
+    """Borra los trabajos terminados más viejos que `max_age` segundos y sus CSV."""
+    directorio = Path(current_app.config['EXPORT_JOBS_DIR']).resolve()
+    for archivo in export_job_repository.delete_older_than(datetime.now() - timedelta(seconds=max_age)):
+        # Los PDF pertenecen a report_cache, que los expulsa por su cuenta
+        if Path(archivo).resolve().parent == directorio:
+            with suppress(FileNotFoundError):
+                os.unlink(archivo)
+
+
+# ==================== GENERACIÓN ====================
+
+def _con_progreso(filas, job_id, total):
+    """Deja pasar las filas y escribe el progreso cada `PROGRESO_CADA` filas."""
+    hechas = 0
+    for i, fila in enumerate(filas, 1):
+        yield fila
+        hechas += fila.cantidad
+        if i % PROGRESO_CADA == 0 and total:
+            export_job_repository.update(job_id, progreso=min(99, hechas * 100 // total))
+
+
+def _generar_pdf(job, parametros):
+    reporte = pdf_generator.preparar_reporte(papeleria_repository, tramite_repository, parametros['papeleria_id'],
+                                             job.user_id, parametros['fecha_inicio'], parametros['fecha_fin'])
+    if reporte is None:
+        raise ExportError("Papelería no encontrada")
+    reporte.filas = _con_progreso(reporte.filas, job.id, reporte.num_tramites)
+    cache = report_cache.ReportCache.from_config(current_app.config)
+    ruta, _ = cache.get_or_build(parametros['clave'], lambda salida: pdf_generator.escribir_pdf(
+        reporte, salida, logo_path=parametros.get('logo_path')))
+    return ruta, reporte.nombre_archivo
+
+
+def _generar_csv(job, parametros):
+    papeleria_id = parametros['papeleria_id']
+    fecha_inicio, fecha_fin = parametros['fecha_inicio'], parametros['fecha_fin']
+    if papeleria_id is None:
+        total = tramite_repository.get_total_general(job.user_id, fecha_inicio, fecha_fin)['cuantos']
+    else:
+        total = tramite_repository.get_report_summary(papeleria_id, job.user_id, fecha_inicio, fecha_fin)['cuantos']
+
+    nombre, header, rows = csv_export.tramites_csv(job.user_id, fecha_inicio, fecha_fin, papeleria_id=papeleria_id,
+                                                   wrap=lambda filas: _con_progreso(filas, job.id, total))
+    chunks = csv_export.csv_chunks(header, rows)
+    if parametros.get('gzip'):
+        chunks = csv_export.gzip_chunks(chunks)
+        nombre += '.gz'
+
+    directorio = Path(current_app.config['EXPORT_JOBS_DIR'])
+    directorio.mkdir(parents=True, exist_ok=True)
+    ruta = directorio / f"{job.id}{''.join(Path(nombre).suffixes)}"
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directorio)
+    try:
+        with os.fdopen(fd, 'wb') as salida:
+            for chunk in chunks:
+                salida.write(chunk)
+        os.replace(tmp_path, ruta)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+    return ruta, nombre
+
+
+def _generar_estados(job, parametros):
+    directorio = Path(current_app.config['EXPORT_JOBS_DIR'])
+    ruta = directorio / f"{job.id}.zip"
+    month_end.generar_zip(ruta, parametros['mes'], user_ids=None if parametros['todos'] else [job.user_id],
+                          progreso=lambda hechos, total: export_job_repository.update(
+                              job.id, progreso=min(99, hechos * 100 // total)))
+    return ruta, f"estados_cuenta_{parametros['mes']}.zip"
+
+
+_GENERADORES = {'pdf': _generar_pdf, 'csv': _generar_csv, 'estados': _generar_estados}
+
+
+# ==================== EJECUCIÓN EN PROCESOS ====================
+
+def _enqueue(app, job_id):
+    global _executor
+    if _executor is None:
+        # spawn: el hijo no hereda hilos (scheduler) ni conexiones SQLite abiertas del worker
+        _executor = ProcessPoolExecutor(max_workers=app.config['EXPORT_JOBS_WORKERS'],
+                                        mp_context=multiprocessing.get_context('spawn'))
+        atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+    config = {k: v for k, v in app.config.items() if k.startswith(_CLAVES_HIJO)}
+    try:
+        future = _executor.submit(_run_in_child, config, job_id)
+    except BrokenProcessPool:
+        _executor = None
+        return _enqueue(app, job_id)
+
+    def _al_terminar(future):
+        # El hijo marca sus propios errores; aquí solo llegan las caídas del proceso
+        if future.exception() is not None:
+            with app.app_context():
+                export_job_repository.update(job_id, estado='error', error=f"Proceso de exportación caído: {future.exception()}")
+
+    future.add_done_callback(_al_terminar)
+
+
+def _app_para_hijo(config):
+    """App mínima del proceso hijo: configuración, SQLAlchemy y perfil SQLite."""
+    global _app_hijo
+    if _app_hijo is None:
+        from flask import Flask
+        app = Flask(__name__)
+        app.config.update(config)
+        if str(app.config['SQLALCHEMY_DATABASE_URI']).startswith('sqlite'):
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_profile.engine_options(app.config)
+        db.init_app(app)
+        sqlite_profile.init_app(app, db)
+        _app_hijo = app
+    return _app_hijo
+
+
+def _run_in_child(config, job_id):
+    with _app_para_hijo(config).app_context():
+        try:
+            run_job(job_id)
+        finally:
+            db.session.remove()
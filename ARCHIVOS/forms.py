@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, PasswordField, SubmitField, SelectField, FloatField, IntegerField, DateField, BooleanField, ValidationError
+from wtforms import Form, FieldList, FormField, StringField, PasswordField, SubmitField, SelectField, FloatField, IntegerField, DateField, BooleanField, ValidationError
 from wtforms.validators import DataRequired, Length, NumberRange, Optional, EqualTo, InputRequired
 from datetime import datetime
 from .constants import TRAMITES_PREDEFINIDOS, CATEGORIAS_GASTOS
@@ -38,6 +38,50 @@ class TramiteForm(FlaskForm):
     fecha = DateField('Fecha', format='%Y-%m-%d', default=datetime.today)
     submit = SubmitField('Registrar')
 
+class TramiteLoteFilaForm(Form):
+    """Una fila de la captura por lote. Sin CSRF propio: lo aporta el formulario contenedor."""
+    papeleria_id = SelectField('Papelería', coerce=int, validators=[Optional()])
+    tramite = StringField('Trámite', validators=[Optional(), Length(max=100)])
+    fecha = DateField('Fecha', format='%Y-%m-%d', default=datetime.today, validators=[Optional()])
+    cantidad = IntegerField('Cantidad', validators=[Optional(), NumberRange(min=1, max=1000)])
+    precio = FloatField('Precio', validators=[Optional(), NumberRange(min=0)])
+    costo = FloatField('Costo', validators=[Optional(), NumberRange(min=0)])
+
+    def is_blank(self):
+        """Una fila sin trámite ni cantidad se ignora (la cuadrícula trae filas vacías)."""
+        return not (self.tramite.data or '').strip() and not self.cantidad.data
+
+class TramiteLoteForm(FlaskForm):
+    """Cuadrícula de captura de cierre de día: varias filas en un solo POST."""
+    filas = FieldList(FormField(TramiteLoteFilaForm), min_entries=8, max_entries=100)
+    submit = SubmitField('Registrar Lote')
+
+    def set_papeleria_choices(self, choices):
+        for fila in self.filas:
+            fila.form.papeleria_id.choices = choices
+
+    def validate(self, extra_validators=None):
+        valido = super().validate(extra_validators)
+        filas_capturadas = 0
+        for fila in self.filas:
+            sub = fila.form
+            if sub.is_blank():
+                continue
+            filas_capturadas += 1
+            if not sub.papeleria_id.data:
+                sub.papeleria_id.errors.append('Selecciona una papelería.')
+                valido = False
+            if not (sub.tramite.data or '').strip():
+                sub.tramite.errors.append('Indica el trámite.')
+                valido = False
+            if not sub.cantidad.data:
+                sub.cantidad.errors.append('Indica la cantidad.')
+                valido = False
+        if filas_capturadas == 0:
+            self.form_errors.append('Captura al menos una fila.')
+            valido = False
+        return valido
+
 class EditarTramiteForm(FlaskForm):
     fecha = DateField('Fecha', format='%Y-%m-%d', validators=[DataRequired()]) # El formato aquí es para el parseo de WTForms
     tramite = SelectField(
@@ -48,6 +92,7 @@ class EditarTramiteForm(FlaskForm):
     tramite_manual = StringField('Nombre del trámite (si es "OTRO")')
     precio = FloatField('Precio', validators=[InputRequired(), NumberRange(min=0)])
     costo = FloatField('Costo', validators=[InputRequired(), NumberRange(min=0)])
+    cantidad = IntegerField('Cantidad', default=1, validators=[DataRequired(), NumberRange(min=1)])
     submit = SubmitField('Guardar Cambios')
 
 class ProveedorForm(FlaskForm):
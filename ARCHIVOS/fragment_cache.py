@@ -0,0 +1,120 @@
+"""
+Caché de fragmentos HTMX versionada por datos y GET condicional (ETag/304) de las APIs JSON.
+
+Cada `reload-dashboard` vuelve a pedir `dashboard_content.html` (41 KB) y la lista de
+papelerías, y `_get_dashboard_context` recalcula todo lo que hay detrás. `responder`
+guarda el HTML ya renderizado bajo una clave con todo lo que lo determina:
+
+    plantilla, usuario efectivo, quién mira (id y rol, por los botones de admin),
+    versiones de los dominios de datos que lee (ver utils.DATA_DOMAINS),
+    argumentos de la URL y la fecha de hoy (el dashboard muestra "hoy" y el mes en curso)
+
+Las plantillas con formularios POST (`hidden_tag`) añaden el token CSRF de la sesión, para
+no servir el token de otra sesión del mismo usuario.
+
+La clave también es el ETag (`Cache-Control: private, no-cache`): el navegador revalida con
+`If-None-Match` y, si nada cambió, recibe un 304 sin que se consulte la BD ni se renderice.
+Sin caché configurada (versión None) el fragmento se renderiza siempre y sin ETag.
+
+Los endpoints JSON del dashboard usan el decorador `conditional(*domains)`: la misma
+clave (con la ruta en lugar de la plantilla) es su ETag, y un `If-None-Match` que
+coincide responde 304 antes de llamar a la vista, sin tocar los repositorios.
+"""
+import hashlib
+import json
+from datetime import date
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+from . import single_flight
+from .utils import get_effective_user_id, get_user_data_version
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'FRAGMENT_CACHE_ENABLED': True,
+    'FRAGMENT_CACHE_TIMEOUT': 600,   # Segundos; una escritura lo invalida antes (cambia la versión)
+}
+
+# Cabeceras con las que la misma URL devuelve otro HTML (p. ej. `/` completo o solo el dashboard)
+_VARY = 'HX-Request, HX-Target, Cookie'
+
+
+def init_app(app):
+    """Completa la configuración de la caché de fragmentos con `DEFAULTS`."""
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, default)
+
+
+def fragment_key(template, domains, por_sesion=False):
+    """
+    Clave (hex SHA-256) de `template` (o de la ruta, en las APIs) para la petición actual,
+    o None si no hay versión de datos.
+    """
+    user_id = get_effective_user_id()
+    version = get_user_data_version(user_id, *domains)
+    if version is None:
+        return None
+    partes = [template, user_id, current_user.get_id(), getattr(current_user, 'role', None), version,
+              sorted(request.args.items(multi=True)), date.today().isoformat()]
+    if por_sesion:
+        partes.append(session.get('csrf_token'))
+    payload = json.dumps(partes, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def responder(template, domains, render, por_sesion=False):
+    """
+    Respuesta con el fragmento `template`: 304 si el navegador ya tiene esta versión, el
+    HTML de la caché si está, o `render()` (que lo guarda). `domains` son los dominios de
+    datos que lee el fragmento.
+    """
+    config = current_app.config
+    clave = fragment_key(template, domains, por_sesion) if config.get('FRAGMENT_CACHE_ENABLED', True) else None
+    if clave is None:
+        return render()
+
+    etag = f'frag-{clave[:32]}'
+    if request.if_none_match.contains(etag):
+        response = _no_modificado()
+    else:
+        # Las pestañas que recargan el dashboard a la vez comparten un único render
+        html = single_flight.cached('frag', clave, render, stale=False,
+                                    timeout=config.get('FRAGMENT_CACHE_TIMEOUT', DEFAULTS['FRAGMENT_CACHE_TIMEOUT']))
+        response = current_app.response_class(html, mimetype='text/html')
+    return _con_etag(response, etag)
+
+
+def conditional(*domains):
+    """
+    Decorador de endpoints JSON que leen `domains`: ETag de la versión de datos y los
+    argumentos, y 304 sin ejecutar la vista si el navegador ya tiene esa versión. Las
+    respuestas que ya traen `Cache-Control` (p. ej. `no-store` en un error) no se etiquetan.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            clave = fragment_key(request.path, domains) if current_app.config.get('FRAGMENT_CACHE_ENABLED', True) else None
+            if clave is None:
+                return view(*args, **kwargs)
+            etag = f'api-{clave[:32]}'
+            if request.if_none_match.contains(etag):
+                return _con_etag(_no_modificado(), etag)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and 'Cache-Control' not in response.headers:
+                _con_etag(response, etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def _no_modificado():
+    return current_app.response_class(status=304)
+
+
+def _con_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = _VARY
+    return response
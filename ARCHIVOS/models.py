@@ -2,13 +2,36 @@
 SQLAlchemy models for DocuExpress.
 """
 from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime
 from sqlalchemy import (Column, Integer, String, Float, ForeignKey, DateTime, Boolean,
-                        UniqueConstraint, Index, Date, func)
+                        UniqueConstraint, Index, Date, func, event, text)
 from sqlalchemy.orm import relationship
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 
-db = SQLAlchemy()
+from .db_routing import RoutingSession
+
+# La sesión enruta los métodos de repositorio marcados con @reads al engine de solo lectura
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def periodo_de(fecha):
+    """Clave de mes YYYYMM (entero) para una fecha (date, datetime o 'YYYY-MM-DD')."""
+    if hasattr(fecha, 'year'):
+        return fecha.year * 100 + fecha.month
+    texto = str(fecha)
+    return int(texto[0:4]) * 100 + int(texto[5:7])
+
+
+def periodo_label(periodo):
+    """Convierte 202405 en '2024-05' (formato que esperan las gráficas)."""
+    return f"{periodo // 100:04d}-{periodo % 100:02d}"
+
+
+def _periodo_default(context):
+    # Default por fila: funciona también en INSERT Core/executemany (add_many)
+    return periodo_de(context.get_current_parameters()['fecha'])
+
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -42,6 +65,8 @@ class Papeleria(db.Model):
     __table_args__ = (
         UniqueConstraint('nombre', 'user_id', name='uq_papeleria_nombre_user'),
         Index('idx_papelerias_user', 'user_id'),
+        # Parcial: solo papelerías activas, ordenadas por nombre (listados y joins con is_active)
+        Index('idx_papelerias_user_activas', 'user_id', 'nombre', sqlite_where=text('is_active = 1')),
     )
 
 class PapeleriaPrecio(db.Model):
@@ -64,6 +89,10 @@ class Tramite(db.Model):
     fecha = Column(Date, nullable=False)
     precio = Column(Float, nullable=False)
     costo = Column(Float, nullable=False, default=0)
+    # Unidades registradas en esta fila (precio y costo son unitarios)
+    cantidad = Column(Integer, nullable=False, default=1, server_default='1')
+    # Mes YYYYMM derivado de `fecha`: agrupar por él usa el índice (user_id, periodo)
+    periodo = Column(Integer, nullable=False, default=_periodo_default)
     timestamp = Column(DateTime, default=func.now())
 
     user = relationship('User', back_populates='tramites')
@@ -71,7 +100,11 @@ class Tramite(db.Model):
 
     __table_args__ = (
         Index('idx_tramites_user_fecha', 'user_id', 'fecha'),
-        Index('idx_tramites_user_papeleria', 'user_id', 'papeleria_id'),
+        # Detalle de papelería: filtro + ORDER BY fecha DESC, id DESC sin ordenar en memoria
+        Index('idx_tramites_user_papeleria_fecha', 'user_id', 'papeleria_id', 'fecha'),
+        Index('idx_tramites_user_periodo', 'user_id', 'periodo'),
+        # Parcial: trámites sin costo asignado (update_old_costos)
+        Index('idx_tramites_sin_costo', 'user_id', 'tramite', sqlite_where=text('costo = 0')),
     )
 
 class TramiteCosto(db.Model):
@@ -104,10 +137,107 @@ class Gasto(db.Model):
     descripcion = Column(String)
     monto = Column(Float, nullable=False)
     fecha = Column(Date, nullable=False)
+    periodo = Column(Integer, nullable=False, default=_periodo_default)
     categoria = Column(String, nullable=False, default='OTROS')
     receipt_filename = Column(String)
 
     user = relationship('User', back_populates='gastos')
     proveedor = relationship('Proveedor', back_populates='gastos')
 
-    __table_args__ = (Index('idx_gastos_user_fecha', 'user_id', 'fecha'),)
+    __table_args__ = (
+        Index('idx_gastos_user_fecha', 'user_id', 'fecha'),
+        Index('idx_gastos_user_periodo', 'user_id', 'periodo'),
+        Index('idx_gastos_user_categoria_fecha', 'user_id', 'categoria', 'fecha'),
+        Index('idx_gastos_user_proveedor', 'user_id', 'proveedor_id'),
+        # Parcial: solo gastos con recibo adjunto (verificación de propiedad del archivo)
+        Index('idx_gastos_recibo', 'receipt_filename', 'user_id', sqlite_where=text('receipt_filename IS NOT NULL')),
+    )
+
+
+@event.listens_for(Tramite, 'before_update')
+@event.listens_for(Gasto, 'before_update')
+def _sync_periodo(mapper, connection, target):
+    """Mantiene `periodo` al editar la fecha de un trámite o gasto."""
+    target.periodo = periodo_de(target.fecha)
+
+
+# ==================== TABLAS DE ROLLUP ====================
+# Agregados diarios mantenidos de forma incremental por los repositorios en la
+# misma transacción que escribe en `tramites`/`gastos`. Los dashboards leen de
+# aquí, así que su costo depende de los días del rango y no del número de filas.
+
+class TramiteDiario(db.Model):
+    """Totales diarios por (usuario, día, papelería, trámite)."""
+    __tablename__ = 'tramites_diarios'
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    fecha = Column(Date, primary_key=True)
+    papeleria_id = Column(Integer, ForeignKey('papelerias.id', ondelete='CASCADE'), primary_key=True)
+    tramite = Column(String, primary_key=True)
+    periodo = Column(Integer, nullable=False, default=_periodo_default)
+    cuantos = Column(Integer, nullable=False, default=0)
+    total_ingresos = Column(Float, nullable=False, default=0)
+    total_costos = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        # Índices cubrientes: incluyen los totales para no volver a la tabla por cada fila
+        Index('idx_tramites_diarios_papeleria_cov', 'user_id', 'papeleria_id', 'fecha',
+              'cuantos', 'total_ingresos', 'total_costos'),
+        Index('idx_tramites_diarios_periodo_cov', 'user_id', 'periodo',
+              'cuantos', 'total_ingresos', 'total_costos'),
+        # Totales por (papelería, trámite) del dashboard sin ordenamiento temporal
+        Index('idx_tramites_diarios_tramite_cov', 'user_id', 'papeleria_id', 'tramite',
+              'cuantos', 'total_ingresos', 'total_costos'),
+        {'sqlite_with_rowid': False},
+    )
+
+class GastoDiario(db.Model):
+    """Totales diarios de gastos por (usuario, día, categoría)."""
+    __tablename__ = 'gastos_diarios'
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    fecha = Column(Date, primary_key=True)
+    categoria = Column(String, primary_key=True)
+    periodo = Column(Integer, nullable=False, default=_periodo_default)
+    cuantos = Column(Integer, nullable=False, default=0)
+    total_monto = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('idx_gastos_diarios_periodo_cov', 'user_id', 'periodo', 'categoria', 'total_monto'),
+        {'sqlite_with_rowid': False},
+    )
+
+
+# ==================== EXPORTACIONES EN SEGUNDO PLANO ====================
+
+class ExportJob(db.Model):
+    """Exportación PDF/CSV en segundo plano (ver export_jobs.py). El proceso que la genera escribe el progreso."""
+    __tablename__ = 'export_jobs'
+    id = Column(String(32), primary_key=True)  # uuid4 hex: no adivinable desde la URL
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    tipo = Column(String, nullable=False)  # 'pdf' | 'csv'
+    parametros = Column(String, nullable=False, default='{}')  # JSON: papelería, rango, gzip, clave de caché
+    estado = Column(String, nullable=False, default='pendiente')  # pendiente | en_proceso | completado | error
+    progreso = Column(Integer, nullable=False, default=0)  # 0-100
+    archivo = Column(String)  # Ruta del resultado en disco
+    nombre_archivo = Column(String)  # Nombre de la descarga
+    error = Column(String)
+    creado = Column(DateTime, nullable=False, default=datetime.now)
+    actualizado = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (Index('idx_export_jobs_user_creado', 'user_id', 'creado'),)
+
+
+# ==================== SNAPSHOTS DE ANALYTICS ====================
+
+class AnalyticsSnapshot(db.Model):
+    """
+    Agregados históricos de una papelería hasta `hasta` (inclusive): lo que leen las
+    métricas de `AnalyticsRepository.get_historico` sin recorrer todo `tramites_diarios`.
+    """
+    __tablename__ = 'analytics_snapshots'
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    papeleria_id = Column(Integer, ForeignKey('papelerias.id', ondelete='CASCADE'), primary_key=True)
+    hasta = Column(Date, nullable=False)
+    # JSON: cuantos/ingresos/costos, ganancia por periodo, [ganancia, cuantos] por día de la
+    # semana (0=Domingo) y [cuantos, ingresos, costos] por trámite
+    datos = Column(String, nullable=False, default='{}')
+    actualizado = Column(DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,207 @@
+"""
+Estados de cuenta de fin de mes: el PDF del mes de cada papelería activa, en un ZIP.
+
+Al cierre de mes se descargaba un PDF por papelería. `generar_zip` los produce todos de
+una vez para un usuario (o para todos los que tienen papelerías activas):
+
+- Una sola lectura por usuario: el resumen de todas sus papelerías sale de un GROUP BY
+  al rollup diario y el detalle de una sola consulta ordenada por papelería, que se
+  reparte con `itertools.groupby` (no una consulta por papelería).
+- Cada PDF se dibuja en un `ProcessPoolExecutor` de `MONTH_END_WORKERS` procesos (0 = uno
+  por CPU): reportlab es Python puro y no suelta el GIL. El hijo recibe las filas ya
+  leídas y no abre la base. Como mucho hay `2 × workers` papelerías leídas esperando
+  turno, así que la memoria no crece con el número de papelerías.
+- El ZIP lleva los PDF (sin recomprimir: ya van comprimidos) y un `indice_<mes>.pdf` con
+  el total de cada papelería. Se escribe en un temporal y se publica con `os.replace`.
+
+Se lanza con `flask --app wsgi month-end-statements`, desde el dashboard de un admin
+(trabajo `estados` de `export_jobs`) o cada mes con el scheduler de `backup_manager`
+(`MONTH_END_SCHEDULE=true`).
+"""
+import calendar
+import itertools
+import logging
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import suppress
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from flask import current_app
+
+from .database import papeleria_repository, tramite_repository, user_repository
+from . import pdf_generator
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'MONTH_END_DIR': Path(__file__).resolve().parent / 'estados_cuenta',
+    'MONTH_END_WORKERS': 0,   # Procesos que dibujan los PDF; 0 = uno por CPU, 1 = sin procesos
+}
+
+# Lo que el PDF necesita de cada trámite (tupla ligera que viaja al proceso hijo)
+_Fila = namedtuple('_Fila', 'tramite fecha precio cantidad')
+
+
+def init_app(app):
+    """Completa la configuración de los estados de cuenta con `DEFAULTS`."""
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, default)
+
+
+def rango_mes(mes=None, hoy=None):
+    """
+    `(mes, fecha_inicio, fecha_fin)` de un mes 'AAAA-MM'; sin `mes`, el mes anterior a
+    `hoy` (el que se acaba de cerrar). Lanza ValueError si el mes no es válido.
+    """
+    if not mes:
+        hoy = hoy or date.today()
+        mes = (hoy.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    inicio = datetime.strptime(mes, '%Y-%m').date()
+    fin = inicio.replace(day=calendar.monthrange(inicio.year, inicio.month)[1])
+    return mes, inicio.isoformat(), fin.isoformat()
+
+
+def ruta_lote(mes, user_id=None):
+    """Ruta en `MONTH_END_DIR` del ZIP de estados de cuenta de `mes` (de todos o de un usuario)."""
+    directorio = Path(current_app.config.get('MONTH_END_DIR', DEFAULTS['MONTH_END_DIR']))
+    return directorio / f"estados_cuenta_{mes}{f'_usuario_{user_id}' if user_id else ''}.zip"
+
+
+def generar_lote(mes=None, user_id=None, workers=None):
+    """
+    ZIP de estados de cuenta en `MONTH_END_DIR` (CLI y scheduler). Sin `user_id`, de todos
+    los usuarios con papelerías activas. Retorna `(ruta, entradas)`.
+    """
+    mes, _, _ = rango_mes(mes)
+    ruta = ruta_lote(mes, user_id)
+    entradas = generar_zip(ruta, mes, user_ids=[user_id] if user_id else None, workers=workers)
+    return ruta, entradas
+
+
+def generar_zip(destino, mes=None, user_ids=None, workers=None, progreso=None):
+    """
+    Escribe en `destino` el ZIP con el estado de cuenta de `mes` de cada papelería activa
+    de `user_ids` (None = todos). `progreso(hechos, total)` se llama tras cada PDF.
+    Retorna las entradas del índice (usuario, papeleria, archivo, num_tramites, total_ingresos).
+    """
+    config = current_app.config
+    mes, fecha_inicio, fecha_fin = rango_mes(mes)
+    if workers is None:
+        workers = config.get('MONTH_END_WORKERS', DEFAULTS['MONTH_END_WORKERS'])
+    workers = workers or os.cpu_count() or 1
+    if user_ids is None:
+        user_ids = papeleria_repository.get_user_ids_with_active_papelerias()
+
+    resumenes = {uid: papeleria_repository.get_statement_summaries(uid, fecha_inicio, fecha_fin) for uid in user_ids}
+    total = sum(len(r) for r in resumenes.values())
+    # Con varios usuarios, una carpeta por usuario dentro del ZIP
+    carpetas = {}
+    if len(user_ids) > 1:
+        for uid in user_ids:
+            user = user_repository.get_by_id(uid)
+            carpetas[uid] = "".join(filter(str.isalnum, user.username if user else '')) or f"usuario_{uid}"
+
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    entradas = []
+    with tempfile.TemporaryDirectory(prefix='.tmp-estados-', dir=destino.parent) as tmp:
+        tareas = _tareas(resumenes, carpetas, fecha_inicio, fecha_fin, config.get('UPLOAD_FOLDER'), Path(tmp))
+        for entrada in _dibujar(tareas, workers):
+            entradas.append(entrada)
+            if progreso:
+                progreso(len(entradas), total)
+
+        entradas.sort(key=lambda e: e['archivo'])
+        indice = Path(tmp) / f"indice_{mes}.pdf"
+        periodo, _ = pdf_generator.periodo_y_archivo('', fecha_inicio, fecha_fin)
+        pdf_generator.escribir_indice(periodo, entradas, str(indice))
+
+        fd, tmp_zip = tempfile.mkstemp(prefix='.tmp-', suffix='.zip', dir=destino.parent)
+        try:
+            with os.fdopen(fd, 'wb') as salida, zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as zf:
+                zf.write(indice, indice.name)
+                for entrada in entradas:
+                    zf.write(entrada.pop('ruta'), entrada['archivo'])
+            os.replace(tmp_zip, destino)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.unlink(tmp_zip)
+            raise
+
+    logging.info(f"Estados de cuenta {mes}: {len(entradas)} PDF de {len(user_ids)} usuarios en {destino}")
+    return entradas
+
+
+def _tareas(resumenes, carpetas, fecha_inicio, fecha_fin, upload_folder, tmp):
+    """
+    Genera `(entrada, argumentos de _dibujar_estado)` por papelería, leyendo el detalle de
+    cada usuario en una sola pasada ordenada por papelería.
+    """
+    for user_id, resumen in resumenes.items():
+        if not resumen:
+            continue
+        por_id = {r['id']: r for r in resumen}
+        logo_path = pdf_generator.logo_de_usuario(upload_folder, user_id) if upload_folder else None
+        usados = set()
+
+        def tarea(papeleria_id, filas):
+            r = por_id.pop(papeleria_id)
+            periodo, nombre = pdf_generator.periodo_y_archivo(r['nombre'], fecha_inicio, fecha_fin)
+            if nombre in usados:  # Dos papelerías con el mismo nombre saneado
+                nombre = f"{nombre[:-4]}_{papeleria_id}.pdf"
+            usados.add(nombre)
+            carpeta = carpetas.get(user_id)
+            entrada = {
+                'usuario': carpeta,
+                'papeleria': r['nombre'],
+                'archivo': f"{carpeta}/{nombre}" if carpeta else nombre,
+                'num_tramites': r['cuantos'],
+                'total_ingresos': r['total_ingresos'],
+                'ruta': str(tmp / f"{user_id}_{papeleria_id}.pdf"),
+            }
+            datos = dict(papeleria=r['nombre'], periodo=periodo, nombre_archivo=nombre,
+                         num_tramites=r['cuantos'], total_ingresos=r['total_ingresos'])
+            return entrada, (datos, filas, logo_path, entrada['ruta'])
+
+        filas = tramite_repository.stream_for_statements(user_id, fecha_inicio, fecha_fin,
+                                                         batch_size=pdf_generator.LOTE_FILAS)
+        for papeleria_id, grupo in itertools.groupby(filas, key=lambda f: f.papeleria_id):
+            if papeleria_id in por_id:
+                yield tarea(papeleria_id, [_Fila(f.tramite, f.fecha, f.precio, f.cantidad) for f in grupo])
+        # Papelerías sin trámites en el mes: estado de cuenta en ceros
+        for papeleria_id in list(por_id):
+            yield tarea(papeleria_id, [])
+
+
+def _dibujar(tareas, workers):
+    """Dibuja los PDF de `tareas` (en procesos si `workers` > 1) y genera sus entradas al terminar."""
+    if workers <= 1:
+        for entrada, argumentos in tareas:
+            _dibujar_estado(*argumentos)
+            yield entrada
+        return
+
+    # spawn: el hijo no hereda hilos (scheduler) ni conexiones SQLite abiertas
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pendientes = {}
+        for entrada, argumentos in tareas:
+            if len(pendientes) >= 2 * workers:
+                hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                for future in hechos:
+                    future.result()
+                    yield pendientes.pop(future)
+            pendientes[pool.submit(_dibujar_estado, *argumentos)] = entrada
+        for future in list(pendientes):
+            future.result()
+            yield pendientes.pop(future)
+
+
+def _dibujar_estado(datos, filas, logo_path, ruta):
+    """Escribe un estado de cuenta en `ruta` (corre en el proceso hijo)."""
+    reporte = pdf_generator.ReportePapeleria(filas=filas, **datos)
+    pdf_generator.escribir_pdf(reporte, ruta, logo_path=logo_path)
+    return ruta
@@ -0,0 +1,123 @@
+"""
+Paginación por cursor (keyset) sobre `(fecha DESC, id DESC)`.
+
+`paginate()` de Flask-SQLAlchemy usa `OFFSET` y un `COUNT(*)` por página: las páginas
+profundas de una papelería con años de historial cuestan cada vez más. Con keyset cada
+página continúa desde la última fila vista con una búsqueda por rango en el índice
+(`(fecha, id) < (:fecha, :id)`), así que la página 500 cuesta lo mismo que la primera.
+
+    page = keyset_paginate(query, Tramite.fecha, Tramite.id, per_page=20,
+                           after=request.args.get('after'))
+    page.items, page.next_cursor, page.prev_cursor
+
+Los cursores son cadenas `YYYY-MM-DD.id` que viajan en la URL (`?after=` / `?before=`).
+`desde=YYYY-MM-DD` salta a la primera fila con fecha <= `desde` ("ir a fecha").
+El total no se cuenta aquí: lo aporta quien llama desde los rollups diarios.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import tuple_
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """Posición `(fecha, id)` de una fila en el orden `fecha DESC, id DESC`."""
+    fecha: date
+    id: int
+
+    def encode(self):
+        return f'{self.fecha.isoformat()}.{self.id}'
+
+    @classmethod
+    def decode(cls, valor):
+        """Cursor desde su forma de URL, o None si falta o está mal formado."""
+        if not valor:
+            return None
+        try:
+            fecha, id_ = str(valor).split('.', 1)
+            return cls(datetime.strptime(fecha, '%Y-%m-%d').date(), int(id_))
+        except ValueError:
+            return None
+
+    @classmethod
+    def seek(cls, valor):
+        """Cursor de "ir a fecha": justo antes de la primera fila del día siguiente a `valor`."""
+        try:
+            fecha = datetime.strptime(str(valor), '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return None
+        return cls(fecha + timedelta(days=1), 0)
+
+
+@dataclass
+class KeysetPage:
+    """Una página de resultados y los cursores para moverse a la anterior/siguiente."""
+    items: list
+    per_page: int
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(query, fecha_col, id_col, per_page=20, after=None, before=None, desde=None):
+    """
+    Página de `query` ordenada por `fecha_col DESC, id_col DESC`.
+
+    - `after`: cursor de la última fila de la página anterior (avanzar).
+    - `before`: cursor de la primera fila de la página siguiente (retroceder).
+    - `desde`: fecha `YYYY-MM-DD`; la página empieza en la primera fila con fecha <= `desde`.
+
+    Cursores inválidos se ignoran (primera página). Lee `per_page + 1` filas para saber si
+    hay página siguiente sin contar.
+    """
+    llave = tuple_(fecha_col, id_col)
+    before = Cursor.decode(before)
+    after = Cursor.decode(after) or (Cursor.seek(desde) if desde and not before else None)
+
+    if before is not None:
+        filas = query.filter(llave > (before.fecha, before.id))\
+            .order_by(fecha_col.asc(), id_col.asc())\
+            .limit(per_page + 1).all()
+        if len(filas) > per_page:
+            filas = filas[:per_page][::-1]
+            return _page(filas, per_page, fecha_col, id_col, hay_siguiente=True, hay_anterior=True)
+        # Se alcanzó el inicio: mostrar la primera página completa
+        after = None
+
+    if after is not None:
+        query = query.filter(llave < (after.fecha, after.id))
+    filas = query.order_by(fecha_col.desc(), id_col.desc()).limit(per_page + 1).all()
+    return _page(filas[:per_page], per_page, fecha_col, id_col,
+                 hay_siguiente=len(filas) > per_page, hay_anterior=after is not None)
+
+
+def _page(filas, per_page, fecha_col, id_col, hay_siguiente, hay_anterior):
+    def cursor(fila):
+        return Cursor(_as_date(getattr(fila, fecha_col.key)), getattr(fila, id_col.key)).encode()
+
+    return KeysetPage(
+        items=filas,
+        per_page=per_page,
+        next_cursor=cursor(filas[-1]) if filas and hay_siguiente else None,
+        prev_cursor=cursor(filas[0]) if filas and hay_anterior else None,
+    )
+
+
+def _as_date(fecha):
+    return fecha.date() if isinstance(fecha, datetime) else fecha
@@ -1,8 +1,33 @@
 # pdf_generator.py
+"""
+Reportes PDF de trámites por papelería.
+
+El reporte no materializa la historia completa aunque la papelería tenga cientos de miles
+de trámites:
+
+- El resumen (número de trámites, ingresos, rango de fechas) sale de una consulta
+  agregada al rollup diario; las filas llegan después como tuplas ligeras, por lotes
+  (`yield_per`), sin materializar objetos ORM.
+- El detalle se reparte en tablas de `FILAS_POR_TABLA` filas que se generan conforme
+  reportlab las va consumiendo (`_ReporteDocTemplate.filterFlowables`): nunca hay más
+  de una tabla pendiente en memoria, y partir tablas pequeñas entre páginas es barato.
+- Las celdas son cadenas simples; solo los nombres de trámite que no caben en la
+  columna se envuelven en un `Paragraph`. El fondo alterno usa `ROWBACKGROUNDS`.
+- El encabezado (logo + título) se dibuja una sola vez como form XObject y cada página
+  lo reutiliza con `doForm`; el logo se decodifica una vez por documento.
+- `escribir_pdf` escribe en cualquier archivo abierto (la respuesta HTTP, un temporal),
+  sin pasar por `reportes_pdf/`.
+
+La memoria no queda acotada: reportlab guarda cada página terminada (con su contenido
+sin comprimir) hasta `save()`, así que el pico crece linealmente con el número de filas.
+Ver `benchmarks/bench_pdf_report.py`.
+"""
+from dataclasses import dataclass
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
+from typing import Iterable, Optional
+from xml.sax.saxutils import escape
 import logging
-import os
 
 # reportlab es opcional (ahorra ~5MB en PythonAnywhere gratis)
 REPORTLAB_AVAILABLE = False
@@ -10,7 +35,9 @@ try:
     from reportlab.lib.pagesizes import A4
     from reportlab.lib import colors
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
     from reportlab.lib.units import mm
     REPORTLAB_AVAILABLE = True
 except ImportError:
@@ -23,55 +50,61 @@ except ImportError:
 BASE_DIR = Path(__file__).resolve().parent
 REPORTS_DIR = BASE_DIR / "reportes_pdf"
 
-def _header_footer(canvas, doc, logo_path=None):
-    """Función para dibujar el encabezado y pie de página en cada página del PDF."""
-    canvas.saveState()
-    styles = getSampleStyleSheet()
-    
-    # --- Encabezado ---
-    header_content = []
-    if logo_path and Path(logo_path).exists():
-        try:
-            img = Image(logo_path, width=20*mm, height=20*mm)
-            img.hAlign = 'LEFT'
-            title_text = Paragraph(f"<b>DOCUEXPRESS</b><br/><font size=10>Reporte de Trámites</font>", styles['Heading1'])
-            header_table = Table([[img, title_text]], colWidths=[25*mm, 150*mm], rowHeights=[20*mm])
-            header_table.setStyle(TableStyle([('VALIGN', (0,0), (-1,-1), 'MIDDLE')]))
-            header_content.append(header_table)
-        except Exception as e:
-            logging.warning(f"No se pudo cargar el logo '{logo_path}' para el PDF: {e}")
-            pass
-    
-    if not header_content:
-        header_content.append(Paragraph("<b>DOCUEXPRESS</b>", styles['Heading1']))
+FILAS_POR_TABLA = 200       # Filas de detalle por tabla (varias páginas cada una)
+LOTE_FILAS = 2000           # Filas por lote leído de la BD
+FORMATO_VERSION = 1         # Subir al cambiar el diseño: invalida los PDF en caché
+_ENCABEZADO_FORM = 'encabezado_docuexpress'
+_FUENTE_CELDA = ('Helvetica', 10)
+_styles = None
 
-    for item in header_content:
-        w, h = item.wrapOn(canvas, doc.width, doc.topMargin)
-        item.drawOn(canvas, doc.leftMargin, doc.height + doc.topMargin - h)
 
-    # --- Línea divisoria ---
-    canvas.setStrokeColorRGB(0.8, 0.8, 0.8)
-    canvas.line(doc.leftMargin, doc.height + doc.topMargin - 25*mm, doc.width + doc.leftMargin, doc.height + doc.topMargin - 25*mm)
+def _get_styles():
+    """Hoja de estilos compartida (se crea una vez por proceso)."""
+    global _styles
+    if _styles is None:
+        _styles = getSampleStyleSheet()
+        _styles.add(ParagraphStyle(name='RightAlign', alignment=2))
+    return _styles
 
-    # --- Pie de página ---
-    footer_text = f"Página {doc.page}"
-    canvas.setFont('Helvetica', 8)
-    canvas.setFillColor(colors.grey)
-    canvas.drawRightString(doc.width + doc.leftMargin, 10 * mm, footer_text)
-    canvas.restoreState()
 
-def generar_pdf_papeleria(papeleria_repository, tramite_repository, papeleria_id, user_id, fecha_inicio=None, fecha_fin=None, carpeta=REPORTS_DIR, logo_path=None, is_admin_view=False):
-    """Genera un PDF con el reporte de trámites. Retorna None si reportlab no está instalado."""
-    if not REPORTLAB_AVAILABLE:
-        logging.warning("reportlab no instalado - PDFs no disponibles")
-        return None
-    
+@dataclass
+class ReportePapeleria:
+    """Datos de un reporte: resumen agregado y las filas de detalle (iterador perezoso)."""
+    papeleria: str
+    periodo: str
+    nombre_archivo: str
+    num_tramites: int
+    total_ingresos: float
+    filas: Iterable
+
+    @property
+    def huella(self):
+        """Valores del resumen que identifican el contenido del PDF (parte de la clave de caché)."""
+        return (FORMATO_VERSION, self.papeleria, self.periodo, self.nombre_archivo, self.num_tramites, self.total_ingresos)
+
+
+def preparar_reporte(papeleria_repository, tramite_repository, papeleria_id, user_id, fecha_inicio=None, fecha_fin=None):
+    """Resumen del reporte y sus filas, sin leer aún el detalle. None si la papelería no existe."""
     pap_nombre = papeleria_repository.get_name(papeleria_id, user_id)
     if not pap_nombre:
         return None
 
-    datos, _, _ = tramite_repository.get_details_for_papeleria(papeleria_id, user_id, fecha_inicio, fecha_fin, page=1, per_page=999999)
-    
+    resumen = tramite_repository.get_report_summary(papeleria_id, user_id, fecha_inicio, fecha_fin)
+    periodo_str, nombre_archivo = periodo_y_archivo(pap_nombre, fecha_inicio, fecha_fin, resumen['primera'], resumen['ultima'])
+    filas = tramite_repository.export_all_as_csv(user_id, fecha_inicio, fecha_fin, papeleria_id=papeleria_id,
+                                                 batch_size=LOTE_FILAS)
+    return ReportePapeleria(
+        papeleria=pap_nombre,
+        periodo=periodo_str,
+        nombre_archivo=nombre_archivo,
+        num_tramites=resumen['cuantos'],
+        total_ingresos=resumen['total_ingresos'],
+        filas=filas,
+    )
+
+
+def periodo_y_archivo(pap_nombre, fecha_inicio=None, fecha_fin=None, primera=None, ultima=None):
+    """Texto del periodo y nombre del PDF de un reporte (`primera`/`ultima`: días con trámites, sin rango)."""
     if fecha_inicio and fecha_fin:
         inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d')
         fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d')
@@ -79,32 +112,131 @@ def generar_pdf_papeleria(papeleria_repository, tramite_repository, papeleria_id
         fecha_archivo_str = f"{fecha_inicio}_a_{fecha_fin}"
     else:
         periodo_str = "Histórico"
-        fechas_tramites = [d.fecha for d in datos] if datos else []
-        fecha_archivo_str = f"{min(fechas_tramites).strftime('%Y-%m-%d')}_a_{max(fechas_tramites).strftime('%Y-%m-%d')}" if fechas_tramites else "historico"
-
-    total_ingresos = sum(r.precio for r in datos)
-    num_tramites = len(datos)
+        if primera:
+            fecha_archivo_str = f"{primera.strftime('%Y-%m-%d')}_a_{ultima.strftime('%Y-%m-%d')}"
+        else:
+            fecha_archivo_str = "historico"
 
-    Path(carpeta).mkdir(parents=True, exist_ok=True)
     safe_papeleria_name = "".join(filter(str.isalnum, pap_nombre)).replace(" ", "_")
-    nombre_archivo = f"reporte_{safe_papeleria_name}_{fecha_archivo_str}.pdf"
-    ruta = Path(carpeta) / nombre_archivo
-    
-    doc = SimpleDocTemplate(str(ruta), pagesize=A4, rightMargin=20*mm, leftMargin=20*mm, topMargin=40*mm, bottomMargin=20*mm)
+    return periodo_str, f"reporte_{safe_papeleria_name}_{fecha_archivo_str}.pdf"
+
+
+def logo_de_usuario(upload_folder, user_id):
+    """Ruta del logo subido por el usuario, o None si no tiene."""
+    logo_path = Path(upload_folder) / f"logo_{user_id}.png"
+    return str(logo_path) if logo_path.exists() else None
+
+
+def clave_cache(reporte, papeleria_id, user_id, fecha_inicio, fecha_fin, logo_path, data_version):
+    """Clave de `report_cache` del PDF: cambia con los datos, el rango, el logo o el diseño."""
+    from .report_cache import cache_key, file_hash
+    return cache_key('papeleria', papeleria_id, user_id, fecha_inicio, fecha_fin, file_hash(logo_path),
+                     data_version, reporte.huella)
 
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='RightAlign', alignment=2))
-    elements = []
+
+def _dibujar_encabezado(canvas, doc, logo_path):
+    """Define el form XObject del encabezado (logo, título y línea divisoria)."""
+    canvas.beginForm(_ENCABEZADO_FORM)
+    top = doc.height + doc.topMargin
+    x = doc.leftMargin
+    if logo_path and Path(logo_path).exists():
+        try:
+            canvas.drawImage(ImageReader(str(logo_path)), x, top - 20*mm, width=20*mm, height=20*mm,
+                             preserveAspectRatio=True, mask='auto')
+            x += 25*mm
+        except Exception as e:
+            logging.warning(f"No se pudo cargar el logo '{logo_path}' para el PDF: {e}")
+    canvas.setFont('Helvetica-Bold', 18)
+    canvas.drawString(x, top - 9*mm, "DOCUEXPRESS")
+    canvas.setFont('Helvetica', 10)
+    canvas.drawString(x, top - 15*mm, "Reporte de Trámites")
+    canvas.setStrokeColorRGB(0.8, 0.8, 0.8)
+    canvas.line(doc.leftMargin, top - 25*mm, doc.width + doc.leftMargin, top - 25*mm)
+    canvas.endForm()
+
+
+def _header_footer(canvas, doc, logo_path=None):
+    """Dibuja el encabezado (form reutilizado) y el pie de página en cada página del PDF."""
+    canvas.saveState()
+    if not getattr(canvas, '_encabezado_definido', False):
+        _dibujar_encabezado(canvas, doc, logo_path)
+        canvas._encabezado_definido = True
+    canvas.doForm(_ENCABEZADO_FORM)
+
+    # --- Pie de página ---
+    canvas.setFont('Helvetica', 8)
+    canvas.setFillColor(colors.grey)
+    canvas.drawRightString(doc.width + doc.leftMargin, 10 * mm, f"Página {doc.page}")
+    canvas.restoreState()
+
+
+class _ReporteDocTemplate(SimpleDocTemplate if REPORTLAB_AVAILABLE else object):
+    """SimpleDocTemplate que pide las tablas de detalle a un generador conforme las necesita."""
+
+    def __init__(self, output, pendientes, **kwargs):
+        super().__init__(output, **kwargs)
+        self._pendientes = pendientes
+
+    def build(self, flowables, **kwargs):
+        self._flowables = flowables
+        super().build(flowables, **kwargs)
+
+    def filterFlowables(self, flowables):
+        # Se llama antes de consumir cada flowable (también con la lista interna `_hanging`):
+        # mantener al menos uno más en la lista del documento
+        if flowables is self._flowables and len(flowables) <= 1:
+            siguiente = next(self._pendientes, None)
+            if siguiente is not None:
+                flowables.append(siguiente)
+
+
+def _tablas_detalle(filas, ancho_tramite):
+    """Genera tablas de `FILAS_POR_TABLA` filas con el detalle del reporte."""
+    styles = _get_styles()
+    estilo = TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#2c3e50')),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('ALIGN', (1,1), (1,-1), 'LEFT'),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0,0), (-1,0), 12),
+        ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#ecf0f1')]),
+        ('GRID', (0,0), (-1,-1), 1, colors.HexColor('#bdc3c7')),
+        ('ALIGN', (3,1), (3,-1), 'RIGHT'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('TOPPADDING', (0,1), (-1,-1), 6),
+        ('BOTTOMPADDING', (0,1), (-1,-1), 6),
+    ])
+    encabezado = ["Fecha", "Trámite", "Cant.", "Importe"]
+    col_widths = [30*mm, ancho_tramite, 15*mm, 30*mm]
+    limite = ancho_tramite - 12  # padding izquierdo + derecho de la celda
+
+    data = [encabezado]
+    for r in filas:
+        tramite = r.tramite
+        if stringWidth(tramite, *_FUENTE_CELDA) > limite:
+            tramite = Paragraph(escape(tramite), styles['BodyText'])
+        data.append((r.fecha.strftime('%Y-%m-%d'), tramite, str(r.cantidad), f"${r.precio * r.cantidad:.2f}"))
+        if len(data) > FILAS_POR_TABLA:
+            yield Table(data, colWidths=col_widths, repeatRows=1, style=estilo)
+            data = [encabezado]
+    if len(data) > 1:
+        yield Table(data, colWidths=col_widths, repeatRows=1, style=estilo)
+
+
+def escribir_pdf(reporte, output, logo_path=None):
+    """Escribe el PDF de `reporte` en `output` (ruta o archivo abierto en modo binario)."""
+    styles = _get_styles()
+    doc_kwargs = dict(pagesize=A4, rightMargin=20*mm, leftMargin=20*mm, topMargin=40*mm, bottomMargin=20*mm)
+    ancho_tramite = A4[0] - 40*mm - 75*mm
 
     resumen_data = [
-        [Paragraph('<b>Papelería:</b>', styles['Normal']), pap_nombre],
-        [Paragraph('<b>Periodo:</b>', styles['Normal']), periodo_str],
-        [Paragraph('<b>Total Trámites:</b>', styles['Normal']), str(num_tramites)],
-        [Paragraph('<b>Total Ingresos:</b>', styles['Normal']), Paragraph(f'<b>${total_ingresos:.2f}</b>', styles['RightAlign'])],
+        [Paragraph('<b>Papelería:</b>', styles['Normal']), reporte.papeleria],
+        [Paragraph('<b>Periodo:</b>', styles['Normal']), reporte.periodo],
+        [Paragraph('<b>Total Trámites:</b>', styles['Normal']), str(reporte.num_tramites)],
+        [Paragraph('<b>Total Ingresos:</b>', styles['Normal']), Paragraph(f'<b>${reporte.total_ingresos:.2f}</b>', styles['RightAlign'])],
     ]
-
-    col_widths = [40*mm, None]
-    resumen_table = Table(resumen_data, colWidths=col_widths)
+    resumen_table = Table(resumen_data, colWidths=[40*mm, None])
     resumen_table.setStyle(TableStyle([
         ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#F7F9FC')),
         ('GRID', (0,0), (-1,-1), 1, colors.HexColor('#E0E6ED')),
@@ -114,37 +246,71 @@ def generar_pdf_papeleria(papeleria_repository, tramite_repository, papeleria_id
         ('TOPPADDING', (0,0), (-1,-1), 4),
         ('BOTTOMPADDING', (0,0), (-1,-1), 4),
     ]))
-    elements.append(resumen_table)
-    elements.append(Spacer(1, 10*mm))
+    elements = [resumen_table, Spacer(1, 10*mm)]
 
-    if not datos:
-        elements.append(Paragraph("No hay registros para esta papelería en el periodo indicado.", styles['BodyText']))
+    if reporte.num_tramites:
+        pendientes = _tablas_detalle(reporte.filas, ancho_tramite)
     else:
-        data = [["Fecha", "Trámite", "Precio"]]
-        col_widths = [30*mm, None, 30*mm]
-        for r in datos:
-            data.append([r.fecha.strftime('%Y-%m-%d'), Paragraph(r.tramite, styles['BodyText']), f"${r.precio:.2f}"])
-
-        t = Table(data, colWidths=col_widths, repeatRows=1)
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#2c3e50')), 
-            ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-            ('ALIGN', (1,1), (1,-1), 'LEFT'),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0,0), (-1,0), 12),
-            ('BACKGROUND', (0,1), (-1,-1), colors.HexColor('#ecf0f1')),
-            ('GRID', (0,0), (-1,-1), 1, colors.HexColor('#bdc3c7')),
-            ('ALIGN', (2,1), (2,-1), 'RIGHT'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('TOPPADDING', (0,1), (-1,-1), 6),
-            ('BOTTOMPADDING', (0,1), (-1,-1), 6),
-        ]))
-        for i, row in enumerate(datos):
-            if i % 2 == 0:
-                t.setStyle(TableStyle([('BACKGROUND', (0, i+1), (-1, i+1), colors.white)]))
-        elements.append(t)
-    on_first = lambda canvas, doc: _header_footer(canvas, doc, logo_path=logo_path)
-    on_later = lambda canvas, doc: _header_footer(canvas, doc, logo_path=logo_path)
-    doc.build(elements, onFirstPage=on_first, onLaterPages=on_later)
+        pendientes = iter(())
+        elements.append(Paragraph("No hay registros para esta papelería en el periodo indicado.", styles['BodyText']))
+
+    doc = _ReporteDocTemplate(output, pendientes, **doc_kwargs)
+    header_footer = lambda canvas, doc: _header_footer(canvas, doc, logo_path=logo_path)
+    doc.build(elements, onFirstPage=header_footer, onLaterPages=header_footer)
+    return output
+
+
+def escribir_indice(periodo, entradas, output, logo_path=None):
+    """
+    Escribe el índice de un lote de estados de cuenta: una fila por PDF (`entradas` con
+    usuario, papeleria, archivo, num_tramites y total_ingresos) y el total del lote.
+    """
+    styles = _get_styles()
+    con_usuario = any(e['usuario'] for e in entradas)
+    encabezado = (["Usuario"] if con_usuario else []) + ["Papelería", "Archivo", "Trámites", "Ingresos"]
+    data = [encabezado]
+    for e in entradas:
+        fila = [e['usuario']] if con_usuario else []
+        fila += [Paragraph(escape(e['papeleria']), styles['BodyText']), Paragraph(escape(e['archivo']), styles['BodyText']),
+                 str(e['num_tramites']), f"${e['total_ingresos']:.2f}"]
+        data.append(fila)
+    total = [""] * (len(encabezado) - 3) + ["Total", str(sum(e['num_tramites'] for e in entradas)),
+                                            f"${sum(e['total_ingresos'] for e in entradas):.2f}"]
+    data.append(total)
+
+    # Papelería y archivo se reparten lo que dejan las columnas fijas
+    ancho_texto = (A4[0] - 40*mm - 50*mm - (30*mm if con_usuario else 0)) / 2
+    col_widths = ([30*mm] if con_usuario else []) + [ancho_texto, ancho_texto, 20*mm, 30*mm]
+    tabla = Table(data, colWidths=col_widths, repeatRows=1, style=TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#2c3e50')),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('ROWBACKGROUNDS', (0,1), (-1,-2), [colors.white, colors.HexColor('#ecf0f1')]),
+        ('BACKGROUND', (0,-1), (-1,-1), colors.HexColor('#F7F9FC')),
+        ('FONTNAME', (0,-1), (-1,-1), 'Helvetica-Bold'),
+        ('GRID', (0,0), (-1,-1), 1, colors.HexColor('#bdc3c7')),
+        ('ALIGN', (-2,0), (-1,-1), 'RIGHT'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ]))
+    elements = [Paragraph(f"<b>Estados de cuenta:</b> {periodo}", styles['Normal']), Spacer(1, 6*mm), tabla]
+
+    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=20*mm, leftMargin=20*mm, topMargin=40*mm, bottomMargin=20*mm)
+    header_footer = lambda canvas, doc: _header_footer(canvas, doc, logo_path=logo_path)
+    doc.build(elements, onFirstPage=header_footer, onLaterPages=header_footer)
+    return output
+
+
+def generar_pdf_papeleria(papeleria_repository, tramite_repository, papeleria_id, user_id, fecha_inicio=None, fecha_fin=None, carpeta=REPORTS_DIR, logo_path=None, is_admin_view=False):
+    """Genera el PDF del reporte en `carpeta` y retorna su ruta. Retorna None si reportlab no está instalado."""
+    if not REPORTLAB_AVAILABLE:
+        logging.warning("reportlab no instalado - PDFs no disponibles")
+        return None
+
+    reporte = preparar_reporte(papeleria_repository, tramite_repository, papeleria_id, user_id, fecha_inicio, fecha_fin)
+    if reporte is None:
+        return None
+
+    Path(carpeta).mkdir(parents=True, exist_ok=True)
+    ruta = Path(carpeta) / reporte.nombre_archivo
+    escribir_pdf(reporte, str(ruta), logo_path=logo_path)
     return ruta
@@ -0,0 +1,149 @@
+"""
+Instrumentación de consultas SQL por petición.
+
+Cuenta las sentencias y el tiempo SQL de cada petición con los eventos
+`before_cursor_execute`/`after_cursor_execute` de SQLAlchemy, detecta sentencias
+repetidas que solo difieren en sus parámetros (patrón N+1) y publica las cifras en la
+cabecera `Server-Timing` (visible en la pestaña Network del navegador).
+
+Fuera de una petición (tests, CLI, benchmarks) se usa `collect()`:
+
+    with query_stats.collect() as stats:
+        papeleria_repository.get_all_papelerias(user_id)
+    assert stats.count == 1
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'QUERY_STATS_ENABLED': True,
+    'QUERY_STATS_SERVER_TIMING': True,
+    'QUERY_STATS_N_PLUS_ONE_THRESHOLD': 3,   # Ejecuciones de la misma sentencia que se reportan como N+1
+}
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'IN \((?:\?, )*\?\)')
+
+# Colectores activos de `collect()` (se anidan)
+_collectors = ContextVar('query_stats_collectors', default=())
+
+
+def normalize(statement):
+    """
+    Forma canónica de una sentencia: sin espacios redundantes, con literales e
+    `IN (?, ?, ...)` expandidos reemplazados por `?`, para agrupar las que solo
+    difieren en parámetros.
+    """
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    statement = _LITERALS.sub('?', statement)
+    return _IN_LISTS.sub('IN (?)', statement)
+
+
+class QueryStats:
+    """Sentencias y tiempo SQL acumulados de una petición o de un bloque `collect()`."""
+
+    def __init__(self, n_plus_one_threshold=DEFAULTS['QUERY_STATS_N_PLUS_ONE_THRESHOLD']):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[normalize(statement)] += 1
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+    def repeated(self):
+        """Sentencias ejecutadas al menos `n_plus_one_threshold` veces: [(sql, veces)]."""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= self.n_plus_one_threshold]
+
+    def server_timing(self):
+        """Métricas para la cabecera `Server-Timing`."""
+        metrics = [f'db;dur={self.duration_ms:.2f};desc="{self.count} queries"']
+        repeated = self.repeated()
+        if repeated:
+            metrics.append(f'db-n1;desc="{len(repeated)} repeated, max {repeated[0][1]}x"')
+        return ', '.join(metrics)
+
+
+@contextmanager
+def collect(n_plus_one_threshold=DEFAULTS['QUERY_STATS_N_PLUS_ONE_THRESHOLD']):
+    """Acumula en un `QueryStats` las sentencias ejecutadas dentro del bloque."""
+    stats = QueryStats(n_plus_one_threshold)
+    token = _collectors.set(_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+def current_stats():
+    """`QueryStats` de la petición en curso, o None."""
+    if has_request_context():
+        return g.get('query_stats')
+    return None
+
+
+def install(engine):
+    """Registra los listeners de conteo y tiempo en el engine."""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_stats_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_stats_start'].pop()
+        for stats in _collectors.get():
+            stats.record(statement, duration)
+        stats = current_stats()
+        if stats is not None:
+            stats.record(statement, duration)
+
+
+def init_app(app, db):
+    """
+    Instala la instrumentación en los engines de la app y los hooks por petición.
+    Llamar después de `db.init_app(app)`.
+    """
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, default)
+    if not app.config['QUERY_STATS_ENABLED']:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            install(engine)
+    # Engine de solo lectura de db_routing (si existe)
+    if app.extensions.get('db_routing') is not None:
+        install(app.extensions['db_routing'])
+
+    @app.before_request
+    def _start_query_stats():
+        g.query_stats = QueryStats(app.config['QUERY_STATS_N_PLUS_ONE_THRESHOLD'])
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        for sql, veces in stats.repeated():
+            logging.warning(f"[N+1] {request.method} {request.path}: {veces} ejecuciones de: {sql[:300]}")
+        if app.config['QUERY_STATS_SERVER_TIMING']:
+            existing = response.headers.get('Server-Timing')
+            timing = stats.server_timing()
+            response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+        return response
@@ -0,0 +1,178 @@
+"""
+Caché de reportes PDF direccionada por contenido (`reportes_pdf/`).
+
+La clave de un reporte es el SHA-256 de todo lo que determina su contenido: papelería,
+usuario, rango de fechas, hash del logo, versión de datos del usuario y la huella del
+resumen (ver `ReportePapeleria.huella`). Misma clave, mismo PDF: un acierto se sirve tal
+cual con `send_file` y la clave como ETag, así que el navegador recibe un 304 si ya lo tiene.
+
+Varios workers de gunicorn pueden pedir la misma clave a la vez:
+
+- Cada clave tiene un `<clave>.lock` con `fcntl.flock`; el primero construye y los demás
+  esperan y encuentran el PDF ya escrito. Sin `fcntl` (Windows) solo se pierde la espera.
+- El PDF se escribe en un temporal del mismo directorio y se publica con `os.replace`
+  (atómico): nadie lee nunca un archivo a medias.
+
+Tras cada construcción `evict` borra los PDF sin uso en `PDF_CACHE_MAX_AGE` segundos y,
+si el directorio pasa de `PDF_CACHE_MAX_BYTES`, los usados hace más tiempo (cada acierto
+actualiza el mtime). Aplica a todo el directorio, incluidos los `reporte_*.pdf` sueltos de
+versiones anteriores, y limpia temporales y locks abandonados.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager, suppress
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin locks entre procesos
+    fcntl = None
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'PDF_CACHE_DIR': Path(__file__).resolve().parent / 'reportes_pdf',
+    'PDF_CACHE_MAX_BYTES': 200 * 1024 * 1024,   # 200MB
+    'PDF_CACHE_MAX_AGE': 7 * 24 * 3600,         # 7 días sin descargas
+}
+
+_TMP_PREFIX = '.tmp-'
+_ABANDONADO_SEGUNDOS = 3600  # Temporales y locks sin tocar en este tiempo se borran
+
+
+def init_app(app):
+    """Completa la configuración de la caché con `DEFAULTS`."""
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, default)
+
+
+def cache_key(*partes):
+    """Clave estable (hex SHA-256) para una combinación de valores serializables."""
+    payload = json.dumps(partes, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_hash(path):
+    """SHA-256 del contenido de un archivo (p. ej. el logo), o None si no existe."""
+    if not path or not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+class ReportCache:
+    """Directorio de PDF indexado por clave, con construcción única por clave y expulsión."""
+
+    def __init__(self, directory, max_bytes=DEFAULTS['PDF_CACHE_MAX_BYTES'], max_age=DEFAULTS['PDF_CACHE_MAX_AGE']):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('PDF_CACHE_DIR', DEFAULTS['PDF_CACHE_DIR']),
+                   max_bytes=config.get('PDF_CACHE_MAX_BYTES', DEFAULTS['PDF_CACHE_MAX_BYTES']),
+                   max_age=config.get('PDF_CACHE_MAX_AGE', DEFAULTS['PDF_CACHE_MAX_AGE']))
+
+    def path(self, key):
+        return self.directory / f'{key}.pdf'
+
+    def get(self, key):
+        """Ruta del PDF en caché (marcándolo como usado ahora), o None."""
+        ruta = self.path(key)
+        try:
+            os.utime(ruta)
+        except FileNotFoundError:
+            return None
+        return ruta
+
+    @contextmanager
+    def _lock(self, key):
+        if fcntl is None:
+            yield
+            return
+        lock_path = self.directory / f'{key}.lock'
+        with open(lock_path, 'a+b') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                os.utime(lock_path)
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_or_build(self, key, build):
+        """
+        Devuelve `(ruta, acierto)`. Si la clave no está, `build(archivo)` escribe el PDF
+        en un archivo binario abierto; solo un worker lo construye por clave.
+        """
+        ruta = self.get(key)
+        if ruta:
+            return ruta, True
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock(key):
+            ruta = self.get(key)  # Otro worker pudo construirlo mientras esperábamos el lock
+            if ruta:
+                return ruta, True
+            ruta = self.path(key)
+            fd, tmp_path = tempfile.mkstemp(prefix=_TMP_PREFIX, suffix='.part', dir=self.directory)
+            try:
+                with os.fdopen(fd, 'wb') as salida:
+                    build(salida)
+                os.replace(tmp_path, ruta)
+            except BaseException:
+                with suppress(FileNotFoundError):
+                    os.unlink(tmp_path)
+                raise
+
+        self.evict()
+        return ruta, False
+
+    def evict(self, now=None):
+        """Aplica los límites de edad y tamaño al directorio. Retorna cuántos archivos borró."""
+        now = time.time() if now is None else now
+        pdfs, borrados = [], 0
+        try:
+            entradas = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+
+        for entrada in entradas:
+            try:
+                stat = entrada.stat()
+            except FileNotFoundError:
+                continue
+            edad = now - stat.st_mtime
+            if entrada.name.endswith('.pdf'):
+                if edad > self.max_age:
+                    borrados += _unlink(entrada.path)
+                else:
+                    pdfs.append((stat.st_mtime, stat.st_size, entrada.path))
+            elif (entrada.name.startswith(_TMP_PREFIX) or entrada.name.endswith('.lock')) and edad > _ABANDONADO_SEGUNDOS:
+                borrados += _unlink(entrada.path)
+
+        total = sum(size for _, size, _ in pdfs)
+        for _, size, path in sorted(pdfs):
+            if total <= self.max_bytes:
+                break
+            borrados += _unlink(path)
+            total -= size
+
+        if borrados:
+            logging.info(f"Caché de reportes PDF: {borrados} archivos expulsados de {self.directory}")
+        return borrados
+
+
+def _unlink(path):
+    """Borra un archivo tolerando que otro worker lo haya borrado antes."""
+    try:
+        os.unlink(path)
+        return 1
+    except FileNotFoundError:
+        return 0
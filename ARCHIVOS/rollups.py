@@ -0,0 +1,177 @@
+"""
+Mantenimiento de las tablas de rollup diario (`tramites_diarios`, `gastos_diarios`).
+
+Los repositorios llaman a estas funciones dentro de su propia transacción, antes del
+`commit`, para que el agregado y la fila cruda se confirmen (o reviertan) juntos.
+"""
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import func, delete, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .models import db, Tramite, Gasto, TramiteDiario, GastoDiario, AnalyticsSnapshot, periodo_de
+
+
+def _as_date(fecha):
+    """Normaliza fechas (str, datetime o date) a `date`."""
+    if isinstance(fecha, datetime):
+        return fecha.date()
+    if isinstance(fecha, date):
+        return fecha
+    return datetime.strptime(str(fecha)[:10], "%Y-%m-%d").date()
+
+
+def apply_tramite_delta(user_id, papeleria_id, tramite, fecha, cuantos, ingresos, costos):
+    """
+    Suma (o resta, con valores negativos) un delta al rollup diario de trámites.
+    Las filas que quedan en cero se eliminan para no inflar los conteos por rango.
+    """
+    fecha = _as_date(fecha)
+    stmt = sqlite_insert(TramiteDiario).values(
+        user_id=user_id,
+        fecha=fecha,
+        papeleria_id=papeleria_id,
+        tramite=tramite,
+        periodo=periodo_de(fecha),
+        cuantos=cuantos,
+        total_ingresos=ingresos,
+        total_costos=costos
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'fecha', 'papeleria_id', 'tramite'],
+        set_={
+            'cuantos': TramiteDiario.cuantos + stmt.excluded.cuantos,
+            'total_ingresos': TramiteDiario.total_ingresos + stmt.excluded.total_ingresos,
+            'total_costos': TramiteDiario.total_costos + stmt.excluded.total_costos,
+        }
+    )
+    db.session.execute(stmt)
+
+    # El snapshot de analytics ya incluye ese día: se descarta y las métricas de esa
+    # papelería salen del rollup hasta el próximo refresco (ver AnalyticsRepository)
+    if fecha < date.today():
+        db.session.execute(delete(AnalyticsSnapshot).where(
+            AnalyticsSnapshot.user_id == user_id,
+            AnalyticsSnapshot.papeleria_id == papeleria_id,
+            AnalyticsSnapshot.hasta >= fecha
+        ))
+
+    if cuantos < 0:
+        db.session.execute(delete(TramiteDiario).where(
+            TramiteDiario.user_id == user_id,
+            TramiteDiario.fecha == fecha,
+            TramiteDiario.papeleria_id == papeleria_id,
+            TramiteDiario.tramite == tramite,
+            TramiteDiario.cuantos <= 0
+        ))
+
+
+def apply_gasto_delta(user_id, categoria, fecha, cuantos, monto):
+    """Suma (o resta) un delta al rollup diario de gastos."""
+    fecha = _as_date(fecha)
+    stmt = sqlite_insert(GastoDiario).values(
+        user_id=user_id,
+        fecha=fecha,
+        categoria=categoria,
+        periodo=periodo_de(fecha),
+        cuantos=cuantos,
+        total_monto=monto
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'fecha', 'categoria'],
+        set_={
+            'cuantos': GastoDiario.cuantos + stmt.excluded.cuantos,
+            'total_monto': GastoDiario.total_monto + stmt.excluded.total_monto,
+        }
+    )
+    db.session.execute(stmt)
+
+    if cuantos < 0:
+        db.session.execute(delete(GastoDiario).where(
+            GastoDiario.user_id == user_id,
+            GastoDiario.fecha == fecha,
+            GastoDiario.categoria == categoria,
+            GastoDiario.cuantos <= 0
+        ))
+
+
+def rebuild_tramites_rollup(user_id=None):
+    """
+    Recalcula `tramites_diarios` desde `tramites` (todo o un usuario) y descarta sus
+    snapshots de analytics. No hace commit.
+    """
+    borrar = delete(TramiteDiario)
+    snapshots = delete(AnalyticsSnapshot)
+    origen = select(
+        Tramite.user_id,
+        Tramite.fecha,
+        Tramite.papeleria_id,
+        Tramite.tramite,
+        Tramite.periodo,
+        func.sum(Tramite.cantidad),
+        func.coalesce(func.sum(Tramite.precio * Tramite.cantidad), 0),
+        func.coalesce(func.sum(Tramite.costo * Tramite.cantidad), 0)
+    )
+    if user_id is not None:
+        borrar = borrar.where(TramiteDiario.user_id == user_id)
+        snapshots = snapshots.where(AnalyticsSnapshot.user_id == user_id)
+        origen = origen.where(Tramite.user_id == user_id)
+    origen = origen.group_by(Tramite.user_id, Tramite.fecha, Tramite.papeleria_id, Tramite.tramite, Tramite.periodo)
+
+    db.session.execute(borrar)
+    db.session.execute(snapshots)
+    db.session.execute(insert(TramiteDiario).from_select(
+        ['user_id', 'fecha', 'papeleria_id', 'tramite', 'periodo', 'cuantos', 'total_ingresos', 'total_costos'],
+        origen
+    ))
+
+
+def rebuild_gastos_rollup(user_id=None):
+    """Recalcula `gastos_diarios` desde `gastos` (todo o un usuario). No hace commit."""
+    borrar = delete(GastoDiario)
+    origen = select(
+        Gasto.user_id,
+        Gasto.fecha,
+        Gasto.categoria,
+        Gasto.periodo,
+        func.count(Gasto.id),
+        func.coalesce(func.sum(Gasto.monto), 0)
+    )
+    if user_id is not None:
+        borrar = borrar.where(GastoDiario.user_id == user_id)
+        origen = origen.where(Gasto.user_id == user_id)
+    origen = origen.group_by(Gasto.user_id, Gasto.fecha, Gasto.categoria, Gasto.periodo)
+
+    db.session.execute(borrar)
+    db.session.execute(insert(GastoDiario).from_select(
+        ['user_id', 'fecha', 'categoria', 'periodo', 'cuantos', 'total_monto'],
+        origen
+    ))
+
+
+def rebuild_all(user_id=None):
+    """Reconstruye ambos rollups y confirma la transacción."""
+    try:
+        rebuild_tramites_rollup(user_id)
+        rebuild_gastos_rollup(user_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logging.info(f"[ROLLUP] Reconstrucción completada user_id={user_id or 'TODOS'}")
+
+
+def ensure_rollups_populated():
+    """
+    Backfill automático para bases existentes: si un rollup está vacío pero su tabla
+    origen tiene datos (p. ej. justo después de desplegar esta versión), se reconstruye.
+    """
+    tramites_vacio = db.session.query(TramiteDiario.user_id).first() is None
+    gastos_vacio = db.session.query(GastoDiario.user_id).first() is None
+    hay_tramites = db.session.query(Tramite.id).first() is not None
+    hay_gastos = db.session.query(Gasto.id).first() is not None
+
+    if (tramites_vacio and hay_tramites) or (gastos_vacio and hay_gastos):
+        logging.info("[ROLLUP] Rollups vacíos con datos existentes, reconstruyendo...")
+        rebuild_all()
@@ -1,10 +1,13 @@
-from flask import Blueprint, jsonify, request, current_app, url_for
-from flask_login import login_required
+from flask import Blueprint, jsonify, request, url_for, render_template, send_file
+from flask_login import login_required, current_user
 import logging
 import time
 
 from ..utils import get_effective_user_id, check_papeleria_owner, get_user_data_version
-from ..database import papeleria_repository, tramite_repository, gasto_repository, analytics_repository
+from ..database import papeleria_repository, tramite_repository, gasto_repository, proveedor_repository, analytics_repository, export_job_repository
+from ..search_index import LIMITES_POR_TIPO
+from ..dashboard_snapshot import DATA_DOMAINS as _DOMINIOS_DASHBOARD
+from .. import export_jobs, fragment_cache, single_flight
 from ..logging_config import log_action, timed_operation
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -12,6 +15,7 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 # Endpoint para totales del dashboard con filtro de fechas
 @api_bp.route('/dashboard-totals')
 @login_required
+@fragment_cache.conditional(*_DOMINIOS_DASHBOARD)
 def dashboard_totals():
     """Devuelve los totales de las tarjetas del dashboard según el rango de fechas."""
     start_time = time.time()
@@ -19,16 +23,35 @@ def dashboard_totals():
     fecha_inicio = request.args.get('fecha_inicio')
     fecha_fin = request.args.get('fecha_fin')
 
-    # --- CACHÉ INTELIGENTE PARA TOTALES ---
-    version = get_user_data_version(effective_user_id)
-    cache = getattr(current_app, 'cache', None)
-    cache_key = f"totals:{effective_user_id}:{version}:{fecha_inicio}:{fecha_fin}"
-    
-    if cache and version:
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return jsonify(cached_data)
+    # --- CACHÉ INTELIGENTE PARA TOTALES (un solo cálculo por versión, ver single_flight) ---
+    response_data = cached_totals(effective_user_id, fecha_inicio, fecha_fin)
+
+    # Log de performance para dashboard-totals
+    elapsed_ms = (time.time() - start_time) * 1000
+    if elapsed_ms > 1000:
+        logging.warning(f"[SLOW_API] dashboard-totals took {elapsed_ms:.2f}ms user={effective_user_id}")
+    else:
+        logging.debug(f"[API] dashboard-totals completed in {elapsed_ms:.2f}ms user={effective_user_id}")
+
+    return jsonify(response_data)
+
+
+def cached_totals(user_id, fecha_inicio=None, fecha_fin=None):
+    """Totales del dashboard desde la caché (o calculados una sola vez); también los usa cache_warming."""
+    version = get_user_data_version(user_id, *_DOMINIOS_DASHBOARD)
+    return single_flight.cached(f"totals:{user_id}:{fecha_inicio}:{fecha_fin}", version,
+                                lambda: _calcular_totales(user_id, fecha_inicio, fecha_fin))
 
+
+def cached_charts(user_id, fecha_inicio=None, fecha_fin=None):
+    """Gráficos del dashboard desde la caché (o calculados una sola vez); también los usa cache_warming."""
+    version = get_user_data_version(user_id, *_DOMINIOS_DASHBOARD)
+    return single_flight.cached(f"charts:{user_id}:{fecha_inicio}:{fecha_fin}", version,
+                                lambda: _calcular_graficos(user_id, fecha_inicio, fecha_fin))
+
+
+def _calcular_totales(effective_user_id, fecha_inicio, fecha_fin):
+    """Totales de las tarjetas del dashboard (sin usar la petición: puede correr en segundo plano)."""
     # Ganancia total en el rango
     totales = papeleria_repository.get_totales_usuario(effective_user_id, fecha_inicio, fecha_fin)
     ganancia = totales.get('ganancia', 0)
@@ -45,7 +68,7 @@ def dashboard_totals():
     # Calcular ganancia promedio por papelería (evitar división por cero)
     ganancia_promedio = round(ganancia / num_papelerias, 2) if num_papelerias > 0 else 0
 
-    response_data = {
+    return {
         'ganancia': ganancia,
         'tramites_de_hoy': tramites_en_rango,
         'num_papelerias': num_papelerias,
@@ -53,21 +76,10 @@ def dashboard_totals():
         'ganancia_promedio': ganancia_promedio
     }
 
-    if cache:
-        cache.set(cache_key, response_data, timeout=300)
-
-    # Log de performance para dashboard-totals
-    elapsed_ms = (time.time() - start_time) * 1000
-    if elapsed_ms > 1000:
-        logging.warning(f"[SLOW_API] dashboard-totals took {elapsed_ms:.2f}ms user={effective_user_id}")
-    else:
-        logging.debug(f"[API] dashboard-totals completed in {elapsed_ms:.2f}ms user={effective_user_id}")
-
-    return jsonify(response_data)
-
 
 @api_bp.route('/dashboard-charts')
 @login_required
+@fragment_cache.conditional(*_DOMINIOS_DASHBOARD)
 def dashboard_charts_data():
     """Endpoint para obtener datos de gráficos del dashboard."""
     start_time = time.time()
@@ -90,80 +102,9 @@ def dashboard_charts_data():
     
     logging.info(f"[API] dashboard-charts request: fecha_inicio={fecha_inicio}, fecha_fin={fecha_fin}")
     
-    # --- CACHÉ INTELIGENTE ---
-    version = get_user_data_version(effective_user_id)
-    cache = getattr(current_app, 'cache', None)
-    cache_key = f"charts:{effective_user_id}:{version}:{fecha_inicio}:{fecha_fin}"
-    
-    if cache and version:
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            logging.info(f"[CACHE HIT] Gráficos dashboard servidos desde caché (v:{version})")
-            return jsonify(cached_data)
-
-    logging.info(f"[CACHE MISS] Calculando gráficos dashboard (v:{version})")
-    
+    # --- CACHÉ INTELIGENTE (un solo cálculo por versión, ver single_flight) ---
     try:
-        # 1. Top Papelerías
-        top_papelerias = papeleria_repository.get_top_by_ganancia(
-            effective_user_id, 
-            limit=10,
-            fecha_inicio=fecha_inicio,
-            fecha_fin=fecha_fin
-        )
-        top_papelerias_data = {
-            'labels': [p['nombre'] for p in top_papelerias], 
-            'data': [float(p.get('ganancia_total') or 0) for p in top_papelerias]
-        }
-
-        # 2. Resumen Mensual
-        summary_result = tramite_repository.get_monthly_summary(
-            effective_user_id,
-            fecha_inicio=fecha_inicio,
-            fecha_fin=fecha_fin
-        )
-        monthly_summary_data = summary_result.get('monthly_data', [])
-        
-        monthly_summary = {
-            'labels': [row['month'] for row in monthly_summary_data],
-            'ingresos': [float(row.get('ingresos') or 0) for row in monthly_summary_data],
-            'costos': [float(row.get('gastos') or 0) for row in monthly_summary_data],
-            'ganancias': [float(row.get('ganancias') or 0) for row in monthly_summary_data],
-            'totals': summary_result.get('totals', {'total_ingresos': 0, 'total_gastos': 0, 'total_ganancia': 0})
-        }
-
-        # 3. Distribución de Trámites
-        dist_data = tramite_repository.get_tramites_distribution(
-            effective_user_id,
-            fecha_inicio=fecha_inicio,
-            fecha_fin=fecha_fin
-        )
-        tramites_dist = {
-            'labels': [row['tramite_label'] for row in dist_data], 
-            'data': [int(row.get('total_count') or 0) for row in dist_data]
-        }
-
-        # 4. Distribución de Gastos
-        gastos_data = gasto_repository.get_gastos_distribution(
-            effective_user_id,
-            fecha_inicio=fecha_inicio,
-            fecha_fin=fecha_fin
-        )
-        gastos_dist = {
-            'labels': [row['categoria'] for row in gastos_data], 
-            'data': [float(row.get('total_monto') or 0) for row in gastos_data]
-        }
-
-        response_data = {
-            'topPapelerias': top_papelerias_data,
-            'monthlySummary': monthly_summary,
-            'tramitesDistribution': tramites_dist,
-            'gastosDistribution': gastos_dist
-        }
-
-        if cache:
-            cache.set(cache_key, response_data, timeout=300) # 5 minutos de caché (o hasta que cambie la versión)
-
+        response_data = cached_charts(effective_user_id, fecha_inicio, fecha_fin)
     except Exception as e:
         logging.error(f"[API] Error generating charts data: {e}")
         # Devolver estructura vacía pero válida en caso de error
@@ -173,6 +114,10 @@ def dashboard_charts_data():
             'tramitesDistribution': {'labels': [], 'data': []},
             'gastosDistribution': {'labels': [], 'data': []}
         }
+        # Sin ETag: que el navegador no conserve los gráficos vacíos como vigentes
+        response = jsonify(response_data)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
 
     # Log de performance para dashboard-charts
     elapsed_ms = (time.time() - start_time) * 1000
@@ -183,6 +128,66 @@ def dashboard_charts_data():
 
     return jsonify(response_data)
 
+def _calcular_graficos(effective_user_id, fecha_inicio, fecha_fin):
+    """Datos de los gráficos del dashboard (sin usar la petición: puede correr en segundo plano)."""
+    logging.info(f"[CACHE MISS] Calculando gráficos dashboard user={effective_user_id}")
+    # 1. Top Papelerías
+    top_papelerias = papeleria_repository.get_top_by_ganancia(
+        effective_user_id, 
+        limit=10,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin
+    )
+    top_papelerias_data = {
+        'labels': [p['nombre'] for p in top_papelerias], 
+        'data': [float(p.get('ganancia_total') or 0) for p in top_papelerias]
+    }
+
+    # 2. Resumen Mensual
+    summary_result = tramite_repository.get_monthly_summary(
+        effective_user_id,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin
+    )
+    monthly_summary_data = summary_result.get('monthly_data', [])
+    
+    monthly_summary = {
+        'labels': [row['month'] for row in monthly_summary_data],
+        'ingresos': [float(row.get('ingresos') or 0) for row in monthly_summary_data],
+        'costos': [float(row.get('gastos') or 0) for row in monthly_summary_data],
+        'ganancias': [float(row.get('ganancias') or 0) for row in monthly_summary_data],
+        'totals': summary_result.get('totals', {'total_ingresos': 0, 'total_gastos': 0, 'total_ganancia': 0})
+    }
+
+    # 3. Distribución de Trámites
+    dist_data = tramite_repository.get_tramites_distribution(
+        effective_user_id,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin
+    )
+    tramites_dist = {
+        'labels': [row['tramite_label'] for row in dist_data], 
+        'data': [int(row.get('total_count') or 0) for row in dist_data]
+    }
+
+    # 4. Distribución de Gastos
+    gastos_data = gasto_repository.get_gastos_distribution(
+        effective_user_id,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin
+    )
+    gastos_dist = {
+        'labels': [row['categoria'] for row in gastos_data], 
+        'data': [float(row.get('total_monto') or 0) for row in gastos_data]
+    }
+
+    return {
+        'topPapelerias': top_papelerias_data,
+        'monthlySummary': monthly_summary,
+        'tramitesDistribution': tramites_dist,
+        'gastosDistribution': gastos_dist
+    }
+
 @api_bp.route('/test-charts')
 def test_charts_data():
     """Endpoint de prueba sin autenticación para verificar gráficos."""
@@ -216,6 +221,7 @@ def test_charts_data():
 @api_bp.route('/papeleria-charts/<int:papeleria_id>')
 @login_required
 @check_papeleria_owner
+@fragment_cache.conditional('tramites')
 def papeleria_charts_data(papeleria_id):
     """Endpoint único para los gráficos de la página de detalle de papelería."""
     effective_user_id = get_effective_user_id()
@@ -238,6 +244,7 @@ def papeleria_charts_data(papeleria_id):
 
 @api_bp.route('/gastos-summary')
 @login_required
+@fragment_cache.conditional('gastos')
 def gastos_summary_data():
     """Endpoint para obtener el resumen de gastos para gráficos."""
     effective_user_id = get_effective_user_id()
@@ -274,20 +281,31 @@ def get_precio_costo(papeleria_id, tramite_nombre):
 
 @api_bp.route('/analytics-avanzado')
 @login_required
+@fragment_cache.conditional(*_DOMINIOS_DASHBOARD)
 def analytics_avanzado():
-    """Endpoint para obtener análisis avanzados y métricas predictivas."""
+    """
+    Endpoint para obtener análisis avanzados y métricas predictivas. Las históricas salen
+    del snapshot nocturno más el delta posterior; `snapshot` indica hasta qué día cubre.
+    """
     effective_user_id = get_effective_user_id()
     
     return jsonify({
         'meta_progress': analytics_repository.get_meta_mensual_progress(effective_user_id),
-        'mejor_mes': analytics_repository.get_mejor_mes_historico(effective_user_id),
-        'dia_productivo': analytics_repository.get_dias_mas_productivos(effective_user_id),
-        'margen_promedio': analytics_repository.get_margen_promedio(effective_user_id),
-        'costo_promedio_tramite': analytics_repository.get_costo_promedio_tramite(effective_user_id),
-        'roi_papelerias': analytics_repository.get_roi_por_papeleria(effective_user_id),
-        'rentabilidad_tramites': analytics_repository.get_rentabilidad_por_tramite(effective_user_id)
+        **analytics_repository.get_historico(effective_user_id)
     })
 
+
+@api_bp.route('/analytics-avanzado/snapshot', methods=['POST'])
+@login_required
+@timed_operation('analytics_snapshot')
+def refrescar_snapshot_analytics():
+    """Refresca bajo demanda el snapshot de analytics del usuario (hasta ayer) y devuelve su frescura."""
+    effective_user_id = get_effective_user_id()
+    papelerias = analytics_repository.refresh_snapshot(effective_user_id)
+    log_action('analytics_snapshot_refreshed', {'papelerias': papelerias})
+    return jsonify({'papelerias': papelerias,
+                    'snapshot': analytics_repository.get_historico(effective_user_id)['snapshot']})
+
 @api_bp.route('/buscar')
 @login_required
 def buscar():
@@ -302,8 +320,8 @@ def buscar():
     
     results = []
     
-    # Buscar en trámites (delegado a DB, límite 20 para rapidez)
-    tramites = tramite_repository.get_all_tramites(effective_user_id, search_term=query, limit=20)
+    # Índice FTS5 (prefijos, sin acentos, orden bm25) con un límite por tipo de resultado
+    tramites = tramite_repository.get_all_tramites(effective_user_id, search_term=query, limit=LIMITES_POR_TIPO['tramite'])
     for tramite in tramites:
         results.append({
             'type': 'tramite',
@@ -314,18 +332,18 @@ def buscar():
         })
     
     # Buscar en papelerías
-    papelerias = papeleria_repository.get_all_papelerias(effective_user_id, search_term=query)
+    papelerias = papeleria_repository.get_all_papelerias(effective_user_id, search_term=query, limit=LIMITES_POR_TIPO['papeleria'])
     for papeleria in papelerias:
         results.append({
             'type': 'papeleria',
             'type_label': 'Papelería',
             'title': papeleria['nombre'],
-            'subtitle': f"Precios configurados: {len(papeleria.get('precios', []))}",
+            'subtitle': f"Precios configurados: {papeleria['precios_count']}",
             'url': url_for('papeleria.ver_papeleria', papeleria_id=papeleria['id'])
         })
     
-    # Buscar en gastos (delegado a DB, límite 20)
-    gastos = gasto_repository.get_all_gastos(effective_user_id, search_term=query, limit=20)
+    # Buscar en gastos
+    gastos = gasto_repository.get_all_gastos(effective_user_id, search_term=query, limit=LIMITES_POR_TIPO['gasto'])
     for gasto in gastos:
         results.append({
             'type': 'gasto',
@@ -335,8 +353,16 @@ def buscar():
             'url': url_for('gastos.gestion_gastos', _anchor='gastos')
         })
     
-    # Limitar resultados a 50
-    results = results[:50]
+    # Buscar en proveedores
+    proveedores = proveedor_repository.search(effective_user_id, query, limit=LIMITES_POR_TIPO['proveedor'])
+    for proveedor in proveedores:
+        results.append({
+            'type': 'proveedor',
+            'type_label': 'Proveedor',
+            'title': proveedor['nombre'],
+            'subtitle': 'Gestión de proveedores',
+            'url': url_for('gastos.gestion_proveedores')
+        })
     
     return jsonify(results)
 
@@ -361,3 +387,87 @@ def marcar_todas_leidas():
     """Marcar todas las notificaciones como leídas."""
     # Por ahora solo retornamos éxito
     return jsonify({'success': True})
+
+
+# ==================== EXPORTACIONES EN SEGUNDO PLANO ====================
+
+def _export_job_response(job, status=200):
+    """Fragmento HTMX (widget de progreso) o JSON con el estado del trabajo."""
+    if request.headers.get('HX-Request'):
+        return render_template('_export_job.html', job=job), status
+    data = export_jobs.status(job)
+    data['status_url'] = url_for('api.export_status', job_id=job.id)
+    data['download_url'] = url_for('api.export_download', job_id=job.id) if job.estado == 'completado' else None
+    return jsonify(data), status
+
+
+@api_bp.route('/exports', methods=['POST'])
+@login_required
+def crear_export():
+    """
+    Encola una exportación (`tipo`=pdf|csv|estados, `papeleria_id`, `fecha_inicio`, `fecha_fin`,
+    `gzip`; los estados de cuenta usan `mes` y `todos`) y devuelve su id.
+    """
+    effective_user_id = get_effective_user_id()
+    datos = request.get_json(silent=True) or request.form
+    tipo = datos.get('tipo')
+    if tipo in ('csv', 'estados') and current_user.role != 'admin':
+        return jsonify({'error': 'Solo un administrador puede generar esta exportación.'}), 403
+    si = lambda clave: str(datos.get(clave, '')).lower() in ('1', 'true', 'si', 'sí')
+    # El lote de todos los usuarios pertenece al admin, no al usuario que está viendo
+    todos = tipo == 'estados' and si('todos')
+    if todos:
+        effective_user_id = current_user.id
+    try:
+        papeleria_id = int(datos['papeleria_id']) if datos.get('papeleria_id') else None
+        job = export_jobs.submit(effective_user_id, tipo, papeleria_id=papeleria_id,
+                                 fecha_inicio=datos.get('fecha_inicio') or None, fecha_fin=datos.get('fecha_fin') or None,
+                                 gzip=si('gzip'), mes=datos.get('mes') or None, todos=todos)
+    except (ValueError, export_jobs.ExportError) as e:
+        if request.headers.get('HX-Request'):
+            return render_template('_export_jobs.html', jobs=export_job_repository.get_recent(effective_user_id), error=str(e))
+        return jsonify({'error': str(e)}), 400
+    log_action('export_job_created', {'job_id': job.id, 'tipo': tipo, 'papeleria_id': papeleria_id})
+    if request.headers.get('HX-Request'):
+        # El widget muestra la lista completa, con el trabajo nuevo arriba
+        return render_template('_export_jobs.html', jobs=export_job_repository.get_recent(effective_user_id))
+    return _export_job_response(job, 202)
+
+
+@api_bp.route('/exports')
+@login_required
+def listar_exports():
+    """Últimas exportaciones del usuario (widget del dashboard o JSON)."""
+    effective_user_id = get_effective_user_id()
+    export_jobs.mark_stale(effective_user_id)
+    jobs = export_job_repository.get_recent(effective_user_id)
+    if request.headers.get('HX-Request'):
+        return render_template('_export_jobs.html', jobs=jobs)
+    return jsonify([export_jobs.status(job) for job in jobs])
+
+
+@api_bp.route('/exports/<job_id>')
+@login_required
+def export_status(job_id):
+    """Estado y progreso de una exportación."""
+    effective_user_id = get_effective_user_id()
+    export_jobs.mark_stale(effective_user_id)
+    job = export_job_repository.get_for_user(job_id, effective_user_id)
+    if job is None:
+        return jsonify({'error': 'Exportación no encontrada'}), 404
+    return _export_job_response(job)
+
+
+@api_bp.route('/exports/<job_id>/download')
+@login_required
+def export_download(job_id):
+    """Descarga el archivo de una exportación terminada."""
+    job = export_job_repository.get_for_user(job_id, get_effective_user_id())
+    if job is None:
+        return jsonify({'error': 'Exportación no encontrada'}), 404
+    if job.estado != 'completado':
+        return jsonify({'error': 'La exportación aún no termina', 'estado': job.estado}), 409
+    try:
+        return send_file(job.archivo, as_attachment=True, download_name=job.nombre_archivo)
+    except FileNotFoundError:
+        return jsonify({'error': 'El archivo expiró; genera la exportación de nuevo.'}), 410
@@ -3,7 +3,7 @@ from flask_login import login_required, current_user
 import os
 from datetime import datetime
 
-from ..utils import get_effective_user_id, admin_required, save_logo_image
+from ..utils import get_effective_user_id, admin_required, save_logo_image, bump_user_data_version
 from ..forms import ConfigForm
 from ..database import tramite_repository
 from ..constants import TRAMITES_PREDEFINIDOS
@@ -113,6 +113,7 @@ def actualizar_costos_viejos():
     if form.validate_on_submit():
         num_actualizados = tramite_repository.update_old_costos(get_effective_user_id())
         if num_actualizados > 0:
+            bump_user_data_version(get_effective_user_id(), 'tramites') # Invalidar caché
             flash(f'¡Proceso completado! Se actualizaron los costos de {num_actualizados} trámites anteriores.', 'success')
         else:
             flash('No se encontraron trámites con costo cero para actualizar.', 'info')
@@ -10,6 +10,7 @@ from ..forms import GastoForm, EditarGastoForm, ProveedorForm, EditarProveedorFo
 from ..utils import get_effective_user_id, bump_user_data_version
 from ..database import gasto_repository, proveedor_repository
 from ..logging_config import log_action, log_db_operation
+from .. import fragment_cache, xlsx_export
 
 gastos_bp = Blueprint('gastos', __name__)
 
@@ -29,6 +30,33 @@ def _save_receipt(file):
     file.save(receipts_folder / unique_filename)
     return unique_filename
 
+def _contexto_tabla(form):
+    """Contexto de la tabla de gastos (filtros y página del cursor de la URL)."""
+    effective_user_id = get_effective_user_id()
+    fecha_inicio = request.args.get('fecha_inicio')
+    fecha_fin = request.args.get('fecha_fin')
+    categoria_filtro = request.args.get('categoria')
+    desde = request.args.get('desde')
+    per_page = 15
+
+    # Paginación por cursor: ?after= / ?before= / ?desde=YYYY-MM-DD (ir a fecha)
+    gastos = gasto_repository.get_all(
+        effective_user_id, per_page, fecha_inicio, fecha_fin, categoria_filtro,
+        after=request.args.get('after'), before=request.args.get('before'), desde=desde
+    )
+
+    delete_form = DeleteForm()
+    return {
+        'form': form,
+        'gastos': gastos,
+        'desde': desde,
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'categoria_filtro': categoria_filtro,
+        'categorias_gastos': CATEGORIAS_GASTOS,
+        'delete_form': delete_form
+    }
+
 @gastos_bp.route('/gastos', methods=['GET', 'POST'])
 @login_required
 def gestion_gastos():
@@ -53,7 +81,7 @@ def gestion_gastos():
             user_id=effective_user_id,
             receipt_filename=receipt_filename
         )
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        bump_user_data_version(effective_user_id, 'gastos') # Invalidar caché
         
         # Log de registro de gasto
         log_db_operation('CREATE', 'gasto', None, {
@@ -86,34 +114,25 @@ def gestion_gastos():
     if request.method == 'POST' and request.headers.get('HX-Request'):
         return render_template('form_gasto.html', form=form), 422
 
-    fecha_inicio = request.args.get('fecha_inicio')
-    fecha_fin = request.args.get('fecha_fin')
-    categoria_filtro = request.args.get('categoria')
-    page = request.args.get('page', 1, type=int)
-    per_page = 15
-
-    gastos, total_items = gasto_repository.get_all(
-        effective_user_id, page, per_page, fecha_inicio, fecha_fin, categoria_filtro
-    )
-    total_pages = (total_items + per_page - 1) // per_page if total_items > 0 else 1
+    if request.headers.get('HX-Request'):
+        # La tabla lleva los formularios de borrado (token CSRF): un fragmento por sesión
+        return fragment_cache.responder('tabla_gastos.html', ('gastos', 'proveedores'),
+                                        lambda: render_template('tabla_gastos.html', **_contexto_tabla(form)),
+                                        por_sesion=True)
 
-    delete_form = DeleteForm()
-    context = {
-        'form': form,
-        'gastos': gastos,
-        'current_page': page,
-        'total_pages': total_pages,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        'categoria_filtro': categoria_filtro,
-        'categorias_gastos': CATEGORIAS_GASTOS,
-        'delete_form': delete_form
-    }
+    return render_template('gastos.html', **_contexto_tabla(form))
 
-    if request.headers.get('HX-Request'):
-        return render_template('tabla_gastos.html', **context)
 
-    return render_template('gastos.html', **context)
+@gastos_bp.route('/gastos/exportar-xlsx')
+@login_required
+def exportar_xlsx_gastos():
+    """Exporta los gastos a Excel: resumen por categoría y por mes, y una hoja por mes (mismos filtros que la tabla)."""
+    if not xlsx_export.OPENPYXL_AVAILABLE:
+        flash('La exportación a Excel no está disponible en este servidor.', 'warning')
+        return redirect(url_for('gastos.gestion_gastos'))
+    return xlsx_export.xlsx_response(xlsx_export.nombre_archivo('gastos'), xlsx_export.escribir_gastos,
+                                     get_effective_user_id(), request.args.get('fecha_inicio') or None,
+                                     request.args.get('fecha_fin') or None, request.args.get('categoria') or None)
 
 @gastos_bp.route('/gastos/editar/<int:gasto_id>', methods=['GET', 'POST'])
 @login_required
@@ -141,7 +160,7 @@ def editar_gasto(gasto_id):
             categoria=form.categoria.data,
             receipt_filename=receipt_filename
         )
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        bump_user_data_version(effective_user_id, 'gastos') # Invalidar caché
         flash('Gasto actualizado con éxito.', 'success')
         return redirect(url_for('gastos.gestion_gastos'))
 
@@ -157,7 +176,7 @@ def eliminar_gasto(gasto_id):
     if form.validate_on_submit():
         effective_user_id = get_effective_user_id()
         gasto_repository.delete(gasto_id, effective_user_id)
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        bump_user_data_version(effective_user_id, 'gastos') # Invalidar caché
         flash('Gasto eliminado con éxito.', 'success')
     else:
         flash('Error de validación al intentar eliminar el gasto.', 'danger')
@@ -185,7 +204,7 @@ def gestion_proveedores():
     form = ProveedorForm()
     if form.validate_on_submit():
         proveedor_repository.add(form.nombre.data, effective_user_id)
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        bump_user_data_version(effective_user_id, 'proveedores') # Invalidar caché
         flash(f'Proveedor "{form.nombre.data}" agregado con éxito.', 'success')
         return redirect(url_for('gastos.gestion_proveedores'))
 
@@ -205,7 +224,7 @@ def editar_proveedor(proveedor_id):
     form = EditarProveedorForm(obj=proveedor)
     if form.validate_on_submit():
         proveedor_repository.update(proveedor_id, form.nombre.data, effective_user_id)
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        bump_user_data_version(effective_user_id, 'proveedores') # Invalidar caché
         flash('Proveedor actualizado con éxito.', 'success')
         return redirect(url_for('gastos.gestion_proveedores'))
 
@@ -226,7 +245,7 @@ def eliminar_proveedor(proveedor_id):
             return redirect(url_for('gastos.gestion_proveedores'))
 
         proveedor_repository.delete(proveedor_id, effective_user_id)
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        bump_user_data_version(effective_user_id, 'proveedores') # Invalidar caché
         flash('Proveedor eliminado con éxito.', 'success')
     else:
         flash('Error de validación al intentar eliminar el proveedor.', 'danger')
@@ -1,56 +1,25 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import login_required
-from datetime import datetime
-import io
-import csv
 import logging
 
 from ..forms import PapeleriaForm, TramiteForm, DismissNotificationForm
 from ..utils import get_effective_user_id, admin_required
-from ..database import papeleria_repository, tramite_repository, gasto_repository, analytics_repository
+from ..dashboard_snapshot import DashboardSnapshot, DATA_DOMAINS
 from ..constants import TRAMITES_PREDEFINIDOS
+from ..csv_export import csv_response, tramites_csv, wants_gzip
+from .. import cache_warming, fragment_cache, xlsx_export
 
 main_bp = Blueprint('main', __name__)
 
 def _get_dashboard_context(search_term=None):
     """Función auxiliar que obtiene y devuelve todo el contexto para el dashboard."""
     effective_user_id = get_effective_user_id()
-    
-    # Esta función ahora devuelve tanto las papelerías como los totales.
-    dashboard_data = papeleria_repository.get_papelerias_and_totals_for_user(effective_user_id, search_term)
-    papelerias = dashboard_data['papelerias']
-    totales = dashboard_data['totales']
-    
-    # Obtener comparativas
-    totales_comparativa = papeleria_repository.get_totales_comparativa(effective_user_id)
-    tramites_comparativa = tramite_repository.get_tramites_comparativa(effective_user_id)
-    
-    # Obtener analytics avanzados
-    meta_progress = analytics_repository.get_meta_mensual_progress(effective_user_id)
-    mejor_mes = analytics_repository.get_mejor_mes_historico(effective_user_id)
-    dia_productivo = analytics_repository.get_dias_mas_productivos(effective_user_id)
-    margen_promedio = analytics_repository.get_margen_promedio(effective_user_id)
-    rentabilidad_tramites = analytics_repository.get_rentabilidad_por_tramite(effective_user_id)
-    
-    tramites_hoy = tramites_comparativa['hoy']
-    total_gastos = gasto_repository.get_total_gastos(effective_user_id)
-
-    context = {
-        'papelerias': papelerias,
-        'totales': totales,
-        'totales_comparativa': totales_comparativa,
-        'tramites_de_hoy': tramites_hoy,
-        'tramites_comparativa': tramites_comparativa,
-        'meta_progress': meta_progress,
-        'mejor_mes': mejor_mes,
-        'dia_productivo': dia_productivo,
-        'margen_promedio': margen_promedio,
-        'rentabilidad_tramites': rentabilidad_tramites[:5],  # Top 5
-        'num_papelerias': len(papelerias),
-        'total_gastos_operativos': total_gastos,
-        'search_term': search_term,
-        'tramites_predefinidos': TRAMITES_PREDEFINIDOS
-    }
+
+    # Todas las cifras del dashboard en pocas consultas acotadas (ver dashboard_snapshot.py)
+    snapshot = DashboardSnapshot.for_user(effective_user_id, search_term)
+
+    context = snapshot.as_context()
+    context['tramites_predefinidos'] = TRAMITES_PREDEFINIDOS
     return context
 
 @main_bp.route('/test-chart')
@@ -71,17 +40,20 @@ def index():
     Optimizada con HTMX para devolver solo el fragmento del dashboard si es necesario.
     """
     search_term = request.args.get('q')
+
+    if request.headers.get('HX-Request'):
+        # Si la petición viene del contenedor del dashboard, devolvemos solo el contenido del dashboard
+        template = 'dashboard_content.html' if request.headers.get('HX-Target') == 'dashboard-container' else 'lista_papelerias.html'
+        # Fragmento versionado: 304 o HTML cacheado sin recalcular el contexto (ver fragment_cache.py)
+        return fragment_cache.responder(template, DATA_DOMAINS,
+                                        lambda: render_template(template, **_get_dashboard_context(search_term)))
+
+    # Ranking de usuarios activos para precalentar su caché al arrancar (ver cache_warming.py)
+    cache_warming.record_activity(get_effective_user_id())
     context = _get_dashboard_context(search_term)
     form_papeleria = PapeleriaForm()
     form_tramite = TramiteForm()
     form_tramite.papeleria_id.choices = [(p.id, p.nombre) for p in context['papelerias']]
- 
-    if request.headers.get('HX-Request'):
-        # Si la petición viene del contenedor del dashboard, devolvemos solo el contenido del dashboard
-        if request.headers.get('HX-Target') == 'dashboard-container':
-            return render_template('dashboard_content.html', **context)
-        
-        return render_template('partials/lista_papelerias.html', **context)
 
     final_context = {**context, 'form_papeleria': form_papeleria, 'form_tramite': form_tramite}
 
@@ -92,31 +64,32 @@ def index():
 def get_papeleria_list_partial():
     """Endpoint HTMX para obtener solo el fragmento de la lista de papelerías."""
     search_term = request.args.get('q')
-    context = _get_dashboard_context(search_term)
-    return render_template('lista_papelerias.html', **context)
+    return fragment_cache.responder('lista_papelerias.html', DATA_DOMAINS,
+                                    lambda: render_template('lista_papelerias.html', **_get_dashboard_context(search_term)))
 
 @main_bp.route('/exportar-csv/general')
 @login_required
 @admin_required
 def exportar_csv_general():
-    """Exporta todos los trámites del usuario a un archivo CSV."""
+    """Exporta los trámites del usuario a un CSV en streaming (`?fecha_inicio=&fecha_fin=`, `?gzip=1`)."""
     effective_user_id = get_effective_user_id()
-    data = tramite_repository.export_all_as_csv(effective_user_id)
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Papelería', 'Trámite', 'Fecha', 'Precio', 'Costo', 'Ganancia'])
-    for row in data:
-        writer.writerow([row.papeleria, row.tramite, row.fecha.strftime('%Y-%m-%d'), row.precio, row.costo, row.ganancia])
-
-    output.seek(0)
-    
-    return send_file(
-        io.BytesIO(output.read().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f"reporte_general_{datetime.now().strftime('%Y-%m-%d')}.csv"
-    )
+    fecha_inicio = request.args.get('fecha_inicio')
+    fecha_fin = request.args.get('fecha_fin')
+    filename, header, rows = tramites_csv(effective_user_id, fecha_inicio, fecha_fin)
+    return csv_response(filename, header, rows, gzip=wants_gzip(request.args))
+
+@main_bp.route('/exportar-xlsx/general')
+@login_required
+@admin_required
+def exportar_xlsx_general():
+    """Exporta los trámites del usuario a Excel: resúmenes y una hoja por papelería (`?fecha_inicio=&fecha_fin=`)."""
+    if not xlsx_export.OPENPYXL_AVAILABLE:
+        flash('La exportación a Excel no está disponible en este servidor. Por favor, usa la opción de exportar a CSV.', 'warning')
+        return redirect(url_for('main.index'))
+    fecha_inicio = request.args.get('fecha_inicio')
+    fecha_fin = request.args.get('fecha_fin')
+    return xlsx_export.xlsx_response(xlsx_export.nombre_archivo('reporte_general'), xlsx_export.escribir_tramites,
+                                     get_effective_user_id(), fecha_inicio, fecha_fin)
 
 @main_bp.route('/dismiss-notification', methods=['POST'])
 @login_required
@@ -1,17 +1,17 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, make_response, send_file, current_app, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime
-import os
-import io
 import json
-import csv
 import logging
 
-from ..forms import PapeleriaForm, TramiteForm, EditarTramiteForm, EditarPapeleriaForm, DeleteForm
-from ..utils import get_effective_user_id, check_papeleria_owner, admin_required, bump_user_data_version
+from ..forms import PapeleriaForm, TramiteForm, TramiteLoteForm, EditarTramiteForm, EditarPapeleriaForm, DeleteForm
+from ..utils import get_effective_user_id, check_papeleria_owner, admin_required, bump_user_data_version, get_user_data_version
 from ..database import papeleria_repository, tramite_repository, gasto_repository
 from ..constants import TRAMITES_PREDEFINIDOS
-from ..pdf_generator import generar_pdf_papeleria
+from ..pdf_generator import preparar_reporte, escribir_pdf, logo_de_usuario, clave_cache
+from ..csv_export import csv_response, tramites_csv, wants_gzip
+from .. import fragment_cache, xlsx_export
+from ..report_cache import ReportCache
 from ..logging_config import log_action, log_db_operation, log_error
 
 papeleria_bp = Blueprint('papeleria', __name__)
@@ -26,12 +26,17 @@ def ver_papeleria(papeleria_id):
 
     form_tramite = TramiteForm(papeleria_id=papeleria_id)
 
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     effective_user_id = get_effective_user_id()
     
-    detalles, total_items, total_pages = tramite_repository.get_details_for_papeleria(papeleria_id, effective_user_id, fecha_inicio, fecha_fin, page, per_page)
+    # Paginación por cursor: ?after= / ?before= / ?desde=YYYY-MM-DD (ir a fecha)
+    detalles = tramite_repository.get_details_for_papeleria(
+        papeleria_id, effective_user_id, fecha_inicio, fecha_fin, per_page,
+        after=request.args.get('after'), before=request.args.get('before'), desde=request.args.get('desde')
+    )
+    # El total sale del rollup diario (ya consultado para las tarjetas), no de un COUNT por página
     totales_papeleria = papeleria_repository.total_por_papeleria(papeleria_id, effective_user_id, fecha_inicio, fecha_fin)
+    detalles.total = totales_papeleria['cuantos']
     nombre_papeleria = papeleria_repository.get_name(papeleria_id, effective_user_id)
 
     periodo_str = "Histórico"
@@ -49,8 +54,7 @@ def ver_papeleria(papeleria_id):
                            fecha_inicio=fecha_inicio,
                            fecha_fin=fecha_fin,
                            periodo_str=periodo_str,
-                           current_page=page,
-                           total_pages=total_pages,
+                           desde=request.args.get('desde'),
                            form_tramite=form_tramite,
                            delete_form=delete_form)
 
@@ -66,7 +70,7 @@ def gestionar_precios_papeleria(papeleria_id):
         form_data = {k: v for k, v in request.form.items() if k != 'csrf_token'}
         _, errors = papeleria_repository.set_precios_bulk(papeleria_id, form_data, effective_user_id)
 
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        bump_user_data_version(effective_user_id, 'precios') # Invalidar caché
         if errors:
             for error in errors:
                 flash(error, 'danger')
@@ -109,7 +113,7 @@ def agregar_papeleria():
             # papeleria_repository.add se encargará de crear una nueva o reactivar una inactiva.
             # Si ya existe una activa con el mismo nombre, lanzará un ValueError.
             new_papeleria = papeleria_repository.add(nombre, user_id)
-            bump_user_data_version(user_id) # Invalidar caché
+            bump_user_data_version(user_id, 'papelerias') # Invalidar caché
             flash('Papelería agregada o reactivada con éxito.', 'success')
             
             # Crear un nuevo formulario limpio
@@ -196,7 +200,7 @@ def registrar_tramite():
             fecha = form.fecha.data.strftime('%Y-%m-%d')
 
             tramite_repository.add_bulk(papeleria_id, tramite_nombre, effective_user_id, fecha, precio, costo, cantidad)
-            bump_user_data_version(effective_user_id) # Invalidar caché
+            bump_user_data_version(effective_user_id, 'tramites') # Invalidar caché
             
             # Log de la operación de registro de trámite
             log_db_operation('CREATE', 'tramite', None, {
@@ -257,9 +261,90 @@ def registrar_tramite():
 @login_required
 def get_tramite_form_papelerias_partial():
     """Endpoint HTMX para refrescar las opciones de papelería en el formulario de trámite."""
-    papelerias_data = papeleria_repository.get_papelerias_and_totals_for_user(get_effective_user_id())
-    papelerias = papelerias_data['papelerias']
-    return render_template('partials/papeleria_select_options.html', papelerias=papelerias)
+    def render():
+        papelerias_data = papeleria_repository.get_papelerias_and_totals_for_user(get_effective_user_id())
+        return render_template('partials/papeleria_select_options.html', papelerias=papelerias_data['papelerias'])
+    return fragment_cache.responder('partials/papeleria_select_options.html', ('papelerias',), render)
+
+@papeleria_bp.route('/registrar-tramites-lote', methods=['GET', 'POST'])
+@login_required
+def registrar_tramites_lote():
+    """Captura por lote (cierre de día): varias filas papelería/trámite/fecha/cantidad en un solo POST."""
+    effective_user_id = get_effective_user_id()
+    papelerias_data = papeleria_repository.get_papelerias_and_totals_for_user(effective_user_id)
+    papeleria_choices = [(p.id, p.nombre) for p in papelerias_data['papelerias']]
+
+    form = TramiteLoteForm()
+    form.set_papeleria_choices(papeleria_choices)
+    is_htmx = bool(request.headers.get('HX-Request'))
+
+    if form.validate_on_submit():
+        # Precios y costos por defecto en dos consultas, no una por fila
+        precios = papeleria_repository.get_precios_map(effective_user_id)
+        costos = tramite_repository.get_all_costos(effective_user_id)
+        filas = []
+        faltan_precios = False
+        for entrada in form.filas:
+            fila = entrada.form
+            if fila.is_blank():
+                continue
+            papeleria_id = fila.papeleria_id.data
+            tramite_nombre = fila.tramite.data.strip().upper()
+
+            precio = fila.precio.data
+            if precio is None:
+                precio = precios.get((papeleria_id, tramite_nombre))
+            if precio is None:
+                fila.precio.errors.append(f"Sin precio predefinido para '{tramite_nombre}'.")
+                faltan_precios = True
+                continue
+
+            costo = fila.costo.data
+            if costo is None:
+                costo = costos.get(tramite_nombre, 0)
+
+            filas.append({
+                'papeleria_id': papeleria_id,
+                'tramite': tramite_nombre,
+                'fecha': fila.fecha.data or datetime.today().date(),
+                'precio': precio,
+                'costo': costo,
+                'cantidad': fila.cantidad.data,
+            })
+
+        if not faltan_precios:
+            try:
+                insertados = tramite_repository.add_many(effective_user_id, filas)
+            except Exception as e:
+                logging.error(f"Error en registrar_tramites_lote: {e}", exc_info=True)
+                flash(f"Error interno: {str(e)}", "danger")
+            else:
+                bump_user_data_version(effective_user_id, 'tramites') # Invalidar caché
+                log_db_operation('CREATE', 'tramite', None, {'lote_filas': len(filas), 'cantidad': insertados})
+                log_action('tramite_lote_registered', {
+                    'filas': len(filas),
+                    'cantidad': insertados,
+                    'ganancia_total': sum((f['precio'] - f['costo']) * f['cantidad'] for f in filas)
+                })
+                flash(f"{insertados} trámite(s) registrados en {len(filas)} fila(s).", 'success')
+
+                if not is_htmx:
+                    return redirect(url_for('papeleria.registrar_tramites_lote'))
+                flash_html = render_template('flash_messages.html')
+                new_form = TramiteLoteForm(formdata=None)
+                new_form.set_papeleria_choices(papeleria_choices)
+                form_html = render_template('partials/form_registrar_lote_content.html', form_lote=new_form,
+                                            tramites_predefinidos=TRAMITES_PREDEFINIDOS)
+                response = make_response(f'<div id="flash-container" hx-swap-oob="innerHTML">{flash_html}</div>{form_html}')
+                response.headers['HX-Trigger'] = json.dumps({'tramiteRegistrado': {'cantidad': insertados, 'tramite': 'LOTE'}})
+                return response
+
+    if is_htmx:
+        flash_html = render_template('flash_messages.html')
+        form_html = render_template('partials/form_registrar_lote_content.html', form_lote=form,
+                                    tramites_predefinidos=TRAMITES_PREDEFINIDOS)
+        return make_response(f'<div id="flash-container" hx-swap-oob="innerHTML">{flash_html}</div>{form_html}')
+    return render_template('registrar_tramites_lote.html', form_lote=form, tramites_predefinidos=TRAMITES_PREDEFINIDOS)
 
 @papeleria_bp.route('/editar-tramite/<int:tramite_id>', methods=['GET', 'POST'])
 @login_required
@@ -292,9 +377,10 @@ def editar_tramite(tramite_id):
         fecha = form.fecha.data.strftime('%Y-%m-%d')
         precio = form.precio.data
         costo = form.costo.data
+        cantidad = form.cantidad.data
 
-        tramite_repository.update(tramite_id, effective_user_id, fecha, tipo_tramite, precio, costo)
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        tramite_repository.update(tramite_id, effective_user_id, fecha, tipo_tramite, precio, costo, cantidad)
+        bump_user_data_version(effective_user_id, 'tramites') # Invalidar caché
         flash('Trámite actualizado con éxito.', 'success')
 
         # Si es una petición HTMX, disparar evento para recargar
@@ -325,7 +411,7 @@ def eliminar_tramite(tramite_id):
         effective_user_id = get_effective_user_id()
         papeleria_id = tramite_repository.delete(tramite_id, effective_user_id)
         if papeleria_id is not None:
-            bump_user_data_version(effective_user_id) # Invalidar caché
+            bump_user_data_version(effective_user_id, 'tramites') # Invalidar caché
             flash('Trámite eliminado correctamente.', 'success')
         else:
             flash('No se pudo eliminar el trámite (no encontrado o sin permisos).', 'error')
@@ -350,6 +436,33 @@ def eliminar_tramite(tramite_id):
         return redirect(url_for('papeleria.ver_papeleria', papeleria_id=papeleria_id))
     return redirect(url_for('main.index'))
 
+@papeleria_bp.route('/separar-tramite/<int:tramite_id>', methods=['POST'])
+@login_required
+def separar_tramite(tramite_id):
+    """Separa una unidad de una fila con cantidad > 1 para editarla o eliminarla por separado."""
+    form = DeleteForm(request.form)
+    effective_user_id = get_effective_user_id()
+    tramite = tramite_repository.get_by_id(tramite_id, effective_user_id)
+    if not tramite:
+        flash('Trámite no encontrado.', 'error')
+        return redirect(url_for('main.index'))
+    papeleria_id = tramite.papeleria_id
+
+    if not form.validate_on_submit():
+        flash('Error de seguridad al intentar separar el trámite. Por favor, recarga la página e inténtalo de nuevo.', 'danger')
+    elif tramite_repository.split_unit(tramite_id, effective_user_id):
+        bump_user_data_version(effective_user_id, 'tramites') # Invalidar caché
+        flash('Se separó una unidad del trámite.', 'success')
+    else:
+        flash('El trámite tiene una sola unidad; no hay nada que separar.', 'warning')
+
+    redirect_url = url_for('papeleria.ver_papeleria', papeleria_id=papeleria_id)
+    if request.headers.get('HX-Request'):
+        response = make_response('')
+        response.headers['HX-Redirect'] = redirect_url
+        return response
+    return redirect(redirect_url)
+
 @papeleria_bp.route('/editar-papeleria/<int:papeleria_id>', methods=['GET', 'POST'])
 @login_required
 @check_papeleria_owner
@@ -371,7 +484,7 @@ def editar_papeleria(papeleria_id):
             return render_template('editar_papeleria.html', form=form, papeleria_id=papeleria_id, nombre_actual=papeleria_actual, delete_form=delete_form)
 
         papeleria_repository.update_name(papeleria_id, nuevo_nombre, effective_user_id)
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        bump_user_data_version(effective_user_id, 'papelerias') # Invalidar caché
         flash(f'Nombre de papelería actualizado a "{nuevo_nombre}" con éxito.', 'success')
 
         # Si es una petición HTMX, disparar evento para recargar dashboard
@@ -400,7 +513,7 @@ def eliminar_papeleria(papeleria_id):
     if form.validate_on_submit():
         nombre_papeleria = papeleria_repository.get_name(papeleria_id, effective_user_id)
         papeleria_repository.delete(papeleria_id, effective_user_id)
-        bump_user_data_version(effective_user_id) # Invalidar caché
+        bump_user_data_version(effective_user_id, 'papelerias') # Invalidar caché
         flash(f'La papelería "{nombre_papeleria}" y todos sus datos han sido eliminados con éxito.', 'success')
     else:
         flash('Error de validación al intentar eliminar la papeleria.', 'danger')
@@ -438,23 +551,22 @@ def descargar_pdf(papeleria_id):
     fecha_fin = request.args.get('fecha_fin')
     effective_user_id = get_effective_user_id()
 
-    datos, _, _ = tramite_repository.get_details_for_papeleria(papeleria_id, effective_user_id, fecha_inicio, fecha_fin, page=1, per_page=1)
-    if not datos:
+    reporte = preparar_reporte(papeleria_repository, tramite_repository, papeleria_id, effective_user_id, fecha_inicio, fecha_fin)
+    if not reporte or not reporte.num_tramites:
         flash('No hay trámites para generar un PDF con los filtros seleccionados.', 'warning')
         return redirect(url_for('papeleria.ver_papeleria', papeleria_id=papeleria_id, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin))
     
     try:
-        is_admin_view = current_user.role == 'admin'
-        logo_filename = f"logo_{effective_user_id}.png"
-        logo_path = os.path.join(current_app.config['UPLOAD_FOLDER'], logo_filename)
-        if not os.path.exists(logo_path):
-            logo_path = None
-        ruta_pdf = generar_pdf_papeleria(papeleria_repository, tramite_repository, papeleria_id, effective_user_id, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, is_admin_view=is_admin_view, logo_path=logo_path)
-        if ruta_pdf and os.path.exists(ruta_pdf):
-            return send_file(ruta_pdf, as_attachment=True)
-        else:
-            flash('No se pudo generar o encontrar el archivo PDF.', 'error')
-            return redirect(url_for('papeleria.ver_papeleria', papeleria_id=papeleria_id))
+        logo_path = logo_de_usuario(current_app.config['UPLOAD_FOLDER'], effective_user_id)
+        cache = ReportCache.from_config(current_app.config)
+        clave = clave_cache(reporte, papeleria_id, effective_user_id, fecha_inicio, fecha_fin, logo_path,
+                            get_user_data_version(effective_user_id, 'tramites', 'papelerias'))
+        ruta_pdf, acierto = cache.get_or_build(clave, lambda salida: escribir_pdf(reporte, salida, logo_path=logo_path))
+        logging.info(f"PDF papeleria {papeleria_id}: {'caché' if acierto else 'generado'} ({clave[:12]})")
+        response = send_file(ruta_pdf, mimetype='application/pdf', as_attachment=True,
+                             download_name=reporte.nombre_archivo, etag=clave)
+        response.cache_control.private = True
+        return response
     except Exception as e:
         flash(f'Ocurrió un error al generar el PDF: {e}', 'error')
         return redirect(url_for('papeleria.ver_papeleria', papeleria_id=papeleria_id))
@@ -464,20 +576,25 @@ def descargar_pdf(papeleria_id):
 @admin_required
 @check_papeleria_owner
 def exportar_csv_papeleria(papeleria_id):
+    """Exporta los trámites de la papelería a un CSV en streaming (`?gzip=1` para .csv.gz)."""
     effective_user_id = get_effective_user_id()
     fecha_inicio = request.args.get('fecha_inicio')
     fecha_fin = request.args.get('fecha_fin')
     
-    tramites, _, _ = tramite_repository.get_details_for_papeleria(
-        papeleria_id, effective_user_id, fecha_inicio, fecha_fin, page=1, per_page=99999
-    )
+    filename, header, rows = tramites_csv(effective_user_id, fecha_inicio, fecha_fin, papeleria_id=papeleria_id)
+    return csv_response(filename, header, rows, gzip=wants_gzip(request.args))
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Trámite', 'Fecha', 'Precio', 'Costo', 'Ganancia'])
-    for tramite in tramites:
-        ganancia = tramite.precio - tramite.costo
-        writer.writerow([tramite.tramite, tramite.fecha.strftime('%Y-%m-%d'), tramite.precio, tramite.costo, ganancia])
-    
-    output.seek(0)
-    return send_file(io.BytesIO(output.read().encode('utf-8')), mimetype='text/csv', as_attachment=True, download_name=f"reporte_papeleria_{papeleria_id}_{datetime.now().strftime('%Y-%m-%d')}.csv")
+@papeleria_bp.route('/exportar-xlsx/papeleria/<int:papeleria_id>')
+@login_required
+@admin_required
+@check_papeleria_owner
+def exportar_xlsx_papeleria(papeleria_id):
+    """Exporta los trámites de la papelería a Excel: resumen y una hoja por mes (`?fecha_inicio=&fecha_fin=`)."""
+    fecha_inicio = request.args.get('fecha_inicio')
+    fecha_fin = request.args.get('fecha_fin')
+    if not xlsx_export.OPENPYXL_AVAILABLE:
+        flash('La exportación a Excel no está disponible en este servidor. Por favor, usa la opción de exportar a CSV.', 'warning')
+        return redirect(url_for('papeleria.ver_papeleria', papeleria_id=papeleria_id, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin))
+    return xlsx_export.xlsx_response(xlsx_export.nombre_archivo(f'reporte_papeleria_{papeleria_id}'),
+                                     xlsx_export.escribir_tramites, get_effective_user_id(), fecha_inicio, fecha_fin,
+                                     papeleria_id=papeleria_id)
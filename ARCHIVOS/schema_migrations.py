@@ -0,0 +1,146 @@
+"""
+Migraciones de esquema idempotentes que se ejecutan al arrancar (`run_db_migration`).
+
+`db.create_all()` solo crea tablas nuevas; las columnas añadidas a tablas existentes
+se agregan aquí con ALTER TABLE, comprobando antes `PRAGMA table_info`.
+
+Cada worker de gunicorn (sin preload) ejecuta estas migraciones al arrancar: la comprobación
+se repite dentro de una transacción `BEGIN IMMEDIATE` (ver `_write_lock`) para que solo uno
+añada la columna y haga el relleno o la compactación; los demás esperan el candado y la encuentran ya creada.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from .models import db
+
+# Tablas con columna `periodo` (YYYYMM) derivada de `fecha`
+_PERIODO_TABLES = ('tramites', 'gastos', 'tramites_diarios', 'gastos_diarios')
+
+# Índices reemplazados por versiones cubrientes/compuestas (ver models.py)
+_OBSOLETE_INDEXES = (
+    'idx_tramites_user_papeleria',
+    'idx_tramites_diarios_user_papeleria',
+    'idx_tramites_diarios_user_periodo',
+    'idx_gastos_diarios_user_periodo',
+)
+
+# Columnas que identifican filas "idénticas" de un mismo registro masivo
+_TRAMITE_GROUP_COLUMNS = "user_id, papeleria_id, tramite, fecha, precio, costo, timestamp"
+
+
+# Espera máxima por el candado de otro worker que está migrando (el relleno puede tardar)
+_LOCK_WAIT_SECONDS = 300
+
+
+def _column_names(table):
+    return {row[1] for row in db.session.execute(text(f"PRAGMA table_info({table})"))}
+
+
+@contextmanager
+def _write_lock():
+    """
+    Transacción `BEGIN IMMEDIATE`: toma el candado de escritura de SQLite antes de volver a
+    comprobar el esquema. Reintenta mientras otro worker lo tenga (hasta `_LOCK_WAIT_SECONDS`).
+    Confirma al salir del bloque y deshace si falla.
+    """
+    db.session.commit()
+    limite = time.monotonic() + _LOCK_WAIT_SECONDS
+    while True:
+        try:
+            db.session.execute(text("BEGIN IMMEDIATE"))
+            break
+        except OperationalError as e:
+            db.session.rollback()
+            if 'locked' not in str(e) or time.monotonic() > limite:
+                raise
+            logging.info("[MIGRACION] Otro worker está migrando; esperando el candado")
+            time.sleep(0.5)
+    try:
+        yield
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def ensure_tramites_cantidad():
+    """
+    Añade `tramites.cantidad` si no existe y, en ese caso, compacta las filas duplicadas
+    que generaba el registro por unidades. Devuelve el número de filas eliminadas.
+    """
+    if 'cantidad' in _column_names('tramites'):
+        return 0
+    with _write_lock():
+        if 'cantidad' in _column_names('tramites'):
+            return 0  # Otro worker la añadió mientras esperábamos
+        logging.info("[MIGRACION] Añadiendo columna tramites.cantidad")
+        db.session.execute(text("ALTER TABLE tramites ADD COLUMN cantidad INTEGER NOT NULL DEFAULT 1"))
+        # Misma transacción: ningún worker ve la columna sin las filas ya compactadas
+        return compact_tramites()
+
+
+def compact_tramites():
+    """
+    Fusiona las filas de `tramites` idénticas (mismo usuario, papelería, trámite, fecha,
+    precio, costo y timestamp) en una sola fila con la suma de `cantidad`.
+    Los rollups no cambian: los totales son los mismos. Devuelve las filas eliminadas.
+    """
+    try:
+        db.session.execute(text("DROP TABLE IF EXISTS temp._tramites_compactos"))
+        db.session.execute(text(
+            "CREATE TEMP TABLE _tramites_compactos AS "
+            "SELECT MIN(id) AS id, SUM(cantidad) AS cantidad FROM tramites "
+            f"GROUP BY {_TRAMITE_GROUP_COLUMNS} HAVING COUNT(*) > 1"
+        ))
+        db.session.execute(text(
+            "UPDATE tramites SET cantidad = "
+            "(SELECT c.cantidad FROM _tramites_compactos c WHERE c.id = tramites.id) "
+            "WHERE id IN (SELECT id FROM _tramites_compactos)"
+        ))
+        eliminadas = db.session.execute(text(
+            "DELETE FROM tramites WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM tramites GROUP BY {_TRAMITE_GROUP_COLUMNS})"
+        )).rowcount
+        db.session.execute(text("DROP TABLE temp._tramites_compactos"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logging.info(f"[MIGRACION] Trámites compactados: {eliminadas} filas duplicadas fusionadas")
+    return eliminadas
+
+
+def ensure_periodo_columns():
+    """
+    Añade la columna `periodo` (YYYYMM) a las tablas que no la tienen y la rellena a
+    partir de `fecha`. Devuelve las tablas migradas.
+    """
+    if all('periodo' in _column_names(table) for table in _PERIODO_TABLES):
+        return []
+    migradas = []
+    with _write_lock():
+        for table in _PERIODO_TABLES:
+            if 'periodo' in _column_names(table):
+                continue
+            logging.info(f"[MIGRACION] Añadiendo columna {table}.periodo")
+            db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN periodo INTEGER NOT NULL DEFAULT 0"))
+            db.session.execute(text(f"UPDATE {table} SET periodo = CAST(strftime('%Y%m', fecha) AS INTEGER)"))
+            migradas.append(table)
+    return migradas
+
+
+def ensure_indexes():
+    """
+    Crea los índices declarados en los modelos que falten en tablas ya existentes
+    (`create_all` solo crea índices junto con tablas nuevas) y elimina los obsoletos.
+    """
+    for name in _OBSOLETE_INDEXES:
+        db.session.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    db.session.commit()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
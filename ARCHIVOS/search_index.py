@@ -0,0 +1,198 @@
+"""
+Índice de búsqueda full-text (SQLite FTS5) para la búsqueda global `/api/buscar`.
+
+Una sola tabla virtual `busqueda_fts` indexa, por usuario, los cuatro tipos de resultado:
+
+    tramite    -> nombre del trámite + nombre de la papelería
+    papeleria  -> nombre de la papelería
+    gasto      -> descripción + categoría + nombre del proveedor
+    proveedor  -> nombre del proveedor
+
+El `rowid` de cada documento es `id * 4 + código de tipo`, así que los triggers
+(`AFTER INSERT/UPDATE/DELETE` sobre las tablas crudas) localizan su documento sin
+búsquedas adicionales. Los renombres de papelerías y proveedores reindexan los trámites
+y gastos que llevan su nombre.
+
+- Tokenizador `unicode61 remove_diacritics 2`: "defuncion" encuentra "DEFUNCIÓN".
+- Índices de prefijo de 2 a 4 caracteres: cada término se busca como prefijo (`acta*`).
+- `usuario` (`u<id>`) y `tipo` son columnas indexadas que se intersectan en el MATCH, de
+  modo que la búsqueda solo recorre los documentos del usuario y del tipo pedido.
+- Orden por `bm25` (solo la columna `texto` pondera) y, a igual relevancia, lo más reciente.
+
+Fuera de SQLite, o si el SQLite no trae FTS5, los repositorios vuelven al `ILIKE`.
+Reconstrucción completa: `flask --app wsgi rebuild-search-index`.
+"""
+import logging
+import re
+
+from flask import current_app
+from sqlalchemy import Column, Integer, MetaData, Table, Text, func, literal_column, select, text
+from sqlalchemy.exc import OperationalError
+
+from .models import db
+
+TABLE = 'busqueda_fts'
+
+# tipo -> (código en el rowid, tabla origen, texto indexado; `{r}` es el alias de la fila)
+DOCUMENTOS = {
+    'tramite': (0, 'tramites',
+                "{r}.tramite || ' ' || coalesce((SELECT p.nombre FROM papelerias p WHERE p.id = {r}.papeleria_id), '')"),
+    'papeleria': (1, 'papelerias', "{r}.nombre"),
+    'gasto': (2, 'gastos',
+              "coalesce({r}.descripcion, '') || ' ' || coalesce({r}.categoria, '') || ' ' || "
+              "coalesce((SELECT pr.nombre FROM proveedores pr WHERE pr.id = {r}.proveedor_id), '')"),
+    'proveedor': (3, 'proveedores', "{r}.nombre"),
+}
+
+# Resultados por tipo en /api/buscar (suman el tope de 50 que tenía la búsqueda)
+LIMITES_POR_TIPO = {'tramite': 15, 'papeleria': 10, 'gasto': 15, 'proveedor': 10}
+
+# Columnas que disparan la reindexación de cada tabla
+_COLUMNAS_INDEXADAS = {
+    'tramites': 'tramite, papeleria_id, user_id',
+    'papelerias': 'nombre, user_id',
+    'gastos': 'descripcion, categoria, proveedor_id, user_id',
+    'proveedores': 'nombre, user_id',
+}
+
+# Documentos que repiten el nombre de otra fila: tabla padre -> (tipo hijo, FK hacia el padre)
+_DEPENDIENTES = {
+    'papelerias': ('tramite', 'papeleria_id'),
+    'proveedores': ('gasto', 'proveedor_id'),
+}
+
+_TERMINO = re.compile(r'\w+', re.UNICODE)
+
+# Tabla "virtual" para construir consultas con SQLAlchemy; no pertenece a `db.metadata`
+# para que `create_all`/`drop_all` no intenten gestionarla.
+busqueda_fts = Table(
+    TABLE, MetaData(),
+    Column('rowid', Integer, primary_key=True),
+    Column('texto', Text),
+    Column('tipo', Text),
+    Column('usuario', Text),
+)
+
+
+def _insert_sql(tipo, alias, origen=''):
+    """`INSERT ... SELECT` del documento `tipo` para la fila `alias` (o las filas de `origen`)."""
+    codigo, _, texto = DOCUMENTOS[tipo]
+    return (
+        f"INSERT INTO {TABLE}(rowid, texto, tipo, usuario) "
+        f"SELECT {alias}.id * 4 + {codigo}, {texto.format(r=alias)}, '{tipo}', 'u' || {alias}.user_id {origen}"
+    )
+
+
+def _delete_sql(tipo, alias):
+    codigo = DOCUMENTOS[tipo][0]
+    return f"DELETE FROM {TABLE} WHERE rowid = {alias}.id * 4 + {codigo}"
+
+
+def _triggers():
+    """Sentencias `CREATE TRIGGER` que mantienen el índice sincronizado."""
+    sentencias = []
+    for tipo, (_, tabla, _) in DOCUMENTOS.items():
+        al_renombrar = []
+        if tabla in _DEPENDIENTES:
+            hijo, fk = _DEPENDIENTES[tabla]
+            codigo_hijo, tabla_hijo, _ = DOCUMENTOS[hijo]
+            filas_hijo = f"FROM {tabla_hijo} h WHERE h.user_id = new.user_id AND h.{fk} = new.id"
+            al_renombrar = [
+                f"DELETE FROM {TABLE} WHERE rowid IN (SELECT h.id * 4 + {codigo_hijo} {filas_hijo})",
+                _insert_sql(hijo, 'h', filas_hijo),
+            ]
+        sentencias.append(
+            f"CREATE TRIGGER IF NOT EXISTS {TABLE}_{tabla}_ai AFTER INSERT ON {tabla} BEGIN "
+            f"{_insert_sql(tipo, 'new')}; END"
+        )
+        sentencias.append(
+            f"CREATE TRIGGER IF NOT EXISTS {TABLE}_{tabla}_au AFTER UPDATE OF {_COLUMNAS_INDEXADAS[tabla]} ON {tabla} BEGIN "
+            + ''.join(f"{s}; " for s in [_delete_sql(tipo, 'old'), _insert_sql(tipo, 'new')] + al_renombrar)
+            + "END"
+        )
+        sentencias.append(
+            f"CREATE TRIGGER IF NOT EXISTS {TABLE}_{tabla}_ad AFTER DELETE ON {tabla} BEGIN "
+            f"{_delete_sql(tipo, 'old')}; END"
+        )
+    return sentencias
+
+
+def ensure_search_index():
+    """
+    Crea la tabla FTS5 y sus triggers si no existen y, si el índice está vacío pero hay
+    datos, lo puebla. Idempotente; se llama desde `run_db_migration`.
+    Devuelve False si la base de datos no soporta FTS5 (la búsqueda usa `ILIKE`).
+    """
+    current_app.extensions['busqueda_fts'] = False
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+            "texto, tipo, usuario, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+        ))
+        for sentencia in _triggers():
+            db.session.execute(text(sentencia))
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        logging.warning(f"⚠️ FTS5 no disponible, la búsqueda usará ILIKE: {e}")
+        return False
+
+    current_app.extensions['busqueda_fts'] = True
+    vacio = db.session.execute(text(f"SELECT 1 FROM {TABLE} LIMIT 1")).first() is None
+    if vacio and db.session.execute(text("SELECT 1 FROM tramites UNION ALL SELECT 1 FROM papelerias LIMIT 1")).first():
+        logging.info("🔎 Índice de búsqueda vacío con datos existentes: reconstruyendo...")
+        rebuild()
+    return True
+
+
+def rebuild(user_id=None):
+    """Reconstruye el índice desde las tablas crudas (todo, o solo un usuario)."""
+    if user_id is None:
+        db.session.execute(text(f"DELETE FROM {TABLE}"))
+    else:
+        db.session.execute(text(f"DELETE FROM {TABLE} WHERE {TABLE} MATCH :usuario"),
+                           {'usuario': f'usuario:u{int(user_id)}'})
+    for tipo, (_, tabla, _) in DOCUMENTOS.items():
+        origen = f"FROM {tabla} r" + (" WHERE r.user_id = :user_id" if user_id is not None else '')
+        db.session.execute(text(_insert_sql(tipo, 'r', origen)), {'user_id': user_id})
+    if user_id is None:
+        db.session.execute(text(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')"))
+    db.session.commit()
+
+
+def enabled():
+    """True si la app tiene el índice FTS5 disponible."""
+    return current_app.extensions.get('busqueda_fts', False)
+
+
+def match_expression(user_id, tipo, search_term):
+    """
+    Expresión MATCH para `search_term`: cada palabra como prefijo sobre `texto`, limitada
+    al usuario y al tipo. None si el término no contiene ninguna palabra.
+    """
+    terminos = _TERMINO.findall(search_term or '')
+    if not terminos:
+        return None
+    palabras = ' AND '.join(f'texto:"{t}"*' for t in terminos)
+    return f'usuario:u{int(user_id)} AND tipo:{tipo} AND {palabras}'
+
+
+def hits(user_id, tipo, search_term, limit=None):
+    """
+    Subconsulta `(ref_id, relevancia)` con los documentos de `tipo` que coinciden, ordenados por
+    bm25 y, a igual relevancia, del más reciente al más antiguo (rowid descendente).
+    None si el término no contiene ninguna palabra.
+    """
+    expresion = match_expression(user_id, tipo, search_term)
+    if expresion is None:
+        return None
+    tabla = literal_column(TABLE)
+    relevancia = func.bm25(tabla, 1.0, 0.0, 0.0).label('relevancia')
+    query = select((busqueda_fts.c.rowid // 4).label('ref_id'), relevancia)\
+        .where(tabla.op('MATCH')(expresion))\
+        .order_by(relevancia, busqueda_fts.c.rowid.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.subquery()
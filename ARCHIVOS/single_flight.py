@@ -0,0 +1,193 @@
+"""
+Protección contra estampidas de caché: un solo cálculo por clave (single-flight) y
+stale-while-revalidate para las agregaciones de `api_routes`.
+
+Registrar un trámite dispara `reload-dashboard`, y cada pestaña abierta del mismo
+usuario pide a la vez `/api/dashboard-totals`, `/api/dashboard-charts` y el fragmento del
+dashboard. Todas fallan juntas en la caché recién invalidada y lanzan las mismas
+agregaciones contra SQLite. `cached` lo evita en dos niveles:
+
+- Dentro del worker, las peticiones que llegan mientras otro hilo calcula la misma clave
+  esperan su resultado (`_vuelos`).
+- Entre workers, el primero toma un candado en la caché compartida (`add` es atómico
+  en TieredCache y en Redis) y los demás esperan a que aparezca el valor, como mucho
+  `SINGLE_FLIGHT_WAIT` segundos; después calculan ellos.
+
+Con `SINGLE_FLIGHT_STALE_MAX_AGE` > 0 se guarda también el último valor de cada clave
+sin versión. Si la versión cambió y ese valor tiene menos de esos segundos, se responde
+con él al momento y se recalcula en segundo plano (un hilo de un pool acotado). Nunca se
+sirve a la sesión que hizo la escritura un valor calculado antes de ella (ver
+`utils.bump_user_data_version`): quien registra un trámite siempre ve sus totales al día.
+
+Con `SINGLE_FLIGHT_REFRESH = 'inline'` el recálculo corre dentro de la petición (tests).
+"""
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_request_context, session
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'SINGLE_FLIGHT_STALE_MAX_AGE': 60,   # Segundos; 0 desactiva stale-while-revalidate
+    'SINGLE_FLIGHT_WAIT': 10,            # Espera máxima por el cálculo de otro worker
+    'SINGLE_FLIGHT_LOCK_TIMEOUT': 30,    # Vida del candado compartido (worker caído a mitad de cálculo)
+    'SINGLE_FLIGHT_REFRESH': 'thread',   # 'thread' | 'inline'
+    'SINGLE_FLIGHT_REFRESH_WORKERS': 2,  # Hilos de recálculo por worker de gunicorn
+}
+
+# Clave de sesión con la hora de la última escritura (la pone bump_user_data_version)
+SESION_ESCRITURA = 'datos_escritos_en'
+
+_vuelos = {}      # Cálculos en curso en este worker
+_refrescos = set()  # Recálculos encolados
+_vuelos_lock = threading.Lock()
+_executor = None
+
+
+class _Vuelo:
+    """Cálculo en curso de una clave dentro de este worker."""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.valor = None
+        self.error = None
+
+
+def init_app(app):
+    """Completa la configuración de single-flight con `DEFAULTS`."""
+    for key, default in DEFAULTS.items():
+        app.config.setdefault(key, default)
+
+
+def cached(base_key, version, compute, timeout=300, stale=True):
+    """
+    Valor de `compute()` para `base_key` en la versión de datos `version`, calculado una
+    sola vez aunque lo pidan varias peticiones a la vez. Con `stale` puede devolver el
+    valor anterior (ver el docstring del módulo); `compute` no debe usar la petición en
+    ese caso, porque el recálculo corre fuera de ella.
+    Sin caché configurada (versión None) siempre llama a `compute()`.
+    """
+    cache = getattr(current_app, 'cache', None)
+    if not cache or version is None:
+        return compute()
+
+    valor = cache.get(f'{base_key}:{version}')
+    if valor is not None:
+        return valor
+
+    config = current_app.config
+    max_age = config.get('SINGLE_FLIGHT_STALE_MAX_AGE', DEFAULTS['SINGLE_FLIGHT_STALE_MAX_AGE']) if stale else 0
+    if max_age > 0:
+        anterior = cache.get(f'{base_key}:ultimo')
+        if _servible(anterior, max_age):
+            logging.debug(f"[STALE] {base_key} (recalculando v:{version})")
+            _refrescar(current_app._get_current_object(), base_key, version, compute, timeout, max_age)
+            return anterior['data']
+
+    return _calcular_una_vez(cache, base_key, version, compute, timeout, max_age)
+
+
+def _servible(anterior, max_age):
+    """El valor anterior es reciente y posterior a la última escritura de esta sesión."""
+    if not anterior:
+        return False
+    if time.time() - anterior['at'] > max_age:
+        return False
+    escrito = session.get(SESION_ESCRITURA) if has_request_context() else None
+    return escrito is None or anterior['at'] >= escrito
+
+
+def _calcular_una_vez(cache, base_key, version, compute, timeout, max_age):
+    clave = f'{base_key}:{version}'
+    with _vuelos_lock:
+        vuelo = _vuelos.get(clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _vuelos[clave] = _Vuelo()
+
+    if not lider:
+        espera = current_app.config.get('SINGLE_FLIGHT_WAIT', DEFAULTS['SINGLE_FLIGHT_WAIT'])
+        if vuelo.listo.wait(espera) and vuelo.error is None:
+            return vuelo.valor
+        return compute()   # El líder falló o tardó demasiado
+
+    try:
+        vuelo.valor = _calcular_entre_workers(cache, base_key, version, compute, timeout, max_age)
+        return vuelo.valor
+    except Exception as e:
+        vuelo.error = e
+        raise
+    finally:
+        with _vuelos_lock:
+            _vuelos.pop(clave, None)
+        vuelo.listo.set()
+
+
+def _calcular_entre_workers(cache, base_key, version, compute, timeout, max_age):
+    config = current_app.config
+    clave = f'{base_key}:{version}'
+    candado = f'sf:{clave}'
+    if cache.add(candado, 1, timeout=config.get('SINGLE_FLIGHT_LOCK_TIMEOUT', DEFAULTS['SINGLE_FLIGHT_LOCK_TIMEOUT'])):
+        try:
+            return _guardar(cache, base_key, version, compute, timeout, max_age)
+        finally:
+            cache.delete(candado)
+
+    # Otro worker lo está calculando: esperar a que publique el valor
+    limite = time.monotonic() + config.get('SINGLE_FLIGHT_WAIT', DEFAULTS['SINGLE_FLIGHT_WAIT'])
+    pausa = 0.02
+    while time.monotonic() < limite:
+        time.sleep(pausa)
+        pausa = min(pausa * 2, 0.25)
+        valor = cache.get(clave)
+        if valor is not None:
+            return valor
+        if not cache.has(candado):
+            break
+    logging.warning(f"[SINGLE_FLIGHT] {clave}: sin resultado del otro worker, calculando aquí")
+    return _guardar(cache, base_key, version, compute, timeout, max_age)
+
+
+def _guardar(cache, base_key, version, compute, timeout, max_age):
+    # La hora se toma antes de consultar: el valor incluye toda escritura confirmada antes
+    inicio = time.time()
+    valor = compute()
+    cache.set(f'{base_key}:{version}', valor, timeout=timeout)
+    if max_age > 0:
+        cache.set(f'{base_key}:ultimo', {'at': inicio, 'data': valor}, timeout=max_age)
+    return valor
+
+
+def _refrescar(app, base_key, version, compute, timeout, max_age):
+    """Encola el recálculo de `base_key` fuera de la petición si nadie lo está haciendo ya."""
+    clave = f'{base_key}:{version}'
+    with _vuelos_lock:
+        if clave in _vuelos or clave in _refrescos:
+            return
+        _refrescos.add(clave)
+
+    def _tarea():
+        with app.app_context():
+            try:
+                if app.cache.get(clave) is None:
+                    _calcular_una_vez(app.cache, base_key, version, compute, timeout, max_age)
+            except Exception as e:
+                logging.error(f"[STALE] Error recalculando {clave}: {e}")
+            finally:
+                with _vuelos_lock:
+                    _refrescos.discard(clave)
+
+    if app.config.get('SINGLE_FLIGHT_REFRESH', DEFAULTS['SINGLE_FLIGHT_REFRESH']) == 'inline':
+        _tarea()
+        return
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get('SINGLE_FLIGHT_REFRESH_WORKERS', DEFAULTS['SINGLE_FLIGHT_REFRESH_WORKERS']),
+            thread_name_prefix='stale-refresh')
+        atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+    _executor.submit(_tarea)
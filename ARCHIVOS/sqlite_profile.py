@@ -0,0 +1,119 @@
+"""
+Perfil de afinación del motor SQLite para DocuExpress.
+
+Aplica en cada conexión nueva los PRAGMA que permiten a los workers de gunicorn leer
+mientras otro escribe (WAL), reducen fsyncs (synchronous=NORMAL, seguro con WAL) y
+amplían la caché de páginas / mmap. Todos los valores se pueden ajustar desde `Config`
+(que a su vez lee variables de entorno con el mismo nombre).
+"""
+import logging
+import os
+
+from sqlalchemy import event
+
+# Valores por defecto (se usan si ni Config ni el entorno definen la clave)
+DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,   # 256MB de lectura mapeada en memoria
+    'SQLITE_CACHE_SIZE': -32000,             # Negativo = KiB -> ~32MB de caché de páginas
+    'SQLITE_TEMP_STORE': 'MEMORY',
+    'SQLITE_BUSY_TIMEOUT': 5000,             # ms que espera un escritor antes de SQLITE_BUSY
+    'SQLITE_STATEMENT_CACHE_SIZE': 256,      # Sentencias preparadas por conexión (pysqlite)
+}
+
+# Perfil "legacy" equivalente al comportamiento anterior (útil para comparar en benchmarks)
+LEGACY_PROFILE = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_MMAP_SIZE': 0,
+    'SQLITE_CACHE_SIZE': -2000,
+    'SQLITE_TEMP_STORE': 'DEFAULT',
+    'SQLITE_BUSY_TIMEOUT': 5000,
+    'SQLITE_STATEMENT_CACHE_SIZE': 128,
+}
+
+_VALID_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+_VALID_SYNCHRONOUS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+_VALID_TEMP_STORE = {'DEFAULT', 'FILE', 'MEMORY'}
+
+
+def load_profile(config=None):
+    """
+    Construye el perfil efectivo. Prioridad: Config > variable de entorno > DEFAULTS.
+    """
+    config = config or {}
+    profile = {}
+    for key, default in DEFAULTS.items():
+        value = config.get(key, os.environ.get(key, default))
+        if isinstance(default, int):
+            value = int(value)
+        else:
+            value = str(value).upper()
+        profile[key] = value
+
+    if profile['SQLITE_JOURNAL_MODE'] not in _VALID_JOURNAL_MODES:
+        raise ValueError(f"SQLITE_JOURNAL_MODE inválido: {profile['SQLITE_JOURNAL_MODE']}")
+    if profile['SQLITE_SYNCHRONOUS'] not in _VALID_SYNCHRONOUS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS inválido: {profile['SQLITE_SYNCHRONOUS']}")
+    if profile['SQLITE_TEMP_STORE'] not in _VALID_TEMP_STORE:
+        raise ValueError(f"SQLITE_TEMP_STORE inválido: {profile['SQLITE_TEMP_STORE']}")
+    return profile
+
+
+def apply_pragmas(dbapi_connection, profile):
+    """Ejecuta los PRAGMA del perfil sobre una conexión DBAPI (sqlite3) ya abierta."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute(f"PRAGMA busy_timeout={profile['SQLITE_BUSY_TIMEOUT']}")
+        cursor.execute(f"PRAGMA journal_mode={profile['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous={profile['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA mmap_size={profile['SQLITE_MMAP_SIZE']}")
+        cursor.execute(f"PRAGMA cache_size={profile['SQLITE_CACHE_SIZE']}")
+        cursor.execute(f"PRAGMA temp_store={profile['SQLITE_TEMP_STORE']}")
+    finally:
+        cursor.close()
+
+
+def engine_options(config, base_options=None):
+    """
+    Devuelve `SQLALCHEMY_ENGINE_OPTIONS` con el tamaño de la caché de sentencias
+    (`cached_statements` de pysqlite) y el timeout de conexión del perfil.
+    Debe llamarse antes de `db.init_app`.
+    """
+    profile = load_profile(config)
+    options = dict(base_options or {})
+    connect_args = dict(options.get('connect_args', {}))
+    connect_args.setdefault('cached_statements', profile['SQLITE_STATEMENT_CACHE_SIZE'])
+    connect_args.setdefault('timeout', profile['SQLITE_BUSY_TIMEOUT'] / 1000)
+    options['connect_args'] = connect_args
+    return options
+
+
+def install(engine, profile):
+    """Registra el hook `connect` que aplica el perfil a cada conexión del engine."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, profile)
+
+
+def init_app(app, db):
+    """
+    Instala el perfil en todos los engines de Flask-SQLAlchemy de la app.
+    Llamar después de `db.init_app(app)`.
+    """
+    profile = load_profile(app.config)
+    app.config['SQLITE_PROFILE'] = profile
+    with app.app_context():
+        for engine in db.engines.values():
+            install(engine, profile)
+    logging.info(
+        "✅ Perfil SQLite: journal=%s synchronous=%s mmap=%s cache=%s temp_store=%s busy_timeout=%sms",
+        profile['SQLITE_JOURNAL_MODE'], profile['SQLITE_SYNCHRONOUS'], profile['SQLITE_MMAP_SIZE'],
+        profile['SQLITE_CACHE_SIZE'], profile['SQLITE_TEMP_STORE'], profile['SQLITE_BUSY_TIMEOUT']
+    )
+    return profile
@@ -1,7 +1,10 @@
 import pytest
 import os
+from contextlib import contextmanager
+from flask_caching import Cache
 from ARCHIVOS.app import create_app
 from ARCHIVOS.models import db, User, Papeleria, Tramite, Gasto
+from ARCHIVOS import query_stats
 
 class TestConfig:
     """Test configuration."""
@@ -16,6 +19,8 @@ class TestConfig:
     DATABASE_PATH = os.path.join(BASE_DIR, 'test_database.sqlite')
     # Disable rate limiting during tests to avoid Redis dependency
     RATELIMIT_ENABLED = False
+    # No background cache warming: it would race the tests against the in-memory DB
+    CACHE_WARMING_ENABLED = False
     # You might not need this if your app structure handles it, but it's a common pattern.
     # For instance, if your create_app uses instance_relative_config.
 
@@ -72,3 +77,89 @@ def init_database(app):
 
         # Clean up after the test function
         db.session.remove()
+
+
+@pytest.fixture
+def real_cache(app, monkeypatch):
+    """
+    In-memory cache (TestConfig's cache is null) swapped in for `app.cache` and emptied,
+    for tests that need data versions, cached fragments or single-flight keys.
+    """
+    cache = Cache()
+    cache.init_app(app, config={'CACHE_TYPE': 'SimpleCache', 'CACHE_THRESHOLD': 10000})
+    monkeypatch.setattr(app, 'cache', cache)
+    with app.app_context():
+        cache.clear()
+    return cache
+
+
+@pytest.fixture
+def login():
+    """
+    Logs a user into the test client's session, optionally viewing another user's data
+    (admin) and with a fixed CSRF token.
+
+        login(client, 2, viewing=1)
+    """
+    def _login(client, user_id, viewing=None, csrf=None):
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+            sess['_fresh'] = True
+            sess.pop('viewing_user_id', None)
+            if viewing:
+                sess['viewing_user_id'] = viewing
+            if csrf:
+                sess['csrf_token'] = csrf
+    return _login
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Context manager that fails the test when the block runs more than `max_queries`
+    SQL statements or repeats a statement that differs only in parameters (N+1).
+
+        with query_budget(5):
+            client.get('/api/buscar?q=pa')
+    """
+    @contextmanager
+    def _budget(max_queries, allow_repeated=False):
+        with query_stats.collect() as stats:
+            yield stats
+        assert stats.count <= max_queries, (
+            f"{stats.count} queries (budget {max_queries}):\n" + "\n".join(stats.statements)
+        )
+        if not allow_repeated:
+            assert not stats.repeated(), f"N+1 detected: {stats.repeated()}"
+    return _budget
+
+
+@pytest.fixture
+def sql_de_datos():
+    """
+    Filters the statements of a `query_budget` / `query_stats.collect()` block down to data
+    queries: drops the session user load and the `ignorar` tables.
+
+        assert not sql_de_datos(stats, ignorar=('papelerias',))
+    """
+    def _sql_de_datos(stats, ignorar=()):
+        tablas = ('users',) + tuple(ignorar)
+        return [s for s in stats.statements if not any(f'FROM {t}' in s for t in tablas)]
+    return _sql_de_datos
+
+
+@pytest.fixture
+def aproximado():
+    """
+    Rounds the floats of a result (through dicts, lists and tuples) so values summed in a
+    different order than SQLite's, such as snapshots or NumPy, compare equal.
+    """
+    def _aproximado(valor):
+        if isinstance(valor, float):
+            return round(valor, 6)
+        if isinstance(valor, dict):
+            return {clave: _aproximado(v) for clave, v in valor.items()}
+        if isinstance(valor, (list, tuple)):
+            return [_aproximado(v) for v in valor]
+        return valor
+    return _aproximado
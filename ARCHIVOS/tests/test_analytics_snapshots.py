@@ -0,0 +1,139 @@
+"""
+Tests para el snapshot nocturno de analytics: mismos valores que las consultas completas,
+refresco incremental, invalidación por escrituras con fecha pasada y frescura en la respuesta.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from ARCHIVOS import query_stats
+from ARCHIVOS.models import db, Papeleria, AnalyticsSnapshot
+
+HOY = date.today()
+
+
+@pytest.fixture
+def historia(app, init_database):
+    """Tres papelerías del usuario 1 (una inactiva) con trámites de los últimos 90 días y de hoy."""
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository
+        db.session.query(AnalyticsSnapshot).delete()
+        db.session.add(Papeleria(id=2, nombre='Segunda', user_id=1))
+        db.session.add(Papeleria(id=3, nombre='Inactiva', user_id=1, is_active=False))
+        db.session.commit()
+        filas = [{'papeleria_id': 1 + i % 3, 'tramite': f'TRAMITE {i % 5}', 'fecha': HOY - timedelta(days=i * 3),
+                  'precio': 40.0 + i % 7, 'costo': 0.0 if i % 4 == 0 else 10.0 + i % 3, 'cantidad': 1 + i % 2}
+                 for i in range(30)]
+        tramite_repository.add_many(1, filas)
+        yield
+
+
+def _completo(analytics, user_id):
+    """Las métricas calculadas con las consultas sobre todo el rollup."""
+    return {
+        'mejor_mes': analytics.get_mejor_mes_historico(user_id),
+        'dia_productivo': analytics.get_dias_mas_productivos(user_id),
+        'margen_promedio': analytics.get_margen_promedio(user_id),
+        'costo_promedio_tramite': analytics.get_costo_promedio_tramite(user_id),
+        'roi_papelerias': analytics.get_roi_por_papeleria(user_id),
+        'rentabilidad_tramites': analytics.get_rentabilidad_por_tramite(user_id),
+    }
+
+
+def _sin_frescura(historico):
+    return {clave: valor for clave, valor in historico.items() if clave != 'snapshot'}
+
+
+class TestSnapshot:
+
+    def test_mismos_valores_con_y_sin_snapshot(self, app, historia, aproximado):
+        with app.app_context():
+            from ARCHIVOS.database import analytics_repository as analytics
+            esperado = aproximado(_completo(analytics, 1))
+
+            sin_snapshot = analytics.get_historico(1)
+            assert aproximado(_sin_frescura(sin_snapshot)) == esperado
+            assert sin_snapshot['snapshot']['hasta'] is None and sin_snapshot['snapshot']['papelerias_sin_snapshot'] == 3
+
+            assert analytics.refresh_snapshot(1) == 3
+            con_snapshot = analytics.get_historico(1)
+            assert aproximado(_sin_frescura(con_snapshot)) == esperado
+            # Solo el día en curso queda fuera del snapshot
+            assert con_snapshot['snapshot']['hasta'] == (HOY - timedelta(days=1)).isoformat()
+            assert con_snapshot['snapshot']['papelerias_sin_snapshot'] == 0
+            assert con_snapshot['snapshot']['filas_delta'] == 1
+
+    def test_refresco_incremental(self, app, historia, aproximado):
+        with app.app_context():
+            from ARCHIVOS.database import analytics_repository as analytics
+            esperado = aproximado(_completo(analytics, 1))
+            analytics.refresh_snapshot(1, HOY - timedelta(days=40))
+            assert analytics.get_historico(1)['snapshot']['filas_delta'] > 1
+            # Una fecha futura se limita a ayer
+            analytics.refresh_snapshot(1, HOY + timedelta(days=5))
+            assert {s.hasta for s in AnalyticsSnapshot.query.filter_by(user_id=1)} == {HOY - timedelta(days=1)}
+            assert aproximado(_sin_frescura(analytics.get_historico(1))) == esperado
+            # Repetir el refresco no vuelve a sumar nada
+            analytics.refresh_snapshot(1)
+            assert aproximado(_sin_frescura(analytics.get_historico(1))) == esperado
+
+    def test_escritura_con_fecha_pasada_descarta_el_snapshot(self, app, historia, aproximado):
+        with app.app_context():
+            from ARCHIVOS.database import analytics_repository as analytics, tramite_repository
+            analytics.refresh_snapshot(1)
+
+            tramite_repository.add_bulk(2, 'TRAMITE 0', 1, HOY.isoformat(), 500.0, 10.0, 1)
+            assert AnalyticsSnapshot.query.filter_by(user_id=1).count() == 3
+
+            tramite_repository.add_bulk(2, 'ATRASADO', 1, (HOY - timedelta(days=10)).isoformat(), 900.0, 10.0, 2)
+            assert {s.papeleria_id for s in AnalyticsSnapshot.query.filter_by(user_id=1)} == {1, 3}
+            historico = analytics.get_historico(1)
+            assert historico['snapshot']['papelerias_sin_snapshot'] == 1
+            assert aproximado(_sin_frescura(historico)) == aproximado(_completo(analytics, 1))
+
+    def test_con_snapshot_no_recorre_la_historia(self, app, historia):
+        with app.app_context():
+            from ARCHIVOS.database import analytics_repository as analytics
+            analytics.refresh_snapshot(1)
+            with query_stats.collect() as stats:
+                analytics.get_historico(1)
+            assert stats.count == 2
+
+
+class TestDisparadores:
+
+    def test_api_reporta_frescura_y_refresca_bajo_demanda(self, client, historia, login):
+        login(client, 1)
+        antes = client.get('/api/analytics-avanzado').get_json()
+        assert antes['snapshot']['hasta'] is None and 'meta_progress' in antes
+
+        refresco = client.post('/api/analytics-avanzado/snapshot').get_json()
+        assert refresco['papelerias'] == 3
+        assert refresco['snapshot']['hasta'] == (HOY - timedelta(days=1)).isoformat()
+
+        despues = client.get('/api/analytics-avanzado').get_json()
+        assert despues['snapshot']['actualizado'] is not None
+        assert despues['rentabilidad_tramites'] == antes['rentabilidad_tramites']
+
+    def test_comando_y_job_nocturno(self, app, runner, historia, monkeypatch, tmp_path):
+        resultado = runner.invoke(args=['analytics-snapshots', '--user-id', '1'])
+        assert resultado.exit_code == 0 and 'usuario 1' in resultado.output
+        with app.app_context():
+            assert AnalyticsSnapshot.query.filter_by(user_id=1).count() == 3
+            db.session.query(AnalyticsSnapshot).delete()
+            db.session.commit()
+
+        from ARCHIVOS.backup_manager import BackupManager
+        # El candado del job va junto a la BD
+        monkeypatch.setitem(app.config, 'DATABASE_PATH', str(tmp_path / 'control_papelerias.db'))
+        manager = BackupManager()
+        manager.app = app
+        assert manager.create_analytics_snapshots() >= 1
+        with app.app_context():
+            assert AnalyticsSnapshot.query.filter_by(user_id=1).count() == 3
+            db.session.query(AnalyticsSnapshot).delete()
+            db.session.commit()
+        # El resto de workers (o una segunda ejecución esa noche) no repite el trabajo
+        assert manager.create_analytics_snapshots() is None
+        with app.app_context():
+            assert AnalyticsSnapshot.query.count() == 0
@@ -0,0 +1,40 @@
+"""
+Tests para los backups de la BD: copia y restauración con la API de backup de SQLite en modo WAL.
+"""
+import sqlite3
+
+from ARCHIVOS.backup_manager import BackupManager
+
+
+def _filas(conn):
+    return conn.execute('SELECT count(*) FROM t').fetchone()[0]
+
+
+def test_restaurar_con_wal_pendiente(tmp_path):
+    """Las páginas aún en el -wal entran en los backups y la restauración no pisa el archivo vivo."""
+    db_path = tmp_path / 'control_papelerias.db'
+    viva = sqlite3.connect(db_path)
+    viva.execute('PRAGMA journal_mode=WAL')
+    viva.execute('PRAGMA wal_autocheckpoint=0')  # Todo lo confirmado se queda en el -wal
+    viva.execute('CREATE TABLE t (x INTEGER)')
+    viva.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(10)])
+    viva.commit()
+
+    manager = BackupManager()
+    manager.db_path = db_path
+    manager.backup_dir = tmp_path / 'backups'
+    manager.backup_dir.mkdir()
+    backup = manager.create_backup(manual=True)
+    assert _filas(sqlite3.connect(backup)) == 10
+
+    viva.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(5)])
+    viva.commit()
+    assert manager.restore_backup(backup.name)
+
+    # La conexión abierta ve la BD restaurada, íntegra
+    assert _filas(viva) == 10
+    assert viva.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    # El backup de seguridad incluye las filas que solo estaban en el -wal
+    seguridad = next(tmp_path.glob('control_papelerias_before_restore_*.db'))
+    assert _filas(sqlite3.connect(seguridad)) == 15
+    viva.close()
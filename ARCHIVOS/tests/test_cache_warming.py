@@ -0,0 +1,86 @@
+"""
+Tests para el precalentamiento de la caché del dashboard (tras escribir y al arrancar con los usuarios activos).
+"""
+import json
+import time
+from datetime import date
+
+import pytest
+
+from ARCHIVOS import cache_warming, query_stats, utils
+from ARCHIVOS.dashboard_snapshot import DATA_DOMAINS
+
+
+@pytest.fixture
+def warming(app, init_database, real_cache, monkeypatch, tmp_path):
+    """Caché en memoria real, precalentamiento activo y en línea, sin carga del sistema."""
+    monkeypatch.setitem(app.config, 'CACHE_WARMING_ENABLED', True)
+    monkeypatch.setitem(app.config, 'CACHE_WARMING_EXECUTOR', 'inline')
+    monkeypatch.setitem(app.config, 'CACHE_WARMING_HOT_FILE', tmp_path / 'hot.json')
+    monkeypatch.setattr(cache_warming.os, 'getloadavg', lambda: (0.0, 0.0, 0.0))
+    monkeypatch.setattr(cache_warming, '_actividad', cache_warming.Counter())
+    with app.app_context():
+        yield real_cache
+
+
+def _claves_por_defecto(user_id):
+    version = utils.get_user_data_version(user_id, *DATA_DOMAINS)
+    return [f"{tipo}:{user_id}:{inicio}:{fin}:{version}"
+            for inicio, fin in cache_warming.default_ranges() for tipo in ('totals', 'charts')]
+
+
+class TestTrasEscribir:
+
+    def test_escritura_precalienta_el_dashboard(self, app, client, warming, login):
+        from ARCHIVOS.database import tramite_repository
+        tramite_repository.add_bulk(1, 'ACTA', 1, date.today().isoformat(), 30.0, 10.0, 1)
+        utils.bump_user_data_version(1, 'tramites')
+        assert all(warming.get(clave) is not None for clave in _claves_por_defecto(1))
+
+        login(client, 1)
+        with query_stats.collect() as stats:
+            totales = client.get('/api/dashboard-totals').get_json()
+        assert totales['ganancia'] == 20.0
+        assert not [s for s in stats.statements if 'FROM users' not in s]
+
+    def test_dominios_ajenos_al_dashboard(self, warming):
+        assert not cache_warming.enqueue(1, ('proveedores', 'precios'))
+        assert cache_warming.enqueue(1, ('gastos',))
+
+    def test_se_descarta_bajo_carga(self, app, warming, monkeypatch):
+        monkeypatch.setattr(cache_warming.os, 'getloadavg', lambda: (64.0 * (cache_warming.os.cpu_count() or 1), 0, 0))
+        assert not cache_warming.enqueue(1)
+        assert all(warming.get(clave) is None for clave in _claves_por_defecto(1))
+
+        monkeypatch.setattr(cache_warming.os, 'getloadavg', lambda: (0.0, 0.0, 0.0))
+        monkeypatch.setitem(app.config, 'CACHE_WARMING_MAX_PENDING', 1)
+        monkeypatch.setattr(cache_warming, '_pendientes', {2})
+        assert not cache_warming.enqueue(1)
+        assert cache_warming.enqueue(2)          # Ya pendiente: se junta con el anterior
+
+
+class TestUsuariosActivos:
+
+    def test_archivo_y_arranque(self, app, warming, tmp_path, monkeypatch):
+        for _ in range(3):
+            cache_warming.record_activity(1)
+        cache_warming.record_activity(2)
+        cache_warming.flush_activity(app)
+        cache_warming.record_activity(2)
+        cache_warming.flush_activity(app)
+        datos = json.loads((tmp_path / 'hot.json').read_text())
+        assert datos['1']['hits'] == 3 and datos['2']['hits'] == 2
+
+        # Un usuario sin actividad reciente no cuenta
+        datos['3'] = {'hits': 99, 'ultimo': time.time() - 30 * 24 * 3600}
+        (tmp_path / 'hot.json').write_text(json.dumps(datos))
+        assert cache_warming.hot_tenants(app) == [1, 2]
+
+        monkeypatch.setitem(app.config, 'CACHE_WARMING_HOT_USERS', 1)
+        assert cache_warming.warm_hot_tenants(app) == [1]
+        assert all(warming.get(clave) is not None for clave in _claves_por_defecto(1))
+
+    def test_archivo_ausente_o_corrupto(self, app, warming, tmp_path):
+        assert cache_warming.hot_tenants(app) == []
+        (tmp_path / 'hot.json').write_text('{no es json')
+        assert cache_warming.warm_hot_tenants(app) == []
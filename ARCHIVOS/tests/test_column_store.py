@@ -0,0 +1,146 @@
+"""
+Tests para el almacén columnar (NumPy) del rollup de trámites: mismos resultados que las consultas SQL,
+invalidación por versión de datos y LRU acotado por bytes.
+"""
+import random
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from ARCHIVOS import column_store, query_stats, utils
+from ARCHIVOS.models import db, User, Papeleria
+
+HOY = date.today()
+
+
+@pytest.fixture
+def columnas(app, init_database, real_cache):
+    """Caché en memoria real (da versiones de datos) y trámites aleatorios de un año en cuatro papelerías."""
+    column_store.clear()
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository
+        db.session.add_all([Papeleria(id=2, nombre='Segunda', user_id=1),
+                            Papeleria(id=3, nombre='Inactiva', user_id=1, is_active=False),
+                            Papeleria(id=4, nombre='Sin trámites', user_id=1)])
+        db.session.commit()
+        azar = random.Random(24)
+        tramite_repository.add_many(1, [{
+            'papeleria_id': azar.randint(1, 3), 'tramite': f'TRAMITE {azar.randint(1, 12)}',
+            'fecha': HOY - timedelta(days=azar.randint(0, 400)),
+            'precio': round(azar.uniform(20, 200), 2), 'costo': azar.choice((0.0, round(azar.uniform(5, 20), 2))),
+            'cantidad': azar.randint(1, 3),
+        } for _ in range(600)])
+        yield
+    column_store.clear()
+
+
+@contextmanager
+def _solo_sql(app):
+    app.config['COLUMN_STORE_ENABLED'] = False
+    try:
+        yield
+    finally:
+        app.config['COLUMN_STORE_ENABLED'] = True
+
+
+def _resultados():
+    """Todas las lecturas con implementación vectorizada."""
+    from ARCHIVOS.database import analytics_repository as analytics, papeleria_repository, tramite_repository
+    fi, ff = (HOY - timedelta(days=75)).isoformat(), (HOY - timedelta(days=3)).isoformat()
+    historico = analytics.get_historico(1)
+    historico.pop('snapshot')
+    return {
+        'mejor_mes': analytics.get_mejor_mes_historico(1),
+        'dia_productivo': analytics.get_dias_mas_productivos(1),
+        'margen': analytics.get_margen_promedio(1),
+        'costo_promedio': analytics.get_costo_promedio_tramite(1),
+        'roi': analytics.get_roi_por_papeleria(1),
+        'rentabilidad': analytics.get_rentabilidad_por_tramite(1),
+        'historico': historico,
+        'top': papeleria_repository.get_top_by_ganancia(1),
+        'top(rango)': papeleria_repository.get_top_by_ganancia(1, fecha_inicio=fi, fecha_fin=ff),
+        'distribucion': tramite_repository.get_tramites_distribution(1),
+        'distribucion(rango)': tramite_repository.get_tramites_distribution(1, fecha_inicio=fi, fecha_fin=ff),
+        'mensual': tramite_repository.get_monthly_summary(1),
+        'mensual(rango)': tramite_repository.get_monthly_summary(1, fi, ff),
+    }
+
+
+class TestParidad:
+
+    def test_mismos_resultados_que_sql(self, app, columnas, aproximado):
+        with app.app_context():
+            with _solo_sql(app):
+                esperado = aproximado(_resultados())
+            assert column_store.columns(1) is not None
+            assert aproximado(_resultados()) == esperado
+
+    def test_sin_datos(self, app, columnas):
+        with app.app_context():
+            otro = User(id=3, username='vacio', role='employee')
+            otro.set_password('x')
+            db.session.add_all([otro, Papeleria(id=9, nombre='Vacía', user_id=3)])
+            db.session.commit()
+            from ARCHIVOS.database import analytics_repository as analytics
+            with _solo_sql(app):
+                esperado = [analytics.get_mejor_mes_historico(3), analytics.get_dias_mas_productivos(3),
+                            analytics.get_margen_promedio(3), analytics.get_rentabilidad_por_tramite(3)]
+            assert [analytics.get_mejor_mes_historico(3), analytics.get_dias_mas_productivos(3),
+                    analytics.get_margen_promedio(3), analytics.get_rentabilidad_por_tramite(3)] == esperado
+
+    def test_en_memoria_no_consulta_sqlite(self, app, columnas):
+        with app.app_context():
+            from ARCHIVOS.database import analytics_repository as analytics
+            analytics.get_historico(1)
+            with query_stats.collect() as stats:
+                historico = analytics.get_historico(1)
+                analytics.get_rentabilidad_por_tramite(1)
+            assert stats.count == 0
+            assert historico['snapshot']['origen'] == 'memoria'
+            # Una fecha inválida no llega a NumPy: la consulta SQL decide
+            from ARCHIVOS.database import tramite_repository
+            assert tramite_repository.get_tramites_distribution(1, fecha_inicio='ayer', fecha_fin='hoy') == []
+
+
+class TestInvalidacion:
+
+    def test_version_de_datos(self, app, columnas):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository, papeleria_repository
+            cargadas = column_store.columns(1)
+            assert column_store.columns(1) is cargadas
+            utils.bump_user_data_version(1, 'gastos')
+            assert column_store.columns(1) is cargadas
+
+            tramite_repository.add_bulk(4, 'NUEVO', 1, HOY.isoformat(), 100000.0, 0.0, 1)
+            utils.bump_user_data_version(1, 'tramites')
+            assert column_store.columns(1) is not cargadas
+            assert 'NUEVO' in [d['tramite_label'] for d in tramite_repository.get_tramites_distribution(1, limit=50)]
+            assert papeleria_repository.get_top_by_ganancia(1)[0]['nombre'] == 'Sin trámites'
+
+    def test_lru_acotado_por_bytes(self, app, columnas):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            db.session.add(Papeleria(id=5, nombre='Del admin', user_id=2))
+            db.session.commit()
+            tramite_repository.add_bulk(5, 'ACTA', 2, HOY.isoformat(), 30.0, 10.0, 1)
+
+            tamano = column_store.columns(1).nbytes
+            app.config['COLUMN_STORE_MAX_BYTES'] = tamano
+            try:
+                column_store.columns(2)
+                assert column_store.stats()['usuarios'] == 1 and column_store.stats()['bytes'] < tamano
+                # El usuario 1 fue expulsado: se vuelve a cargar
+                with query_stats.collect() as stats:
+                    column_store.columns(1)
+                assert stats.count == 2
+                # Uno que no cabe se calcula pero no se guarda
+                app.config['COLUMN_STORE_MAX_BYTES'] = 10
+                utils.bump_user_data_version(1, 'tramites')
+                assert column_store.columns(1) is not None
+                assert column_store.stats() == {'usuarios': 0, 'bytes': 0}
+            finally:
+                app.config['COLUMN_STORE_MAX_BYTES'] = column_store.DEFAULTS['COLUMN_STORE_MAX_BYTES']
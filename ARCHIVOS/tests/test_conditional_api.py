@@ -0,0 +1,84 @@
+"""
+Tests para el GET condicional (ETag/304) de las APIs JSON del dashboard.
+"""
+from datetime import date
+
+import pytest
+
+from ARCHIVOS import query_stats, utils
+
+ENDPOINTS = [
+    '/api/dashboard-totals',
+    '/api/dashboard-charts',
+    '/api/analytics-avanzado',
+    '/api/papeleria-charts/1',
+    '/api/gastos-summary',
+]
+
+
+@pytest.fixture
+def condicional(app, init_database, real_cache, monkeypatch):
+    """Caché en memoria real y un trámite de hoy."""
+    # Las escrituras de estos tests no pasan por la sesión: sin valores anteriores
+    monkeypatch.setitem(app.config, 'SINGLE_FLIGHT_STALE_MAX_AGE', 0)
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository
+        tramite_repository.add_bulk(1, 'ACTA', 1, date.today().isoformat(), 30.0, 10.0, 1)
+    return real_cache
+
+
+class TestGetCondicional:
+
+    @pytest.mark.parametrize('url', ENDPOINTS)
+    def test_304_sin_consultar_datos(self, client, condicional, url, login, sql_de_datos):
+        login(client, 1)
+        primera = client.get(url)
+        assert primera.status_code == 200 and primera.headers['Cache-Control'] == 'private, no-cache'
+        etag = primera.headers['ETag']
+        assert etag.strip('"').startswith('api-')
+
+        with query_stats.collect() as stats:
+            revalidada = client.get(url, headers={'If-None-Match': etag})
+        assert revalidada.status_code == 304 and not revalidada.data
+        assert revalidada.headers['ETag'] == etag
+        # La verificación de dueño de la papelería no es una consulta de datos
+        assert not sql_de_datos(stats, ignorar=('papelerias',))
+
+    def test_etag_por_argumentos_y_dominios(self, app, client, condicional, login):
+        login(client, 1)
+        url = '/api/dashboard-totals'
+        etag = client.get(url).headers['ETag']
+        assert client.get(url + '?fecha_inicio=2024-01-01').headers['ETag'] != etag
+
+        # Proveedores y precios no los lee el dashboard
+        with app.app_context():
+            utils.bump_user_data_version(1, 'proveedores', 'precios')
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            tramite_repository.add_bulk(1, 'NUEVO TRÁMITE', 1, date.today().isoformat(), 500.0, 10.0, 1)
+            utils.bump_user_data_version(1, 'tramites')
+        nueva = client.get(url, headers={'If-None-Match': etag})
+        assert nueva.status_code == 200 and nueva.headers['ETag'] != etag
+        assert nueva.get_json()['ganancia'] == 510.0
+
+        # El resumen de gastos no depende de los trámites
+        gastos = client.get('/api/gastos-summary').headers['ETag']
+        with app.app_context():
+            utils.bump_user_data_version(1, 'tramites')
+        assert client.get('/api/gastos-summary', headers={'If-None-Match': gastos}).status_code == 304
+
+    def test_ver_como_otro_usuario_no_revalida(self, client, condicional, login):
+        login(client, 2)
+        with client.session_transaction() as sess:
+            sess['viewing_user_id'] = 1
+        etag = client.get('/api/papeleria-charts/1').headers['ETag']
+        with client.session_transaction() as sess:
+            sess['viewing_user_id'] = 2
+        assert client.get('/api/papeleria-charts/1', headers={'If-None-Match': etag}).status_code == 200
+
+    def test_sin_cache_no_hay_etag(self, client, init_database, login):
+        login(client, 1)
+        response = client.get('/api/dashboard-totals')
+        assert response.status_code == 200 and 'ETag' not in response.headers
@@ -0,0 +1,89 @@
+"""
+Tests para las exportaciones CSV en streaming (general y por papelería).
+"""
+import csv
+import gzip
+import io
+from datetime import date, timedelta
+
+import pytest
+
+from ARCHIVOS import csv_export
+
+
+@pytest.fixture
+def datos_export(app, init_database):
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository
+        from ARCHIVOS.models import db, Papeleria
+        db.session.add(Papeleria(id=2, nombre='Cerrada', user_id=1, is_active=False))
+        db.session.commit()
+        hoy = date.today()
+        tramite_repository.add_many(1, [
+            {'papeleria_id': 1 if i % 5 else 2, 'tramite': f'TRÁMITE {i % 3}', 'fecha': hoy - timedelta(days=i),
+             'precio': 50.0, 'costo': 20.0, 'cantidad': 1 + i % 2}
+            for i in range(1200)
+        ])
+        yield hoy
+
+
+@pytest.fixture
+def admin_client(client, login):
+    login(client, 2, viewing=1)
+    yield client
+    with client.session_transaction() as sess:
+        sess.pop('viewing_user_id', None)
+
+
+def _leer_csv(contenido):
+    return list(csv.reader(io.StringIO(contenido.decode('utf-8'))))
+
+
+class TestCsvChunks:
+
+    def test_trozos_acotados(self):
+        filas = ([i, f'fila {i}'] for i in range(csv_export.CHUNK_ROWS * 3 + 7))
+        trozos = list(csv_export.csv_chunks(['n', 'texto'], filas))
+        assert len(trozos) == 4
+        assert _leer_csv(b''.join(trozos))[-1] == [str(csv_export.CHUNK_ROWS * 3 + 6), f'fila {csv_export.CHUNK_ROWS * 3 + 6}']
+
+    def test_gzip_al_vuelo(self):
+        trozos = csv_export.csv_chunks(['a'], ([i] for i in range(2000)))
+        comprimido = b''.join(csv_export.gzip_chunks(trozos))
+        assert _leer_csv(gzip.decompress(comprimido))[1:3] == [['0'], ['1']]
+
+
+class TestExportaciones:
+
+    def test_general_en_streaming(self, admin_client, datos_export):
+        response = admin_client.get('/exportar-csv/general')
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == 'text/csv'
+        filas = _leer_csv(response.get_data())
+        assert filas[0] == ['Papelería', 'Trámite', 'Fecha', 'Cantidad', 'Precio', 'Costo', 'Ganancia']
+        assert len(filas) == 1201  # incluye la papelería inactiva
+        assert filas[1][2] == datos_export.isoformat()
+
+    def test_general_con_rango_y_gzip(self, admin_client, datos_export):
+        inicio = (datos_export - timedelta(days=9)).isoformat()
+        response = admin_client.get(f'/exportar-csv/general?fecha_inicio={inicio}&fecha_fin={datos_export}&gzip=1')
+        assert response.mimetype == 'application/gzip'
+        assert '.csv.gz' in response.headers['Content-Disposition']
+        filas = _leer_csv(gzip.decompress(response.get_data()))
+        assert len(filas) == 11
+        assert all(inicio <= f[2] <= datos_export.isoformat() for f in filas[1:])
+
+    def test_papeleria(self, admin_client, datos_export):
+        response = admin_client.get('/exportar-csv/papeleria/1')
+        filas = _leer_csv(response.get_data())
+        assert filas[0] == ['Trámite', 'Fecha', 'Cantidad', 'Precio', 'Costo', 'Ganancia']
+        assert len(filas) == 961
+        assert filas[1] == ['TRÁMITE 1', (datos_export - timedelta(days=1)).isoformat(), '2', '50.0', '20.0', '60.0']
+
+    def test_repositorio_lee_por_lotes(self, app, datos_export):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            filas = tramite_repository.export_all_as_csv(1, batch_size=100)
+            assert filas.get_execution_options()['yield_per'] == 100
+            assert sum(1 for _ in filas) == 1200
@@ -0,0 +1,113 @@
+"""
+Tests para DashboardSnapshot: mismas cifras que los métodos de los repositorios,
+con unas pocas consultas acotadas en lugar de una por métrica.
+"""
+from datetime import date, timedelta
+
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from ARCHIVOS.models import db, Papeleria
+from ARCHIVOS.dashboard_snapshot import DashboardSnapshot, _por_dia
+from ARCHIVOS import query_stats
+
+
+@pytest.fixture
+def datos_dashboard(app, init_database):
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository, gasto_repository, proveedor_repository
+        db.session.add(Papeleria(id=2, nombre='Segunda', user_id=1))
+        db.session.add(Papeleria(id=3, nombre='Cerrada', user_id=1, is_active=False))
+        db.session.commit()
+
+        hoy = date.today()
+        filas = []
+        for i in range(90):
+            filas.append({'papeleria_id': (1, 2, 3)[i % 3], 'tramite': f'TRAMITE {i % 4}',
+                          'fecha': hoy - timedelta(days=i * 3 + i % 2), 'precio': 40.0 + i * 1.5,
+                          'costo': 10.0 + i % 5, 'cantidad': 1 + i % 3})
+        filas.append({'papeleria_id': 2, 'tramite': 'RFC', 'fecha': hoy - timedelta(days=1),
+                      'precio': 80.0, 'costo': 30.0, 'cantidad': 2})
+        tramite_repository.add_many(1, filas)
+
+        proveedor = proveedor_repository.add('Proveedor Dashboard', 1)
+        for i in range(10):
+            gasto_repository.add(proveedor.id, f'Gasto {i}', 75.0 + i,
+                                 (hoy - timedelta(days=i * 9)).strftime('%Y-%m-%d'), 'RENTA', 1)
+        yield
+
+
+def _legacy_context(user_id, search_term=None):
+    """Las llamadas que hacía `_get_dashboard_context` antes del snapshot."""
+    from ARCHIVOS.database import papeleria_repository, tramite_repository, gasto_repository, analytics_repository
+    dashboard_data = papeleria_repository.get_papelerias_and_totals_for_user(user_id, search_term)
+    tramites_comparativa = tramite_repository.get_tramites_comparativa(user_id)
+    return {
+        'papelerias': dashboard_data['papelerias'],
+        'totales': dashboard_data['totales'],
+        'totales_comparativa': papeleria_repository.get_totales_comparativa(user_id),
+        'tramites_de_hoy': tramites_comparativa['hoy'],
+        'tramites_comparativa': tramites_comparativa,
+        'meta_progress': analytics_repository.get_meta_mensual_progress(user_id),
+        'mejor_mes': analytics_repository.get_mejor_mes_historico(user_id),
+        'dia_productivo': analytics_repository.get_dias_mas_productivos(user_id),
+        'margen_promedio': analytics_repository.get_margen_promedio(user_id),
+        'rentabilidad_tramites': analytics_repository.get_rentabilidad_por_tramite(user_id)[:5],
+        'num_papelerias': len(dashboard_data['papelerias']),
+        'total_gastos_operativos': gasto_repository.get_total_gastos(user_id),
+        'search_term': search_term,
+    }
+
+
+def _normalizar(valor):
+    """Convierte filas/resúmenes a dicts y redondea flotantes para comparar ambos caminos."""
+    if isinstance(valor, float):
+        return round(valor, 6)
+    if isinstance(valor, dict):
+        return {k: _normalizar(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_normalizar(v) for v in valor]
+    if hasattr(valor, 'nombre'):
+        keys = ('id', 'nombre', 'cuantos', 'total_ingresos', 'total_costos', 'ganancia_total')
+        return {k: _normalizar(float(getattr(valor, k)) if k.startswith(('total', 'ganancia')) else getattr(valor, k))
+                for k in keys}
+    return valor
+
+
+class TestDashboardSnapshot:
+
+    @pytest.mark.parametrize('search_term', [None, 'Seg'])
+    def test_coincide_con_los_repositorios(self, app, datos_dashboard, search_term):
+        with app.app_context():
+            esperado = _legacy_context(1, search_term)
+            obtenido = DashboardSnapshot.for_user(1, search_term).as_context()
+            assert _normalizar(obtenido) == _normalizar(esperado)
+
+    def test_pocas_consultas_acotadas(self, app, datos_dashboard):
+        with app.app_context():
+            with query_stats.collect() as legacy:
+                _legacy_context(1)
+            with query_stats.collect() as snapshot:
+                DashboardSnapshot.for_user(1)
+            # Dos consultas propias más las dos de get_historico (snapshot + delta)
+            assert snapshot.count == 4
+            assert legacy.count > snapshot.count
+
+            # Los totales por día solo cubren los meses que muestra la página
+            desde = date.today().replace(day=1) - relativedelta(months=1)
+            dias = _por_dia(1, date.today(), desde)[0]
+            assert dias and min(d.fecha for d in dias) >= desde
+
+    def test_usuario_sin_datos(self, app, init_database):
+        with app.app_context():
+            snapshot = DashboardSnapshot.for_user(2)
+            assert snapshot.papelerias == []
+            assert snapshot.tramites_de_hoy == 0
+            assert snapshot.mejor_mes is None and snapshot.dia_productivo is None
+            assert snapshot.total_gastos_operativos == 0
+
+    def test_index_renderiza_con_snapshot(self, client, app, datos_dashboard, login):
+        login(client, 1)
+        response = client.get('/')
+        assert response.status_code == 200
+        assert 'Segunda' in response.get_data(as_text=True)
@@ -0,0 +1,119 @@
+"""
+Tests para las versiones de datos por dominio (contadores monótonos por usuario y dominio) que invalidan la caché.
+"""
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from ARCHIVOS import single_flight, utils
+
+
+@pytest.fixture
+def cache(app, real_cache):
+    """Caché en memoria real, con el contexto de la app activo."""
+    with app.app_context():
+        yield real_cache
+
+
+class TestVersiones:
+
+    def test_solo_cambian_los_dominios_escritos(self, cache):
+        dashboard = utils.get_user_data_version(1, 'tramites', 'gastos', 'papelerias')
+        utils.bump_user_data_version(1, 'proveedores')
+        utils.bump_user_data_version(2, 'tramites')
+        assert utils.get_user_data_version(1, 'tramites', 'gastos', 'papelerias') == dashboard
+
+        utils.bump_user_data_version(1, 'gastos')
+        assert utils.get_user_data_version(1, 'tramites', 'gastos', 'papelerias') != dashboard
+        with pytest.raises(ValueError):
+            utils.bump_user_data_version(1, 'clientes')
+
+    def test_monotonas_en_el_mismo_segundo(self, cache):
+        vistas = []
+        for _ in range(50):
+            utils.bump_user_data_version(1, 'tramites')
+            vistas.append(int(utils.get_user_data_version(1, 'tramites').split('-')[1]))
+        assert vistas == sorted(set(vistas))
+
+        # Si el contador se pierde, reinicia por encima del último valor
+        cache.delete('data_ver:1:tramites')
+        assert int(utils.get_user_data_version(1, 'tramites').split('-')[1]) > vistas[-1]
+
+    def test_sin_cache_no_hay_version(self, app):
+        with app.app_context():
+            assert utils.get_user_data_version(1) is None
+            utils.bump_user_data_version(1)
+
+
+class TestEscriturasConcurrentes:
+
+    def test_ninguna_lectura_obsoleta(self, tmp_path, login):
+        """
+        Varios hilos registran trámites y enseguida leen los totales del dashboard (con caché):
+        cada lectura debe incluir al menos las escrituras cuya versión ya se incrementó.
+        (Una escritura confirmada pero aún sin incrementar su versión puede faltar.)
+        """
+        from ARCHIVOS.app import create_app
+        from ARCHIVOS.models import db, User, Papeleria
+        from ARCHIVOS.database import tramite_repository
+
+        class ConcurrentConfig:
+            TESTING = True
+            SECRET_KEY = 'test'
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'versiones.db'}"
+            DATABASE_PATH = str(tmp_path / 'versiones.db')
+            RATELIMIT_ENABLED = False
+            CACHE_TYPE = 'SimpleCache'
+
+            @staticmethod
+            def init_app(app):
+                pass
+
+        app = create_app(config_class=ConcurrentConfig)
+        with app.app_context():
+            db.create_all()
+            user = User(id=1, username='concurrente', role='employee')
+            user.set_password('x')
+            db.session.add_all([user, Papeleria(id=1, nombre='Concurrente', user_id=1)])
+            db.session.commit()
+
+        hoy = date.today().isoformat()
+        errores = []
+        confirmadas = [0]
+        confirmadas_lock = threading.Lock()
+
+        def escritor():
+            client = app.test_client()
+            login(client, 1)
+            try:
+                for _ in range(15):
+                    with app.app_context():
+                        tramite_repository.add_bulk(1, 'ACTA', 1, hoy, 30.0, 10.0, 1)
+                        utils.bump_user_data_version(1, 'tramites')
+                        db.session.remove()
+                    with confirmadas_lock:
+                        confirmadas[0] += 1
+                        minimo = confirmadas[0] * 20.0
+                    # Como la ruta que escribe: la sesión del escritor queda marcada (sin valores anteriores)
+                    with client.session_transaction() as sess:
+                        sess[single_flight.SESION_ESCRITURA] = time.time()
+                    leido = client.get('/api/dashboard-totals').get_json()['ganancia']
+                    if leido < minimo:
+                        errores.append((minimo, leido))
+            except Exception as e:  # pragma: no cover - se reporta abajo
+                errores.append(e)
+
+        hilos = [threading.Thread(target=escritor) for _ in range(4)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        with app.app_context():
+            final = app.test_client()
+            login(final, 1)
+            assert final.get('/api/dashboard-totals').get_json()['ganancia'] == 4 * 15 * 20.0
+            db.engine.dispose()
+        assert not errores, errores
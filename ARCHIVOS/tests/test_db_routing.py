@@ -0,0 +1,177 @@
+"""
+Tests para la separación lectura/escritura: enrutado de los métodos marcados al engine de solo
+lectura y lecturas largas que no bloquean escrituras en modo WAL (BD en archivo).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from ARCHIVOS import db_routing
+from ARCHIVOS.app import create_app
+from ARCHIVOS.models import db, User, Papeleria, Tramite
+from .conftest import TestConfig
+
+HOY = date.today().isoformat()
+
+
+@pytest.fixture(scope='module')
+def wal_app(tmp_path_factory):
+    """App sobre un archivo SQLite en WAL; busy_timeout corto para que un bloqueo falle enseguida."""
+    ruta = tmp_path_factory.mktemp('routing') / 'routing.db'
+
+    class WalConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{ruta}'
+        SQLITE_BUSY_TIMEOUT = 200
+
+    app = create_app(config_class=WalConfig)
+    with app.app_context():
+        db.create_all()
+        usuario = User(id=1, username='lector', role='employee')
+        usuario.set_password('x')
+        db.session.add_all([usuario, Papeleria(id=1, nombre='Centro', user_id=1)])
+        db.session.commit()
+        from ARCHIVOS.database import tramite_repository
+        tramite_repository.add_many(1, [{'papeleria_id': 1, 'tramite': 'ACTA', 'fecha': HOY,
+                                         'precio': 30.0, 'costo': 10.0, 'cantidad': 1} for _ in range(50)])
+        yield app
+        db.session.remove()
+        db_routing.read_engine().dispose()
+        db.engine.dispose()
+
+
+@contextmanager
+def _sentencias_de_lectura():
+    """Sentencias que ejecuta el engine de solo lectura dentro del bloque."""
+    sentencias = []
+
+    def _registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    engine = db_routing.read_engine()
+    event.listen(engine, 'before_cursor_execute', _registrar)
+    try:
+        yield sentencias
+    finally:
+        event.remove(engine, 'before_cursor_execute', _registrar)
+
+
+class TestEnrutado:
+
+    def test_lecturas_marcadas_van_al_engine_de_solo_lectura(self, wal_app):
+        with wal_app.app_context():
+            from ARCHIVOS.database import analytics_repository, papeleria_repository, tramite_repository
+            with _sentencias_de_lectura() as sentencias:
+                assert papeleria_repository.get_top_by_ganancia(1)[0]['ganancia_total'] == 1000.0
+                assert len(tramite_repository.get_all_tramites(1, search_term='ACTA')) == 50
+                assert analytics_repository.get_margen_promedio(1) > 0
+            assert len(sentencias) >= 3
+
+            # Las exportaciones devuelven la consulta sin ejecutar: se enruta al iterarla
+            with _sentencias_de_lectura() as sentencias:
+                assert len(list(tramite_repository.export_all_as_csv(1))) == 50
+            assert len(sentencias) == 1
+
+            # Los métodos sin marcar y las escrituras usan el primario
+            with _sentencias_de_lectura() as sentencias:
+                tramite_repository.get_total_general(1)
+                tramite_repository.add_bulk(1, 'ACTA', 1, HOY, 30.0, 10.0, 1)
+                db.session.query(Tramite).filter_by(tramite='ACTA', user_id=1).order_by(Tramite.id.desc()).first()
+            assert sentencias == []
+            tramite_repository.delete(Tramite.query.order_by(Tramite.id.desc()).first().id, 1)
+
+    def test_escrituras_pendientes_se_leen_del_primario(self, wal_app):
+        with wal_app.app_context():
+            from ARCHIVOS.database import papeleria_repository
+            db.session.add(Papeleria(id=2, nombre='Sin confirmar', user_id=1))
+            db.session.flush()
+            with _sentencias_de_lectura() as sentencias:
+                nombres = [p['nombre'] for p in papeleria_repository.get_all_papelerias(1)]
+            assert 'Sin confirmar' in nombres and sentencias == []
+            db.session.rollback()
+
+            # Tras cerrar la transacción vuelve al engine de lectura
+            with _sentencias_de_lectura() as sentencias:
+                nombres = [p['nombre'] for p in papeleria_repository.get_all_papelerias(1)]
+            assert nombres == ['Centro'] and sentencias
+
+    def test_writes_fuerza_el_primario(self, wal_app):
+        with wal_app.app_context():
+            from ARCHIVOS.database import analytics_repository
+            with db_routing.reading():
+                assert db.session.get_bind() is db_routing.read_engine()
+                # refresh_snapshot (@writes) lee y escribe: en el engine de lectura fallaría
+                assert analytics_repository.refresh_snapshot(1) == 0
+
+    def test_engine_de_lectura_rechaza_escrituras(self, wal_app):
+        with wal_app.app_context():
+            with db_routing.read_engine().connect() as conn:
+                assert conn.exec_driver_sql('PRAGMA query_only').scalar() == 1
+                with pytest.raises(OperationalError, match='readonly'):
+                    conn.exec_driver_sql("DELETE FROM tramites")
+
+    def test_bd_en_memoria_usa_un_solo_engine(self, app):
+        with app.app_context():
+            assert db_routing.read_engine() is None
+            with db_routing.reading():
+                assert db.session.get_bind() is db.engine
+
+
+class TestWal:
+
+    def _escribir(self, veces):
+        """Registra `veces` trámites por el primario; retorna la escritura más lenta (s)."""
+        from ARCHIVOS.database import tramite_repository
+        lenta = 0.0
+        for _ in range(veces):
+            inicio = time.perf_counter()
+            tramite_repository.add_bulk(1, 'COPIA', 1, HOY, 5.0, 1.0, 1)
+            lenta = max(lenta, time.perf_counter() - inicio)
+        return lenta
+
+    def test_transaccion_de_lectura_abierta_no_bloquea_escrituras(self, wal_app):
+        with wal_app.app_context():
+            antes = Tramite.query.filter_by(user_id=1).count()
+            with db_routing.read_engine().connect() as lector:
+                lector.exec_driver_sql('BEGIN')
+                assert lector.exec_driver_sql('SELECT count(*) FROM tramites').scalar() == antes
+
+                # Con busy_timeout=200ms un bloqueo haría fallar add_bulk
+                assert self._escribir(20) < 0.2
+                # El lector conserva su instantánea mientras su transacción siga abierta
+                assert lector.exec_driver_sql('SELECT count(*) FROM tramites').scalar() == antes
+                lector.exec_driver_sql('COMMIT')
+                assert lector.exec_driver_sql('SELECT count(*) FROM tramites').scalar() == antes + 20
+
+    def test_export_en_curso_en_otro_hilo_no_bloquea_escrituras(self, wal_app):
+        leidas = []
+        empezo, seguir = threading.Event(), threading.Event()
+
+        def exportar():
+            with wal_app.app_context():
+                from ARCHIVOS.database import tramite_repository
+                for fila in tramite_repository.export_all_as_csv(1, batch_size=5):
+                    leidas.append(fila)
+                    if len(leidas) == 1:
+                        empezo.set()
+                        seguir.wait(10)
+                db.session.remove()
+
+        with wal_app.app_context():
+            antes = Tramite.query.filter_by(user_id=1).count()
+            hilo = threading.Thread(target=exportar)
+            hilo.start()
+            assert empezo.wait(10)
+            try:
+                # El export tiene su cursor abierto en el engine de lectura mientras se escribe
+                assert self._escribir(20) < 0.2
+                assert Tramite.query.filter_by(user_id=1).count() == antes + 20
+            finally:
+                seguir.set()
+                hilo.join(10)
+            # El export ve una instantánea coherente: las filas que existían al empezar
+            assert len(leidas) == antes
@@ -0,0 +1,159 @@
+"""
+Tests para las exportaciones en segundo plano (trabajos, progreso, endpoints /api/exports y proceso hijo).
+"""
+import csv
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from ARCHIVOS import export_jobs
+
+
+@pytest.fixture
+def exportaciones(app, init_database, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'EXPORT_JOBS_EXECUTOR', 'inline')
+    monkeypatch.setitem(app.config, 'EXPORT_JOBS_DIR', tmp_path / 'exportaciones')
+    monkeypatch.setitem(app.config, 'PDF_CACHE_DIR', tmp_path / 'reportes')
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository
+        from ARCHIVOS.models import db, ExportJob
+        db.session.query(ExportJob).delete()
+        db.session.commit()
+        hoy = date.today()
+        tramite_repository.add_many(1, [
+            {'papeleria_id': 1, 'tramite': f'TRÁMITE {i % 3}', 'fecha': hoy - timedelta(days=i // 4),
+             'precio': 30.0, 'costo': 10.0, 'cantidad': 1 + i % 2}
+            for i in range(120)
+        ])
+    return tmp_path
+
+
+class TestExportJobs:
+
+    def test_csv_con_progreso(self, app, exportaciones, monkeypatch):
+        from ARCHIVOS.database import export_job_repository
+        progreso = []
+        update = export_job_repository.update
+        monkeypatch.setattr(export_jobs, 'PROGRESO_CADA', 25)
+        monkeypatch.setattr(export_job_repository, 'update',
+                            lambda job_id, **values: (progreso.append(values.get('progreso')), update(job_id, **values)))
+        with app.app_context():
+            job = export_jobs.submit(1, 'csv', papeleria_id=1)
+            assert job.estado == 'completado' and job.progreso == 100
+            assert job.nombre_archivo.startswith('reporte_papeleria_1_')
+            with open(job.archivo, newline='', encoding='utf-8') as f:
+                filas = list(csv.reader(f))
+        assert len(filas) == 121
+        assert [p for p in progreso if p not in (0, 100)] == [21, 41, 62, 83]  # por unidades (180 en total)
+
+    def test_pdf_reutiliza_la_cache(self, app, exportaciones, monkeypatch):
+        with app.app_context():
+            primero = export_jobs.submit(1, 'pdf', papeleria_id=1)
+            assert primero.estado == 'completado'
+            monkeypatch.setattr(export_jobs, 'run_job', lambda job_id: pytest.fail('no debía regenerarse'))
+            segundo = export_jobs.submit(1, 'pdf', papeleria_id=1)
+            assert segundo.estado == 'completado' and segundo.archivo == primero.archivo
+
+    def test_peticiones_invalidas(self, app, exportaciones):
+        with app.app_context():
+            for kwargs in ({'tipo': 'xlsx'}, {'tipo': 'pdf'}, {'tipo': 'pdf', 'papeleria_id': 99},
+                           {'tipo': 'pdf', 'papeleria_id': 1, 'fecha_inicio': '2001-01-01', 'fecha_fin': '2001-01-31'}):
+                with pytest.raises(export_jobs.ExportError):
+                    export_jobs.submit(1, **kwargs)
+
+    def test_trabajos_colgados_y_purga(self, app, exportaciones):
+        with app.app_context():
+            from ARCHIVOS.database import export_job_repository
+            colgado = export_job_repository.create(1, 'csv', {})
+            export_job_repository.update(colgado.id, estado='en_proceso', actualizado=datetime.now() - timedelta(hours=1))
+            assert export_jobs.mark_stale(1) == 1
+            assert export_job_repository.get(colgado.id).estado == 'error'
+
+            viejo = export_jobs.submit(1, 'csv')
+            export_job_repository.update(viejo.id, creado=datetime.now() - timedelta(days=2))
+            export_jobs.purge(24 * 3600)
+            assert export_job_repository.get(viejo.id) is None
+            assert not list((exportaciones / 'exportaciones').glob(f'{viejo.id}*'))
+
+
+class TestExportEndpoints:
+
+    def test_flujo_json(self, client, exportaciones, login):
+        login(client, 2, viewing=1)
+        response = client.post('/api/exports', json={'tipo': 'csv', 'gzip': '1'})
+        assert response.status_code == 202
+        job = response.get_json()
+        assert job['estado'] == 'completado' and job['nombre_archivo'].endswith('.csv.gz')
+
+        estado = client.get(job['status_url']).get_json()
+        assert estado['progreso'] == 100
+        descarga = client.get(job['download_url'])
+        assert descarga.status_code == 200 and descarga.data[:2] == b'\x1f\x8b'
+        assert [j['id'] for j in client.get('/api/exports').get_json()] == [job['id']]
+
+    def test_permisos_y_estados(self, app, client, exportaciones, login):
+        login(client, 1)
+        assert client.post('/api/exports', data={'tipo': 'csv'}).status_code == 403
+        assert client.post('/api/exports', data={'tipo': 'pdf', 'papeleria_id': '1', 'fecha_inicio': '2001-01-01',
+                                                 'fecha_fin': '2001-01-31'}).status_code == 400
+        with app.app_context():
+            from ARCHIVOS.database import export_job_repository
+            pendiente = export_job_repository.create(1, 'pdf', {}).id
+            ajeno = export_job_repository.create(2, 'pdf', {}).id
+        assert client.get(f'/api/exports/{ajeno}').status_code == 404
+        assert client.get(f'/api/exports/{pendiente}/download').status_code == 409
+
+        widget = client.get(f'/api/exports/{pendiente}', headers={'HX-Request': 'true'}).get_data(as_text=True)
+        assert 'hx-trigger="every 1s"' in widget and 'En cola' in widget
+
+    def test_widget_htmx(self, client, exportaciones, login):
+        login(client, 1)
+        html = client.post('/api/exports', data={'tipo': 'pdf', 'papeleria_id': '1'},
+                           headers={'HX-Request': 'true'}).get_data(as_text=True)
+        assert 'Descargar' in html and 'every 1s' not in html
+        assert 'id="export-jobs"' in client.get('/papeleria/1').get_data(as_text=True)
+
+
+class TestProcesoHijo:
+
+    def test_exportacion_en_proceso_separado(self, tmp_path):
+        from ARCHIVOS.app import create_app
+        from ARCHIVOS.models import db, User, Papeleria
+        from ARCHIVOS.database import tramite_repository, export_job_repository
+
+        class ProcessConfig:
+            TESTING = True
+            SECRET_KEY = 'test'
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'export.db'}"
+            DATABASE_PATH = str(tmp_path / 'export.db')
+            RATELIMIT_ENABLED = False
+            EXPORT_JOBS_DIR = tmp_path / 'exportaciones'
+
+            @staticmethod
+            def init_app(app):
+                pass
+
+        app = create_app(config_class=ProcessConfig)
+        with app.app_context():
+            db.create_all()
+            user = User(id=1, username='hijo', role='admin')
+            user.set_password('x')
+            db.session.add_all([user, Papeleria(id=1, nombre='Proceso', user_id=1)])
+            db.session.commit()
+            tramite_repository.add_bulk(1, 'ACTA', 1, date.today(), 50.0, 10.0, 3)
+
+            job = export_jobs.submit(1, 'csv')
+            limite = time.time() + 60
+            while time.time() < limite:
+                db.session.expire_all()
+                job = export_job_repository.get(job.id)
+                if job.estado in ('completado', 'error'):
+                    break
+                time.sleep(0.2)
+            assert job.estado == 'completado', job.error
+            with open(job.archivo, encoding='utf-8') as f:
+                assert 'ACTA' in f.read()
+            db.engine.dispose()
+        export_jobs._executor.shutdown()
+        export_jobs._executor = None
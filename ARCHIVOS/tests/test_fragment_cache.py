@@ -0,0 +1,106 @@
+"""
+Tests para la caché de fragmentos HTMX (clave por plantilla, usuario, versiones de datos y argumentos; ETag/304).
+"""
+from datetime import date
+
+import pytest
+
+from ARCHIVOS import query_stats, utils
+from ARCHIVOS.dashboard_snapshot import DashboardSnapshot
+
+DASHBOARD = {'HX-Request': 'true', 'HX-Target': 'dashboard-container'}
+
+
+@pytest.fixture
+def fragmentos(app, init_database, real_cache):
+    """Caché en memoria real y un trámite de hoy."""
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository
+        tramite_repository.add_bulk(1, 'ACTA', 1, date.today().isoformat(), 30.0, 10.0, 1)
+    return real_cache
+
+
+class TestDashboard:
+
+    def test_etag_304_y_cache(self, app, client, fragmentos, monkeypatch, login, sql_de_datos):
+        login(client, 1)
+        primera = client.get('/', headers=DASHBOARD)
+        assert primera.status_code == 200 and primera.headers['Cache-Control'] == 'private, no-cache'
+        assert 'HX-Target' in primera.headers['Vary']
+        etag = primera.headers['ETag']
+
+        # Mismo fragmento: 304 sin consultar datos ni renderizar
+        monkeypatch.setattr(DashboardSnapshot, 'for_user', lambda *a, **k: pytest.fail('no debía recalcularse'))
+        with query_stats.collect() as stats:
+            revalidada = client.get('/', headers={**DASHBOARD, 'If-None-Match': etag})
+        assert revalidada.status_code == 304 and not revalidada.data
+        assert not sql_de_datos(stats)
+
+        # Sin If-None-Match: el HTML sale de la caché
+        assert client.get('/', headers=DASHBOARD).data == primera.data
+
+    def test_solo_invalidan_los_dominios_leidos(self, app, client, fragmentos, login):
+        login(client, 1)
+        etag = client.get('/', headers=DASHBOARD).headers['ETag']
+        with app.app_context():
+            utils.bump_user_data_version(1, 'proveedores')
+            utils.bump_user_data_version(1, 'precios')
+        assert client.get('/', headers={**DASHBOARD, 'If-None-Match': etag}).status_code == 304
+
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            tramite_repository.add_bulk(1, 'NUEVO TRÁMITE', 1, date.today().isoformat(), 500.0, 10.0, 1)
+            utils.bump_user_data_version(1, 'tramites')
+        nueva = client.get('/', headers={**DASHBOARD, 'If-None-Match': etag})
+        assert nueva.status_code == 200 and nueva.headers['ETag'] != etag
+
+    def test_lista_de_papelerias_por_busqueda(self, client, fragmentos, login):
+        login(client, 1)
+        todas = client.get('/_papeleria_list_partial', headers={'HX-Request': 'true'})
+        ninguna = client.get('/_papeleria_list_partial?q=zzz', headers={'HX-Request': 'true'})
+        assert 'Test Papeleria' in todas.get_data(as_text=True)
+        assert 'Test Papeleria' not in ninguna.get_data(as_text=True)
+        assert todas.headers['ETag'] != ninguna.headers['ETag']
+        assert client.get('/', headers={'HX-Request': 'true'}).status_code == 200
+
+    def test_admin_viendo_como_usuario(self, client, fragmentos, login):
+        login(client, 2, viewing=1)
+        admin = client.get('/', headers=DASHBOARD)
+        assert admin.status_code == 200
+        with client.session_transaction() as sess:
+            sess['viewing_user_id'] = 2
+        assert client.get('/', headers=DASHBOARD).headers['ETag'] != admin.headers['ETag']
+
+
+class TestOtrosFragmentos:
+
+    def test_opciones_de_papeleria(self, app, client, fragmentos, login):
+        login(client, 1)
+        opciones = client.get('/_tramite_form_papelerias', headers={'HX-Request': 'true'})
+        assert '<option value="1">Test Papeleria</option>' in opciones.get_data(as_text=True)
+        with app.app_context():
+            utils.bump_user_data_version(1, 'tramites')
+        assert client.get('/_tramite_form_papelerias',
+                          headers={'If-None-Match': opciones.headers['ETag']}).status_code == 304
+
+    def test_tabla_de_gastos_por_sesion(self, app, client, fragmentos, login):
+        login(client, 1, csrf='sesion-a')
+        tabla = client.get('/gastos?categoria=RENTA', headers={'HX-Request': 'true'})
+        assert tabla.status_code == 200 and 'ETag' in tabla.headers
+        assert client.get('/gastos', headers={'HX-Request': 'true'}).headers['ETag'] != tabla.headers['ETag']
+        with client.session_transaction() as sess:
+            sess['csrf_token'] = 'sesion-b'
+        otra_sesion = client.get('/gastos?categoria=RENTA', headers={'HX-Request': 'true'})
+        assert otra_sesion.headers['ETag'] != tabla.headers['ETag']
+
+        with app.app_context():
+            utils.bump_user_data_version(1, 'proveedores')
+        assert client.get('/gastos?categoria=RENTA', headers={
+            'HX-Request': 'true', 'If-None-Match': otra_sesion.headers['ETag']}).status_code == 200
+        # La página completa no se cachea
+        assert 'ETag' not in client.get('/gastos').headers
+
+    def test_sin_cache_renderiza_siempre(self, client, init_database, login):
+        login(client, 1)
+        response = client.get('/', headers=DASHBOARD)
+        assert response.status_code == 200 and 'ETag' not in response.headers
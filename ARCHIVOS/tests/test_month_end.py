@@ -0,0 +1,133 @@
+"""
+Tests para los estados de cuenta de fin de mes (una pasada por usuario, ZIP con índice, procesos y trabajo `estados`).
+"""
+import io
+import zipfile
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from ARCHIVOS import month_end
+
+
+@pytest.fixture
+def estados(app, init_database, monkeypatch, tmp_path):
+    """Usuario 1 con tres papelerías activas (una sin trámites en mayo) y una inactiva; usuario 2 con una."""
+    monkeypatch.setitem(app.config, 'EXPORT_JOBS_EXECUTOR', 'inline')
+    monkeypatch.setitem(app.config, 'EXPORT_JOBS_DIR', tmp_path / 'exportaciones')
+    monkeypatch.setitem(app.config, 'MONTH_END_DIR', tmp_path / 'estados')
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository
+        from ARCHIVOS.models import db, Papeleria, ExportJob
+        db.session.query(ExportJob).delete()
+        db.session.add_all([Papeleria(id=2, nombre='Segunda', user_id=1), Papeleria(id=3, nombre='Vacía', user_id=1),
+                            Papeleria(id=4, nombre='Cerrada', user_id=1, is_active=False),
+                            Papeleria(id=5, nombre='Ajena', user_id=2)])
+        db.session.commit()
+        for papeleria_id, user_id in ((1, 1), (2, 1), (4, 1), (5, 2)):
+            tramite_repository.add_many(user_id, [
+                {'papeleria_id': papeleria_id, 'tramite': f'TRÁMITE {i % 3}', 'fecha': date(2024, 5, 1 + i % 31),
+                 'precio': 10.0 * papeleria_id, 'costo': 1.0, 'cantidad': 1 + i % 2}
+                for i in range(40)
+            ])
+            # Fuera del mes: no debe aparecer
+            tramite_repository.add_bulk(papeleria_id, 'ABRIL', user_id, date(2024, 4, 30), 99.0, 1.0, 1)
+    return tmp_path
+
+
+def _contenido(zf):
+    return sorted(zf.namelist())
+
+
+class TestMonthEnd:
+
+    def test_rango_mes(self):
+        assert month_end.rango_mes(hoy=date(2024, 3, 15)) == ('2024-02', '2024-02-01', '2024-02-29')
+        assert month_end.rango_mes('2024-12') == ('2024-12', '2024-12-01', '2024-12-31')
+        with pytest.raises(ValueError):
+            month_end.rango_mes('2024-13')
+
+    def test_zip_de_un_usuario_en_una_pasada(self, app, estados):
+        destino = estados / 'mayo.zip'
+        with app.app_context():
+            from ARCHIVOS.models import db
+            consultas = []
+            escuchar = lambda conn, cursor, statement, *args: consultas.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', escuchar)
+            try:
+                entradas = month_end.generar_zip(destino, '2024-05', user_ids=[1], workers=1)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', escuchar)
+
+        # Detalle: una sola consulta a `tramites` para todas las papelerías del usuario
+        assert len([s for s in consultas if 'FROM tramites ' in s]) == 1
+        assert [(e['papeleria'], e['num_tramites'], e['total_ingresos']) for e in entradas] == [
+            ('Segunda', 60, 1200.0), ('Test Papeleria', 60, 600.0), ('Vacía', 0, 0.0)]
+        with zipfile.ZipFile(destino) as zf:
+            assert _contenido(zf) == ['indice_2024-05.pdf', 'reporte_Segunda_2024-05-01_a_2024-05-31.pdf',
+                                      'reporte_TestPapeleria_2024-05-01_a_2024-05-31.pdf',
+                                      'reporte_Vacía_2024-05-01_a_2024-05-31.pdf']
+            assert all(zf.read(nombre).startswith(b'%PDF') for nombre in zf.namelist())
+        assert not [p for p in estados.iterdir() if p.name.startswith('.tmp-')]
+
+    def test_todos_los_usuarios_en_procesos(self, app, estados):
+        with app.app_context():
+            ruta, entradas = month_end.generar_lote('2024-05', workers=2)
+        assert ruta == estados / 'estados' / 'estados_cuenta_2024-05.zip'
+        with zipfile.ZipFile(ruta) as zf:
+            assert _contenido(zf) == ['admin/reporte_Ajena_2024-05-01_a_2024-05-31.pdf', 'indice_2024-05.pdf',
+                                      'testuser/reporte_Segunda_2024-05-01_a_2024-05-31.pdf',
+                                      'testuser/reporte_TestPapeleria_2024-05-01_a_2024-05-31.pdf',
+                                      'testuser/reporte_Vacía_2024-05-01_a_2024-05-31.pdf']
+            assert all(zf.read(nombre).startswith(b'%PDF') for nombre in zf.namelist())
+        assert sum(e['total_ingresos'] for e in entradas) == 600.0 + 1200.0 + 3000.0
+
+    def test_cli(self, app, estados):
+        resultado = app.test_cli_runner().invoke(args=['month-end-statements', '--mes', '2024-05', '--user-id', '2',
+                                                       '--workers', '1'])
+        assert '1 estados de cuenta' in resultado.output
+        assert (estados / 'estados' / 'estados_cuenta_2024-05_usuario_2.zip').exists()
+        assert app.test_cli_runner().invoke(args=['month-end-statements', '--mes', 'mayo']).exit_code != 0
+
+    def test_job_programado_en_un_solo_worker(self, app, estados, monkeypatch):
+        from ARCHIVOS.backup_manager import BackupManager
+        monkeypatch.setitem(app.config, 'MONTH_END_WORKERS', 1)
+        manager = BackupManager()
+        manager.app = app
+        # Otro worker tiene el candado: este se salta la ejecución
+        with manager._job_lock(estados / 'estados', 'month_end_statements', 'otro') as ejecutar:
+            assert ejecutar
+            assert manager.create_month_end_statements() is None
+        assert not list((estados / 'estados').glob('*.zip'))
+
+        ruta = manager.create_month_end_statements()
+        assert ruta.exists()
+        # El ZIP del mes ya existe: no se vuelve a generar
+        assert manager.create_month_end_statements() is None
+
+
+class TestEstadosEndpoint:
+
+    def test_solo_admin(self, client, estados, login):
+        login(client, 1)
+        assert client.post('/api/exports', data={'tipo': 'estados', 'mes': '2024-05'}).status_code == 403
+
+    def test_admin_genera_el_zip_del_usuario(self, client, estados, login):
+        login(client, 2, viewing=1)
+        assert client.post('/api/exports', json={'tipo': 'estados', 'mes': 'mayo'}).status_code == 400
+        job = client.post('/api/exports', json={'tipo': 'estados', 'mes': '2024-05'}).get_json()
+        assert job['estado'] == 'completado' and job['nombre_archivo'] == 'estados_cuenta_2024-05.zip'
+        with zipfile.ZipFile(io.BytesIO(client.get(job['download_url']).data)) as zf:
+            assert len(zf.namelist()) == 4
+
+    def test_todos_pertenece_al_admin(self, client, estados, login):
+        login(client, 2)
+        assert 'Estados del mes' in client.get('/').get_data(as_text=True)
+        html = client.post('/api/exports', data={'tipo': 'estados', 'mes': '2024-05', 'todos': '1'},
+                           headers={'HX-Request': 'true'}).get_data(as_text=True)
+        assert 'estados_cuenta_2024-05.zip' in html and 'every 1s' not in html
+        with client.session_transaction() as sess:
+            sess['viewing_user_id'] = 1
+        # El lote de todos no aparece en la lista del usuario que el admin está viendo
+        assert client.get('/api/exports').get_json() == []
@@ -0,0 +1,109 @@
+"""
+Tests para la paginación por cursor (keyset) de los listados de trámites y gastos.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from ARCHIVOS.pagination import Cursor
+from ARCHIVOS import query_stats
+
+
+@pytest.fixture
+def historial(app, init_database):
+    """53 trámites y 40 gastos con fechas repetidas (varias filas por día)."""
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository, gasto_repository, proveedor_repository
+        hoy = date.today()
+        tramite_repository.add_many(1, [
+            {'papeleria_id': 1, 'tramite': f'TRAMITE {i}', 'fecha': hoy - timedelta(days=i // 3),
+             'precio': 50.0, 'costo': 10.0, 'cantidad': 1 + i % 2}
+            for i in range(53)
+        ])
+        proveedor = proveedor_repository.add('Proveedor Paginado', 1)
+        for i in range(40):
+            gasto_repository.add(proveedor.id, f'Gasto {i}', 10.0 + i, (hoy - timedelta(days=i // 2)).strftime('%Y-%m-%d'),
+                                 'RENTA' if i % 4 == 0 else 'SERVICIOS', 1)
+        yield hoy
+
+
+def _orden_esperado(app):
+    from ARCHIVOS.models import Tramite
+    return [t.id for t in Tramite.query.filter_by(papeleria_id=1).order_by(Tramite.fecha.desc(), Tramite.id.desc())]
+
+
+class TestCursor:
+
+    def test_ida_y_vuelta(self):
+        cursor = Cursor(date(2024, 3, 9), 42)
+        assert Cursor.decode(cursor.encode()) == cursor
+
+    @pytest.mark.parametrize('valor', [None, '', 'basura', '2024-13-01.5', '2024-01-01.x'])
+    def test_cursor_invalido(self, valor):
+        assert Cursor.decode(valor) is None
+
+
+class TestKeysetPagination:
+
+    def test_recorre_todas_las_paginas_hacia_adelante_y_atras(self, app, historial):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            esperado = _orden_esperado(app)
+
+            paginas, page = [], tramite_repository.get_details_for_papeleria(1, 1, per_page=10)
+            assert not page.has_prev
+            while True:
+                paginas.append([t.id for t in page])
+                if not page.has_next:
+                    break
+                page = tramite_repository.get_details_for_papeleria(1, 1, per_page=10, after=page.next_cursor)
+            assert [i for p in paginas for i in p] == esperado
+            assert [len(p) for p in paginas] == [10, 10, 10, 10, 10, 3]
+
+            # De regreso con `before` se obtienen exactamente las mismas páginas
+            for anterior in reversed(paginas[:-1]):
+                page = tramite_repository.get_details_for_papeleria(1, 1, per_page=10, before=page.prev_cursor)
+                assert [t.id for t in page] == anterior
+            assert not page.has_prev
+
+    def test_before_cerca_del_inicio_devuelve_la_primera_pagina_completa(self, app, historial):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            esperado = _orden_esperado(app)
+            page = tramite_repository.get_details_for_papeleria(1, 1, per_page=10, after=f'{date.today()}.{esperado[3]}')
+            page = tramite_repository.get_details_for_papeleria(1, 1, per_page=10, before=page.prev_cursor)
+            assert [t.id for t in page] == esperado[:10]
+            assert not page.has_prev and page.has_next
+
+    def test_ir_a_fecha(self, app, historial):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            desde = historial - timedelta(days=7)
+            page = tramite_repository.get_details_for_papeleria(1, 1, per_page=5, desde=desde.isoformat())
+            assert page.items[0].fecha == desde
+            assert all(t.fecha <= desde for t in page)
+            assert page.has_prev
+
+    def test_gastos_total_del_rollup_y_proveedor_sin_consultas_extra(self, app, historial):
+        with app.app_context():
+            from ARCHIVOS.database import gasto_repository
+            with query_stats.collect() as stats:
+                page = gasto_repository.get_all(1, per_page=15, categoria='RENTA')
+                nombres = {g.proveedor.nombre for g in page}
+            assert stats.count == 2  # página + total desde gastos_diarios
+            assert page.total == 10 and len(page) == 10 and not page.has_next
+            assert nombres == {'PROVEEDOR PAGINADO'}
+
+    def test_vistas_renderizan_controles(self, client, app, historial, login):
+        login(client, 1)
+        with app.app_context():
+            esperado = _orden_esperado(app)
+        html = client.get('/papeleria/1').get_data(as_text=True)
+        assert 'after=' in html and 'Ir a fecha' in html
+        assert '79 trámites' in html  # suma de `cantidad` en el rollup
+
+        response = client.get(f'/papeleria/1?after={date.today()}.{esperado[0]}')
+        assert response.status_code == 200 and 'before=' in response.get_data(as_text=True)
+
+        html = client.get('/gastos', headers={'HX-Request': 'true'}).get_data(as_text=True)
+        assert '40 gastos' in html and 'PROVEEDOR PAGINADO' in html
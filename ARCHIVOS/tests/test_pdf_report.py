@@ -0,0 +1,95 @@
+"""
+Tests para el reporte PDF de papelería (resumen desde el rollup, tablas por trozos, encabezado reutilizado).
+"""
+import io
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('reportlab')
+
+from ARCHIVOS import pdf_generator
+
+
+@pytest.fixture
+def historial_pdf(app, init_database):
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository
+        hoy = date.today()
+        tramite_repository.add_many(1, [
+            {'papeleria_id': 1, 'tramite': 'ACTA DE NACIMIENTO CERTIFICADA CON APOSTILLA Y TRADUCCIÓN OFICIAL' if i % 50 == 0 else f'TRÁMITE {i % 4}',
+             'fecha': hoy - timedelta(days=i // 10), 'precio': 40.0, 'costo': 10.0, 'cantidad': 1 + i % 2}
+            for i in range(450)
+        ])
+        yield hoy
+
+
+@pytest.fixture
+def logged_client(client, login):
+    login(client, 1)
+    return client
+
+
+def _preparar(fecha_inicio=None, fecha_fin=None):
+    from ARCHIVOS.database import papeleria_repository, tramite_repository
+    return pdf_generator.preparar_reporte(papeleria_repository, tramite_repository, 1, 1, fecha_inicio, fecha_fin)
+
+
+class TestReportePapeleria:
+
+    def test_resumen_desde_el_rollup(self, app, historial_pdf):
+        with app.app_context():
+            reporte = _preparar()
+            assert reporte.num_tramites == 675
+            assert reporte.total_ingresos == pytest.approx(675 * 40.0)
+            inicio = (historial_pdf - timedelta(days=44)).isoformat()
+            assert reporte.nombre_archivo == f'reporte_TestPapeleria_{inicio}_a_{historial_pdf.isoformat()}.pdf'
+
+            con_rango = _preparar('2001-01-01', '2001-01-31')
+            assert con_rango.periodo == '01/01/2001 al 31/01/2001' and con_rango.num_tramites == 0
+
+    def test_tablas_por_trozos_y_encabezado_una_vez(self, app, historial_pdf, monkeypatch):
+        monkeypatch.setattr(pdf_generator, 'FILAS_POR_TABLA', 100)
+        with app.app_context():
+            reporte = _preparar()
+            tablas = list(pdf_generator._tablas_detalle(_preparar().filas, 80 * pdf_generator.mm))
+            assert [len(t._cellvalues) for t in tablas] == [101, 101, 101, 101, 51]
+            envueltos = [fila[1] for t in tablas for fila in t._cellvalues[1:] if not isinstance(fila[1], str)]
+            assert len(envueltos) == 9  # solo los nombres que no caben en la columna
+
+            salida = io.BytesIO()
+            pdf_generator.escribir_pdf(reporte, salida)
+        contenido = salida.getvalue()
+        assert contenido.startswith(b'%PDF')
+        assert contenido.count(b'/Subtype /Form') == 1
+        assert contenido.count(b'/Type /Page\n') > 5
+
+    def test_nombre_largo_con_marcado(self):
+        nombre = 'COPIAS B&N <DOBLE CARTA> CON ENGARGOLADO Y PORTADA A COLOR PERSONALIZADA'
+        fila = SimpleNamespace(tramite=nombre, fecha=date.today(), cantidad=1, precio=5.0)
+        tabla = next(pdf_generator._tablas_detalle([fila], 80 * pdf_generator.mm))
+        # El Paragraph muestra el nombre tal cual, sin interpretarlo como marcado
+        assert ''.join(f.text for f in tabla._cellvalues[1][1].frags) == nombre
+
+    def test_generar_pdf_en_carpeta(self, app, historial_pdf, tmp_path):
+        with app.app_context():
+            from ARCHIVOS.database import papeleria_repository, tramite_repository
+            ruta = pdf_generator.generar_pdf_papeleria(papeleria_repository, tramite_repository, 1, 1, carpeta=tmp_path)
+        assert ruta.parent == tmp_path and ruta.read_bytes().startswith(b'%PDF')
+
+
+class TestDescargaPdf:
+
+    def test_descarga(self, app, logged_client, historial_pdf, monkeypatch, tmp_path):
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setitem(app.config, 'PDF_CACHE_DIR', tmp_path / 'cache')
+        response = logged_client.get('/descargar-pdf/1')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/pdf'
+        assert 'reporte_TestPapeleria_' in response.headers['Content-Disposition']
+        assert response.get_data().startswith(b'%PDF')
+
+    def test_sin_tramites_redirige(self, logged_client, historial_pdf):
+        response = logged_client.get('/descargar-pdf/1?fecha_inicio=2001-01-01&fecha_fin=2001-01-31')
+        assert response.status_code == 302
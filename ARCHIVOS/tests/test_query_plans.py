@@ -0,0 +1,213 @@
+"""
+Regresión de planes de consulta: ejecuta cada método de los repositorios contra una BD
+sembrada, captura el SQL emitido y corre `EXPLAIN QUERY PLAN` sobre cada sentencia.
+Falla si alguna consulta recorre completa una tabla grande (`SCAN tramites` sin índice).
+"""
+import re
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from ARCHIVOS.models import db, User, Papeleria, Tramite, Gasto
+
+# Tablas que crecen con el uso: nunca deben recorrerse completas
+TABLAS_GRANDES = ('tramites', 'gastos', 'tramites_diarios', 'gastos_diarios', 'papelerias')
+_FULL_SCAN = re.compile(r'^SCAN (%s)\b' % '|'.join(TABLAS_GRANDES))
+
+# Mantenimiento que recorre todas las filas a propósito (reconstrucciones sin usuario)
+_EXCLUIR = ('papelerias.get_user_ids_with_active_papelerias', 'analytics.refresh_all_snapshots')
+
+
+@contextmanager
+def capture_sql():
+    """Captura (sentencia, parámetros) de todo lo que se ejecuta en el engine."""
+    capturadas = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        verbo = statement.lstrip().split(None, 1)[0].upper()
+        if verbo in ('SELECT', 'UPDATE', 'DELETE', 'WITH') and not executemany:
+            capturadas.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', _before)
+    try:
+        yield capturadas
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', _before)
+
+
+def full_scans(statement, parameters):
+    """Devuelve los pasos del plan que recorren completa una tabla grande."""
+    with db.engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return [row[-1] for row in plan if _FULL_SCAN.match(row[-1])]
+
+
+@pytest.fixture
+def seeded(app, init_database):
+    """
+    Siembra papelerías, trámites, gastos, precios y costos para dos usuarios (más otros
+    dueños de papelerías, para que filtrar por usuario sea selectivo) y ejecuta ANALYZE,
+    para que el planificador decida con estadísticas parecidas a producción.
+    """
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository, gasto_repository, proveedor_repository, papeleria_repository
+        db.session.add(Papeleria(id=2, nombre='Segunda', user_id=1))
+        db.session.add(Papeleria(id=3, nombre='Inactiva', user_id=1, is_active=False))
+        for i in range(4, 16):
+            db.session.add(Papeleria(id=i, nombre=f'Ajena {i}', user_id=2, is_active=i % 5 != 0))
+        for user_id in range(3, 23):
+            otro = User(id=user_id, username=f'otro{user_id}', role='employee')
+            otro.set_password('password')
+            db.session.add(otro)
+            for j in range(4):
+                db.session.add(Papeleria(nombre=f'Otra {user_id}-{j}', user_id=user_id))
+        db.session.commit()
+
+        hoy = date.today()
+        ctx = {}
+        for user_id, papelerias in ((1, [1, 2, 3]), (2, list(range(4, 16)))):
+            filas = []
+            for i in range(300):
+                filas.append({'papeleria_id': papelerias[i % len(papelerias)], 'tramite': f'TRAMITE {i % 7}',
+                              'fecha': hoy - timedelta(days=i * 2), 'precio': 50.0 + i % 10,
+                              'costo': 0.0 if i % 4 == 0 else 10.0, 'cantidad': 1 + i % 3})
+            tramite_repository.add_many(user_id, filas)
+            tramite_repository.set_costo('TRAMITE 0', 12.0, user_id)
+
+            proveedor = proveedor_repository.add(f'Proveedor Plan {user_id}', user_id)
+            for i in range(60):
+                gasto_repository.add(proveedor.id, f'Gasto {i}', 100.0 + i, (hoy - timedelta(days=i * 5)).strftime('%Y-%m-%d'),
+                                     'SERVICIOS' if i % 2 else 'RENTA', user_id,
+                                     receipt_filename=f'recibo_{user_id}_{i}.pdf' if i % 6 == 0 else None)
+            ctx.setdefault('proveedor_id', proveedor.id)
+        papeleria_repository.set_precios_bulk(1, {'TRAMITE 1': '55'}, 1)
+
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        yield ctx
+
+
+def _llamadas(repos, ctx):
+    """Una invocación por método de repositorio (lecturas y escrituras)."""
+    from ARCHIVOS.dashboard_snapshot import DashboardSnapshot
+    users, papelerias, tramites, proveedores, gastos, analytics = repos
+    hoy = date.today()
+    fi, ff = (hoy - timedelta(days=90)).strftime('%Y-%m-%d'), hoy.strftime('%Y-%m-%d')
+    tramite_id = Tramite.query.filter_by(user_id=1).order_by(Tramite.id).first().id
+    gasto_id = Gasto.query.filter_by(user_id=1).order_by(Gasto.id).first().id
+    prov = ctx['proveedor_id']
+    return [
+        ('users.get_by_username', lambda: users.get_by_username('testuser')),
+        ('users.get_by_id', lambda: users.get_by_id(1)),
+        ('users.get_all_except', lambda: users.get_all_except(2)),
+        ('papelerias.get_num_papelerias_activas', lambda: papelerias.get_num_papelerias_activas(1)),
+        ('papelerias.get_num_papelerias_activas(rango)', lambda: papelerias.get_num_papelerias_activas(1, fi, ff)),
+        ('papelerias.get_totales_usuario', lambda: papelerias.get_totales_usuario(1)),
+        ('papelerias.get_totales_usuario(rango)', lambda: papelerias.get_totales_usuario(1, fi, ff)),
+        ('papelerias.get_papelerias_and_totals_for_user', lambda: papelerias.get_papelerias_and_totals_for_user(1)),
+        ('papelerias.get_papelerias_and_totals_for_user(busqueda)', lambda: papelerias.get_papelerias_and_totals_for_user(1, 'Seg')),
+        ('papelerias.get_totales_comparativa', lambda: papelerias.get_totales_comparativa(1)),
+        ('papelerias.get_top_by_ganancia', lambda: papelerias.get_top_by_ganancia(1)),
+        ('papelerias.get_top_by_ganancia(rango)', lambda: papelerias.get_top_by_ganancia(1, 10, fi, ff)),
+        ('papelerias.exists_with_name', lambda: papelerias.exists_with_name('Segunda', 1, 1)),
+        ('papelerias.get_name', lambda: papelerias.get_name(1, 1)),
+        ('papelerias.get_default_precio', lambda: papelerias.get_default_precio(1, 'TRAMITE 1', 1)),
+        ('papelerias.get_precios_para_papeleria', lambda: papelerias.get_precios_para_papeleria(1, 1)),
+        ('papelerias.get_precios_map', lambda: papelerias.get_precios_map(1)),
+        ('papelerias.total_por_papeleria', lambda: papelerias.total_por_papeleria(1, 1)),
+        ('papelerias.total_por_papeleria(rango)', lambda: papelerias.total_por_papeleria(1, 1, fi, ff)),
+        ('papelerias.get_all_papelerias', lambda: papelerias.get_all_papelerias(1)),
+        ('papelerias.get_statement_summaries', lambda: papelerias.get_statement_summaries(1, fi, ff)),
+        ('papelerias.get_user_ids_with_active_papelerias', lambda: papelerias.get_user_ids_with_active_papelerias()),
+        ('papelerias.update_name', lambda: papelerias.update_name(2, 'Segunda B', 1)),
+        ('tramites.get_by_id', lambda: tramites.get_by_id(tramite_id, 1)),
+        ('tramites.get_details_for_papeleria', lambda: tramites.get_details_for_papeleria(1, 1)),
+        ('tramites.get_details_for_papeleria(rango)', lambda: tramites.get_details_for_papeleria(1, 1, fi, ff)),
+        ('tramites.get_details_for_papeleria(after)', lambda: tramites.get_details_for_papeleria(1, 1, after=f'{fi}.{tramite_id}')),
+        ('tramites.get_details_for_papeleria(before)', lambda: tramites.get_details_for_papeleria(1, 1, before=f'{fi}.{tramite_id}')),
+        ('tramites.get_details_for_papeleria(desde)', lambda: tramites.get_details_for_papeleria(1, 1, desde=fi)),
+        ('tramites.get_report_summary', lambda: tramites.get_report_summary(1, 1)),
+        ('tramites.get_report_summary(rango)', lambda: tramites.get_report_summary(1, 1, fi, ff)),
+        ('tramites.get_total_general', lambda: tramites.get_total_general(1)),
+        ('tramites.get_total_general(rango)', lambda: tramites.get_total_general(1, fi, ff)),
+        ('tramites.get_tramites_hoy', lambda: tramites.get_tramites_hoy(1)),
+        ('tramites.get_all_tramites', lambda: tramites.get_all_tramites(1)),
+        ('tramites.get_tramites_comparativa', lambda: tramites.get_tramites_comparativa(1)),
+        ('tramites.export_all_as_csv', lambda: list(tramites.export_all_as_csv(1))),
+        ('tramites.export_all_as_csv(papeleria, rango)', lambda: list(tramites.export_all_as_csv(1, fi, ff, papeleria_id=1))),
+        ('tramites.export_all_as_csv(por_papeleria)', lambda: list(tramites.export_all_as_csv(1, fi, ff, por_papeleria=True))),
+        ('tramites.get_totals_by_papeleria', lambda: tramites.get_totals_by_papeleria(1)),
+        ('tramites.get_totals_by_papeleria(rango)', lambda: tramites.get_totals_by_papeleria(1, fi, ff)),
+        ('tramites.get_totals_by_periodo', lambda: tramites.get_totals_by_periodo(1)),
+        ('tramites.get_totals_by_periodo(papeleria, rango)', lambda: tramites.get_totals_by_periodo(1, fi, ff, papeleria_id=1)),
+        ('tramites.stream_for_statements', lambda: list(tramites.stream_for_statements(1, fi, ff))),
+        ('tramites.get_all_costos', lambda: tramites.get_all_costos(1)),
+        ('tramites.get_costo_for_tramite', lambda: tramites.get_costo_for_tramite('TRAMITE 0', 1)),
+        ('tramites.get_distinct_tramites', lambda: tramites.get_distinct_tramites(1)),
+        ('tramites.update_old_costos', lambda: tramites.update_old_costos(1)),
+        ('tramites.get_monthly_summary', lambda: tramites.get_monthly_summary(1)),
+        ('tramites.get_monthly_summary(rango)', lambda: tramites.get_monthly_summary(1, fi, ff)),
+        ('tramites.get_tramites_distribution', lambda: tramites.get_tramites_distribution(1)),
+        ('tramites.get_tramites_distribution_for_papeleria', lambda: tramites.get_tramites_distribution_for_papeleria(1, 1)),
+        ('tramites.get_monthly_summary_for_papeleria', lambda: tramites.get_monthly_summary_for_papeleria(1, 1)),
+        ('tramites.update', lambda: tramites.update(tramite_id, 1, ff, 'TRAMITE 9', 60.0, 5.0)),
+        ('tramites.split_unit', lambda: tramites.split_unit(tramite_id, 1)),
+        ('tramites.delete', lambda: tramites.delete(tramite_id, 1)),
+        ('proveedores.get_all', lambda: proveedores.get_all(1)),
+        ('proveedores.get_by_id', lambda: proveedores.get_by_id(prov, 1)),
+        ('proveedores.is_in_use', lambda: proveedores.is_in_use(prov, 1)),
+        ('gastos.get_all', lambda: gastos.get_all(1)),
+        ('gastos.get_all(filtros)', lambda: gastos.get_all(1, 20, fi, ff, 'RENTA')),
+        ('gastos.get_all(after)', lambda: gastos.get_all(1, after=f'{fi}.{gasto_id}')),
+        ('gastos.get_all(filtros, desde)', lambda: gastos.get_all(1, 20, fi, ff, 'RENTA', desde=fi)),
+        ('gastos.get_all_gastos', lambda: gastos.get_all_gastos(1)),
+        ('gastos.get_total_gastos', lambda: gastos.get_total_gastos(1, fi, ff)),
+        ('gastos.get_by_id', lambda: gastos.get_by_id(gasto_id, 1)),
+        ('gastos.does_receipt_belong_to_user', lambda: gastos.does_receipt_belong_to_user('recibo_1_0.pdf', 1)),
+        ('gastos.get_gastos_distribution', lambda: gastos.get_gastos_distribution(1, fi, ff)),
+        ('gastos.get_gastos_summary', lambda: gastos.get_gastos_summary(1)),
+        ('gastos.get_gastos_summary(filtros)', lambda: gastos.get_gastos_summary(1, fi, ff, 'RENTA')),
+        ('gastos.export_all', lambda: list(gastos.export_all(1))),
+        ('gastos.export_all(filtros)', lambda: list(gastos.export_all(1, fi, ff, 'RENTA'))),
+        ('gastos.get_totals_by_periodo', lambda: gastos.get_totals_by_periodo(1)),
+        ('gastos.get_totals_by_periodo(filtros)', lambda: gastos.get_totals_by_periodo(1, fi, ff, 'RENTA')),
+        ('gastos.update', lambda: gastos.update(gasto_id, 1, prov, 'Editado', 90.0, ff, 'RENTA')),
+        ('gastos.delete', lambda: gastos.delete(gasto_id, 1)),
+        ('analytics.get_meta_mensual_progress', lambda: analytics.get_meta_mensual_progress(1)),
+        ('analytics.get_mejor_mes_historico', lambda: analytics.get_mejor_mes_historico(1)),
+        ('analytics.get_dias_mas_productivos', lambda: analytics.get_dias_mas_productivos(1)),
+        ('analytics.get_hora_pico', lambda: analytics.get_hora_pico(1)),
+        ('analytics.get_margen_promedio', lambda: analytics.get_margen_promedio(1)),
+        ('analytics.get_costo_promedio_tramite', lambda: analytics.get_costo_promedio_tramite(1)),
+        ('analytics.get_roi_por_papeleria', lambda: analytics.get_roi_por_papeleria(1)),
+        ('analytics.get_rentabilidad_por_tramite', lambda: analytics.get_rentabilidad_por_tramite(1)),
+        ('analytics.get_historico', lambda: analytics.get_historico(1)),
+        ('analytics.refresh_snapshot', lambda: analytics.refresh_snapshot(1)),
+        ('analytics.get_historico(snapshot)', lambda: analytics.get_historico(1)),
+        ('analytics.refresh_all_snapshots', lambda: analytics.refresh_all_snapshots()),
+        ('dashboard.snapshot', lambda: DashboardSnapshot.for_user(1)),
+        ('dashboard.snapshot(busqueda)', lambda: DashboardSnapshot.for_user(1, 'Seg')),
+        ('papelerias.delete', lambda: papelerias.delete(2, 1)),
+    ]
+
+
+def test_ninguna_consulta_recorre_tablas_completas(app, seeded):
+    with app.app_context():
+        from ARCHIVOS import database
+        repos = (database.user_repository, database.papeleria_repository, database.tramite_repository,
+                 database.proveedor_repository, database.gasto_repository, database.analytics_repository)
+
+        fallos = []
+        for nombre, llamada in _llamadas(repos, seeded):
+            with capture_sql() as capturadas:
+                llamada()
+            if nombre in _EXCLUIR:
+                continue
+            for statement, parameters in capturadas:
+                scans = full_scans(statement, parameters)
+                if scans:
+                    fallos.append(f"{nombre}: {', '.join(scans)}\n    {' '.join(statement.split())[:300]}")
+
+        assert not fallos, "Consultas sin índice:\n" + "\n".join(fallos)
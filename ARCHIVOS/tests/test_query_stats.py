@@ -0,0 +1,74 @@
+"""
+Tests para la instrumentación SQL por petición (query_stats) y presupuestos de consultas
+por endpoint.
+"""
+from datetime import date
+
+import pytest
+
+from ARCHIVOS import query_stats
+from ARCHIVOS.models import db, Papeleria, PapeleriaPrecio
+
+
+@pytest.fixture
+def papelerias_con_precios(app, init_database):
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository
+        for i in range(2, 8):
+            db.session.add(Papeleria(id=i, nombre=f'Papeleria {i}', user_id=1))
+        db.session.flush()
+        for i in range(1, 8):
+            for j in range(i % 4):
+                db.session.add(PapeleriaPrecio(papeleria_id=i, tramite=f'TRAMITE {j}', precio=10.0 * (j + 1)))
+        db.session.commit()
+        tramite_repository.add_many(1, [
+            {'papeleria_id': i, 'tramite': 'ACTA DE NACIMIENTO', 'fecha': date.today(), 'precio': 50.0, 'costo': 20.0, 'cantidad': 1}
+            for i in range(1, 8)
+        ])
+        yield
+
+
+class TestQueryStats:
+
+    def test_normalize_agrupa_sentencias_por_parametros(self):
+        a = query_stats.normalize("SELECT * FROM t WHERE id = 5 AND nombre = 'x'")
+        b = query_stats.normalize("SELECT *  FROM t\n WHERE id = 12 AND nombre = 'y'")
+        assert a == b
+        assert query_stats.normalize("SELECT 1 WHERE id IN (?, ?, ?)") == query_stats.normalize("SELECT 1 WHERE id IN (?)")
+
+    def test_collect_detecta_n_mas_uno(self, app, papelerias_con_precios):
+        with app.app_context():
+            with query_stats.collect() as stats:
+                for papeleria_id in range(1, 8):
+                    PapeleriaPrecio.query.filter_by(papeleria_id=papeleria_id).count()
+            assert stats.count == 7
+            [(sql, veces)] = stats.repeated()
+            assert veces == 7 and 'papeleria_precios' in sql
+
+    def test_get_all_papelerias_en_una_consulta(self, app, papelerias_con_precios, query_budget):
+        with app.app_context():
+            from ARCHIVOS.database import papeleria_repository
+            with query_budget(1):
+                papelerias = papeleria_repository.get_all_papelerias(1)
+            assert {p['id']: p['precios_count'] for p in papelerias} == {i: i % 4 for i in range(1, 8)}
+
+    def test_server_timing_en_respuesta(self, client, app, init_database):
+        response = client.get('/health')
+        assert 'db;dur=' in response.headers['Server-Timing']
+        assert 'desc="1 queries"' in response.headers['Server-Timing']
+
+
+@pytest.mark.parametrize('url, presupuesto', [
+    ('/', 6),  # snapshot (2) + get_historico (2) + usuario
+    ('/api/buscar?q=papeleria', 5),  # trámites, papelerías, gastos, proveedores + usuario
+    ('/api/dashboard-charts', 6),
+    ('/api/dashboard-totals', 5),
+    ('/papeleria/1', 6),
+    ('/gastos', 4),
+])
+def test_presupuesto_de_consultas_por_endpoint(client, app, papelerias_con_precios, query_budget, login, url,
+                                              presupuesto):
+    login(client, 1)
+    with query_budget(presupuesto):
+        response = client.get(url)
+    assert response.status_code == 200
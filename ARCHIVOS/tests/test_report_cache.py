@@ -0,0 +1,127 @@
+"""
+Tests para la caché de reportes PDF (clave por contenido, un solo build por clave, expulsión).
+"""
+import os
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from ARCHIVOS.report_cache import ReportCache, cache_key, file_hash
+
+
+def _escribir(contenido):
+    def build(salida):
+        salida.write(contenido)
+    return build
+
+
+class TestReportCache:
+
+    def test_construye_una_vez_y_luego_acierta(self, tmp_path):
+        cache = ReportCache(tmp_path)
+        llamadas = []
+        build = lambda salida: (llamadas.append(1), salida.write(b'%PDF-1'))
+
+        ruta, acierto = cache.get_or_build('abc', build)
+        assert not acierto and ruta.read_bytes() == b'%PDF-1'
+        ruta, acierto = cache.get_or_build('abc', build)
+        assert acierto and len(llamadas) == 1
+
+    def test_workers_concurrentes_construyen_una_sola_vez(self, tmp_path):
+        cache = ReportCache(tmp_path)
+        llamadas = []
+
+        def build(salida):
+            llamadas.append(1)
+            time.sleep(0.2)
+            salida.write(b'%PDF-lento')
+
+        resultados = []
+        hilos = [threading.Thread(target=lambda: resultados.append(cache.get_or_build('k', build))) for _ in range(4)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        assert len(llamadas) == 1
+        assert sorted(acierto for _, acierto in resultados) == [False, True, True, True]
+        assert {ruta.read_bytes() for ruta, _ in resultados} == {b'%PDF-lento'}
+
+    def test_build_fallido_no_deja_archivos(self, tmp_path):
+        cache = ReportCache(tmp_path)
+
+        def build(salida):
+            salida.write(b'%PDF-a medias')
+            raise RuntimeError('reportlab falló')
+
+        with pytest.raises(RuntimeError):
+            cache.get_or_build('roto', build)
+        assert cache.get('roto') is None
+        assert [p.name for p in tmp_path.iterdir()] in ([], ['roto.lock'])
+
+    def test_expulsion_por_edad_y_tamano(self, tmp_path):
+        cache = ReportCache(tmp_path, max_bytes=250, max_age=3600)
+        ahora = time.time()
+        for nombre, edad in (('viejo', 7200), ('a', 300), ('b', 200), ('c', 100)):
+            ruta = tmp_path / f'{nombre}.pdf'
+            ruta.write_bytes(b'x' * 100)
+            os.utime(ruta, (ahora - edad, ahora - edad))
+        (tmp_path / 'reporte_ROYAL_None_a_None.pdf').write_bytes(b'x')
+        os.utime(tmp_path / 'reporte_ROYAL_None_a_None.pdf', (ahora - 90000, ahora - 90000))
+        huerfano = tmp_path / '.tmp-abc.part'
+        huerfano.write_bytes(b'x')
+        os.utime(huerfano, (ahora - 7200, ahora - 7200))
+
+        assert cache.evict(now=ahora) == 4
+        assert sorted(p.name for p in tmp_path.iterdir()) == ['b.pdf', 'c.pdf']
+
+    def test_claves(self, tmp_path):
+        logo = tmp_path / 'logo.png'
+        logo.write_bytes(b'logo 1')
+        hash_1 = file_hash(logo)
+        logo.write_bytes(b'logo 2')
+        assert file_hash(logo) != hash_1
+        assert file_hash(tmp_path / 'no-existe.png') is None
+        assert cache_key(1, '2024-01-01', None) == cache_key(1, '2024-01-01', None) != cache_key(1, '2024-01-02', None)
+
+
+class TestDescargaCacheada:
+
+    @pytest.fixture
+    def descarga(self, app, client, init_database, monkeypatch, tmp_path, login):
+        login(client, 1)
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setitem(app.config, 'PDF_CACHE_DIR', tmp_path / 'cache')
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            tramite_repository.add_bulk(1, 'ACTA', 1, date.today(), 50.0, 10.0, 2)
+
+        from ARCHIVOS.routes import papeleria_routes
+        construidos = []
+        escribir_pdf = papeleria_routes.escribir_pdf
+        monkeypatch.setattr(papeleria_routes, 'escribir_pdf',
+                            lambda *args, **kwargs: (construidos.append(1), escribir_pdf(*args, **kwargs)))
+        return construidos
+
+    def test_acierto_etag_y_304(self, app, client, descarga, tmp_path):
+        primera = client.get('/descargar-pdf/1')
+        etag = primera.headers['ETag']
+        assert primera.status_code == 200 and 'private' in primera.headers['Cache-Control']
+        assert [p.name for p in (tmp_path / 'cache').glob('*.pdf')] == [f'{etag.strip(chr(34))}.pdf']
+
+        segunda = client.get('/descargar-pdf/1')
+        assert segunda.headers['ETag'] == etag and segunda.get_data() == primera.get_data()
+        assert client.get('/descargar-pdf/1', headers={'If-None-Match': etag}).status_code == 304
+        assert len(descarga) == 1
+
+    def test_datos_o_logo_nuevos_cambian_la_clave(self, app, client, descarga, tmp_path):
+        etag = client.get('/descargar-pdf/1').headers['ETag']
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            tramite_repository.add_bulk(1, 'CURP', 1, date.today(), 20.0, 5.0, 1)
+        etag_datos = client.get('/descargar-pdf/1').headers['ETag']
+        (tmp_path / 'logo_1.png').write_bytes(b'no es un png')
+        etag_logo = client.get('/descargar-pdf/1').headers['ETag']
+        assert len({etag, etag_datos, etag_logo}) == 3
+        assert len(descarga) == 3
@@ -0,0 +1,140 @@
+"""
+Tests para los rollups diarios de trámites y gastos.
+"""
+from datetime import date
+from sqlalchemy import func
+from ARCHIVOS.models import db, Tramite, Gasto, TramiteDiario, GastoDiario
+
+
+def _rollup_tramites(user_id):
+    return db.session.query(
+        func.sum(TramiteDiario.cuantos),
+        func.sum(TramiteDiario.total_ingresos),
+        func.sum(TramiteDiario.total_costos)
+    ).filter(TramiteDiario.user_id == user_id).one()
+
+
+def _raw_tramites(user_id):
+    return db.session.query(
+        func.sum(Tramite.cantidad),
+        func.sum(Tramite.precio * Tramite.cantidad),
+        func.sum(Tramite.costo * Tramite.cantidad)
+    ).filter(Tramite.user_id == user_id).one()
+
+
+class TestTramitesRollup:
+    """El rollup de trámites debe coincidir siempre con la tabla cruda."""
+
+    def test_add_update_delete_mantienen_rollup(self, app, init_database):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            hoy = date.today().strftime('%Y-%m-%d')
+
+            tramite_repository.add_bulk(1, 'ACTA DE NACIMIENTO', 1, hoy, 50.0, 20.0, 4)
+            assert tuple(_rollup_tramites(1)) == (4, 200.0, 80.0)
+
+            # Separar una unidad de la fila compacta y editar solo esa
+            tramite = tramite_repository.split_unit(Tramite.query.filter_by(user_id=1).first().id, 1)
+            assert tuple(_rollup_tramites(1)) == (4, 200.0, 80.0)
+            tramite_repository.update(tramite.id, 1, '2024-01-15', 'RFC', 100.0, 30.0)
+            assert tuple(_rollup_tramites(1)) == tuple(_raw_tramites(1))
+            assert TramiteDiario.query.filter_by(user_id=1, tramite='RFC').one().cuantos == 1
+
+            tramite_repository.delete(tramite.id, 1)
+            assert tuple(_rollup_tramites(1)) == (3, 150.0, 60.0)
+            # Las filas que llegan a cero se eliminan
+            assert TramiteDiario.query.filter_by(user_id=1, tramite='RFC').first() is None
+
+    def test_agregados_leen_del_rollup(self, app, init_database):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository, papeleria_repository
+            hoy = date.today().strftime('%Y-%m-%d')
+            tramite_repository.add_bulk(1, 'TIPO A', 1, hoy, 10.0, 4.0, 3)
+
+            totales = papeleria_repository.get_totales_usuario(1)
+            assert totales['total_ingresos'] == 30.0
+            assert totales['ganancia'] == 18.0
+            assert tramite_repository.get_tramites_hoy(1) == 3
+            dist = tramite_repository.get_tramites_distribution(1)
+            assert dist[0]['tramite_label'] == 'TIPO A'
+            assert dist[0]['total_count'] == 3
+
+    def test_rebuild_cli(self, app, runner, init_database):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            hoy = date.today().strftime('%Y-%m-%d')
+            tramite_repository.add_bulk(1, 'TIPO B', 1, hoy, 25.0, 5.0, 2)
+
+            # Simular un rollup desincronizado
+            TramiteDiario.query.delete()
+            db.session.commit()
+
+            result = runner.invoke(args=['rebuild-rollups', '--user-id', '1'])
+            assert result.exit_code == 0
+            assert tuple(_rollup_tramites(1)) == (2, 50.0, 10.0)
+
+
+class TestGastosRollup:
+    """El rollup de gastos debe seguir add/update/delete."""
+
+    def test_gastos_rollup(self, app, init_database):
+        with app.app_context():
+            from ARCHIVOS.database import gasto_repository, proveedor_repository
+            proveedor = proveedor_repository.add('Proveedor Rollup', 1)
+            hoy = date.today().strftime('%Y-%m-%d')
+
+            gasto_repository.add(proveedor.id, 'Luz', 300.0, hoy, 'SERVICIOS', 1)
+            gasto_repository.add(proveedor.id, 'Renta', 1000.0, hoy, 'RENTA', 1)
+            assert gasto_repository.get_total_gastos(1) == 1300.0
+
+            gasto = Gasto.query.filter_by(user_id=1, categoria='SERVICIOS').first()
+            gasto_repository.update(gasto.id, 1, proveedor.id, 'Luz', 350.0, hoy, 'RENTA')
+            assert GastoDiario.query.filter_by(user_id=1, categoria='SERVICIOS').first() is None
+            assert GastoDiario.query.filter_by(user_id=1, categoria='RENTA').one().total_monto == 1350.0
+
+            gasto_repository.delete(gasto.id, 1)
+            dist = gasto_repository.get_gastos_distribution(1)
+            assert dist == [{'categoria': 'RENTA', 'total_monto': 1000.0}]
+
+
+class TestPeriodo:
+    """La clave de mes `periodo` (YYYYMM) se mantiene al escribir y agrupa los resúmenes mensuales."""
+
+    def test_periodo_en_insert_y_update(self, app, init_database):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository, gasto_repository, proveedor_repository
+            tramite_repository.add_bulk(1, 'PERIODO', 1, '2024-03-15', 10.0, 2.0, 2)
+            tramite = Tramite.query.filter_by(tramite='PERIODO').one()
+            assert tramite.periodo == 202403
+            assert TramiteDiario.query.filter_by(tramite='PERIODO').one().periodo == 202403
+
+            tramite_repository.update(tramite.id, 1, '2024-04-01', 'PERIODO', 10.0, 2.0)
+            assert db.session.get(Tramite, tramite.id).periodo == 202404
+            assert TramiteDiario.query.filter_by(tramite='PERIODO').one().periodo == 202404
+
+            proveedor = proveedor_repository.add('Proveedor Periodo', 1)
+            gasto_repository.add(proveedor.id, 'Papel', 80.0, '2024-12-31', 'INSUMOS', 1)
+            assert Gasto.query.filter_by(descripcion='Papel').one().periodo == 202412
+
+    def test_resumen_mensual_agrupa_por_periodo(self, app, init_database):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            tramite_repository.add_bulk(1, 'MES A', 1, '2024-01-31', 10.0, 4.0, 1)
+            tramite_repository.add_bulk(1, 'MES A', 1, '2024-02-01', 20.0, 5.0, 2)
+
+            summary = tramite_repository.get_monthly_summary(1, '2024-01-01', '2024-02-29')
+            meses = {m['month']: m['ingresos'] for m in summary['monthly_data']}
+            assert meses == {'2024-01': 10.0, '2024-02': 40.0}
+
+            # Rango corto que no empieza en día 1: se respeta la fecha exacta
+            summary = tramite_repository.get_monthly_summary(1, '2024-02-01', '2024-02-10')
+            assert summary['totals']['total_ingresos'] == 40.0
+
+    def test_resumen_mensual_usa_indice_periodo(self, app, init_database):
+        with app.app_context():
+            from sqlalchemy import text
+            plan = db.session.execute(text(
+                "EXPLAIN QUERY PLAN SELECT periodo, SUM(total_ingresos) FROM tramites_diarios "
+                "WHERE user_id = 1 AND periodo BETWEEN 202401 AND 202412 GROUP BY periodo"
+            )).fetchall()
+            assert 'idx_tramites_diarios_periodo_cov' in ' '.join(row[-1] for row in plan)
@@ -0,0 +1,76 @@
+"""
+Tests para las migraciones de arranque: varios workers migrando a la vez la misma BD en archivo.
+"""
+import threading
+
+import pytest
+from sqlalchemy import text
+
+from ARCHIVOS.app import create_app
+from ARCHIVOS.models import db, User, Papeleria
+from ARCHIVOS.schema_migrations import _PERIODO_TABLES, ensure_periodo_columns, ensure_tramites_cantidad
+from .conftest import TestConfig
+
+
+@pytest.fixture
+def bd_antigua(tmp_path):
+    """BD en archivo con el esquema anterior: sin `tramites.cantidad` ni las columnas `periodo`."""
+    class ArchivoConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'antigua.db'}"
+        SQLITE_READ_ENGINE_ENABLED = False
+
+    app = create_app(config_class=ArchivoConfig)
+    with app.app_context():
+        usuario = User(id=1, username='migra', role='employee')
+        usuario.set_password('x')
+        db.session.add_all([usuario, Papeleria(id=1, nombre='Centro', user_id=1)])
+        db.session.commit()
+        for table in _PERIODO_TABLES:
+            indices = db.session.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"
+            ), {'t': table}).scalars().all()
+            for nombre in indices:
+                db.session.execute(text(f"DROP INDEX {nombre}"))
+            db.session.execute(text(f"ALTER TABLE {table} DROP COLUMN periodo"))
+        db.session.execute(text("ALTER TABLE tramites DROP COLUMN cantidad"))
+        # Registro por unidades: tres filas idénticas
+        for _ in range(3):
+            db.session.execute(text(
+                "INSERT INTO tramites (user_id, papeleria_id, tramite, fecha, precio, costo, timestamp) "
+                "VALUES (1, 1, 'ACTA', '2024-05-01', 30.0, 10.0, '2024-05-01 12:00:00')"
+            ))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_workers_simultaneos_migran_una_sola_vez(bd_antigua):
+    workers = 3
+    barrera = threading.Barrier(workers)
+    resultados, errores = [], []
+
+    def arrancar():
+        with bd_antigua.app_context():
+            try:
+                barrera.wait(10)
+                resultados.append((ensure_tramites_cantidad(), ensure_periodo_columns()))
+            except Exception as e:  # pragma: no cover - es lo que el test vigila
+                errores.append(e)
+            finally:
+                db.session.remove()
+
+    hilos = [threading.Thread(target=arrancar) for _ in range(workers)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(30)
+
+    assert errores == []
+    # Un solo worker añadió cada columna, compactó y rellenó; los demás las encontraron ya creadas
+    assert sorted(compactadas for compactadas, _ in resultados) == [0, 0, 2]
+    assert sorted(len(migradas) for _, migradas in resultados) == [0, 0, len(_PERIODO_TABLES)]
+    with bd_antigua.app_context():
+        fila = db.session.execute(text("SELECT cantidad, periodo FROM tramites")).one()
+        assert tuple(fila) == (3, 202405)
@@ -0,0 +1,113 @@
+"""
+Tests para el índice FTS5 de la búsqueda global: acentos, prefijos, sincronización por
+triggers, aislamiento por usuario, reconstrucción y el endpoint /api/buscar.
+"""
+from datetime import date
+
+import pytest
+
+from ARCHIVOS import search_index
+from ARCHIVOS.models import db, Papeleria, Proveedor, Tramite, Gasto
+
+
+@pytest.fixture
+def datos_busqueda(app, init_database):
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository, gasto_repository, proveedor_repository
+        db.session.add(Papeleria(id=2, nombre='Papelería Ñandú', user_id=1))
+        db.session.add(Papeleria(id=3, nombre='Ajena', user_id=2))
+        db.session.commit()
+        hoy = date.today()
+        tramite_repository.add_many(1, [
+            {'papeleria_id': 1, 'tramite': 'ACTA DE DEFUNCIÓN', 'fecha': hoy, 'precio': 50.0, 'costo': 20.0, 'cantidad': 1},
+            {'papeleria_id': 2, 'tramite': 'CONSTANCIA DE SITUACIÓN FISCAL', 'fecha': hoy, 'precio': 30.0, 'costo': 0.0, 'cantidad': 2},
+            {'papeleria_id': 2, 'tramite': 'ACTA DE NACIMIENTO', 'fecha': hoy, 'precio': 50.0, 'costo': 20.0, 'cantidad': 1},
+        ])
+        tramite_repository.add_many(2, [
+            {'papeleria_id': 3, 'tramite': 'ACTA DE DEFUNCIÓN', 'fecha': hoy, 'precio': 50.0, 'costo': 20.0, 'cantidad': 1},
+        ])
+        proveedor = proveedor_repository.add('Papelera Económica', 1)
+        gasto_repository.add(proveedor.id, 'Tóner para impresora', 450.0, hoy.strftime('%Y-%m-%d'), 'INSUMOS', 1)
+        yield
+        Proveedor.query.delete()
+        db.session.commit()
+
+
+def _tramites(term, user_id=1):
+    from ARCHIVOS.database import tramite_repository
+    return [t['tramite'] for t in tramite_repository.get_all_tramites(user_id, search_term=term)]
+
+
+class TestSearchIndex:
+
+    def test_fts_disponible(self, app):
+        with app.app_context():
+            assert search_index.enabled()
+
+    def test_sin_acentos_y_por_prefijo(self, app, datos_busqueda):
+        with app.app_context():
+            assert _tramites('defuncion') == ['ACTA DE DEFUNCIÓN']
+            assert _tramites('situacion fis') == ['CONSTANCIA DE SITUACIÓN FISCAL']
+            assert sorted(_tramites('act')) == ['ACTA DE DEFUNCIÓN', 'ACTA DE NACIMIENTO']
+            # El nombre de la papelería también identifica sus trámites
+            assert sorted(_tramites('nandu')) == ['ACTA DE NACIMIENTO', 'CONSTANCIA DE SITUACIÓN FISCAL']
+
+    def test_aislado_por_usuario(self, app, datos_busqueda):
+        with app.app_context():
+            from ARCHIVOS.database import papeleria_repository
+            assert _tramites('defuncion', user_id=2) == ['ACTA DE DEFUNCIÓN']
+            assert [p['nombre'] for p in papeleria_repository.get_all_papelerias(1, search_term='ajena')] == []
+
+    def test_termino_sin_palabras(self, app, datos_busqueda):
+        with app.app_context():
+            assert _tramites('"*') == []
+            assert search_index.match_expression(1, 'tramite', '') is None
+
+    def test_triggers_sincronizan_cambios(self, app, datos_busqueda):
+        with app.app_context():
+            from ARCHIVOS.database import gasto_repository, proveedor_repository
+            tramite = Tramite.query.filter_by(tramite='ACTA DE NACIMIENTO').one()
+            tramite.tramite = 'CURP'
+            db.session.commit()
+            assert _tramites('nacimiento') == []
+            assert _tramites('curp') == ['CURP']
+
+            # Renombrar la papelería reindexa sus trámites
+            db.session.get(Papeleria, 2).nombre = 'Centro'
+            db.session.commit()
+            assert _tramites('nandu') == []
+            assert sorted(_tramites('centro')) == ['CONSTANCIA DE SITUACIÓN FISCAL', 'CURP']
+
+            proveedor = Proveedor.query.filter_by(user_id=1).one()
+            proveedor_repository.update(proveedor.id, 'Distribuidora Óptima', 1)
+            assert [g['concepto'] for g in gasto_repository.get_all_gastos(1, search_term='optima')] == ['Tóner para impresora']
+            assert proveedor_repository.search(1, 'distrib') == [{'id': proveedor.id, 'nombre': 'DISTRIBUIDORA ÓPTIMA'}]
+
+            db.session.delete(db.session.get(Tramite, tramite.id))
+            db.session.commit()
+            assert _tramites('curp') == []
+
+    def test_rebuild(self, app, datos_busqueda):
+        with app.app_context():
+            db.session.execute(db.text(f"DELETE FROM {search_index.TABLE}"))
+            db.session.commit()
+            assert _tramites('defuncion') == []
+            search_index.rebuild(1)
+            assert _tramites('defuncion') == ['ACTA DE DEFUNCIÓN']
+            assert _tramites('defuncion', user_id=2) == []
+            search_index.rebuild()
+            assert _tramites('defuncion', user_id=2) == ['ACTA DE DEFUNCIÓN']
+
+    def test_comando_rebuild(self, app, runner, datos_busqueda):
+        result = runner.invoke(args=['rebuild-search-index', '--user-id', '1'])
+        assert 'Índice de búsqueda reconstruido' in result.output
+        with app.app_context():
+            assert _tramites('defuncion') == ['ACTA DE DEFUNCIÓN']
+
+    def test_api_buscar(self, client, app, datos_busqueda, login):
+        login(client, 1)
+        resultados = client.get('/api/buscar?q=economica').get_json()
+        assert [(r['type'], r['title']) for r in resultados] == [
+            ('gasto', 'Tóner para impresora'),
+            ('proveedor', 'PAPELERA ECONÓMICA'),
+        ]
@@ -0,0 +1,111 @@
+"""
+Tests para single-flight y stale-while-revalidate de las agregaciones del dashboard.
+"""
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from ARCHIVOS import single_flight, utils
+
+
+@pytest.fixture
+def cache(app, real_cache, monkeypatch):
+    """Caché en memoria real y recálculo dentro de la petición."""
+    monkeypatch.setitem(app.config, 'SINGLE_FLIGHT_REFRESH', 'inline')
+    with app.app_context():
+        yield real_cache
+
+
+class TestSingleFlight:
+
+    def test_un_calculo_por_clave_en_el_worker(self, app, cache):
+        calculos, barrera = [], threading.Barrier(8)
+
+        def calcular():
+            calculos.append(1)
+            time.sleep(0.2)
+            return {'total': 42}
+
+        resultados = []
+
+        def peticion():
+            with app.app_context():
+                barrera.wait()
+                resultados.append(single_flight.cached('totals:1', 'v1', calcular))
+
+        hilos = [threading.Thread(target=peticion) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        assert len(calculos) == 1 and resultados == [{'total': 42}] * 8
+        assert single_flight._vuelos == {}
+
+    def test_espera_al_otro_worker(self, app, cache):
+        # Otro worker tiene el candado y publica el valor un momento después
+        cache.add('sf:charts:1:v1', 1)
+
+        def otro_worker():
+            time.sleep(0.1)
+            cache.set('charts:1:v1', 'del otro worker')
+            cache.delete('sf:charts:1:v1')
+
+        threading.Thread(target=otro_worker).start()
+        assert single_flight.cached('charts:1', 'v1', lambda: pytest.fail('no debía calcular')) == 'del otro worker'
+
+    def test_candado_abandonado(self, app, cache, monkeypatch):
+        monkeypatch.setitem(app.config, 'SINGLE_FLIGHT_WAIT', 0.1)
+        cache.add('sf:charts:1:v1', 1)
+        assert single_flight.cached('charts:1', 'v1', lambda: 'propio') == 'propio'
+
+    def test_error_no_se_guarda(self, app, cache):
+        with pytest.raises(ZeroDivisionError):
+            single_flight.cached('totals:1', 'v1', lambda: 1 / 0)
+        assert single_flight.cached('totals:1', 'v1', lambda: 'bien') == 'bien'
+        assert not cache.has('sf:totals:1:v1')
+
+
+class TestStaleWhileRevalidate:
+
+    def test_sirve_el_anterior_y_recalcula(self, app, cache):
+        assert single_flight.cached('totals:1', 'v1', lambda: 'viejo') == 'viejo'
+        assert single_flight.cached('totals:1', 'v2', lambda: 'nuevo') == 'viejo'
+        assert cache.get('totals:1:v2') == 'nuevo'
+        assert single_flight.cached('totals:1', 'v2', lambda: pytest.fail('ya calculado')) == 'nuevo'
+
+    def test_presupuesto_de_antiguedad(self, app, cache, monkeypatch):
+        single_flight.cached('totals:1', 'v1', lambda: 'viejo')
+        cache.set('totals:1:ultimo', {'at': time.time() - 120, 'data': 'viejo'})
+        assert single_flight.cached('totals:1', 'v2', lambda: 'nuevo') == 'nuevo'
+
+        monkeypatch.setitem(app.config, 'SINGLE_FLIGHT_STALE_MAX_AGE', 0)
+        assert single_flight.cached('totals:1', 'v3', lambda: 'al día') == 'al día'
+        assert single_flight.cached('frag', 'v4', lambda: 'sin anterior', stale=False) == 'sin anterior'
+
+    def test_quien_escribe_ve_su_escritura(self, app, client, init_database, cache, login):
+        login(client, 1)
+        antes = client.get('/api/dashboard-totals').get_json()['ganancia']
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            tramite_repository.add_bulk(1, 'ACTA', 1, date.today().isoformat(), 30.0, 10.0, 1)
+            utils.bump_user_data_version(1, 'tramites')
+
+        # Otra pestaña sin escrituras: valor anterior al momento (y se recalcula)
+        assert client.get('/api/dashboard-totals').get_json()['ganancia'] == antes
+        assert client.get('/api/dashboard-totals').get_json()['ganancia'] == antes + 20.0
+
+        # La sesión que escribió nunca recibe un valor anterior a su escritura
+        with app.app_context():
+            tramite_repository.add_bulk(1, 'ACTA', 1, date.today().isoformat(), 30.0, 10.0, 1)
+            utils.bump_user_data_version(1, 'tramites')
+        with client.session_transaction() as sess:
+            sess[single_flight.SESION_ESCRITURA] = time.time()
+        assert client.get('/api/dashboard-totals').get_json()['ganancia'] == antes + 40.0
+
+    def test_escritura_marca_la_sesion(self, app, cache):
+        with app.test_request_context():
+            from flask import session
+            utils.bump_user_data_version(1, 'gastos')
+            assert session[single_flight.SESION_ESCRITURA] <= time.time()
@@ -0,0 +1,38 @@
+"""
+Tests para el perfil de afinación de SQLite.
+"""
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+from ARCHIVOS import sqlite_profile
+from ARCHIVOS.models import db
+
+
+def test_load_profile_prioridad_config():
+    profile = sqlite_profile.load_profile({'SQLITE_SYNCHRONOUS': 'full', 'SQLITE_CACHE_SIZE': '-1000'})
+    assert profile['SQLITE_SYNCHRONOUS'] == 'FULL'
+    assert profile['SQLITE_CACHE_SIZE'] == -1000
+    assert profile['SQLITE_JOURNAL_MODE'] == sqlite_profile.DEFAULTS['SQLITE_JOURNAL_MODE']
+
+
+def test_load_profile_rechaza_valores_invalidos():
+    with pytest.raises(ValueError):
+        sqlite_profile.load_profile({'SQLITE_JOURNAL_MODE': 'WALL'})
+
+
+def test_apply_pragmas_en_archivo(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'perfil.db'))
+    sqlite_profile.apply_pragmas(conn, sqlite_profile.load_profile({}))
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert conn.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+    conn.close()
+
+
+def test_engine_de_la_app_aplica_perfil(app):
+    with app.app_context():
+        assert 'SQLITE_PROFILE' in app.config
+        assert db.session.execute(text('PRAGMA foreign_keys')).scalar() == 1
+        assert db.session.execute(text('PRAGMA temp_store')).scalar() == 2  # MEMORY
@@ -0,0 +1,115 @@
+"""
+Tests para la caché en dos niveles (LRU por worker + SQLite compartido): coherencia entre workers, contadores y expulsiones.
+"""
+import multiprocessing
+import threading
+
+import pytest
+
+from ARCHIVOS import tiered_cache
+from ARCHIVOS.tiered_cache import TieredCache
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return tmp_path / 'cache.db'
+
+
+def _sumar(ruta, n):
+    cache = TieredCache(ruta)
+    for _ in range(n):
+        cache.inc('data_ver:1:tramites')
+
+
+class TestTieredCache:
+
+    def test_dos_workers_comparten_l2(self, ruta):
+        uno, otro = TieredCache(ruta), TieredCache(ruta)
+        valor = {'labels': ['ACTA'] * 500, 'data': list(range(500))}
+        assert uno.set('charts:1', valor)
+        assert otro.get('charts:1') == valor       # L2
+        assert otro.get('charts:1') == valor       # L1
+        assert otro.get_many('charts:1', 'nada') == [valor, None]
+        assert otro.stats()['l2_hits'] == 1 and otro.stats()['l1_hits'] == 2 and otro.stats()['misses'] == 1
+
+        # El valor de L1 es una copia: mutarlo no altera la caché
+        otro.get('charts:1')['labels'].clear()
+        assert len(otro.get('charts:1')['labels']) == 500
+
+    def test_versiones_sin_l1(self, ruta):
+        uno, otro = TieredCache(ruta), TieredCache(ruta)
+        assert uno.add('data_ver:1:tramites', 10, timeout=0)
+        assert not otro.add('data_ver:1:tramites', 99, timeout=0)
+        assert otro.get('data_ver:1:tramites') == 10
+        assert uno.inc('data_ver:1:tramites') == 11
+        assert otro.get('data_ver:1:tramites') == 11   # Sin esperar al TTL de L1
+        assert otro.stats()['l1_items'] == 0
+
+    def test_inc_atomico_entre_procesos(self, ruta):
+        TieredCache(ruta).add('data_ver:1:tramites', 0, timeout=0)
+        contexto = multiprocessing.get_context('spawn')
+        procesos = [contexto.Process(target=_sumar, args=(ruta, 100)) for _ in range(3)]
+        hilos = [threading.Thread(target=_sumar, args=(ruta, 100)) for _ in range(3)]
+        for trabajador in procesos + hilos:
+            trabajador.start()
+        for trabajador in procesos + hilos:
+            trabajador.join()
+        assert TieredCache(ruta).get('data_ver:1:tramites') == 600
+
+    def test_expiracion_y_l1_acotado(self, ruta, monkeypatch):
+        ahora = [1000.0]
+        monkeypatch.setattr(tiered_cache, '_now', lambda: ahora[0])
+        cache = TieredCache(ruta, l1_max_bytes=2000, compress_min_size=10 ** 6)
+        for i in range(5):
+            cache.set(f'k{i}', 'x' * 600, timeout=60)
+        stats = cache.stats()
+        assert stats['l1_bytes'] <= 2000 and stats['l1_evictions'] == 2
+        assert cache.get('k0') == 'x' * 600           # Expulsada de L1, sigue en L2
+
+        ahora[0] += 61
+        assert cache.get('k4') is None and not cache.has('k0')
+        assert cache.prune() == 5 and cache.stats()['l2_evictions'] == 5
+
+    def test_tope_de_filas_conserva_lo_permanente(self, ruta):
+        cache = TieredCache(ruta, threshold=3)
+        cache.add('data_ver:1:gastos', 1, timeout=0)
+        for i in range(4):
+            cache.set(f'totals:{i}', i, timeout=60 + i)
+        assert cache.prune() == 2
+        assert TieredCache(ruta).get_many('data_ver:1:gastos', 'totals:0', 'totals:3') == [1, None, 3]
+
+    def test_serializacion_compacta(self):
+        grande = {'data': [0.0] * 5000}
+        assert tiered_cache.dumps(7) == 7
+        assert tiered_cache.dumps(grande)[:1] == b'z'
+        assert len(tiered_cache.dumps(grande)) < 1000
+        assert tiered_cache.loads(tiered_cache.dumps(grande)) == grande
+        assert tiered_cache.loads(tiered_cache.dumps(True)) is True
+
+
+class TestIntegracionFlask:
+
+    def test_backend_configurado(self, tmp_path):
+        from ARCHIVOS.app import create_app
+        from ARCHIVOS import utils
+
+        class TieredConfig:
+            TESTING = True
+            SECRET_KEY = 'test'
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+            DATABASE_PATH = str(tmp_path / 'db.sqlite')
+            RATELIMIT_ENABLED = False
+            CACHE_TYPE = 'ARCHIVOS.tiered_cache.TieredCache'
+            CACHE_L2_PATH = tmp_path / 'compartida.db'
+
+            @staticmethod
+            def init_app(app):
+                pass
+
+        app, otro_worker = create_app(config_class=TieredConfig), TieredCache(tmp_path / 'compartida.db')
+        with app.app_context():
+            assert isinstance(app.cache.cache, TieredCache)
+            antes = utils.get_user_data_version(1, 'tramites')
+            otro_worker.inc('data_ver:1:tramites')
+            assert utils.get_user_data_version(1, 'tramites') != antes
+        assert 'l1_hits' in app.test_client().get('/health').get_json()['cache']
@@ -75,8 +75,10 @@ class TestTramiteRepository:
                 cantidad=3
             )
             
+            # Una sola fila compacta con la cantidad, no una fila por unidad
             tramites = Tramite.query.filter_by(tramite='CONSTANCIA BULK', user_id=1).all()
-            assert len(tramites) == 3
+            assert len(tramites) == 1
+            assert tramites[0].cantidad == 3
     
     def test_resumen_mensual(self, app, init_database):
         """Test obtener resumen mensual de trámites."""
@@ -153,3 +155,107 @@ class TestTramiteCostos:
             
             costo = tramite_repository.get_costo_for_tramite('RFC', 1)
             assert costo == 25.00
+
+
+class TestRegistroPorLote:
+    """Tests para la captura por lote (inserción Core multi-fila)."""
+
+    def test_add_many_inserta_y_actualiza_rollup(self, app, init_database):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            from ARCHIVOS.models import TramiteDiario
+            hoy = date.today()
+
+            insertados = tramite_repository.add_many(1, [
+                {'papeleria_id': 1, 'tramite': 'LOTE A', 'fecha': hoy, 'precio': 50.0, 'costo': 20.0, 'cantidad': 200},
+                {'papeleria_id': 1, 'tramite': 'LOTE B', 'fecha': hoy, 'precio': 30.0, 'costo': 10.0, 'cantidad': 5},
+                {'papeleria_id': 1, 'tramite': 'LOTE A', 'fecha': hoy, 'precio': 50.0, 'costo': 20.0, 'cantidad': 1},
+            ])
+
+            assert insertados == 206
+            assert Tramite.query.filter_by(user_id=1, tramite='LOTE A').count() == 2
+            assert Tramite.query.filter_by(user_id=1, tramite='LOTE A').first().timestamp is not None
+            fila = TramiteDiario.query.filter_by(user_id=1, tramite='LOTE A').one()
+            assert (fila.cuantos, fila.total_ingresos) == (201, 10050.0)
+
+    def test_endpoint_registrar_lote(self, client, app, init_database, login):
+        login(client, 1)
+
+        hoy = date.today().strftime('%Y-%m-%d')
+        response = client.post('/registrar-tramites-lote', data={
+            'filas-0-papeleria_id': '1', 'filas-0-tramite': 'acta lote', 'filas-0-fecha': hoy,
+            'filas-0-cantidad': '3', 'filas-0-precio': '40', 'filas-0-costo': '15',
+            'filas-1-papeleria_id': '1', 'filas-1-tramite': 'RFC LOTE', 'filas-1-fecha': hoy,
+            'filas-1-cantidad': '2', 'filas-1-precio': '25', 'filas-1-costo': '',
+            # Fila vacía de la cuadrícula: se ignora
+            'filas-2-papeleria_id': '1', 'filas-2-tramite': '', 'filas-2-fecha': hoy, 'filas-2-cantidad': '',
+        }, headers={'HX-Request': 'true'})
+
+        assert response.status_code == 200
+        assert 'tramiteRegistrado' in response.headers.get('HX-Trigger', '')
+        with app.app_context():
+            assert Tramite.query.filter_by(user_id=1, tramite='ACTA LOTE').one().cantidad == 3
+            assert Tramite.query.filter_by(user_id=1, tramite='RFC LOTE').one().cantidad == 2
+
+    def test_endpoint_lote_costo_cero_explicito(self, client, app, init_database, login):
+        login(client, 1)
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            tramite_repository.set_costo('COSTO LOTE', 12.0, 1)
+
+        hoy = date.today().strftime('%Y-%m-%d')
+        client.post('/registrar-tramites-lote', data={
+            'filas-0-papeleria_id': '1', 'filas-0-tramite': 'costo lote', 'filas-0-fecha': hoy,
+            'filas-0-cantidad': '1', 'filas-0-precio': '40', 'filas-0-costo': '0',
+            'filas-1-papeleria_id': '1', 'filas-1-tramite': 'costo lote', 'filas-1-fecha': hoy,
+            'filas-1-cantidad': '2', 'filas-1-precio': '40', 'filas-1-costo': '',
+        }, headers={'HX-Request': 'true'})
+
+        with app.app_context():
+            # Un costo 0 escrito se respeta; solo el vacío toma el costo predefinido
+            filas = Tramite.query.filter_by(user_id=1, tramite='COSTO LOTE').order_by(Tramite.cantidad).all()
+            assert [(f.cantidad, f.costo) for f in filas] == [(1, 0.0), (2, 12.0)]
+
+    def test_endpoint_lote_sin_precio_no_inserta(self, client, app, init_database, login):
+        login(client, 1)
+
+        response = client.post('/registrar-tramites-lote', data={
+            'filas-0-papeleria_id': '1', 'filas-0-tramite': 'SIN PRECIO', 'filas-0-cantidad': '2',
+        })
+
+        assert response.status_code == 200
+        assert 'Sin precio predefinido' in response.get_data(as_text=True)
+        with app.app_context():
+            assert Tramite.query.filter_by(tramite='SIN PRECIO').count() == 0
+
+
+class TestTramitesCompactos:
+    """Tests para la columna cantidad y la compactación de filas duplicadas."""
+
+    def test_split_unit(self, app, init_database):
+        with app.app_context():
+            from ARCHIVOS.database import tramite_repository
+            tramite_repository.add_bulk(1, 'SEPARABLE', 1, date.today().strftime('%Y-%m-%d'), 10.0, 2.0, 3)
+            fila = Tramite.query.filter_by(tramite='SEPARABLE').one()
+
+            unidad = tramite_repository.split_unit(fila.id, 1)
+            assert unidad.cantidad == 1
+            assert db.session.get(Tramite, fila.id).cantidad == 2
+            # Una fila de una sola unidad no se puede separar
+            assert tramite_repository.split_unit(unidad.id, 1) is None
+
+    def test_compact_tramites_fusiona_duplicados(self, app, init_database):
+        with app.app_context():
+            from datetime import datetime
+            from ARCHIVOS.schema_migrations import compact_tramites
+            ts = datetime(2024, 5, 1, 12, 0, 0)
+            for _ in range(4):
+                db.session.add(Tramite(user_id=1, papeleria_id=1, tramite='LEGACY', fecha=date(2024, 5, 1),
+                                       precio=20.0, costo=5.0, timestamp=ts))
+            db.session.add(Tramite(user_id=1, papeleria_id=1, tramite='LEGACY', fecha=date(2024, 5, 1),
+                                   precio=25.0, costo=5.0, timestamp=ts))
+            db.session.commit()
+
+            assert compact_tramites() == 3
+            filas = Tramite.query.filter_by(tramite='LEGACY').order_by(Tramite.precio).all()
+            assert [(f.precio, f.cantidad) for f in filas] == [(20.0, 4), (25.0, 1)]
@@ -0,0 +1,106 @@
+"""
+Tests para las exportaciones a Excel (modo write-only, hojas por papelería/mes, resúmenes de los rollups).
+"""
+import io
+from datetime import date, datetime
+
+import pytest
+
+openpyxl = pytest.importorskip('openpyxl')
+
+from ARCHIVOS import xlsx_export
+
+
+@pytest.fixture
+def libros(app, init_database):
+    """Trámites de abril y mayo en dos papelerías del usuario 1 (una inactiva) y gastos en dos categorías."""
+    with app.app_context():
+        from ARCHIVOS.database import tramite_repository, gasto_repository, proveedor_repository
+        from ARCHIVOS.models import db, Papeleria
+        db.session.add(Papeleria(id=2, nombre='Sucursal: Centro/Norte', user_id=1, is_active=False))
+        db.session.commit()
+        tramite_repository.add_many(1, [
+            {'papeleria_id': 1 + i % 2, 'tramite': f'TRÁMITE {i % 3}', 'fecha': date(2024, 4 + i % 4 // 2, 1 + i % 28),
+             'precio': 30.0, 'costo': 10.0, 'cantidad': 1 + i % 2}
+            for i in range(80)
+        ])
+        proveedor = proveedor_repository.add('Proveedor Excel', 1)
+        for i in range(12):
+            gasto_repository.add(proveedor.id, f'Gasto {i}', 100.0 + i, f'2024-0{4 + i % 2}-{10 + i:02d}',
+                                 'RENTA' if i % 3 == 0 else 'SERVICIOS', 1)
+
+
+def _abrir(data):
+    return openpyxl.load_workbook(io.BytesIO(data))
+
+
+def _filas(ws):
+    return list(ws.iter_rows(min_row=2, values_only=True))
+
+
+class TestLibros:
+
+    def test_general_una_hoja_por_papeleria(self, app, libros):
+        with app.app_context():
+            wb = _abrir(xlsx_export.escribir_tramites(io.BytesIO(), 1).getvalue())
+
+        assert wb.sheetnames == ['Resumen', 'Por mes', 'Test Papeleria', 'Sucursal  Centro Norte']
+        resumen = _filas(wb['Resumen'])
+        assert [f[0] for f in resumen] == ['Sucursal: Centro/Norte', 'Test Papeleria', 'Total']
+        assert resumen[-1][1] == 120 and resumen[-1][2] == 3600.0 and resumen[-1][4] == 2400.0
+        assert [f[0] for f in _filas(wb['Por mes'])] == ['2024-05', '2024-04', 'Total']
+
+        detalle = wb['Test Papeleria']
+        assert detalle.freeze_panes == 'A2'
+        assert [c.value for c in detalle[1]] == ['Trámite', 'Fecha', 'Cantidad', 'Precio', 'Costo', 'Ganancia']
+        assert detalle.max_row == 41
+        fecha, precio = detalle['B2'], detalle['D2']
+        assert isinstance(fecha.value, datetime) and fecha.number_format == xlsx_export.FORMATO_FECHA
+        assert precio.value == 30.0 and precio.number_format == xlsx_export.FORMATO_MONEDA
+
+    def test_papeleria_una_hoja_por_mes(self, app, libros):
+        with app.app_context():
+            wb = _abrir(xlsx_export.escribir_tramites(io.BytesIO(), 1, '2024-05-01', '2024-05-31',
+                                                      papeleria_id=1).getvalue())
+        assert wb.sheetnames == ['Resumen', '2024-05']
+        assert _filas(wb['Resumen'])[-1][1] == sum(f[2] for f in _filas(wb['2024-05']))
+
+    def test_gastos_con_filtros(self, app, libros):
+        with app.app_context():
+            wb = _abrir(xlsx_export.escribir_gastos(io.BytesIO(), 1).getvalue())
+            filtrado = _abrir(xlsx_export.escribir_gastos(io.BytesIO(), 1, categoria='RENTA').getvalue())
+
+        assert wb.sheetnames == ['Resumen', 'Por mes', '2024-05', '2024-04']
+        assert [f[0] for f in _filas(wb['Resumen'])] == ['SERVICIOS', 'RENTA', 'Total']
+        assert _filas(wb['Resumen'])[-1][1:] == (12, sum(100.0 + i for i in range(12)))
+        assert [c.value for c in wb['2024-05'][2]][1:3] == ['PROVEEDOR EXCEL', 'SERVICIOS']
+        assert {f[2] for f in _filas(filtrado['2024-04'])} == {'RENTA'}
+
+    def test_nombres_de_hoja(self):
+        libro = xlsx_export._Libro()
+        columnas = [('A', 10, None)]
+        nombres = [libro.hoja(t, columnas).title for t in ('Resumen', 'resumen', 'x' * 40, 'x' * 40, '[*?]')]
+        assert nombres == ['Resumen', 'resumen (2)', 'x' * 31, 'x' * 27 + ' (2)', 'Hoja']
+        assert _abrir(libro.save(io.BytesIO()).getvalue()).sheetnames == nombres
+
+
+class TestRutas:
+
+    def test_exportacion_general_y_permisos(self, client, libros, login):
+        login(client, 1)
+        assert client.get('/exportar-xlsx/general').status_code == 302
+        assert client.get('/exportar-xlsx/papeleria/1').status_code == 302
+
+    def test_admin_descarga_el_libro(self, client, libros, login):
+        login(client, 2, viewing=1)
+        response = client.get('/exportar-xlsx/papeleria/1?fecha_inicio=2024-04-01&fecha_fin=2024-04-30')
+        assert response.status_code == 200 and response.mimetype == xlsx_export.XLSX_MIMETYPE
+        assert 'reporte_papeleria_1_' in response.headers['Content-Disposition']
+        assert _abrir(response.data).sheetnames == ['Resumen', '2024-04']
+        assert _abrir(client.get('/exportar-xlsx/general').data).sheetnames[:2] == ['Resumen', 'Por mes']
+
+    def test_gastos_del_usuario(self, client, libros, login):
+        login(client, 1)
+        response = client.get('/gastos/exportar-xlsx?fecha_inicio=2024-05-01&fecha_fin=2024-05-31')
+        assert response.status_code == 200
+        assert _abrir(response.data).sheetnames == ['Resumen', 'Por mes', '2024-05']
@@ -0,0 +1,326 @@
+"""
+Backend de Flask-Caching en dos niveles, sin Redis: `CACHE_TYPE = 'ARCHIVOS.tiered_cache.TieredCache'`.
+
+Con `SimpleCache` cada worker de gunicorn tiene su propia caché: el mismo dashboard se
+calcula hasta una vez por worker y `bump_user_data_version` solo avanza la versión en el
+worker que atendió la escritura, así que los demás siguen sirviendo datos viejos.
+
+- L1: LRU en memoria por worker, acotado en bytes (`CACHE_L1_MAX_BYTES`). Guarda el valor
+  ya serializado (el tamaño es exacto y nadie comparte objetos mutables) y como mucho
+  `CACHE_L1_TTL` segundos, lo que acota cuánto puede ver un worker un `set`/`delete`
+  hecho por otro sobre la misma clave.
+- L2: tabla SQLite en modo WAL (`CACHE_L2_PATH`) compartida por todos los workers, con
+  expiración por clave y tope de filas (`CACHE_THRESHOLD`).
+- Contadores atómicos: los enteros se guardan como INTEGER y `inc` es un solo UPSERT,
+  así que dos workers nunca obtienen la misma versión. Las claves con un prefijo de
+  `CACHE_L1_BYPASS_PREFIXES` (las versiones `data_ver:`) no pasan por L1: un cambio de
+  versión se ve al instante en todos los workers.
+- Serialización compacta: pickle binario, comprimido con zlib a partir de
+  `CACHE_COMPRESS_MIN_SIZE` bytes si ahorra espacio.
+
+`stats()` cuenta aciertos por nivel, fallos y expulsiones (se muestran en `/health`).
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask_caching.backends.base import BaseCache
+
+# Valores por defecto (se usan si Config no define la clave)
+DEFAULTS = {
+    'CACHE_L2_PATH': Path(__file__).resolve().parent / 'cache_compartida.db',
+    'CACHE_L1_MAX_BYTES': 16 * 1024 * 1024,    # 16MB por worker
+    'CACHE_L1_TTL': 30,                         # Segundos que un valor vive en L1
+    'CACHE_L1_BYPASS_PREFIXES': ('data_ver:',),
+    'CACHE_COMPRESS_MIN_SIZE': 1024,
+    'CACHE_THRESHOLD': 2000,                    # Filas en L2 antes de expulsar
+}
+
+_PICKLE = b'p'
+_ZLIB = b'z'
+_PODA_CADA = 200      # Escrituras entre podas de L2
+_TAMANO_ENTERO = 8    # Bytes que cuenta un entero en L1
+
+_now = time.time
+
+
+def dumps(value, compress_min_size=DEFAULTS['CACHE_COMPRESS_MIN_SIZE']):
+    """Serializa `value`: los enteros quedan como INTEGER de SQLite, lo demás como bytes."""
+    if type(value) is int:
+        return value
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) >= compress_min_size:
+        comprimido = zlib.compress(data, 6)
+        if len(comprimido) < len(data):
+            return _ZLIB + comprimido
+    return _PICKLE + data
+
+
+def loads(stored):
+    """Inverso de `dumps`."""
+    if isinstance(stored, int):
+        return stored
+    stored = bytes(stored)
+    if stored[:1] == _ZLIB:
+        return pickle.loads(zlib.decompress(stored[1:]))
+    return pickle.loads(stored[1:])
+
+
+class TieredCache(BaseCache):
+    """LRU en memoria por worker delante de una tabla SQLite compartida (ver el docstring del módulo)."""
+
+    def __init__(self, path=DEFAULTS['CACHE_L2_PATH'], default_timeout=300,
+                 l1_max_bytes=DEFAULTS['CACHE_L1_MAX_BYTES'], l1_ttl=DEFAULTS['CACHE_L1_TTL'],
+                 l1_bypass_prefixes=DEFAULTS['CACHE_L1_BYPASS_PREFIXES'],
+                 compress_min_size=DEFAULTS['CACHE_COMPRESS_MIN_SIZE'], threshold=DEFAULTS['CACHE_THRESHOLD'],
+                 busy_timeout=5000):
+        super().__init__(default_timeout=default_timeout)
+        self.path = str(path)
+        self.l1_max_bytes = l1_max_bytes
+        self.l1_ttl = l1_ttl
+        self.l1_bypass_prefixes = tuple(l1_bypass_prefixes)
+        self.compress_min_size = compress_min_size
+        self.threshold = threshold
+        self.busy_timeout = busy_timeout
+        self._l1 = OrderedDict()      # clave -> (expira, tamaño, valor serializado)
+        self._l1_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._escrituras = 0
+        self._stats = dict.fromkeys(('l1_hits', 'l2_hits', 'misses', 'sets', 'l1_evictions', 'l2_evictions'), 0)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._connect()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(
+            path=config.get('CACHE_L2_PATH', DEFAULTS['CACHE_L2_PATH']),
+            l1_max_bytes=config.get('CACHE_L1_MAX_BYTES', DEFAULTS['CACHE_L1_MAX_BYTES']),
+            l1_ttl=config.get('CACHE_L1_TTL', DEFAULTS['CACHE_L1_TTL']),
+            l1_bypass_prefixes=config.get('CACHE_L1_BYPASS_PREFIXES', DEFAULTS['CACHE_L1_BYPASS_PREFIXES']),
+            compress_min_size=config.get('CACHE_COMPRESS_MIN_SIZE', DEFAULTS['CACHE_COMPRESS_MIN_SIZE']),
+            threshold=config.get('CACHE_THRESHOLD', DEFAULTS['CACHE_THRESHOLD']),
+            busy_timeout=config.get('SQLITE_BUSY_TIMEOUT', 5000),
+        )
+        return cls(*args, **kwargs)
+
+    # --- Conexión L2 (una por hilo y por proceso: gunicorn hace fork después de importar) ---
+
+    def _connect(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value, expires REAL NOT NULL) '
+                         'WITHOUT ROWID')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires)')
+            local.conn, local.pid = conn, os.getpid()
+        return local.conn
+
+    @contextmanager
+    def _transaccion(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _expires(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return 0 if timeout == 0 else _now() + timeout
+
+    # --- L1 ---
+
+    def _en_l1(self, key):
+        return not key.startswith(self.l1_bypass_prefixes)
+
+    def _l1_get(self, key):
+        with self._lock:
+            entrada = self._l1.get(key)
+            if entrada is None:
+                return None
+            if entrada[0] <= _now():
+                self._l1_drop(key)
+                return None
+            self._l1.move_to_end(key)
+            self._stats['l1_hits'] += 1
+            return entrada
+
+    def _l1_put(self, key, stored, expires):
+        if not self._en_l1(key):
+            return
+        tamano = _TAMANO_ENTERO if isinstance(stored, int) else len(stored)
+        if tamano > self.l1_max_bytes:
+            self._l1_discard(key)
+            return
+        vence = _now() + self.l1_ttl
+        if expires:
+            vence = min(vence, expires)
+        with self._lock:
+            self._l1_drop(key)
+            self._l1[key] = (vence, tamano, stored)
+            self._l1_bytes += tamano
+            while self._l1_bytes > self.l1_max_bytes:
+                _, (_, liberado, _) = self._l1.popitem(last=False)
+                self._l1_bytes -= liberado
+                self._stats['l1_evictions'] += 1
+
+    def _l1_drop(self, key):
+        entrada = self._l1.pop(key, None)
+        if entrada is not None:
+            self._l1_bytes -= entrada[1]
+
+    def _l1_discard(self, key):
+        with self._lock:
+            self._l1_drop(key)
+
+    def _contar(self, clave, n=1):
+        with self._lock:
+            self._stats[clave] += n
+
+    # --- API de cachelib ---
+
+    def get(self, key):
+        return self.get_many(key)[0]
+
+    def get_many(self, *keys):
+        valores = [None] * len(keys)
+        faltan = {}
+        for i, key in enumerate(keys):
+            entrada = self._l1_get(key) if self._en_l1(key) else None
+            if entrada is not None:
+                valores[i] = loads(entrada[2])
+            else:
+                faltan.setdefault(key, []).append(i)
+        if not faltan:
+            return valores
+
+        marcas = ','.join('?' * len(faltan))
+        filas = self._connect().execute(
+            f'SELECT key, value, expires FROM cache WHERE key IN ({marcas}) AND (expires = 0 OR expires > ?)',
+            (*faltan, _now())).fetchall()
+        for key, stored, expires in filas:
+            valor = loads(stored)
+            for i in faltan.pop(key):
+                valores[i] = valor
+            self._l1_put(key, stored, expires)
+        self._contar('l2_hits', len(filas))
+        self._contar('misses', sum(len(indices) for indices in faltan.values()))
+        return valores
+
+    def has(self, key):
+        if self._en_l1(key) and self._l1_get(key) is not None:
+            return True
+        return self._connect().execute('SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)',
+                                       (key, _now())).fetchone() is not None
+
+    def set(self, key, value, timeout=None):
+        return self.set_many({key: value}, timeout) == [key]
+
+    def set_many(self, mapping, timeout=None):
+        expires = self._expires(timeout)
+        filas = [(key, dumps(value, self.compress_min_size), expires) for key, value in mapping.items()]
+        with self._transaccion() as conn:
+            conn.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', filas)
+        for key, stored, _ in filas:
+            self._l1_put(key, stored, expires)
+        self._contar('sets', len(filas))
+        self._escrito(len(filas))
+        return [key for key, _, _ in filas]
+
+    def add(self, key, value, timeout=None):
+        """Guarda solo si la clave no existe (o expiró). Atómico entre workers."""
+        expires = self._expires(timeout)
+        stored = dumps(value, self.compress_min_size)
+        agregado = self._connect().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires != 0 AND cache.expires <= ?',
+            (key, stored, expires, _now())).rowcount == 1
+        if agregado:
+            self._l1_put(key, stored, expires)
+            self._contar('sets')
+            self._escrito()
+        return agregado
+
+    def inc(self, key, delta=1):
+        """Suma `delta` en un solo UPSERT (atómico entre workers); una clave ausente empieza en `delta`."""
+        ahora = _now()
+        vigente = "typeof(cache.value) = 'integer' AND (cache.expires = 0 OR cache.expires > :ahora)"
+        fila = self._connect().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (:key, :delta, :expires) '
+            f'ON CONFLICT(key) DO UPDATE SET value = CASE WHEN {vigente} THEN cache.value + :delta ELSE :delta END, '
+            f'expires = CASE WHEN {vigente} THEN cache.expires ELSE :expires END '
+            'RETURNING value',
+            {'key': key, 'delta': delta, 'expires': self._expires(None), 'ahora': ahora}).fetchall()[0]
+        self._l1_discard(key)
+        self._escrito()
+        return fila[0]
+
+    def dec(self, key, delta=1):
+        return self.inc(key, -delta)
+
+    def delete(self, key):
+        return bool(self.delete_many(key))
+
+    def delete_many(self, *keys):
+        borradas = []
+        with self._transaccion() as conn:
+            for key in keys:
+                self._l1_discard(key)
+                if conn.execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount:
+                    borradas.append(key)
+        return borradas
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+            self._l1_bytes = 0
+        self._connect().execute('DELETE FROM cache')
+        return True
+
+    # --- Mantenimiento y estadísticas ---
+
+    def _escrito(self, n=1):
+        with self._lock:
+            self._escrituras += n
+            if self._escrituras < _PODA_CADA:
+                return
+            self._escrituras = 0
+        self.prune()
+
+    def prune(self):
+        """Borra de L2 lo expirado y, si pasa de `threshold` filas, lo que vence antes (lo permanente al final)."""
+        try:
+            with self._transaccion() as conn:
+                borradas = conn.execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (_now(),)).rowcount
+                sobran = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.threshold
+                if self.threshold and sobran > 0:
+                    borradas += conn.execute(
+                        'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires = 0, expires LIMIT ?)',
+                        (sobran,)).rowcount
+        except sqlite3.OperationalError as e:  # Otro worker escribiendo: se poda la próxima vez
+            logging.debug(f"[CACHE] Poda omitida: {e}")
+            return 0
+        self._contar('l2_evictions', borradas)
+        return borradas
+
+    def stats(self):
+        """Aciertos por nivel, fallos, expulsiones y ocupación de L1 de este worker."""
+        with self._lock:
+            stats = dict(self._stats, l1_items=len(self._l1), l1_bytes=self._l1_bytes, l1_max_bytes=self.l1_max_bytes)
+        consultas = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['l1_hits'] + stats['l2_hits']) / consultas, 3) if consultas else None
+        return stats
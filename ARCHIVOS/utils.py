@@ -1,7 +1,9 @@
-from flask import flash, redirect, url_for, session, current_app
+from flask import flash, redirect, url_for, session, current_app, has_request_context
 from functools import wraps
 from flask_login import current_user
 from .models import Papeleria, db
+from .single_flight import SESION_ESCRITURA
+from . import cache_warming
 import os
 # Pillow es opcional (ahorra ~7MB en PythonAnywhere gratis)
 try:
@@ -12,6 +14,7 @@ except ImportError:
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import threading
+import time
 import smtplib
 from email.message import EmailMessage
 import logging
@@ -95,25 +98,67 @@ def save_logo_image(file, user_id):
         # Relanzar la excepción con un mensaje más claro.
         raise Exception(f'El archivo subido no es una imagen válida. Error: {e}')
 
-def get_user_data_version(user_id):
-    """Obtiene la versión actual de los datos del usuario para invalidación de caché."""
+# --- Versiones de datos para la caché ---
+# Un contador monótono por (usuario, dominio). Cada clave de caché incluye solo las
+# versiones de los dominios que lee: registrar un proveedor ya no invalida los gráficos.
+DATA_DOMAINS = ('tramites', 'gastos', 'precios', 'papelerias', 'proveedores')
+_version_lock = threading.Lock()
+
+
+def _version_key(user_id, domain):
+    if domain not in DATA_DOMAINS:
+        raise ValueError(f"Dominio de datos desconocido: {domain}")
+    return f"data_ver:{user_id}:{domain}"
+
+
+def _version_seed():
+    # Si el contador se pierde (reinicio, desalojo) se reinicia por encima de cualquier
+    # valor anterior: los microsegundos actuales solo los alcanzaría más de una escritura
+    # por microsegundo.
+    return time.time_ns() // 1000
+
+
+def get_user_data_version(user_id, *domains):
+    """
+    Versión de los datos del usuario en `domains` (todos si no se indican) para armar
+    claves de caché, p. ej. 'tramites-12.gastos-4'. None si no hay caché.
+    """
     cache = getattr(current_app, 'cache', None)
     if not cache:
         return None
-    key = f"data_ver:{user_id}"
-    version = cache.get(key)
-    if not version:
-        version = str(int(datetime.now().timestamp()))
-        cache.set(key, version, timeout=0)
-    return version
-
-def bump_user_data_version(user_id):
-    """Actualiza la versión de los datos del usuario, invalidando cachés dependientes."""
+    domains = domains or DATA_DOMAINS
+    keys = [_version_key(user_id, d) for d in domains]
+    versions = cache.get_many(*keys)
+    if None in versions:
+        with _version_lock:
+            for i, (key, version) in enumerate(zip(keys, versions)):
+                if version is None:
+                    cache.add(key, _version_seed(), timeout=0)
+                    versions[i] = cache.get(key)
+    if None in versions:  # Caché nula: nada que versionar
+        return None
+    return '.'.join(f"{d}-{v}" for d, v in zip(domains, versions))
+
+
+def bump_user_data_version(user_id, *domains):
+    """
+    Incrementa la versión de `domains` (todos si no se indican) tras confirmar una
+    escritura, invalidando las cachés que dependen de ellos.
+    """
     cache = getattr(current_app, 'cache', None)
-    if cache:
-        key = f"data_ver:{user_id}"
-        new_version = str(int(datetime.now().timestamp()))
-        cache.set(key, new_version, timeout=0)
+    if not cache:
+        return
+    # `inc` es atómico en Redis; en SimpleCache es leer+escribir, de ahí el lock
+    with _version_lock:
+        for domain in domains or DATA_DOMAINS:
+            key = _version_key(user_id, domain)
+            if not cache.add(key, _version_seed(), timeout=0):
+                cache.cache.inc(key)
+    # Quien escribe no recibe valores anteriores a su escritura (stale-while-revalidate, ver single_flight)
+    if has_request_context():
+        session[SESION_ESCRITURA] = time.time()
+    # La próxima vista del dashboard no paga el cálculo en frío (ver cache_warming)
+    cache_warming.enqueue(user_id, domains)
 
 def send_error_email_async(subject, body):
     """
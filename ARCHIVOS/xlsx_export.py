@@ -0,0 +1,187 @@
+"""
+Exportaciones XLSX (Excel) con memoria acotada: trámites (general o por papelería) y gastos.
+
+- El libro usa el modo write-only de openpyxl: cada hoja se escribe fila por fila a un
+  archivo temporal y nunca se arma en memoria la cuadrícula completa.
+- Las filas llegan de los repositorios por lotes (`yield_per`), igual que el CSV, y se
+  reparten en hojas con `itertools.groupby`: una hoja por papelería en la exportación
+  general (la consulta viene ordenada por papelería) y una por mes en la de una papelería
+  y en la de gastos.
+- Las primeras hojas son resúmenes que salen de los rollups diarios (un GROUP BY, no se
+  recorre el detalle dos veces).
+- Fechas y montos son celdas tipadas (fecha y moneda), así que Excel ordena, filtra y
+  suma sin convertir texto.
+
+El libro se escribe en un archivo temporal (un ZIP no se puede enviar antes de cerrarlo)
+y `send_file` lo entrega por bloques. Los textos repetidos (nombres de trámite,
+proveedores) van a la tabla de cadenas compartidas de openpyxl, que crece con los valores
+distintos, no con el número de filas.
+"""
+import tempfile
+from datetime import datetime
+from itertools import groupby
+
+from flask import send_file
+
+# openpyxl es opcional (como reportlab): sin él las rutas ofrecen el CSV
+OPENPYXL_AVAILABLE = False
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    Workbook = None
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+LOTE_FILAS = 2000           # Filas por lote leído de la BD
+FORMATO_FECHA = 'yyyy-mm-dd'
+FORMATO_MONEDA = '"$"#,##0.00'
+_MAX_NOMBRE_HOJA = 31       # Límite de Excel
+_INVALIDOS_HOJA = str.maketrans({c: ' ' for c in '[]:*?/\\'})
+
+# (encabezado, ancho, formato) de cada columna
+_COLUMNAS_TRAMITES = [('Trámite', 40, None), ('Fecha', 12, FORMATO_FECHA), ('Cantidad', 10, None),
+                      ('Precio', 12, FORMATO_MONEDA), ('Costo', 12, FORMATO_MONEDA), ('Ganancia', 12, FORMATO_MONEDA)]
+_COLUMNAS_GASTOS = [('Fecha', 12, FORMATO_FECHA), ('Proveedor', 30, None), ('Categoría', 16, None),
+                    ('Descripción', 40, None), ('Monto', 14, FORMATO_MONEDA)]
+_COLUMNAS_TOTALES = [('Trámites', 10, None), ('Ingresos', 14, FORMATO_MONEDA), ('Costos', 14, FORMATO_MONEDA),
+                     ('Ganancia', 14, FORMATO_MONEDA)]
+
+
+class _Libro:
+    """Workbook write-only con encabezados en negrita, celdas tipadas y nombres de hoja válidos."""
+
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+        self._nombres = set()
+        self._formatos = {}
+        self._negrita = Font(bold=True)
+
+    def hoja(self, titulo, columnas):
+        ws = self.wb.create_sheet(self._nombre(titulo))
+        for i, (_, ancho, _) in enumerate(columnas, 1):
+            ws.column_dimensions[get_column_letter(i)].width = ancho
+        ws.freeze_panes = 'A2'
+        encabezado = []
+        for texto, _, _ in columnas:
+            celda = WriteOnlyCell(ws, texto)
+            celda.font = self._negrita
+            encabezado.append(celda)
+        ws.append(encabezado)
+        self._formatos[ws.title] = [formato for _, _, formato in columnas]
+        return ws
+
+    def fila(self, ws, valores, negrita=False):
+        celdas = []
+        for valor, formato in zip(valores, self._formatos[ws.title]):
+            if formato or negrita:
+                celda = WriteOnlyCell(ws, valor)
+                if formato:
+                    celda.number_format = formato
+                if negrita:
+                    celda.font = self._negrita
+                valor = celda
+            celdas.append(valor)
+        ws.append(celdas)
+
+    def _nombre(self, titulo):
+        # Excel: máximo 31 caracteres, sin []:*?/\ y sin repetir (sin distinguir mayúsculas)
+        base = (str(titulo).translate(_INVALIDOS_HOJA).strip() or 'Hoja')[:_MAX_NOMBRE_HOJA]
+        nombre, n = base, 1
+        while nombre.lower() in self._nombres:
+            n += 1
+            sufijo = f" ({n})"
+            nombre = base[:_MAX_NOMBRE_HOJA - len(sufijo)] + sufijo
+        self._nombres.add(nombre.lower())
+        return nombre
+
+    def save(self, output):
+        self.wb.save(output)
+        return output
+
+
+def _resumen_tramites(libro, titulo, primera, filas, clave):
+    """Hoja de resumen de trámites (una fila por `clave`) con la fila de totales."""
+    ws = libro.hoja(titulo, [(primera, 30, None)] + _COLUMNAS_TOTALES)
+    for f in filas:
+        libro.fila(ws, [f[clave], f['cuantos'], f['total_ingresos'], f['total_costos'],
+                        f['total_ingresos'] - f['total_costos']])
+    ingresos, costos = sum(f['total_ingresos'] for f in filas), sum(f['total_costos'] for f in filas)
+    libro.fila(ws, ['Total', sum(f['cuantos'] for f in filas), ingresos, costos, ingresos - costos], negrita=True)
+
+
+def escribir_tramites(output, user_id, fecha_inicio=None, fecha_fin=None, papeleria_id=None):
+    """
+    Escribe el libro de trámites en `output`. General: resumen por papelería y por mes, y
+    una hoja por papelería. De una papelería: resumen por mes y una hoja por mes.
+    """
+    from .database import tramite_repository
+
+    libro = _Libro()
+    por_mes = tramite_repository.get_totals_by_periodo(user_id, fecha_inicio, fecha_fin, papeleria_id=papeleria_id)
+    if papeleria_id is None:
+        _resumen_tramites(libro, 'Resumen', 'Papelería',
+                          tramite_repository.get_totals_by_papeleria(user_id, fecha_inicio, fecha_fin), 'papeleria')
+    _resumen_tramites(libro, 'Por mes' if papeleria_id is None else 'Resumen', 'Mes', por_mes, 'mes')
+
+    filas = tramite_repository.export_all_as_csv(user_id, fecha_inicio, fecha_fin, papeleria_id=papeleria_id,
+                                                 batch_size=LOTE_FILAS, por_papeleria=papeleria_id is None)
+    if papeleria_id is None:
+        grupos = ((nombre, grupo) for (_, nombre), grupo in groupby(filas, key=lambda r: (r.papeleria_id, r.papeleria)))
+    else:
+        grupos = groupby(filas, key=lambda r: r.fecha.strftime('%Y-%m'))
+    for titulo, grupo in grupos:
+        ws = libro.hoja(titulo, _COLUMNAS_TRAMITES)
+        for r in grupo:
+            libro.fila(ws, [r.tramite, r.fecha, r.cantidad, r.precio, r.costo, r.ganancia])
+    return libro.save(output)
+
+
+def escribir_gastos(output, user_id, fecha_inicio=None, fecha_fin=None, categoria=None):
+    """Escribe el libro de gastos en `output`: resumen por categoría y por mes, y una hoja por mes."""
+    from .database import gasto_repository
+
+    libro = _Libro()
+    por_mes = gasto_repository.get_totals_by_periodo(user_id, fecha_inicio, fecha_fin, categoria)
+    por_categoria = {}
+    for f in por_mes:
+        cuantos, monto = por_categoria.get(f['categoria'], (0, 0.0))
+        por_categoria[f['categoria']] = (cuantos + f['cuantos'], monto + f['total_monto'])
+
+    ws = libro.hoja('Resumen', [('Categoría', 20, None), ('Gastos', 10, None), ('Monto', 14, FORMATO_MONEDA)])
+    for nombre, (cuantos, monto) in sorted(por_categoria.items(), key=lambda item: -item[1][1]):
+        libro.fila(ws, [nombre, cuantos, monto])
+    libro.fila(ws, ['Total', sum(c for c, _ in por_categoria.values()), sum(m for _, m in por_categoria.values())],
+               negrita=True)
+
+    ws = libro.hoja('Por mes', [('Mes', 10, None), ('Categoría', 20, None), ('Gastos', 10, None),
+                                ('Monto', 14, FORMATO_MONEDA)])
+    for f in por_mes:
+        libro.fila(ws, [f['mes'], f['categoria'], f['cuantos'], f['total_monto']])
+
+    filas = gasto_repository.export_all(user_id, fecha_inicio, fecha_fin, categoria, batch_size=LOTE_FILAS)
+    for mes, grupo in groupby(filas, key=lambda r: r.fecha.strftime('%Y-%m')):
+        ws = libro.hoja(mes, _COLUMNAS_GASTOS)
+        for r in grupo:
+            libro.fila(ws, [r.fecha, r.proveedor, r.categoria, r.descripcion, r.monto])
+    return libro.save(output)
+
+
+def xlsx_response(filename, escribir, *args, **kwargs):
+    """Escribe el libro con `escribir(archivo, *args, **kwargs)` en un temporal y lo envía por bloques."""
+    archivo = tempfile.TemporaryFile()
+    try:
+        escribir(archivo, *args, **kwargs)
+        archivo.seek(0)
+    except BaseException:
+        archivo.close()
+        raise
+    # send_file cierra el temporal (y el SO lo borra) al terminar la respuesta
+    return send_file(archivo, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)
+
+
+def nombre_archivo(prefijo):
+    """`<prefijo>_<hoy>.xlsx`, como los CSV."""
+    return f"{prefijo}_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
@@ -19,7 +19,19 @@ if [ ! -f "$DB_PATH" ]; then
 fi
 
 echo "[backup] Creando copia de $DB_PATH -> $DEST"
-cp -f "$DB_PATH" "$DEST"
+# Con journal_mode=WAL las transacciones confirmadas pueden seguir en el archivo -wal,
+# por eso no basta con `cp`: se usa la API de backup en línea de SQLite.
+python3 - "$DB_PATH" "$DEST" <<'PY'
+import sqlite3
+import sys
+
+src = sqlite3.connect(sys.argv[1], timeout=30)
+dst = sqlite3.connect(sys.argv[2])
+with dst:
+    src.backup(dst)
+dst.close()
+src.close()
+PY
 chown --reference="$DB_PATH" "$DEST" || true
 chmod 640 "$DEST" || true
 echo "[backup] Backup creado correctamente"